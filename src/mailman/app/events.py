@@ -24,8 +24,13 @@ __all__ = [
 
 from mailman.app import (
     domain, membership, moderator, registrar, subscriptions)
+from mailman.chains import headers
 from mailman.core import i18n, switchboard
 from mailman.languages import manager as language_manager
+from mailman.model import roster
+from mailman.mta import connection
+from mailman.rules import suspicious
+from mailman.runners import lmtp
 from mailman.styles import manager as style_manager
 from mailman.utilities import passwords
 from zope import event
@@ -35,14 +40,21 @@ from zope import event
 def initialize():
     """Initialize global event subscribers."""
     event.subscribers.extend([
+        connection.handle_ConfigurationUpdatedEvent,
         domain.handle_DomainDeletingEvent,
+        headers.handle_ListDeletingEvent,
         i18n.handle_ConfigurationUpdatedEvent,
         language_manager.handle_ConfigurationUpdatedEvent,
+        lmtp.handle_ListCreatedEvent,
+        lmtp.handle_ListDeletedEvent,
         membership.handle_SubscriptionEvent,
         moderator.handle_ListDeletingEvent,
         passwords.handle_ConfigurationUpdatedEvent,
         registrar.handle_ConfirmationNeededEvent,
+        roster.handle_AddressLinkEvent,
+        roster.handle_MembershipChangeEvent,
         style_manager.handle_ConfigurationUpdatedEvent,
         subscriptions.handle_ListDeletingEvent,
+        suspicious.handle_ListDeletingEvent,
         switchboard.handle_ConfigurationUpdatedEvent,
         ])
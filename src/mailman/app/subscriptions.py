@@ -40,18 +40,20 @@ from mailman.interfaces.bans import IBanManager
 from mailman.interfaces.listmanager import (
     IListManager, ListDeletingEvent, NoSuchListError)
 from mailman.interfaces.mailinglist import SubscriptionPolicy
-from mailman.interfaces.member import MembershipIsBannedError
+from mailman.interfaces.member import MemberRole, MembershipIsBannedError
 from mailman.interfaces.pending import IPendable, IPendings
 from mailman.interfaces.registrar import ConfirmationNeededEvent
 from mailman.interfaces.subscriptions import ISubscriptionService, TokenOwner
 from mailman.interfaces.user import IUser
 from mailman.interfaces.usermanager import IUserManager
 from mailman.interfaces.workflow import IWorkflowStateManager
+from mailman.model.address import Address
 from mailman.model.member import Member
 from mailman.utilities.datetime import now
 from mailman.utilities.i18n import make
-from operator import attrgetter
-from sqlalchemy import and_, or_
+from mailman.utilities.queries import QuerySequence
+from sqlalchemy import and_, case, func, or_
+from sqlalchemy.orm import aliased
 from zope.component import getUtility
 from zope.event import notify
 from zope.interface import implementer
@@ -61,13 +63,26 @@ log = logging.getLogger('mailman.subscribe')
 
 
 
-def _membership_sort_key(member):
-    """Sort function for find_members().
+def _with_subscribed_email(query):
+    """Join a query of members with the email address they subscribed with.
 
-    The members are sorted first by unique list id, then by subscribed email
-    address, then by role.
+    That is the member's explicit address, or else the preferred address of
+    the member's user.
+
+    :param query: A query for `Member` objects.
+    :return: The joined query, and the column expression of the email
+        address.
     """
-    return (member.list_id, member.address.email, member.role.value)
+    # Avoid circular imports.
+    from mailman.model.user import User
+    explicit = aliased(Address)
+    subscribed = aliased(User)
+    preferred = aliased(Address)
+    query = query.outerjoin(
+        explicit, Member.address_id == explicit.id).outerjoin(
+        subscribed, Member.user_id == subscribed.id).outerjoin(
+        preferred, subscribed._preferred_address_id == preferred.id)
+    return query, func.coalesce(explicit.email, preferred.email)
 
 
 class WhichSubscriber(Enum):
@@ -347,27 +362,19 @@ class SubscriptionService:
 
     __name__ = 'members'
 
-    def get_members(self):
+    @dbconnection
+    def get_members(self, store):
         """See `ISubscriptionService`."""
-        # {list_id -> {role -> [members]}}
-        by_list = {}
-        user_manager = getUtility(IUserManager)
-        for member in user_manager.members:
-            by_role = by_list.setdefault(member.list_id, {})
-            members = by_role.setdefault(member.role.name, [])
-            members.append(member)
-        # Flatten into single list sorted as per the interface.
-        all_members = []
-        address_of_member = attrgetter('address.email')
-        for list_id in sorted(by_list):
-            by_role = by_list[list_id]
-            all_members.extend(
-                sorted(by_role.get('owner', []), key=address_of_member))
-            all_members.extend(
-                sorted(by_role.get('moderator', []), key=address_of_member))
-            all_members.extend(
-                sorted(by_role.get('member', []), key=address_of_member))
-        return all_members
+        query, email = _with_subscribed_email(store.query(Member))
+        role_order = case([
+            (Member.role == MemberRole.owner, 0),
+            (Member.role == MemberRole.moderator, 1),
+            ], else_=2)
+        return QuerySequence(query.filter(
+            Member.role.in_((MemberRole.owner,
+                             MemberRole.moderator,
+                             MemberRole.member))
+            ).order_by(Member.list_id, role_order, email, Member.id))
 
     @dbconnection
     def get_member(self, store, member_id):
@@ -387,7 +394,7 @@ class SubscriptionService:
         # the given address.
         user_manager = getUtility(IUserManager)
         if subscriber is None and list_id is None and role is None:
-            return []
+            return QuerySequence()
         # Querying for the subscriber is the most complicated part, because
         # the parameter can either be an email address or a user id.
         query = []
@@ -398,7 +405,7 @@ class SubscriptionService:
                 user = user_manager.get_user(subscriber)
                 # This probably could be made more efficient.
                 if address is None or user is None:
-                    return []
+                    return QuerySequence()
                 query.append(or_(Member.address_id == address.id,
                                  Member.user_id == user.id))
             else:
@@ -407,7 +414,7 @@ class SubscriptionService:
                 address_ids = list(address.id for address in user.addresses
                                    if address.id is not None)
                 if len(address_ids) == 0 or user is None:
-                    return []
+                    return QuerySequence()
                 query.append(or_(Member.user_id == user.id,
                                  Member.address_id.in_(address_ids)))
         # Calculate the rest of the query expression, which will get And'd
@@ -416,8 +423,10 @@ class SubscriptionService:
             query.append(Member.list_id == list_id)
         if role is not None:
             query.append(Member.role == role)
-        results = store.query(Member).filter(and_(*query))
-        return sorted(results, key=_membership_sort_key)
+        results, email = _with_subscribed_email(
+            store.query(Member).filter(and_(*query)))
+        return QuerySequence(
+            results.order_by(Member.list_id, email, Member.role, Member.id))
 
     def __iter__(self):
         for member in self.get_members():
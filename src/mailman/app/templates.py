@@ -22,7 +22,13 @@ __all__ = [
     ]
 
 
+import time
+import threading
+
+from collections import OrderedDict
 from contextlib import closing
+from lazr.config import as_timedelta
+from mailman.config import config
 from mailman.interfaces.languages import ILanguageManager
 from mailman.interfaces.listmanager import IListManager
 from mailman.interfaces.templates import ITemplateLoader
@@ -90,13 +96,48 @@ class MailmanHandler(BaseHandler):
 
 @implementer(ITemplateLoader)
 class TemplateLoader:
-    """Loader of templates, with caching and support for mailman:// URIs."""
+    """Loader of templates, with caching and support for mailman:// URIs.
+
+    The most recently used templates are cached, keyed by their URI and the
+    template directory.  For mailman: URIs, the URI names the template, the
+    mailing list and the language, so the cache maps these to the template
+    found by the search.  A cached template is only looked up again after
+    `[mailman]template_cache_check`, which finds changed templates as well
+    as new ones earlier in the search order.
+    """
 
     def __init__(self):
         opener = build_opener(MailmanHandler())
         install_opener(opener)
+        # Map (uri, template_dir) keys to (text, expiry time) in least
+        # recently used order.
+        self._templates = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
 
     def get(self, uri):
         """See `ITemplateLoader`."""
+        key = (uri, config.TEMPLATE_DIR)
+        with self._lock:
+            entry = self._templates.get(key)
+            if entry is not None and time.time() < entry[1]:
+                self._templates.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
         with closing(urlopen(uri)) as fp:
-            return fp.read()
+            text = fp.read()
+        check = as_timedelta(config.mailman.template_cache_check)
+        size = int(config.mailman.template_cache_size)
+        with self._lock:
+            self._templates[key] = (text, time.time() + check.total_seconds())
+            self._templates.move_to_end(key)
+            while len(self._templates) > size:
+                self._templates.popitem(last=False)
+        return text
+
+    def flush(self):
+        """See `ITemplateLoader`."""
+        with self._lock:
+            self._templates.clear()
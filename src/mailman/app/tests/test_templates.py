@@ -18,6 +18,7 @@
 """Test the template downloader API."""
 
 __all__ = [
+    'TestTemplateCache',
     'TestTemplateLoader',
     ]
 
@@ -30,6 +31,7 @@ import unittest
 from mailman.app.lifecycle import create_list
 from mailman.config import config
 from mailman.interfaces.templates import ITemplateLoader
+from mailman.testing.helpers import configuration
 from mailman.testing.layers import ConfigLayer
 from urllib.error import URLError
 from zope.component import getUtility
@@ -131,3 +133,80 @@ class TestTemplateLoader(unittest.TestCase):
         content = self._loader.get('mailman:///it/demo.txt')
         self.assertIsInstance(content, str)
         self.assertEqual(content, test_text.decode('utf-8'))
+
+
+
+class TestTemplateCache(unittest.TestCase):
+    """Test the caching of templates."""
+
+    layer = ConfigLayer
+
+    def setUp(self):
+        self.var_dir = tempfile.mkdtemp()
+        config.push('template config', """\
+        [paths.testing]
+        var_dir: {0}
+        """.format(self.var_dir))
+        self._path = os.path.join(self.var_dir, 'templates', 'site', 'en')
+        os.makedirs(self._path)
+        self._write('demo.txt', 'Test content')
+        self._loader = getUtility(ITemplateLoader)
+        self._loader.flush()
+
+    def tearDown(self):
+        config.pop('template config')
+        shutil.rmtree(self.var_dir)
+
+    def _write(self, name, text, path=None):
+        with open(os.path.join(path or self._path, name), 'w') as fp:
+            print(text, end='', file=fp)
+
+    def test_cached(self):
+        hits, misses = self._loader.hits, self._loader.misses
+        self._loader.get('mailman:///demo.txt')
+        self._write('demo.txt', 'Changed content')
+        content = self._loader.get('mailman:///demo.txt')
+        self.assertEqual(content, 'Test content')
+        self.assertEqual(self._loader.hits - hits, 1)
+        self.assertEqual(self._loader.misses - misses, 1)
+
+    def test_flush(self):
+        self._loader.get('mailman:///demo.txt')
+        self._write('demo.txt', 'Changed content')
+        self._loader.flush()
+        content = self._loader.get('mailman:///demo.txt')
+        self.assertEqual(content, 'Changed content')
+
+    @configuration('mailman', template_cache_check='0s')
+    def test_check(self):
+        # Once a template has been cached for long enough, it is looked up
+        # again, which finds new templates overriding it.
+        create_list('test@example.com')
+        uri = 'mailman:///test@example.com/en/demo.txt'
+        self.assertEqual(self._loader.get(uri), 'Test content')
+        path = os.path.join(
+            self.var_dir, 'templates', 'lists', 'test@example.com', 'en')
+        os.makedirs(path)
+        self._write('demo.txt', 'List content', path)
+        self.assertEqual(self._loader.get(uri), 'List content')
+
+    @configuration('mailman', template_cache_size=2)
+    def test_least_recently_used_are_dropped(self):
+        for name in ('one.txt', 'two.txt', 'three.txt'):
+            self._write(name, name)
+        self._loader.get('mailman:///one.txt')
+        self._loader.get('mailman:///two.txt')
+        self._loader.get('mailman:///one.txt')
+        self._loader.get('mailman:///three.txt')
+        misses = self._loader.misses
+        self._loader.get('mailman:///one.txt')
+        self._loader.get('mailman:///three.txt')
+        self.assertEqual(self._loader.misses, misses)
+        self._loader.get('mailman:///two.txt')
+        self.assertEqual(self._loader.misses, misses + 1)
+
+    def test_missing_templates_are_not_cached(self):
+        with self.assertRaises(URLError):
+            self._loader.get('mailman:///missing.txt')
+        self._write('missing.txt', 'Found')
+        self.assertEqual(self._loader.get('mailman:///missing.txt'), 'Found')
@@ -75,3 +75,8 @@ class MailArchive:
                 listid=mlist.list_id,
                 recipients=[self.recipient])
         return None
+
+    def archive_messages(self, mlist, messages):
+        """See `IArchiver`."""
+        for msg in messages:
+            self.archive_message(mlist, msg)
@@ -15,28 +15,146 @@
 # You should have received a copy of the GNU General Public License along with
 # GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
 
-"""MHonArc archiver."""
+"""MHonArc archiver.
+
+MHonArc is run for every message as it is archived, unless a batch size is
+configured.  Then the messages are spooled into a mailbox per mailing list,
+which MHonArc adds to the archive in a single run once it holds enough
+messages, or once its first message has waited long enough.  The spool is
+moved aside into a batch mailbox of its own before MHonArc is run.  Should
+MHonArc fail, the batch mailbox is kept and handed to MHonArc again later.
+"""
 
 __all__ = [
     'MHonArc',
     ]
 
 
+import os
+import time
+import fcntl
 import logging
+import calendar
+import tempfile
 import subprocess
 
+from email.utils import parsedate
+from flufl.lock import Lock
+from lazr.config import as_boolean, as_timedelta
+from mailbox import mbox
 from mailman.config import config
 from mailman.config.config import external_configuration
+from mailman.core.metrics import metrics
+from mailman.core.queuefile import message_bytes
 from mailman.interfaces.archiver import IArchiver
+from mailman.utilities.filesystem import makedirs, sync_files
 from mailman.utilities.string import expand
+from shlex import quote
 from urllib.parse import urljoin
 from zope.interface import implementer
 
 
 log = logging.getLogger('mailman.archiver')
 
+SPOOL_EXT = '.mbox'
+BATCH_EXT = '.batch'
+
+# The long-lived shells running MHonArc in this process, by list name.
+_workers = {}
+
+# The inode, size and number of messages of each list's spool or batch
+# mailbox when this process last counted it, by list name.
+_counts = {}
+
+
+
+class _Worker:
+    """A long-lived shell which runs MHonArc for one mailing list.
+
+    The shell is fed a command line for every run, so the archive runner
+    doesn't have to fork itself each time.
+    """
+
+    def __init__(self):
+        self._tempdir = tempfile.TemporaryDirectory()
+        self._proc = subprocess.Popen(
+            ['/bin/sh'], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self.last_run = time.time()
+
+    def run(self, command, text):
+        """Run a command in the shell.
+
+        :param command: The command line.
+        :type command: str
+        :param text: What to feed the command on its standard input.
+        :type text: bytes or None
+        :return: The command's exit code, standard output and standard
+            error.
+        :raise OSError: if the shell is gone.
+        """
+        self.last_run = time.time()
+        paths = [os.path.join(self._tempdir.name, name)
+                 for name in ('stdin', 'stdout', 'stderr')]
+        with open(paths[0], 'wb') as fp:
+            fp.write(b'' if text is None else text)
+        line = '{{ {0}\n}} <{1} >{2} 2>{3}; echo $?\n'.format(
+            command, *[quote(path) for path in paths])
+        self._proc.stdin.write(line.encode('utf-8'))
+        self._proc.stdin.flush()
+        status = self._proc.stdout.readline()
+        if len(status) == 0:
+            raise OSError('The MHonArc worker shell is gone')
+        output = []
+        for path in paths[1:]:
+            with open(path, 'rb') as fp:
+                output.append(fp.read())
+        return (int(status), output[0], output[1])
+
+    def close(self):
+        """Stop the shell."""
+        self._proc.communicate()
+        self._tempdir.cleanup()
+
+
+def _spool_directory():
+    return os.path.join(config.ARCHIVE_DIR, 'mhonarc-spool')
+
+
+def _spooled_at(path):
+    # When the first message in a spool mailbox was spooled, according to
+    # its From_ line, or None if the mailbox is empty.
+    with open(path, 'rb') as fp:
+        line = fp.readline()
+    if len(line) == 0:
+        return None
+    parts = line.decode('ascii', 'replace').split(None, 2)
+    date = (parsedate(parts[2]) if len(parts) == 3 else None)
+    # A From_ line which can't be read makes the spool due right away.
+    return (0 if date is None else calendar.timegm(date))
+
+
+def _count(listname, fp):
+    # The number of messages in a list's spool or batch mailbox.  Only what
+    # was added since this process last counted the mailbox is read.
+    stat = os.fstat(fp.fileno())
+    inode, size, count = _counts.get(listname, (None, 0, 0))
+    if inode != stat.st_ino or size > stat.st_size:
+        size = count = 0
+    elif size < stat.st_size:
+        # What was added since starts with a From_ line, unless the inode
+        # has been reused for another mailbox.
+        fp.seek(size)
+        if fp.read(5) != b'From ':
+            size = count = 0
+    if size < stat.st_size:
+        fp.seek(size)
+        # Every message starts with a From_ line; From_ lines in the
+        # messages themselves are escaped.
+        count += sum(1 for line in fp if line.startswith(b'From '))
+    return count
+
+
 
-
 @implementer(IArchiver)
 class MHonArc:
     """Local MHonArc archiver."""
@@ -50,6 +168,15 @@ class MHonArc:
             config.archiver.mhonarc.configuration)
         self.base_url = archiver_config.get('general', 'base_url')
         self.command = archiver_config.get('general', 'command')
+        # Older configuration files don't have the batching options.
+        self.batch_size = int(archiver_config.get(
+            'general', 'batch_size', fallback='1'))
+        self.batch_time = as_timedelta(archiver_config.get(
+            'general', 'batch_time', fallback='1m')).total_seconds()
+        self.worker = as_boolean(archiver_config.get(
+            'general', 'worker', fallback='no'))
+        self.worker_idle = as_timedelta(archiver_config.get(
+            'general', 'worker_idle', fallback='10m')).total_seconds()
 
     def list_url(self, mlist):
         """See `IArchiver`."""
@@ -75,18 +202,188 @@ class MHonArc:
 
     def archive_message(self, mlist, msg):
         """See `IArchiver`."""
-        substitutions = config.__dict__.copy()
-        substitutions['listname'] = mlist.fqdn_listname
-        command = expand(self.command, substitutions)
-        proc = subprocess.Popen(
-            command, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-            universal_newlines=True, shell=True)
-        stdout, stderr = proc.communicate(msg.as_string())
-        if proc.returncode != 0:
-            log.error('%s: mhonarc subprocess had non-zero exit code: %s' %
-                      (msg['message-id'], proc.returncode))
-        log.info(stdout)
-        log.error(stderr)
+        if self.batch_size > 1:
+            self._spool(mlist.fqdn_listname, [msg])
+        else:
+            self._run(mlist.fqdn_listname, [], message_bytes(msg, 'utf-8'),
+                      msg['message-id'])
         # Can we get more information, such as the url to the message just
         # archived, out of MHonArc?
         return None
+
+    def archive_messages(self, mlist, messages):
+        """See `IArchiver`.
+
+        The messages are added to the list's spool when batching, and
+        otherwise written to a temporary mailbox, which MHonArc adds to the
+        archive in a single run.
+        """
+        messages = list(messages)
+        if self.batch_size > 1:
+            self._spool(mlist.fqdn_listname, messages)
+            return
+        if len(messages) < 2:
+            for msg in messages:
+                self.archive_message(mlist, msg)
+            return
+        with tempfile.TemporaryDirectory() as tempdir:
+            path = os.path.join(tempdir, 'batch.mbox')
+            mailbox = mbox(path)
+            for msg in messages:
+                mailbox.add(message_bytes(msg, 'utf-8'))
+            mailbox.close()
+            self._run(mlist.fqdn_listname, [path], None,
+                      '{0} messages'.format(len(messages)), len(messages))
+
+    def flush(self):
+        """Hand MHonArc the spools that have waited long enough.
+
+        Batches which MHonArc failed on are retried once they have waited
+        long enough again, and worker shells which have been idle for long
+        enough are stopped.  The archive runner calls this every once in a
+        while.
+        """
+        idle = time.time() - self.worker_idle
+        for listname, worker in list(_workers.items()):
+            if worker.last_run <= idle:
+                del _workers[listname]
+                worker.close()
+        spool_dir = _spool_directory()
+        try:
+            filenames = sorted(os.listdir(spool_dir))
+        except FileNotFoundError:
+            return
+        due = time.time() - self.batch_time
+        for filename in filenames:
+            path = os.path.join(spool_dir, filename)
+            if filename.endswith(SPOOL_EXT):
+                spooled_at = _spooled_at(path)
+                if spooled_at is not None and spooled_at <= due:
+                    self._flush(filename[:-len(SPOOL_EXT)])
+            elif filename.endswith(BATCH_EXT):
+                try:
+                    if os.stat(path).st_mtime <= due:
+                        self._run_batch(path)
+                except FileNotFoundError:
+                    # Another process has archived it.
+                    pass
+
+    def close(self):
+        """Stop the worker shells.
+
+        The archive runner calls this when it stops.
+        """
+        for worker in _workers.values():
+            worker.close()
+        _workers.clear()
+
+    def _lock(self, listname):
+        return Lock(os.path.join(
+            config.LOCK_DIR, '{0}-mhonarc.lock'.format(listname)))
+
+    def _spool(self, listname, messages):
+        # Append the messages to the list's spool mailbox, and hand it to
+        # MHonArc if it is due.
+        spool_dir = _spool_directory()
+        makedirs(spool_dir)
+        path = os.path.join(spool_dir, listname + SPOOL_EXT)
+        from_line = 'From mailman {0}\n'.format(
+            time.asctime(time.gmtime(time.time()))).encode('ascii')
+        chunks = []
+        for msg in messages:
+            text = message_bytes(msg, 'utf-8')
+            if text.startswith(b'From '):
+                # Replace the message's own From_ line.
+                text = text.partition(b'\n')[2]
+            chunks.append(from_line)
+            chunks.append(text.replace(b'\nFrom ', b'\n>From '))
+            chunks.append(b'\n' if text.endswith(b'\n') else b'\n\n')
+        with self._lock(listname):
+            with open(path, 'a+b') as fp:
+                count = _count(listname, fp) + len(messages)
+                fp.write(b''.join(chunks))
+                fp.flush()
+                stat = os.fstat(fp.fileno())
+                _counts[listname] = (stat.st_ino, stat.st_size, count)
+            # The messages must be safe before their queue files are gone.
+            sync_files([path])
+        spooled_at = _spooled_at(path)
+        if (count >= self.batch_size or
+                (spooled_at is not None and
+                 spooled_at <= time.time() - self.batch_time)):
+            self._flush(listname)
+
+    def _flush(self, listname):
+        # Move the list's spool aside into a batch, and run MHonArc on it.
+        spool_dir = _spool_directory()
+        path = os.path.join(spool_dir, listname + SPOOL_EXT)
+        batch_path = os.path.join(spool_dir, '{0}+{1!r}+{2}{3}'.format(
+            listname, time.time(), os.getpid(), BATCH_EXT))
+        with self._lock(listname):
+            try:
+                os.rename(path, batch_path)
+            except FileNotFoundError:
+                # Another process has flushed it.
+                return
+        self._run_batch(batch_path)
+
+    def _run_batch(self, path):
+        # Run MHonArc on a batch mailbox, which is removed when MHonArc
+        # succeeds.  Otherwise it is left for a later retry.
+        listname = os.path.basename(path).rsplit('+', 2)[0]
+        try:
+            fp = open(path, 'rb')
+        except FileNotFoundError:
+            return
+        with fp:
+            try:
+                fcntl.flock(fp.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Another process is running MHonArc on it.
+                return
+            if os.fstat(fp.fileno()).st_nlink == 0:
+                # Another process has archived it.
+                return
+            count = _count(listname, fp)
+            if self._run(listname, [path], None,
+                         '{0} messages'.format(count), count):
+                os.remove(path)
+                _counts.pop(listname, None)
+            else:
+                os.utime(path)
+
+    def _run(self, listname, mailboxes, text, what, count=1):
+        # Run MHonArc on the given mailboxes, or on the message text.  Return
+        # whether it succeeded.
+        substitutions = config.__dict__.copy()
+        substitutions['listname'] = listname
+        command = expand(self.command, substitutions)
+        if len(mailboxes) > 0:
+            command = ' '.join([command] + [quote(path) for path in mailboxes])
+        metrics.increment('mailman_mhonarc_runs_total')
+        metrics.increment('mailman_mhonarc_messages_total', count)
+        with metrics.timer('mailman_mhonarc_run_seconds'):
+            if self.worker:
+                worker = _workers.get(listname)
+                if worker is None:
+                    worker = _workers[listname] = _Worker()
+                try:
+                    returncode, stdout, stderr = worker.run(command, text)
+                except OSError:
+                    log.exception('%s: mhonarc worker failed' % what)
+                    del _workers[listname]
+                    returncode, stdout, stderr = None, b'', b''
+            else:
+                proc = subprocess.Popen(
+                    command, stdin=subprocess.PIPE,
+                    stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                    shell=True)
+                stdout, stderr = proc.communicate(text)
+                returncode = proc.returncode
+        if returncode != 0:
+            metrics.increment('mailman_mhonarc_failures_total')
+            log.error('%s: mhonarc subprocess had non-zero exit code: %s' %
+                      (what, returncode))
+        log.info(stdout.decode('utf-8', 'replace'))
+        log.error(stderr.decode('utf-8', 'replace'))
+        return returncode == 0
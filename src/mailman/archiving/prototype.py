@@ -30,6 +30,7 @@ from datetime import timedelta
 from flufl.lock import Lock, TimeOutError
 from mailbox import Maildir
 from mailman.config import config
+from mailman.core.queuefile import message_bytes
 from mailman.interfaces.archiver import IArchiver
 from urllib.parse import urljoin
 from zope.interface import implementer
@@ -74,6 +75,16 @@ class Prototype:
 
         This archiver saves messages into a maildir.
         """
+        Prototype.archive_messages(mlist, [message])
+        # Can we get return the URL of the archived message?
+        return None
+
+    @staticmethod
+    def archive_messages(mlist, messages):
+        """See `IArchiver`.
+
+        All the messages are added to the maildir under a single lock.
+        """
         archive_dir = os.path.join(config.ARCHIVE_DIR, 'prototype')
         try:
             os.makedirs(archive_dir, 0o775)
@@ -101,19 +112,24 @@ class Prototype:
         lock = Lock(lock_file)
         try:
             lock.lock(timeout=timedelta(seconds=1))
-            # Add the message to the maildir.  The return value could be used
-            # to construct the file path if necessary.  E.g.
+            # Add the messages to the maildir.  The return value could be
+            # used to construct the file path if necessary.  E.g.
             #
             # os.path.join(archive_dir, mlist.fqdn_listname, 'new',
             #              message_key)
-            mailbox.add(message)
+            #
+            # Adding the messages' bytes saves flattening the messages which
+            # are already flat.  A message parsed from text which isn't ASCII
+            # has no bytes, and the maildir can't add it either, so its text
+            # is stored as UTF-8.
+            for message in messages:
+                mailbox.add(message_bytes(message, 'utf-8'))
         except TimeOutError:
             # Log the error and go on.
-            log.error('Unable to acquire prototype archiver lock for {0}, '
-                      'discarding: {1}'.format(
-                          mlist.fqdn_listname,
-                          message.get('message-id', 'n/a')))
+            for message in messages:
+                log.error('Unable to acquire prototype archiver lock for {0}, '
+                          'discarding: {1}'.format(
+                              mlist.fqdn_listname,
+                              message.get('message-id', 'n/a')))
         finally:
             lock.unlock(unconditionally=True)
-        # Can we get return the URL of the archived message?
-        return None
@@ -0,0 +1,224 @@
+# Copyright (C) 2012-2015 by the Free Software Foundation, Inc.
+#
+# This file is part of GNU Mailman.
+#
+# GNU Mailman is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# GNU Mailman is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test the MHonArc archiver."""
+
+__all__ = [
+    'TestMHonArc',
+    ]
+
+
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+from mailman.app.lifecycle import create_list
+from mailman.archiving import mhonarc
+from mailman.archiving.mhonarc import MHonArc
+from mailman.config import config
+from mailman.core.metrics import Registry
+from mailman.testing.helpers import (
+    specialized_message_from_string as mfs)
+from mailman.testing.layers import ConfigLayer
+from unittest.mock import patch
+
+
+
+class TestMHonArc(unittest.TestCase):
+    """Test the MHonArc archiver."""
+
+    layer = ConfigLayer
+
+    def setUp(self):
+        self._mlist = create_list('test@example.com')
+        self._tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self._tempdir)
+        # The command appends whatever it gets to a file, unless it is told
+        # to fail.
+        self._archived = os.path.join(self._tempdir, 'archived')
+        self._fail = os.path.join(self._tempdir, 'fail')
+        self._cfg = os.path.join(self._tempdir, 'mhonarc.cfg')
+        config.push('mhonarc', """
+        [paths.testing]
+        archive_dir: {0}/archives
+        [archiver.mhonarc]
+        configuration: {1}
+        """.format(self._tempdir, self._cfg))
+        self.addCleanup(config.pop, 'mhonarc')
+        self.addCleanup(self._close_workers)
+        self.addCleanup(mhonarc._counts.clear)
+        self._spool_dir = os.path.join(config.ARCHIVE_DIR, 'mhonarc-spool')
+        self._msgs = []
+        for i in range(3):
+            self._msgs.append(mfs("""\
+From: anne@example.com
+To: test@example.com
+Subject: Message {0}
+Message-ID: <ant{0}>
+
+From here on, this is message {0}.
+""".format(i)))
+
+    def _close_workers(self):
+        for worker in mhonarc._workers.values():
+            worker.close()
+        mhonarc._workers.clear()
+
+    def _configure(self, batch_size=1, worker='no'):
+        with open(self._cfg, 'w') as fp:
+            print("""\
+[general]
+base_url: http://$hostname/archives/$fqdn_listname
+command: test ! -e {0} && cat >> {1}
+batch_size: {2}
+batch_time: 1m
+worker: {3}
+""".format(self._fail, self._archived, batch_size, worker), file=fp)
+        return MHonArc()
+
+    def _read_archived(self):
+        try:
+            with open(self._archived) as fp:
+                return fp.read()
+        except FileNotFoundError:
+            return ''
+
+    def test_no_batching(self):
+        # Every message is handed to MHonArc on its standard input.
+        archiver = self._configure()
+        archiver.archive_message(self._mlist, self._msgs[0])
+        archived = self._read_archived()
+        self.assertIn('Message-ID: <ant0>', archived)
+        self.assertFalse(archived.startswith('From '))
+        self.assertFalse(os.path.exists(self._spool_dir))
+
+    def test_spool(self):
+        # Messages wait in the spool until there are enough of them.
+        archiver = self._configure(batch_size=3)
+        registry = Registry()
+        with patch('mailman.archiving.mhonarc.metrics', registry):
+            archiver.archive_messages(self._mlist, self._msgs[:2])
+            self.assertEqual(self._read_archived(), '')
+            self.assertEqual(os.listdir(self._spool_dir),
+                             ['test@example.com.mbox'])
+            archiver.archive_message(self._mlist, self._msgs[2])
+        archived = self._read_archived()
+        self.assertEqual(archived.count('\nFrom mailman '), 2)
+        self.assertEqual(archived.count('\n>From here on'), 3)
+        for i in range(3):
+            self.assertIn('Message-ID: <ant{0}>'.format(i), archived)
+        self.assertEqual(os.listdir(self._spool_dir), [])
+        counters = {name: value for name, labels, value
+                    in registry.snapshot()['counters']}
+        self.assertEqual(counters['mailman_mhonarc_runs_total'], 1)
+        self.assertEqual(counters['mailman_mhonarc_messages_total'], 3)
+
+    def test_spool_count(self):
+        # Only what was added to the spool since this process last counted
+        # it is read.  Messages spooled by other processes are counted too.
+        archiver = self._configure(batch_size=5)
+        registry = Registry()
+        with patch('mailman.archiving.mhonarc.metrics', registry):
+            archiver.archive_messages(self._mlist, self._msgs[:2])
+            self.assertEqual(mhonarc._counts['test@example.com'][2], 2)
+            mhonarc._counts.clear()
+            archiver.archive_message(self._mlist, self._msgs[2])
+            self.assertEqual(mhonarc._counts['test@example.com'][2], 3)
+            self.assertEqual(self._read_archived(), '')
+            archiver.archive_messages(self._mlist, self._msgs[:2])
+        self.assertEqual(os.listdir(self._spool_dir), [])
+        counters = {name: value for name, labels, value
+                    in registry.snapshot()['counters']}
+        self.assertEqual(counters['mailman_mhonarc_messages_total'], 5)
+
+    def test_flush(self):
+        # Spooled messages are handed to MHonArc once they've waited long
+        # enough.
+        archiver = self._configure(batch_size=10)
+        archiver.archive_message(self._mlist, self._msgs[0])
+        archiver.flush()
+        self.assertEqual(self._read_archived(), '')
+        later = time.time() + 61
+        with patch('mailman.archiving.mhonarc.time.time', return_value=later):
+            archiver.flush()
+        self.assertIn('Message-ID: <ant0>', self._read_archived())
+        self.assertEqual(os.listdir(self._spool_dir), [])
+
+    def test_failed_batch_is_retried(self):
+        # A batch which MHonArc fails on is kept, and retried later.
+        archiver = self._configure(batch_size=2)
+        open(self._fail, 'w').close()
+        registry = Registry()
+        with patch('mailman.archiving.mhonarc.metrics', registry):
+            archiver.archive_messages(self._mlist, self._msgs[:2])
+        counters = {name: value for name, labels, value
+                    in registry.snapshot()['counters']}
+        self.assertEqual(counters['mailman_mhonarc_failures_total'], 1)
+        batches = os.listdir(self._spool_dir)
+        self.assertEqual(len(batches), 1)
+        self.assertTrue(batches[0].startswith('test@example.com+'))
+        self.assertTrue(batches[0].endswith('.batch'))
+        os.remove(self._fail)
+        # The batch isn't retried right away.
+        archiver.flush()
+        self.assertEqual(self._read_archived(), '')
+        later = time.time() + 61
+        with patch('mailman.archiving.mhonarc.time.time', return_value=later):
+            archiver.flush()
+        archived = self._read_archived()
+        self.assertIn('Message-ID: <ant0>', archived)
+        self.assertIn('Message-ID: <ant1>', archived)
+        self.assertEqual(os.listdir(self._spool_dir), [])
+
+    def test_worker(self):
+        # A long-lived shell runs MHonArc for the list.
+        archiver = self._configure(worker='yes')
+        archiver.archive_message(self._mlist, self._msgs[0])
+        archiver.archive_messages(self._mlist, self._msgs[1:])
+        self.assertEqual(list(mhonarc._workers), ['test@example.com'])
+        archived = self._read_archived()
+        for i in range(3):
+            self.assertIn('Message-ID: <ant{0}>'.format(i), archived)
+
+    def test_worker_failure(self):
+        # The worker reports MHonArc's failures.
+        archiver = self._configure(batch_size=2, worker='yes')
+        open(self._fail, 'w').close()
+        archiver.archive_messages(self._mlist, self._msgs[:2])
+        self.assertEqual(self._read_archived(), '')
+        self.assertEqual(len(os.listdir(self._spool_dir)), 1)
+
+    def test_idle_worker(self):
+        # A worker which has been idle for long enough is stopped.
+        archiver = self._configure(worker='yes')
+        archiver.archive_message(self._mlist, self._msgs[0])
+        archiver.flush()
+        self.assertEqual(list(mhonarc._workers), ['test@example.com'])
+        later = time.time() + 601
+        with patch('mailman.archiving.mhonarc.time.time', return_value=later):
+            archiver.flush()
+        self.assertEqual(mhonarc._workers, {})
+
+    def test_close(self):
+        # Closing the archiver stops its workers.
+        archiver = self._configure(worker='yes')
+        archiver.archive_message(self._mlist, self._msgs[0])
+        self.assertEqual(list(mhonarc._workers), ['test@example.com'])
+        archiver.close()
+        self.assertEqual(mhonarc._workers, {})
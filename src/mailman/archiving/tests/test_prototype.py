@@ -39,6 +39,7 @@ from mailman.testing.helpers import (
     specialized_message_from_string as mfs)
 from mailman.testing.layers import ConfigLayer
 from mailman.utilities.email import add_message_hash
+from unittest.mock import patch
 
 
 class TestPrototypeArchiver(unittest.TestCase):
@@ -169,3 +170,34 @@ but the water deserves to be swum.
         with open(os.path.join(new_path, archived_messages[0])) as fp:
             archived_message = message_from_file(fp)
         self.assertEqual(self._msg.as_string(), archived_message.as_string())
+
+    def test_archive_non_ascii_text(self):
+        # A message parsed from text which isn't ASCII is archived as UTF-8.
+        msg = mfs(self._msg.as_string().replace(
+            'Tests are better than no tests', 'Caf\xe9 \u20ac'))
+        Prototype.archive_messages(self._mlist, [msg])
+        new_path = os.path.join(
+            config.ARCHIVE_DIR, 'prototype', self._mlist.fqdn_listname, 'new')
+        archived_messages = list(os.listdir(new_path))
+        self.assertEqual(len(archived_messages), 1)
+        with open(os.path.join(new_path, archived_messages[0]), 'rb') as fp:
+            archived = fp.read()
+        self.assertIn('Caf\xe9 \u20ac'.encode('utf-8'), archived)
+
+    def test_archive_messages(self):
+        # Several messages are archived under a single lock.
+        second = mfs(self._msg.as_string())
+        del second['message-id']
+        del second['x-message-id-hash']
+        second['Message-ID'] = '<bee>'
+        add_message_hash(second)
+        with patch('mailman.archiving.prototype.Lock', wraps=Lock) as lock:
+            Prototype.archive_messages(self._mlist, [self._msg, second])
+        self.assertEqual(lock.call_count, 1)
+        new_path = os.path.join(
+            config.ARCHIVE_DIR, 'prototype', self._mlist.fqdn_listname, 'new')
+        message_ids = set()
+        for filename in os.listdir(new_path):
+            with open(os.path.join(new_path, filename)) as fp:
+                message_ids.add(message_from_file(fp)['message-id'])
+        self.assertEqual(message_ids, {'<ant>', '<bee>'})
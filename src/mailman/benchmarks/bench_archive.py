@@ -0,0 +1,106 @@
+# Copyright (C) 2015 by the Free Software Foundation, Inc.
+#
+# This file is part of GNU Mailman.
+#
+# GNU Mailman is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# GNU Mailman is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Cost of giving a message to several archivers, by copying method.
+
+Each archiver gets a copy of the message with its Date header clobbered,
+and flattens it.  A deep copy has to be flattened again by every archiver,
+while lazy copies share the bytes the message was flattened to once, and
+only have their headers generated again.
+"""
+
+__all__ = [
+    'main',
+    ]
+
+
+import copy
+
+from email import message_from_string
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from mailman.benchmarks.helpers import argument_parser, best_of, print_table
+from mailman.core.queuefile import lazy_copy, message_bytes
+from mailman.email.message import Message
+
+
+DATE = 'Mon, 01 Aug 2005 07:49:23 +0000'
+
+
+def _make_message(attachments):
+    # A post with a text part and some attachments, as it was received.
+    msg = MIMEMultipart()
+    msg['From'] = 'anne@example.com'
+    msg['To'] = 'bench@example.com'
+    msg['Subject'] = 'Archiving'
+    msg['Message-ID'] = '<ant@example.com>'
+    msg['Date'] = DATE
+    msg.attach(MIMEText('A line of the message body.\n' * 50))
+    for i in range(attachments):
+        msg.attach(MIMEApplication(bytes(range(256)) * 200))
+    return message_from_string(msg.as_string(), Message)
+
+
+def _clobber(msg_copy):
+    del msg_copy['date']
+    msg_copy['Date'] = DATE
+    msg_copy['X-Original-Date'] = DATE
+
+
+def _deep_copies(msg, archivers):
+    for i in range(archivers):
+        msg_copy = copy.deepcopy(msg)
+        _clobber(msg_copy)
+        msg_copy.as_string()
+
+
+def _lazy_copies(msg, archivers):
+    raw = message_bytes(msg)
+    for i in range(archivers):
+        msg_copy = lazy_copy(msg, raw)
+        _clobber(msg_copy)
+        msg_copy.as_string()
+
+
+def main():
+    parser = argument_parser(__doc__.splitlines()[0])
+    parser.add_argument(
+        '-a', '--archivers', default='1,2,4',
+        help='Comma separated numbers of enabled archivers.')
+    parser.add_argument(
+        '-n', '--attachments', type=int, default=4,
+        help='The number of 50KB attachments in the message.')
+    args = parser.parse_args()
+    headers = ['archivers', 'deep copies', 'lazy copies', 'speedup']
+    rows = []
+    msg = _make_message(args.attachments)
+    for archivers in (int(value) for value in args.archivers.split(',')):
+        row = [archivers]
+        for function in (_deep_copies, _lazy_copies):
+            row.append(1000 * best_of(
+                lambda: function(msg, archivers), args.repeat))
+        row.append(row[1] / row[2])
+        rows.append(row)
+    print('Milliseconds per message with {0} attachments.'.format(
+        args.attachments))
+    print_table(headers, rows)
+
+
+
+if __name__ == '__main__':
+    main()
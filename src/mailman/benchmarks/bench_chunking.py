@@ -0,0 +1,161 @@
+# Copyright (C) 2015 by the Free Software Foundation, Inc.
+#
+# This file is part of GNU Mailman.
+#
+# GNU Mailman is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# GNU Mailman is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Bulk delivery chunk counts and times with TLD and domain chunking.
+
+The recipients are a made up but realistic corpus: a few big freemail
+providers, several of which share mail exchangers, and a long tail of small
+domains.  For each chunking strategy this counts the SMTP transactions to the
+MTA, and the transactions the MTA then has to make when it relays each chunk
+to the mail exchangers of the domains in it.  The delivery time is measured
+against the test suite's fake SMTP server, with a delay added to every
+transaction as in bench_delivery.
+"""
+
+__all__ = [
+    'main',
+    ]
+
+
+import random
+
+from mailman.app.lifecycle import create_list
+from mailman.benchmarks.bench_delivery import _slow_sendmail
+from mailman.benchmarks.helpers import (
+    argument_parser, best_of, print_table, test_layer)
+from mailman.mta.bulk import BulkDelivery, DomainBulkDelivery
+from mailman.mta.connection import Connection
+from mailman.testing.helpers import specialized_message_from_string as mfs
+from mailman.testing.layers import SMTPLayer
+
+
+# The share of recipients at the big providers, and their mail exchangers.
+PROVIDERS = [
+    ('gmail.com', 0.30, 'google'),
+    ('googlemail.com', 0.01, 'google'),
+    ('yahoo.com', 0.09, 'yahoo'),
+    ('ymail.com', 0.01, 'yahoo'),
+    ('hotmail.com', 0.07, 'microsoft'),
+    ('outlook.com', 0.04, 'microsoft'),
+    ('live.com', 0.02, 'microsoft'),
+    ('msn.com', 0.01, 'microsoft'),
+    ('aol.com', 0.03, 'aol'),
+    ('icloud.com', 0.03, 'apple'),
+    ('comcast.net', 0.02, 'comcast'),
+    ('gmx.de', 0.02, 'gmx'),
+    ('web.de', 0.02, 'web.de'),
+    ]
+# The rest are spread over small domains, some of them hosted by the big
+# providers.
+SMALL_DOMAIN_SUFFIXES = ['com', 'org', 'net', 'edu', 'de', 'co.uk', 'fr']
+
+
+
+def make_corpus(count, seed=0):
+    """Return the recipients and the MX groups of their domains."""
+    rng = random.Random(seed)
+    mx_groups = {domain: group for domain, share, group in PROVIDERS}
+    small_domains = []
+    for i in range(max(count // 20, 1)):
+        domain = 'domain{0}.{1}'.format(
+            i, rng.choice(SMALL_DOMAIN_SUFFIXES))
+        if rng.random() < 0.1:
+            mx_groups[domain] = 'google'
+        small_domains.append(domain)
+    recipients = set()
+    while len(recipients) < count:
+        pick = rng.random()
+        for domain, share, group in PROVIDERS:
+            if pick < share:
+                break
+            pick -= share
+        else:
+            # Small domains are Zipf distributed.
+            domain = small_domains[
+                int(len(small_domains) ** rng.random()) - 1]
+        recipients.add('person{0}@{1}'.format(len(recipients), domain))
+    return recipients, mx_groups
+
+
+def relay_transactions(chunks, mx_groups):
+    # The MTA makes one transaction per mail exchanger in each chunk.
+    return sum(len(set(mx_groups.get(address.partition('@')[2],
+                                     address.partition('@')[2])
+                       for address in chunk))
+               for chunk in chunks)
+
+
+
+def main():
+    parser = argument_parser(__doc__.splitlines()[0])
+    parser.add_argument(
+        '-n', '--recipients', type=int, default=5000,
+        help='The number of recipients.')
+    parser.add_argument(
+        '-m', '--max-recipients', type=int, default=100,
+        help='The maximum number of recipients per transaction.')
+    parser.add_argument(
+        '-d', '--max-per-domain', type=int, default=0,
+        help='The maximum number of recipients per domain per transaction.')
+    parser.add_argument(
+        '-l', '--latency', type=float, default=0.02,
+        help='Seconds added to every SMTP transaction.')
+    args = parser.parse_args()
+    recipients, mx_groups = make_corpus(args.recipients)
+    agents = [
+        ('tld', BulkDelivery(args.max_recipients)),
+        ('domain', DomainBulkDelivery(
+            args.max_recipients, args.max_per_domain)),
+        ('domain+mx', DomainBulkDelivery(
+            args.max_recipients, args.max_per_domain, mx_groups)),
+        ]
+    headers = ['chunking', 'transactions', 'relayed', 'seconds']
+    rows = []
+    with test_layer(SMTPLayer):
+        mlist = create_list('bench@example.com')
+        msg = mfs("""\
+From: anne@example.com
+To: bench@example.com
+Subject: Chunking
+Message-ID: <ant@example.com>
+
+Hello.
+""")
+        sendmail = Connection.sendmail
+        Connection.sendmail = _slow_sendmail(args.latency)
+        try:
+            for name, agent in agents:
+                chunks = list(agent.chunkify(recipients))
+                elapsed = best_of(
+                    lambda: agent.deliver(
+                        mlist, msg, dict(recipients=recipients)),
+                    args.repeat, SMTPLayer.smtpd.clear)
+                rows.append([name, len(chunks),
+                             relay_transactions(chunks, mx_groups), elapsed])
+        finally:
+            Connection.sendmail = sendmail
+    print('Delivering to {0} recipients in {1} domains, at most {2} per '
+          'transaction.'.format(
+              len(recipients),
+              len(set(address.partition('@')[2] for address in recipients)),
+              args.max_recipients))
+    print_table(headers, rows)
+
+
+
+if __name__ == '__main__':
+    main()
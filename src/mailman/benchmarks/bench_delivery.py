@@ -0,0 +1,108 @@
+# Copyright (C) 2015 by the Free Software Foundation, Inc.
+#
+# This file is part of GNU Mailman.
+#
+# GNU Mailman is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# GNU Mailman is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Bulk delivery throughput against the number of delivery threads.
+
+The message is delivered to the test suite's fake SMTP server.  That server
+answers as fast as it can, so a delay is added to every SMTP transaction to
+stand in for a real MTA doing DNS lookups, spam checks and disk syncs.
+"""
+
+__all__ = [
+    'main',
+    ]
+
+
+import time
+
+from mailman.app.lifecycle import create_list
+from mailman.benchmarks.helpers import (
+    argument_parser, best_of, print_table, test_layer)
+from mailman.config import config
+from mailman.mta.bulk import BulkDelivery
+from mailman.mta.connection import Connection
+from mailman.testing.helpers import specialized_message_from_string as mfs
+from mailman.testing.layers import SMTPLayer
+
+
+def _slow_sendmail(latency):
+    # Stand in for an MTA which takes a while to accept each transaction.
+    # Sleeping releases the GIL, as waiting on a socket does.
+    sendmail = Connection.sendmail
+    def slow_sendmail(self, envsender, recipients, msgtext):
+        time.sleep(latency)
+        return sendmail(self, envsender, recipients, msgtext)
+    return slow_sendmail
+
+
+def main():
+    parser = argument_parser(__doc__.splitlines()[0])
+    parser.add_argument(
+        '-t', '--threads', default='0,2,4,8,16',
+        help='Comma separated numbers of delivery threads.')
+    parser.add_argument(
+        '-c', '--chunks', type=int, default=64,
+        help='The number of recipient chunks per message.')
+    parser.add_argument(
+        '-l', '--latency', type=float, default=0.02,
+        help='Seconds added to every SMTP transaction.')
+    args = parser.parse_args()
+    headers = ['threads', 'seconds', 'chunks/second', 'speedup']
+    rows = []
+    with test_layer(SMTPLayer):
+        mlist = create_list('bench@example.com')
+        msg = mfs("""\
+From: anne@example.com
+To: bench@example.com
+Subject: Throughput
+Message-ID: <ant@example.com>
+
+Hello.
+""")
+        recipients = ['person_{0}@example.org'.format(i)
+                      for i in range(args.chunks)]
+        sendmail = Connection.sendmail
+        Connection.sendmail = _slow_sendmail(args.latency)
+        try:
+            baseline = None
+            for threads in [int(value) for value in args.threads.split(',')]:
+                config.push('bench', """
+                [mta]
+                max_delivery_threads: {0}
+                """.format(threads))
+                try:
+                    agent = BulkDelivery(1)
+                    elapsed = best_of(
+                        lambda: agent.deliver(
+                            mlist, msg, dict(recipients=recipients)),
+                        args.repeat, SMTPLayer.smtpd.clear)
+                finally:
+                    config.pop('bench')
+                if baseline is None:
+                    baseline = elapsed
+                rows.append([threads, elapsed, args.chunks / elapsed,
+                             baseline / elapsed])
+        finally:
+            Connection.sendmail = sendmail
+    print('Delivering one message in {0} chunks, {1} seconds per SMTP '
+          'transaction.'.format(args.chunks, args.latency))
+    print_table(headers, rows)
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+# Copyright (C) 2015 by the Free Software Foundation, Inc.
+#
+# This file is part of GNU Mailman.
+#
+# GNU Mailman is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# GNU Mailman is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Peak memory use of the digest runner against the size of the digest.
+
+The digest is filled with messages and the runner makes the MIME and
+RFC 1153 digests from it.  Two numbers are shown.  The peak is the most
+memory Python had allocated while the digests were made, as traced by
+`tracemalloc`.  The maximum resident set size is the process's high water
+mark so far; the digests are made smallest first, so it grows only when a
+digest needed more memory than all those before it.
+"""
+
+__all__ = [
+    'main',
+    ]
+
+
+import os
+import shutil
+import resource
+import tracemalloc
+
+from mailman.app.lifecycle import create_list
+from mailman.benchmarks.helpers import argument_parser, print_table, test_layer
+from mailman.config import config
+from mailman.runners.digest import DigestRunner
+from mailman.testing.helpers import (
+    get_queue_messages, make_testable_runner,
+    specialized_message_from_string as mfs)
+from mailman.utilities.mailbox import DigestAccumulator
+
+
+MEGABYTE = 1024 * 1024
+
+
+def _fill(path, count, size):
+    # Fill the digest and return its size.
+    digest = DigestAccumulator(path)
+    line = 'A line of the message body, just about 64 characters long....\n'
+    body = line * max(1, size // len(line))
+    for i in range(count):
+        digest.add("""\
+From: person_{0}@example.org
+To: bench@example.com
+Subject: Message number {0}
+Message-ID: <{0}@example.org>
+
+{1}""".format(i, body))
+    return digest.size
+
+
+def main():
+    parser = argument_parser(__doc__.splitlines()[0])
+    parser.add_argument(
+        '-m', '--messages', default='100,1000,5000',
+        help='Comma separated numbers of messages in the digest.')
+    parser.add_argument(
+        '-s', '--size', type=int, default=4096,
+        help='The size of each message body in bytes.')
+    args = parser.parse_args()
+    headers = ['messages', 'digest MB', 'peak MB', 'max RSS MB']
+    rows = []
+    with test_layer():
+        mlist = create_list('bench@example.com')
+        runner = make_testable_runner(DigestRunner, 'digest')
+        path = os.path.join(mlist.data_path, 'digest.bench')
+        counts = sorted(int(count) for count in args.messages.split(','))
+        for count in counts:
+            size = _fill(path, count, args.size)
+            config.switchboards['digest'].enqueue(
+                mfs('From: bench@example.com\n\n'),
+                listid=mlist.list_id,
+                digest_path=path,
+                volume=1, digest_number=count)
+            tracemalloc.start()
+            try:
+                runner.run()
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+            # ru_maxrss is in kilobytes on Linux.
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            get_queue_messages('virgin')
+            shutil.rmtree(path)
+            rows.append([count, size / MEGABYTE, peak / MEGABYTE,
+                         rss / 1024])
+    print('Digests of messages with {0} byte bodies.'.format(args.size))
+    print_table(headers, rows)
+
+
+
+if __name__ == '__main__':
+    main()
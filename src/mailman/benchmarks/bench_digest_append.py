@@ -0,0 +1,115 @@
+# Copyright (C) 2015 by the Free Software Foundation, Inc.
+#
+# This file is part of GNU Mailman.
+#
+# GNU Mailman is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# GNU Mailman is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Adding posts to one list's digest from several processes at once.
+
+This stands in for the pipeline runner slices all handling posts to the same
+busy list.  Each process adds its share of the posts to the digest and then
+checks the digest's size, as the to-digest handler does.  The locked mailbox
+is what the handler used before the digest accumulator.
+"""
+
+__all__ = [
+    'main',
+    ]
+
+
+import os
+import time
+import shutil
+import tempfile
+
+from mailbox import ExternalClashError
+from mailman.benchmarks.helpers import argument_parser, print_table
+from mailman.testing.helpers import specialized_message_from_string as mfs
+from mailman.utilities.mailbox import DigestAccumulator, Mailbox
+from multiprocessing import Process
+
+
+def _locked_mailbox(path, msg, posts):
+    mailbox_path = os.path.join(path, 'digest.mmdf')
+    for i in range(posts):
+        while True:
+            try:
+                with Mailbox(mailbox_path, create=True) as mbox:
+                    mbox.add(msg)
+            except ExternalClashError:
+                # The mailbox lock doesn't wait for whoever holds it.
+                time.sleep(0.001)
+            else:
+                break
+        os.path.getsize(mailbox_path)
+
+
+def _accumulator(path, msg, posts):
+    digest = DigestAccumulator(os.path.join(path, 'digest'))
+    for i in range(posts):
+        digest.add(msg)
+        digest.size
+
+
+def _run(function, msg, processes, posts):
+    # Return the time taken for the processes to add all the posts.
+    path = tempfile.mkdtemp()
+    try:
+        workers = [Process(target=function,
+                           args=(path, msg, posts // processes))
+                   for i in range(processes)]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return time.perf_counter() - start
+    finally:
+        shutil.rmtree(path)
+
+
+def main():
+    parser = argument_parser(__doc__.splitlines()[0])
+    parser.add_argument(
+        '-p', '--processes', default='1,2,4,8',
+        help='Comma separated numbers of processes.')
+    parser.add_argument(
+        '-n', '--posts', type=int, default=2000,
+        help='The number of posts added to the digest.')
+    args = parser.parse_args()
+    msg = mfs("""\
+From: anne@example.com
+To: bench@example.com
+Subject: A post
+Message-ID: <ant@example.com>
+
+""" + 'A line of the message body.\n' * 50)
+    headers = ['processes', 'mailbox posts/s', 'accumulator posts/s',
+               'speedup']
+    rows = []
+    for processes in [int(value) for value in args.processes.split(',')]:
+        row = [processes]
+        for function in (_locked_mailbox, _accumulator):
+            elapsed = min(_run(function, msg, processes, args.posts)
+                          for i in range(args.repeat))
+            row.append(args.posts / elapsed)
+        row.append(row[2] / row[1])
+        rows.append(row)
+    print('{0} posts to one digest.'.format(args.posts))
+    print_table(headers, rows)
+
+
+
+if __name__ == '__main__':
+    main()
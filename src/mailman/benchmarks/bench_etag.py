@@ -0,0 +1,124 @@
+# Copyright (C) 2015 by the Free Software Foundation, Inc.
+#
+# This file is part of GNU Mailman.
+#
+# GNU Mailman is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# GNU Mailman is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Cost of tagging and encoding a REST collection against its size.
+
+This compares the old way of making a collection resource, which
+pretty-printed every member resource to calculate its etag and then encoded
+it as JSON twice, with encoding each resource once.  It also times a
+conditional request for a collection with a cheap version.
+"""
+
+__all__ = [
+    'main',
+    ]
+
+
+import json
+import hashlib
+
+from datetime import datetime
+from mailman.benchmarks.helpers import argument_parser, best_of, print_table
+from mailman.rest.helpers import CollectionMixin, ExtendedEncoder
+from pprint import pformat
+
+
+def _old_etag(resource):
+    hashfood = pformat(resource).encode('raw-unicode-escape')
+    resource['http_etag'] = '"{0}"'.format(hashlib.sha1(hashfood).hexdigest())
+    return json.dumps(resource, cls=ExtendedEncoder)
+
+
+class _Request:
+    def __init__(self, etag=None):
+        self._etag = etag
+
+    def get_param_as_int(self, name, min=None):
+        return None
+
+    def get_header(self, name):
+        return self._etag
+
+
+class _Response:
+    def set_header(self, name, value):
+        self.etag = value
+
+
+class _Members(CollectionMixin):
+    def __init__(self, count, versioned=False):
+        self._count = count
+        self._versioned = versioned
+
+    def _resource_as_dict(self, i):
+        url = 'http://localhost:9001/3.0/'
+        return dict(
+            address='{0}addresses/person_{1}@example.org'.format(url, i),
+            delivery_mode='regular',
+            email='person_{0}@example.org'.format(i),
+            list_id='bench.example.com',
+            member_id=i,
+            role='member',
+            self_link='{0}members/{1}'.format(url, i),
+            subscribed_on=datetime(2005, 8, 1, 7, 49, 23),
+            user='{0}users/{1}'.format(url, i),
+            )
+
+    def _get_collection(self, request):
+        return range(self._count)
+
+    def _get_version(self, page):
+        return (list(page) if self._versioned else None)
+
+    def old_collection(self):
+        entries = [self._resource_as_dict(i) for i in range(self._count)]
+        [_old_etag(resource) for resource in entries]
+        return _old_etag(dict(start=0, total_size=len(entries),
+                              entries=entries))
+
+
+def main():
+    parser = argument_parser(__doc__.splitlines()[0])
+    parser.add_argument(
+        '-m', '--members', default='100,1000,10000',
+        help='Comma separated numbers of members in the collection.')
+    args = parser.parse_args()
+    headers = ['members', 'old', 'new', 'speedup', 'not modified']
+    rows = []
+    for count in (int(count) for count in args.members.split(',')):
+        members = _Members(count)
+        row = [count]
+        row.append(1000 * best_of(members.old_collection, args.repeat))
+        row.append(1000 * best_of(
+            lambda: members._okay_collection(_Request(), _Response()),
+            args.repeat))
+        row.append(row[1] / row[2])
+        versioned = _Members(count, versioned=True)
+        response = _Response()
+        versioned._okay_collection(_Request(), response)
+        row.append(1000 * best_of(
+            lambda: versioned._okay_collection(
+                _Request(response.etag), _Response()),
+            args.repeat))
+        rows.append(row)
+    print('Milliseconds per collection.')
+    print_table(headers, rows)
+
+
+
+if __name__ == '__main__':
+    main()
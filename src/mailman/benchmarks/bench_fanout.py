@@ -0,0 +1,84 @@
+# Copyright (C) 2015 by the Free Software Foundation, Inc.
+#
+# This file is part of GNU Mailman.
+#
+# GNU Mailman is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# GNU Mailman is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Cost of enqueuing a message to several queues at once.
+
+This compares enqueuing the whole message to each queue, as the LMTP server
+used to for a message with several recipients, with writing its body once
+and sharing it between the queue files.
+"""
+
+__all__ = [
+    'main',
+    ]
+
+
+from mailman.benchmarks.helpers import (
+    argument_parser, best_of, print_table, test_layer)
+from mailman.config import config
+from mailman.core.switchboard import enqueue_shared
+from mailman.testing.helpers import (
+    get_queue_messages, specialized_message_from_string as mfs)
+from mailman.utilities.email import add_message_hash
+
+
+def _clear():
+    for name in ('in', 'command'):
+        get_queue_messages(name)
+
+
+def main():
+    parser = argument_parser(__doc__.splitlines()[0])
+    parser.add_argument(
+        '-d', '--destinations', default='2,4,8',
+        help='Comma separated numbers of destinations.')
+    parser.add_argument(
+        '-s', '--size', type=int, default=100,
+        help='The size of the message body, in kilobytes.')
+    args = parser.parse_args()
+    headers = ['destinations', 'each', 'shared', 'speedup']
+    rows = []
+    with test_layer():
+        msg = mfs("""\
+From: anne@example.com
+To: bench@example.com
+Subject: Cross-posted
+Message-ID: <ant@example.com>
+
+""" + ('x' * 1023 + '\n') * args.size)
+        add_message_hash(msg)
+        for count in [int(value) for value in args.destinations.split(',')]:
+            destinations = [
+                (config.switchboards['in' if i % 2 == 0 else 'command'],
+                 dict(listid='bench{0}.example.com'.format(i)))
+                for i in range(count)]
+            each = best_of(
+                lambda: [switchboard.enqueue(msg, metadata)
+                         for switchboard, metadata in destinations],
+                args.repeat, _clear)
+            shared = best_of(
+                lambda: enqueue_shared(msg, destinations),
+                args.repeat, _clear)
+            rows.append([count, 1000 * each, 1000 * shared, each / shared])
+        _clear()
+    print('Milliseconds to enqueue a {0} KiB message.'.format(args.size))
+    print_table(headers, rows)
+
+
+
+if __name__ == '__main__':
+    main()
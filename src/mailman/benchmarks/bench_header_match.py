@@ -0,0 +1,98 @@
+# Copyright (C) 2015 by the Free Software Foundation, Inc.
+#
+# This file is part of GNU Mailman.
+#
+# GNU Mailman is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# GNU Mailman is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Per-message cost of the header-match chain and suspicious-header rule.
+
+The list has a number of header matches and bounce matching headers, none of
+which match the message, so every pattern is tried.  Rebuilding stands in
+for making the rules and compiling the patterns for every message, as was
+done before they were cached.
+"""
+
+__all__ = [
+    'main',
+    ]
+
+
+from mailman.app.lifecycle import create_list
+from mailman.benchmarks.helpers import (
+    argument_parser, best_of, print_table, test_layer)
+from mailman.config import config
+from mailman.rules import suspicious
+from mailman.testing.helpers import specialized_message_from_string as mfs
+
+
+def _check(chain, rule, mlist, msg, rebuild):
+    if rebuild:
+        chain.flush()
+        suspicious._patterns.clear()
+    for link in chain.get_links(mlist, msg, {}):
+        if link.rule.name != 'any':
+            link.rule.check(mlist, msg, {})
+    rule.check(mlist, msg, {})
+
+
+def main():
+    parser = argument_parser(__doc__.splitlines()[0])
+    parser.add_argument(
+        '-p', '--patterns', default='5,20,100',
+        help='Comma separated numbers of patterns of each kind.')
+    parser.add_argument(
+        '-m', '--messages', type=int, default=100,
+        help='The number of messages checked per timing.')
+    args = parser.parse_args()
+    headers = ['patterns', 'rebuilt', 'cached', 'speedup']
+    rows = []
+    with test_layer():
+        chain = config.chains['header-match']
+        rule = config.rules['suspicious-header']
+        msg = mfs("""\
+From: anne@example.com
+To: bench@example.com
+Subject: Header matching
+Message-ID: <ant@example.com>
+X-Spam-Score: **
+Received: from a.example.com by b.example.com
+Received: from c.example.com by a.example.com
+
+Hello.
+""")
+        for count in (int(value) for value in args.patterns.split(',')):
+            mlist = create_list('bench{0}@example.com'.format(count))
+            mlist.header_matches = [
+                ('X-Spam-Score', '[*]{{{0}}}'.format(i + 5))
+                for i in range(count)]
+            mlist.bounce_matching_headers = '\n'.join(
+                'Received: from host{0}[.]example[.]org'.format(i)
+                for i in range(count))
+            row = [count]
+            for rebuild in (True, False):
+                def check():
+                    for i in range(args.messages):
+                        _check(chain, rule, mlist, msg, rebuild)
+                row.append(1000000 * best_of(check, args.repeat) /
+                           args.messages)
+            row.append(row[1] / row[2])
+            rows.append(row)
+        chain.flush()
+    print('Microseconds per message.')
+    print_table(headers, rows)
+
+
+
+if __name__ == '__main__':
+    main()
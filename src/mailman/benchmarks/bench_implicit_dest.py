@@ -0,0 +1,91 @@
+# Copyright (C) 2015 by the Free Software Foundation, Inc.
+#
+# This file is part of GNU Mailman.
+#
+# GNU Mailman is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# GNU Mailman is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Per-message cost of the implicit-dest rule, with and without its cache.
+
+The list has a number of alias patterns, none of which match any of the
+message's recipients, so every recipient is checked against all of them.
+Without the cache, the aliases are loaded from the database and compiled
+for every message.
+"""
+
+__all__ = [
+    'main',
+    ]
+
+
+from mailman.app.lifecycle import create_list
+from mailman.benchmarks.helpers import (
+    argument_parser, best_of, print_table, test_layer)
+from mailman.config import config
+from mailman.interfaces.mailinglist import IAcceptableAliasSet
+from mailman.rules import implicit_dest
+from mailman.testing.helpers import specialized_message_from_string as mfs
+
+
+def main():
+    parser = argument_parser(__doc__.splitlines()[0])
+    parser.add_argument(
+        '-a', '--aliases', default='5,20,50',
+        help='Comma separated numbers of alias patterns.')
+    parser.add_argument(
+        '-c', '--recipients', type=int, default=20,
+        help='The number of To and Cc recipients.')
+    parser.add_argument(
+        '-m', '--messages', type=int, default=100,
+        help='The number of messages checked per timing.')
+    args = parser.parse_args()
+    headers = ['aliases', 'uncached', 'cached', 'speedup']
+    rows = []
+    with test_layer():
+        rule = config.rules['implicit-dest']
+        recipients = ['person_{0}@example.org'.format(i)
+                      for i in range(args.recipients)]
+        half = len(recipients) // 2
+        msg = mfs("""\
+From: anne@example.com
+To: {0}
+Cc: {1}
+Message-ID: <ant@example.com>
+
+Hello.
+""".format(', '.join(recipients[:half]), ', '.join(recipients[half:])))
+        for count in (int(value) for value in args.aliases.split(',')):
+            mlist = create_list('bench{0}@example.com'.format(count))
+            mlist.require_explicit_destination = True
+            alias_set = IAcceptableAliasSet(mlist)
+            for i in range(count):
+                alias_set.add('^.*@host{0}[.]example[.]net$'.format(i))
+            row = [count]
+            for cached in (False, True):
+                def check():
+                    for i in range(args.messages):
+                        if not cached:
+                            implicit_dest._matchers.clear()
+                        rule.check(mlist, msg, {})
+                row.append(1000000 * best_of(check, args.repeat) /
+                           args.messages)
+            row.append(row[1] / row[2])
+            rows.append(row)
+    print('Microseconds per message with {0} recipients.'.format(
+        args.recipients))
+    print_table(headers, rows)
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+# Copyright (C) 2015 by the Free Software Foundation, Inc.
+#
+# This file is part of GNU Mailman.
+#
+# GNU Mailman is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# GNU Mailman is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
+
+"""LMTP server throughput against the number of concurrent clients.
+
+Each client is a thread with its own LMTP connection, delivering messages
+one after the other to a mailing list.  Messages which aren't accepted are
+counted as temporary failures.
+"""
+
+__all__ = [
+    'main',
+    ]
+
+
+import smtplib
+import threading
+
+from mailman.app.lifecycle import create_list
+from mailman.benchmarks.helpers import (
+    argument_parser, best_of, print_table, test_layer)
+from mailman.database.transaction import transaction
+from mailman.testing.helpers import get_lmtp_client, get_queue_messages
+from mailman.testing.layers import LMTPLayer
+
+
+MESSAGE = """\
+From: anne@example.com
+To: bench@example.com
+Subject: Throughput
+Message-ID: <{0}.{1}@example.com>
+
+""" + 'A line of the message body.\n' * 50
+
+
+def _burst(clients, messages, failures):
+    # Deliver messages over several connections at once.
+    def deliver(client):
+        lmtp = get_lmtp_client(quiet=True)
+        lmtp.lhlo('remote.example.org')
+        try:
+            for i in range(messages):
+                try:
+                    lmtp.sendmail('anne@example.com', ['bench@example.com'],
+                                  MESSAGE.format(client, i))
+                except smtplib.SMTPDataError:
+                    failures.append(client)
+        finally:
+            lmtp.quit()
+    threads = [threading.Thread(target=deliver, args=(client,))
+               for client in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def main():
+    parser = argument_parser(__doc__.splitlines()[0])
+    parser.add_argument(
+        '-c', '--clients', default='1,4,16',
+        help='Comma separated numbers of concurrent clients.')
+    parser.add_argument(
+        '-m', '--messages', type=int, default=50,
+        help='The number of messages each client delivers.')
+    args = parser.parse_args()
+    headers = ['clients', 'seconds', 'messages/second', 'tempfails']
+    rows = []
+    with test_layer(LMTPLayer):
+        with transaction():
+            create_list('bench@example.com')
+        for clients in [int(value) for value in args.clients.split(',')]:
+            failures = []
+            elapsed = best_of(
+                lambda: _burst(clients, args.messages, failures),
+                args.repeat, lambda: get_queue_messages('in'))
+            rows.append([clients, elapsed, clients * args.messages / elapsed,
+                         len(failures)])
+        get_queue_messages('in')
+    print('Each client delivers {0} messages.'.format(args.messages))
+    print_table(headers, rows)
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+# Copyright (C) 2015 by the Free Software Foundation, Inc.
+#
+# This file is part of GNU Mailman.
+#
+# GNU Mailman is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# GNU Mailman is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Runner start up time and memory against the runner start method.
+
+The master watcher is started with a number of slices of a runner which does
+nothing but say that it is ready.  The time until every slice is ready, and
+the resident and proportional set sizes of the slices, are measured for
+runners which are exec'd and for runners which are only forked.  The
+proportional set size shares memory out among the processes sharing it.
+"""
+
+__all__ = [
+    'ReadyRunner',
+    'main',
+    ]
+
+
+import os
+import sys
+import time
+import signal
+import subprocess
+
+from mailman.benchmarks.helpers import argument_parser, print_table, test_layer
+from mailman.config import config
+from mailman.core.runner import Runner
+
+
+class ReadyRunner(Runner):
+    """A runner which says it is ready by creating a file."""
+
+    def __init__(self, name, slice=None):
+        super(ReadyRunner, self).__init__(name, slice)
+        path = os.path.join(config.VAR_DIR, 'ready', str(os.getpid()))
+        with open(path, 'w'):
+            pass
+
+
+def _memory(pid):
+    # Return the resident and proportional set sizes of a process, in MiB.
+    sizes = {}
+    for name in ('smaps_rollup', 'status'):
+        try:
+            with open('/proc/{0}/{1}'.format(pid, name)) as fp:
+                for line in fp:
+                    key, colon, value = line.partition(':')
+                    if key in ('Rss', 'Pss', 'VmRSS') and key not in sizes:
+                        sizes[key] = int(value.split()[0]) / 1024
+        except IOError:
+            pass
+    rss = sizes.get('Rss', sizes.get('VmRSS', 0.0))
+    return rss, sizes.get('Pss', rss)
+
+
+def _start(method, slices, timeout):
+    ready_dir = os.path.join(config.VAR_DIR, 'ready')
+    os.makedirs(ready_dir, exist_ok=True)
+    for filename in os.listdir(ready_dir):
+        os.remove(os.path.join(ready_dir, filename))
+    with open(config.filename) as fp:
+        test_config = fp.read()
+    config_file = os.path.join(config.VAR_DIR, 'bench_{0}.cfg'.format(method))
+    with open(config_file, 'w') as fp:
+        fp.write(test_config)
+        print("""
+[mailman]
+runner_start_method: {0}
+
+[runner.bench]
+class: mailman.benchmarks.bench_master.ReadyRunner
+instances: {1}
+""".format(method, slices), file=fp)
+    start = time.perf_counter()
+    master = subprocess.Popen([
+        sys.executable, os.path.join(config.BIN_DIR, 'master'),
+        '-C', config_file, '-r', 'bench'])
+    try:
+        while len(os.listdir(ready_dir)) < slices:
+            if time.perf_counter() - start > timeout:
+                raise RuntimeError('The runners did not start')
+            if master.poll() is not None:
+                raise RuntimeError('The master exited')
+            time.sleep(0.01)
+        elapsed = time.perf_counter() - start
+        sizes = [_memory(int(pid)) for pid in os.listdir(ready_dir)]
+    finally:
+        master.send_signal(signal.SIGTERM)
+        master.wait()
+    rss = sum(size[0] for size in sizes) / slices
+    pss = sum(size[1] for size in sizes) / slices
+    return elapsed, rss, pss
+
+
+def main():
+    parser = argument_parser(__doc__.splitlines()[0])
+    parser.add_argument(
+        '-s', '--slices', type=int, default=16,
+        help='The number of runner slices; a power of 2.')
+    parser.add_argument(
+        '-t', '--timeout', type=float, default=120,
+        help='Seconds to wait for the runners to start.')
+    args = parser.parse_args()
+    headers = ['method', 'seconds', 'RSS/slice', 'PSS/slice']
+    rows = []
+    with test_layer():
+        for method in ('exec', 'fork'):
+            best = None
+            for i in range(args.repeat):
+                result = _start(method, args.slices, args.timeout)
+                if best is None or result[0] < best[0]:
+                    best = result
+            rows.append([method] + list(best))
+    print('Starting {0} runner slices; sizes in MiB.'.format(args.slices))
+    print_table(headers, rows)
+
+
+
+if __name__ == '__main__':
+    main()
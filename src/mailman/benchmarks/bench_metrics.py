@@ -0,0 +1,96 @@
+# Copyright (C) 2015 by the Free Software Foundation, Inc.
+#
+# This file is part of GNU Mailman.
+#
+# GNU Mailman is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# GNU Mailman is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Cost of recording and collecting metrics.
+
+The first table shows what each kind of measurement adds to the code it
+instruments, in microseconds.  The second shows how long the REST server
+takes to collect the metrics of a number of runner processes, each of which
+has published a snapshot of its registry.
+"""
+
+__all__ = [
+    'main',
+    ]
+
+
+import shutil
+
+from mailman.benchmarks.helpers import (
+    argument_parser, best_of, print_table, test_layer)
+from mailman.core.metrics import Registry, collect, metrics_directory
+
+
+def _record(registry, calls, kind):
+    # Record one measurement per call.
+    def noop():
+        pass
+    if kind == 'increment':
+        for i in range(calls):
+            registry.increment('bench_total', queue='in')
+    elif kind == 'observe':
+        for i in range(calls):
+            registry.observe('bench_seconds', 0.02, queue='in')
+    elif kind == 'timer':
+        for i in range(calls):
+            with registry.timer('bench_seconds', queue='in'):
+                noop()
+    else:
+        for i in range(calls):
+            noop()
+
+
+def main():
+    parser = argument_parser(__doc__.splitlines()[0])
+    parser.add_argument(
+        '-c', '--calls', type=int, default=100000,
+        help='The number of measurements recorded per repeat.')
+    parser.add_argument(
+        '-p', '--processes', default='1,10,50',
+        help='Comma separated numbers of published snapshots.')
+    args = parser.parse_args()
+    rows = []
+    registry = Registry()
+    baseline = best_of(
+        lambda: _record(registry, args.calls, 'call'), args.repeat)
+    for kind in ('increment', 'observe', 'timer'):
+        elapsed = best_of(
+            lambda: _record(registry, args.calls, kind), args.repeat)
+        rows.append([kind, 1000000 * (elapsed - baseline) / args.calls])
+    print('Microseconds added per measurement.')
+    print_table(['measurement', 'microseconds'], rows)
+    print()
+    rows = []
+    with test_layer():
+        for count in (int(value) for value in args.processes.split(',')):
+            shutil.rmtree(metrics_directory(), ignore_errors=True)
+            for i in range(count):
+                registry = Registry()
+                for name in ('in', 'out', 'pipeline', 'bounces', 'archive'):
+                    registry.increment('bench_total', queue=name)
+                    registry.observe('bench_seconds', 0.02, runner=name)
+                registry.publish('bench.{0}'.format(i))
+            elapsed = best_of(collect, args.repeat)
+            rows.append([count, 1000 * elapsed])
+        shutil.rmtree(metrics_directory(), ignore_errors=True)
+    print('Milliseconds to collect the metrics.')
+    print_table(['snapshots', 'milliseconds'], rows)
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+# Copyright (C) 2015 by the Free Software Foundation, Inc.
+#
+# This file is part of GNU Mailman.
+#
+# GNU Mailman is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# GNU Mailman is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Cost of handing messages to MHonArc, with and without batching.
+
+The archive runner gives the messages to the archiver one at a time.  The
+MHonArc command is replaced by one which reads its input and exits, so what
+is measured is the cost of running it: forking a shell from the archiver's
+process, feeding a long-lived shell instead, or spooling the messages and
+running the command once per batch.
+"""
+
+__all__ = [
+    'main',
+    ]
+
+
+import os
+import shutil
+import tempfile
+
+from mailman.app.lifecycle import create_list
+from mailman.archiving import mhonarc
+from mailman.archiving.mhonarc import MHonArc
+from mailman.benchmarks.helpers import (
+    argument_parser, best_of, print_table, test_layer)
+from mailman.config import config
+from mailman.testing.helpers import specialized_message_from_string as mfs
+
+
+def _archiver(tempdir, batch_size, worker):
+    path = os.path.join(tempdir, 'mhonarc.cfg')
+    with open(path, 'w') as fp:
+        print("""\
+[general]
+base_url: http://$hostname/archives/$fqdn_listname
+command: cat > /dev/null
+batch_size: {0}
+batch_time: 1h
+worker: {1}
+""".format(batch_size, worker), file=fp)
+    return MHonArc()
+
+
+def main():
+    parser = argument_parser(__doc__.splitlines()[0])
+    parser.add_argument(
+        '-m', '--messages', type=int, default=100,
+        help='The number of messages to archive.')
+    parser.add_argument(
+        '-b', '--batch-size', type=int, default=20,
+        help='The number of messages per batch.')
+    args = parser.parse_args()
+    headers = ['mode', 'runs', 'ms/message', 'speedup']
+    rows = []
+    tempdir = tempfile.mkdtemp()
+    try:
+        with test_layer():
+            config.push('bench', """
+            [archiver.mhonarc]
+            configuration: {0}
+            """.format(os.path.join(tempdir, 'mhonarc.cfg')))
+            try:
+                mlist = create_list('bench@example.com')
+                msg = mfs("""\
+From: anne@example.com
+To: bench@example.com
+Subject: Archiving
+Message-ID: <ant@example.com>
+
+""" + 'A line of the message body.\n' * 50)
+                modes = [
+                    ('per message', 1, 'no'),
+                    ('worker', 1, 'yes'),
+                    ('batched', args.batch_size, 'no'),
+                    ('batched worker', args.batch_size, 'yes'),
+                    ]
+                baseline = None
+                for mode, batch_size, worker in modes:
+                    archiver = _archiver(tempdir, batch_size, worker)
+                    def archive():
+                        for i in range(args.messages):
+                            archiver.archive_message(mlist, msg)
+                    elapsed = best_of(archive, args.repeat)
+                    if baseline is None:
+                        baseline = elapsed
+                    runs = -(-args.messages // batch_size)
+                    rows.append([mode, runs,
+                                 1000 * elapsed / args.messages,
+                                 baseline / elapsed])
+            finally:
+                for worker in mhonarc._workers.values():
+                    worker.close()
+                mhonarc._workers.clear()
+                config.pop('bench')
+    finally:
+        shutil.rmtree(tempdir)
+    print('Archiving {0} messages.'.format(args.messages))
+    print_table(headers, rows)
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+# Copyright (C) 2015 by the Free Software Foundation, Inc.
+#
+# This file is part of GNU Mailman.
+#
+# GNU Mailman is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# GNU Mailman is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Cost of a page of the REST member collection against its size.
+
+This compares loading the whole collection and slicing the page out of it
+with counting the collection and fetching just the page from the database.
+Only the collection is paginated; no HTTP request is made.
+"""
+
+__all__ = [
+    'main',
+    ]
+
+
+from mailman.app.lifecycle import create_list
+from mailman.benchmarks.helpers import (
+    argument_parser, best_of, print_table, test_layer)
+from mailman.interfaces.subscriptions import ISubscriptionService
+from mailman.interfaces.usermanager import IUserManager
+from zope.component import getUtility
+
+
+def _load_page(members, count):
+    # Load every member, as the collections used to be.
+    members = list(members)
+    return len(members), members[:count]
+
+
+def _query_page(members, count):
+    return len(members), list(members[:count])
+
+
+def main():
+    parser = argument_parser(__doc__.splitlines()[0])
+    parser.add_argument(
+        '-m', '--members', default='100,1000,10000',
+        help='Comma separated numbers of list members.')
+    parser.add_argument(
+        '-c', '--count', type=int, default=25,
+        help='The number of members in a page.')
+    args = parser.parse_args()
+    headers = ['members', 'load all', 'query page', 'speedup']
+    rows = []
+    with test_layer():
+        user_manager = getUtility(IUserManager)
+        service = getUtility(ISubscriptionService)
+        total = 0
+        for count in (int(count) for count in args.members.split(',')):
+            mlist = create_list('bench{0}@example.com'.format(count))
+            for i in range(count):
+                address = user_manager.create_address(
+                    'person_{0}_{1}@example.org'.format(count, i))
+                mlist.subscribe(address)
+            total += count
+            row = [total]
+            for paginate in (_load_page, _query_page):
+                row.append(1000 * best_of(
+                    lambda: paginate(service.get_members(), args.count),
+                    args.repeat))
+            row.append(row[1] / row[2])
+            rows.append(row)
+    print('Milliseconds for the first page of {0} members.'.format(
+        args.count))
+    print_table(headers, rows)
+
+
+
+if __name__ == '__main__':
+    main()
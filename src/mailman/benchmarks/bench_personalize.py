@@ -0,0 +1,93 @@
+# Copyright (C) 2015 by the Free Software Foundation, Inc.
+#
+# This file is part of GNU Mailman.
+#
+# GNU Mailman is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# GNU Mailman is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Per-recipient cost of rendering personalized, decorated messages.
+
+This compares rendering each recipient's message from a template with
+running the decoration and personalization callbacks for every recipient.
+Nothing is sent; only the messages are produced and flattened.
+"""
+
+__all__ = [
+    'main',
+    ]
+
+
+from mailman.app.lifecycle import create_list
+from mailman.benchmarks.helpers import (
+    argument_parser, best_of, print_table, test_layer)
+from mailman.interfaces.mailinglist import Personalization
+from mailman.interfaces.usermanager import IUserManager
+from mailman.mta.deliver import Deliver
+from mailman.testing.helpers import specialized_message_from_string as mfs
+from zope.component import getUtility
+
+
+class _Renderer(Deliver):
+    # Flatten every recipient's message, but don't send it.
+    def _deliver_to_recipients(self, mlist, msg, msgdata, recipients):
+        msg.as_string()
+        return {}
+
+
+class _SlowRenderer(_Renderer):
+    def _make_template(self, *args):
+        return None
+
+
+def main():
+    parser = argument_parser(__doc__.splitlines()[0])
+    parser.add_argument(
+        '-m', '--members', default='100,1000',
+        help='Comma separated numbers of list members.')
+    args = parser.parse_args()
+    headers = ['members', 'callbacks', 'template', 'speedup']
+    rows = []
+    with test_layer():
+        user_manager = getUtility(IUserManager)
+        msg = mfs("""\
+From: anne@example.com
+To: bench@example.com
+Subject: Personalized
+Message-ID: <ant@example.com>
+
+""" + 'A line of the message body.\n' * 50)
+        for count in (int(count) for count in args.members.split(',')):
+            mlist = create_list('bench{0}@example.com'.format(count))
+            mlist.personalize = Personalization.full
+            recipients = []
+            for i in range(count):
+                email = 'person_{0}@example.org'.format(i)
+                user = user_manager.create_user(
+                    email, 'Person {0}'.format(i))
+                mlist.subscribe(list(user.addresses)[0])
+                recipients.append(email)
+            row = [count]
+            for agent in (_SlowRenderer(), _Renderer()):
+                row.append(1000000 * best_of(
+                    lambda: agent.deliver(
+                        mlist, msg, dict(recipients=recipients)),
+                    args.repeat) / count)
+            row.append(row[1] / row[2])
+            rows.append(row)
+    print('Microseconds per recipient.')
+    print_table(headers, rows)
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+# Copyright (C) 2015 by the Free Software Foundation, Inc.
+#
+# This file is part of GNU Mailman.
+#
+# GNU Mailman is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# GNU Mailman is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Queue file size and CPU time per queue hop, for each queue file format.
+
+A hop dequeues a message, lets a runner look at it, and enqueues it to the
+next queue.  The runner either doesn't look at the message at all (like the
+retry runner), only reads and adds headers (like most rules), or walks the
+payload of every part (like content filtering).
+"""
+
+__all__ = [
+    'main',
+    ]
+
+
+import os
+import time
+import shutil
+import tempfile
+
+from email.mime.application import MIMEApplication
+from email.mime.text import MIMEText
+from mailman.benchmarks.helpers import (
+    argument_parser, best_of, print_table, test_layer)
+from mailman.core.queuefile import PickleFormat, RFC822Format
+from mailman.core.switchboard import Switchboard
+from mailman.email.message import Message
+
+
+def _make_message(attachment_size):
+    msg = Message()
+    msg['From'] = 'anne@example.com'
+    msg['To'] = 'test@example.com'
+    msg['Subject'] = 'A message with an attachment'
+    msg['Message-ID'] = '<ant@example.com>'
+    msg['MIME-Version'] = '1.0'
+    msg.set_type('multipart/mixed')
+    msg.attach(MIMEText('Here is the file you asked for.\n' * 40))
+    msg.attach(MIMEApplication(os.urandom(attachment_size)))
+    return msg
+
+
+def _ignore(msg):
+    pass
+
+
+def _headers(msg):
+    msg.sender
+    msg['X-Mailman-Rule-Misses'] = 'emergency; loop; administrivia'
+
+
+def _payload(msg):
+    _headers(msg)
+    for part in msg.walk():
+        part.get_payload()
+
+
+def _hop(switchboard, filebase, touch):
+    # One hop through the queue.  The new file base replaces the old one.
+    def hop():
+        msg, msgdata = switchboard.dequeue(filebase[0])
+        switchboard.finish(filebase[0])
+        touch(msg)
+        filebase[0] = switchboard.enqueue(msg, msgdata)
+    return hop
+
+
+def main():
+    parser = argument_parser(__doc__.splitlines()[0])
+    parser.add_argument(
+        '-s', '--sizes', default='4096,10485760',
+        help='Comma separated attachment sizes in bytes.')
+    args = parser.parse_args()
+    formats = [('pickle', PickleFormat()), ('rfc822', RFC822Format())]
+    touches = [('none', _ignore), ('headers', _headers), ('payload', _payload)]
+    headers = ['size', 'format', 'file bytes']
+    headers.extend(name for name, touch in touches)
+    rows = []
+    with test_layer():
+        for size in (int(size) for size in args.sizes.split(',')):
+            msg = _make_message(size)
+            for format_name, queue_format in formats:
+                directory = tempfile.mkdtemp()
+                try:
+                    switchboard = Switchboard(
+                        'bench', directory, queue_format=queue_format)
+                    filebase = [switchboard.enqueue(msg, listid='test')]
+                    # Prime the queue with a file written by a previous hop.
+                    _hop(switchboard, filebase, _ignore)()
+                    path = os.path.join(directory, filebase[0] + '.pck')
+                    row = [size, format_name, os.path.getsize(path)]
+                    for touch_name, touch in touches:
+                        row.append(1000 * best_of(
+                            _hop(switchboard, filebase, touch), args.repeat,
+                            timer=time.process_time))
+                    rows.append(row)
+                finally:
+                    shutil.rmtree(directory)
+    print('CPU milliseconds per queue hop, by how much of the message the')
+    print('runner looks at.')
+    print_table(headers, rows)
+
+
+
+if __name__ == '__main__':
+    main()
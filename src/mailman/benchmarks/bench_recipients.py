@@ -0,0 +1,80 @@
+# Copyright (C) 2015 by the Free Software Foundation, Inc.
+#
+# This file is part of GNU Mailman.
+#
+# GNU Mailman is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# GNU Mailman is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Calculating the regular delivery recipients of a mailing list.
+
+This compares asking each regular member for its delivery details, which
+looks up the member's, address's and user's preferences one at a time, with
+getting all of them from the roster's recipients in one query.
+"""
+
+__all__ = [
+    'main',
+    ]
+
+
+from mailman.app.lifecycle import create_list
+from mailman.benchmarks.helpers import (
+    argument_parser, best_of, print_table, test_layer)
+from mailman.interfaces.member import DeliveryStatus
+from mailman.interfaces.usermanager import IUserManager
+from zope.component import getUtility
+
+
+
+def _from_members(mlist):
+    return set(member.address.email
+               for member in mlist.regular_members.members
+               if member.delivery_status == DeliveryStatus.enabled)
+
+
+def _from_recipients(mlist):
+    return set(recipient.email
+               for recipient in mlist.regular_members.recipients
+               if recipient.delivery_status == DeliveryStatus.enabled)
+
+
+
+def main():
+    parser = argument_parser(__doc__.splitlines()[0])
+    parser.add_argument(
+        '-m', '--members', default='100,1000',
+        help='Comma separated numbers of list members.')
+    args = parser.parse_args()
+    headers = ['members', 'members (ms)', 'recipients (ms)', 'speedup']
+    rows = []
+    with test_layer():
+        user_manager = getUtility(IUserManager)
+        for count in (int(count) for count in args.members.split(',')):
+            mlist = create_list('bench{0}@example.com'.format(count))
+            for i in range(count):
+                user = user_manager.create_user(
+                    'person_{0}@example.org'.format(count * 100000 + i))
+                mlist.subscribe(list(user.addresses)[0])
+            assert _from_members(mlist) == _from_recipients(mlist)
+            row = [count]
+            for function in (_from_members, _from_recipients):
+                row.append(1000 * best_of(lambda: function(mlist),
+                                          args.repeat))
+            row.append(row[1] / row[2])
+            rows.append(row)
+    print_table(headers, rows)
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+# Copyright (C) 2015 by the Free Software Foundation, Inc.
+#
+# This file is part of GNU Mailman.
+#
+# GNU Mailman is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# GNU Mailman is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
+
+"""REST server throughput against the number of worker threads.
+
+The server runs in this process, and several clients send it requests over
+kept alive connections.  A delay can be added to every request to stand in
+for the database round trips of a database server on another host, which
+the worker threads spend waiting, as they do on sockets.
+"""
+
+__all__ = [
+    'main',
+    ]
+
+
+import time
+import threading
+
+from base64 import b64encode
+from http.client import HTTPConnection
+from mailman.app.lifecycle import create_list
+from mailman.benchmarks.helpers import argument_parser, print_table, test_layer
+from mailman.config import config
+from mailman.interfaces.usermanager import IUserManager
+from mailman.rest.wsgiapp import make_server
+from zope.component import getUtility
+
+
+def _slow_application(application, latency):
+    def slow_application(environ, start_response):
+        time.sleep(latency)
+        return application(environ, start_response)
+    return slow_application
+
+
+def _client(path, headers, requests, errors):
+    connection = HTTPConnection(
+        config.webservice.hostname, int(config.webservice.port))
+    try:
+        for i in range(requests):
+            connection.request('GET', path, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            if response.status != 200:
+                errors.append(response.status)
+    finally:
+        connection.close()
+
+
+def _load(path, clients, requests):
+    # Return the time it takes the clients to get their responses.
+    basic_auth = '{0}:{1}'.format(
+        config.webservice.admin_user, config.webservice.admin_pass)
+    token = b64encode(basic_auth.encode('utf-8')).decode('ascii')
+    headers = {'Authorization': 'Basic ' + token}
+    errors = []
+    threads = [
+        threading.Thread(target=_client,
+                         args=(path, headers, requests, errors))
+        for i in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    assert len(errors) == 0, errors
+    return elapsed
+
+
+def main():
+    parser = argument_parser(__doc__.splitlines()[0])
+    parser.add_argument(
+        '-w', '--workers', default='1,2,4,8',
+        help='Comma separated numbers of worker threads.')
+    parser.add_argument(
+        '-c', '--clients', type=int, default=8,
+        help='The number of clients sending requests at the same time.')
+    parser.add_argument(
+        '-n', '--requests', type=int, default=50,
+        help='The number of requests each client sends.')
+    parser.add_argument(
+        '-l', '--latency', type=float, default=0.01,
+        help='Seconds added to every request.')
+    parser.add_argument(
+        '-p', '--path', default='/3.0/lists/bench.example.com/roster/member',
+        help='The resource the clients get.')
+    args = parser.parse_args()
+    headers = ['workers', 'seconds', 'requests/second', 'speedup']
+    rows = []
+    with test_layer():
+        user_manager = getUtility(IUserManager)
+        mlist = create_list('bench@example.com')
+        for i in range(20):
+            mlist.subscribe(user_manager.create_address(
+                'person_{0}@example.org'.format(i)))
+        config.db.commit()
+        baseline = None
+        for workers in [int(value) for value in args.workers.split(',')]:
+            config.push('bench', """
+            [webservice]
+            workers: {0}
+            """.format(workers))
+            try:
+                server = make_server()
+            finally:
+                config.pop('bench')
+            server.set_app(_slow_application(server.get_app(), args.latency))
+            thread = threading.Thread(target=server.serve_forever)
+            thread.start()
+            try:
+                elapsed = min(
+                    _load(args.path, args.clients, args.requests)
+                    for i in range(args.repeat))
+            finally:
+                server.shutdown()
+                server.server_close()
+                thread.join()
+            if baseline is None:
+                baseline = elapsed
+            total = args.clients * args.requests
+            rows.append([workers, elapsed, total / elapsed,
+                         baseline / elapsed])
+    print('{0} clients sending {1} requests each, {2} seconds added to '
+          'every request.'.format(args.clients, args.requests, args.latency))
+    print_table(headers, rows)
+
+
+
+if __name__ == '__main__':
+    main()
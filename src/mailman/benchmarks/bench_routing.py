@@ -0,0 +1,85 @@
+# Copyright (C) 2015 by the Free Software Foundation, Inc.
+#
+# This file is part of GNU Mailman.
+#
+# GNU Mailman is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# GNU Mailman is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Cost of routing REST requests to their resources, by path depth.
+
+Each path is routed with the routes of every resource class found once, and
+with the routes found again at every path segment, which is what routing
+used to cost.  Routing includes the database lookups of the resources along
+the path, but not the responder.
+"""
+
+__all__ = [
+    'main',
+    ]
+
+
+from mailman.app.lifecycle import create_list
+from mailman.benchmarks.helpers import (
+    argument_parser, best_of, print_table, test_layer)
+from mailman.interfaces.usermanager import IUserManager
+from mailman.rest.root import Root
+from mailman.rest.wsgiapp import RootedAPI, _Routes
+from types import SimpleNamespace
+from zope.component import getUtility
+
+
+class _UncachedAPI(RootedAPI):
+    def _routes(self, resource):
+        return _Routes(resource)
+
+
+def main():
+    parser = argument_parser(__doc__.splitlines()[0])
+    parser.add_argument(
+        '-n', '--number', type=int, default=1000,
+        help='How many times each path is routed per measurement.')
+    args = parser.parse_args()
+    headers = ['path', 'segments', 'uncached', 'compiled', 'speedup']
+    rows = []
+    with test_layer():
+        mlist = create_list('bench@example.com')
+        anne = getUtility(IUserManager).create_address('anne@example.com')
+        member = mlist.subscribe(anne)
+        paths = [
+            '/3.0/system/versions',
+            '/3.0/lists/bench.example.com',
+            '/3.0/lists/bench.example.com/member/anne@example.com',
+            '/3.0/lists/bench.example.com/config/description',
+            '/3.0/addresses/anne@example.com/preferences',
+            '/3.0/members/{0}/preferences'.format(member.member_id.int),
+            ]
+        root = Root()
+        apis = [_UncachedAPI(root), RootedAPI(root)]
+        for path in paths:
+            request = SimpleNamespace(path=path, method='GET')
+            row = [path, path.count('/')]
+            for api in apis:
+                def route():
+                    for i in range(args.number):
+                        api._get_responder(request)
+                row.append(
+                    1000000 * best_of(route, args.repeat) / args.number)
+            row.append(row[2] / row[3])
+            rows.append(row)
+    print('Microseconds per request.')
+    print_table(headers, rows)
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+# Copyright (C) 2015 by the Free Software Foundation, Inc.
+#
+# This file is part of GNU Mailman.
+#
+# GNU Mailman is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# GNU Mailman is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Cost of a runner pass over a backlog of messages waiting for a retry.
+
+This stands in for the outgoing queue during an MTA outage, when every
+message in it is waiting to be retried later.  Re-enqueuing each message
+that isn't due yet rewrites and syncs every file on every pass, while
+scheduled files aren't touched until they are due.
+"""
+
+__all__ = [
+    'main',
+    ]
+
+
+import time
+import shutil
+import tempfile
+
+from email import message_from_string
+from mailman.benchmarks.helpers import argument_parser, best_of, print_table
+from mailman.core.switchboard import Switchboard
+from mailman.email.message import Message
+
+
+MESSAGE = """\
+From: anne@example.com
+To: bench@example.com
+Subject: Scheduling
+Message-ID: <ant@example.com>
+
+""" + 'A line of the message body.\n' * 50
+
+
+def _requeue_pass(switchboard):
+    # Read every file and, since none is due, write it back.
+    for filebase in switchboard.files:
+        msg, msgdata = switchboard.dequeue(filebase)
+        switchboard.enqueue(msg, msgdata)
+        switchboard.finish(filebase)
+
+
+def _scheduled_pass(switchboard):
+    # Look for due files; there are none.
+    assert len(switchboard.files) == 0, 'Nothing should be due'
+
+
+def main():
+    parser = argument_parser(__doc__.splitlines()[0])
+    parser.add_argument(
+        '-n', '--files', default='100,1000',
+        help='Comma separated numbers of messages waiting in the queue.')
+    args = parser.parse_args()
+    headers = ['messages', 're-enqueue', 'scheduled', 'speedup']
+    rows = []
+    msg = message_from_string(MESSAGE, Message)
+    for count in (int(value) for value in args.files.split(',')):
+        row = [count]
+        for scheduled in (False, True):
+            directory = tempfile.mkdtemp()
+            try:
+                switchboard = Switchboard('bench', directory)
+                later = time.time() + 3600
+                for i in range(count):
+                    switchboard.enqueue(
+                        msg, listid='bench.example.com',
+                        _due=(later if scheduled else None))
+                if scheduled:
+                    elapsed = best_of(
+                        lambda: _scheduled_pass(switchboard), args.repeat)
+                else:
+                    elapsed = best_of(
+                        lambda: _requeue_pass(switchboard), args.repeat)
+            finally:
+                shutil.rmtree(directory)
+            row.append(1000 * elapsed)
+        row.append(row[1] / row[2])
+        rows.append(row)
+    print('Milliseconds per runner pass.')
+    print_table(headers, rows)
+
+
+
+if __name__ == '__main__':
+    main()
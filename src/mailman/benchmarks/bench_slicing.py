@@ -0,0 +1,136 @@
+# Copyright (C) 2015 by the Free Software Foundation, Inc.
+#
+# This file is part of GNU Mailman.
+#
+# GNU Mailman is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# GNU Mailman is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Time to drain a queue with several runner processes, by slicing method.
+
+Each worker process dequeues files and spends a fixed time on each, standing
+in for a runner's processing.  With hash slicing, every worker only takes
+the files in its own slice of the hash space, so when the queue's file names
+don't hash evenly, some workers sit idle while the others work through their
+slices.  With claim slicing, any worker takes any file.
+"""
+
+__all__ = [
+    'main',
+    ]
+
+
+import os
+import time
+import shutil
+import tempfile
+
+from email import message_from_string
+from mailman.benchmarks.helpers import argument_parser, best_of, print_table
+from mailman.core.switchboard import Switchboard
+from mailman.email.message import Message
+from mailman.interfaces.switchboard import AlreadyDequeuedError
+
+
+MESSAGE = """\
+From: anne@example.com
+To: bench@example.com
+Subject: Slicing
+Message-ID: <ant@example.com>
+
+Hello.
+"""
+
+
+def _fill(directory, count, skewed):
+    # Enqueue the files.  Skewed file names all hash into the first slice.
+    switchboard = Switchboard('bench', directory)
+    msg = message_from_string(MESSAGE, Message)
+    for i in range(count):
+        filebase = switchboard.enqueue(msg, listid='bench.example.com')
+        if skewed:
+            when, digest = filebase.split('+')
+            os.rename(os.path.join(directory, filebase + '.pck'),
+                      os.path.join(directory,
+                                   when + '+0' + digest[1:] + '.pck'))
+
+
+def _work(directory, slice, count, slicing, seconds):
+    # Drain our share of the queue, then exit.
+    switchboard = Switchboard(
+        'bench', directory, slice, count, slicing=slicing)
+    while True:
+        files = switchboard.files
+        if len(files) == 0:
+            break
+        for filebase in files:
+            try:
+                switchboard.dequeue(filebase)
+            except AlreadyDequeuedError:
+                continue
+            time.sleep(seconds)
+            switchboard.finish(filebase)
+
+
+def _drain(directory, workers, slicing, seconds):
+    pids = []
+    for slice in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            status = 0
+            try:
+                _work(directory, slice, workers, slicing, seconds)
+            except BaseException:
+                status = 1
+            os._exit(status)
+        pids.append(pid)
+    for pid in pids:
+        pid, status = os.waitpid(pid, 0)
+        assert status == 0, 'Worker failed'
+
+
+def main():
+    parser = argument_parser(__doc__.splitlines()[0])
+    parser.add_argument(
+        '-w', '--workers', type=int, default=4,
+        help='The number of worker processes (a power of 2).')
+    parser.add_argument(
+        '-n', '--files', type=int, default=400,
+        help='The number of files in the queue.')
+    parser.add_argument(
+        '-t', '--time', type=float, default=0.005,
+        help='Seconds spent on each file.')
+    args = parser.parse_args()
+    headers = ['file names', 'hash', 'claim', 'speedup']
+    rows = []
+    for skewed in (False, True):
+        row = ['skewed' if skewed else 'even']
+        for slicing in ('hash', 'claim'):
+            directory = tempfile.mkdtemp()
+            try:
+                row.append(best_of(
+                    lambda: _drain(directory, args.workers, slicing,
+                                   args.time),
+                    args.repeat,
+                    lambda: _fill(directory, args.files, skewed)))
+            finally:
+                shutil.rmtree(directory)
+        row.append(row[1] / row[2])
+        rows.append(row)
+    print('Seconds to drain {0} files with {1} workers, {2} seconds per '
+          'file.'.format(args.files, args.workers, args.time))
+    print_table(headers, rows)
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+# Copyright (C) 2015 by the Free Software Foundation, Inc.
+#
+# This file is part of GNU Mailman.
+#
+# GNU Mailman is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# GNU Mailman is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Per-pass cost of finding queue files, against queue depth.
+
+For each queue depth, this times one runner pass over the queue as the full
+directory scan does it, and as the queue index does it with each change
+detection method, both when the directory is unchanged and when one file has
+arrived since the last pass.
+"""
+
+__all__ = [
+    'main',
+    ]
+
+
+import os
+import time
+import shutil
+import hashlib
+import tempfile
+
+from mailman.benchmarks.helpers import argument_parser, best_of, print_table
+from mailman.core.switchboard import Switchboard
+from mailman.utilities.inotify import get_watcher
+
+
+def _fill(directory, count):
+    now = time.time()
+    for i in range(count):
+        digest = hashlib.sha1(str(i).encode('ascii')).hexdigest()
+        filebase = repr(now + i / 1000) + '+' + digest
+        with open(os.path.join(directory, filebase + '.pck'), 'wb'):
+            pass
+    return now + count
+
+
+def _arrival(directory, when):
+    # Drop one new file into the queue.
+    def setup():
+        when[0] += 1
+        filebase = repr(when[0]) + '+' + 'f' * 40
+        with open(os.path.join(directory, filebase + '.pck'), 'wb'):
+            pass
+    return setup
+
+
+def main():
+    parser = argument_parser(__doc__.splitlines()[0])
+    parser.add_argument(
+        '-d', '--depths', default='1000,10000,100000',
+        help='Comma separated queue depths to measure.')
+    parser.add_argument(
+        '-s', '--slices', type=int, default=1,
+        help='The number of queue slices (a power of 2).')
+    args = parser.parse_args()
+    methods = ['scan', 'poll']
+    if get_watcher() is not None:
+        methods.append('inotify')
+    headers = ['depth', 'full scan']
+    for method in methods:
+        headers.extend([method, method + '+1'])
+    rows = []
+    for depth in (int(depth) for depth in args.depths.split(',')):
+        directory = tempfile.mkdtemp()
+        try:
+            when = [_fill(directory, depth)]
+            row = [depth]
+            switchboard = Switchboard('bench', directory, 0, args.slices)
+            # The full scan that used to happen on every pass.
+            row.append(1000 * best_of(
+                lambda: switchboard._scan('.pck'), args.repeat))
+            for method in methods:
+                switchboard = Switchboard(
+                    'bench', directory, 0, args.slices, scan_method=method)
+                # Prime the index.  This is the one time cost.
+                switchboard.files
+                # An unchanged queue directory...
+                row.append(1000 * best_of(
+                    lambda: switchboard.files, args.repeat))
+                # ...and one which has just seen a new file arrive.
+                row.append(1000 * best_of(
+                    lambda: switchboard.files, args.repeat,
+                    _arrival(directory, when)))
+            rows.append(row)
+        finally:
+            shutil.rmtree(directory)
+    print('Milliseconds per pass over the queue.')
+    print_table(headers, rows)
+
+
+
+if __name__ == '__main__':
+    main()
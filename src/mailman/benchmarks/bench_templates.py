@@ -0,0 +1,64 @@
+# Copyright (C) 2015 by the Free Software Foundation, Inc.
+#
+# This file is part of GNU Mailman.
+#
+# GNU Mailman is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# GNU Mailman is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Cost of loading a list's footer, with and without the template cache.
+
+Without the cache, every load opens the mailman: URL, looks up the mailing
+list and the language, and searches the template directories.  This is what
+happened for every recipient of a personalized list.
+"""
+
+__all__ = [
+    'main',
+    ]
+
+
+from mailman.app.lifecycle import create_list
+from mailman.benchmarks.helpers import (
+    argument_parser, best_of, print_table, test_layer)
+from mailman.interfaces.templates import ITemplateLoader
+from zope.component import getUtility
+
+
+def main():
+    parser = argument_parser(__doc__.splitlines()[0])
+    parser.add_argument(
+        '-n', '--loads', type=int, default=1000,
+        help='The number of times the footer is loaded.')
+    args = parser.parse_args()
+    headers = ['uncached', 'cached', 'speedup']
+    with test_layer():
+        create_list('bench@example.com')
+        loader = getUtility(ITemplateLoader)
+        uri = 'mailman:///bench@example.com/en/footer-generic.txt'
+        def uncached():
+            for i in range(args.loads):
+                loader.flush()
+                loader.get(uri)
+        def cached():
+            for i in range(args.loads):
+                loader.get(uri)
+        row = [1000000 * best_of(function, args.repeat) / args.loads
+               for function in (uncached, cached)]
+        row.append(row[0] / row[1])
+    print('Microseconds per load.')
+    print_table(headers, [row])
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+# Copyright (C) 2015 by the Free Software Foundation, Inc.
+#
+# This file is part of GNU Mailman.
+#
+# GNU Mailman is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# GNU Mailman is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Helpers for the benchmark scripts.
+
+The benchmarks are not part of the test suite.  Run them directly, e.g.::
+
+    $ python -m mailman.benchmarks.bench_switchboard
+"""
+
+__all__ = [
+    'argument_parser',
+    'best_of',
+    'print_table',
+    'test_layer',
+    ]
+
+
+import time
+import argparse
+
+from contextlib import contextmanager
+
+
+def argument_parser(description):
+    """Return an argument parser with the options common to all benchmarks.
+
+    :param description: The benchmark's description.
+    :type description: str
+    :return: The parser.
+    :rtype: `argparse.ArgumentParser`
+    """
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument(
+        '-r', '--repeat', type=int, default=5,
+        help='How many times to repeat each measurement; the best is shown.')
+    return parser
+
+
+
+def best_of(function, repeat=5, setup=None, timer=time.perf_counter):
+    """Return the shortest time taken by several calls of a function.
+
+    :param function: The callable to time.
+    :param repeat: The number of calls.
+    :type repeat: int
+    :param setup: An optional callable run, untimed, before every call.
+    :param timer: The clock to use.  The default measures wall clock time;
+        pass `time.process_time` to measure CPU time instead.
+    :return: The best time, in seconds.
+    :rtype: float
+    """
+    best = None
+    for i in range(repeat):
+        if setup is not None:
+            setup()
+        start = timer()
+        function()
+        elapsed = timer() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+
+def print_table(headers, rows):
+    """Print rows of values in aligned columns.
+
+    Floats are printed with three decimal places.
+
+    :param headers: The column headers.
+    :type headers: sequence of str
+    :param rows: The rows of values.
+    :type rows: sequence of sequences
+    """
+    def fmt(value):
+        if isinstance(value, float):
+            return '{:.3f}'.format(value)
+        return str(value)
+    cells = [list(headers)] + [[fmt(value) for value in row] for row in rows]
+    widths = [max(len(row[i]) for row in cells) for i in range(len(headers))]
+    for i, row in enumerate(cells):
+        print('  '.join(cell.rjust(width)
+                        for cell, width in zip(row, widths)))
+        if i == 0:
+            print('  '.join('-' * width for width in widths))
+
+
+
+@contextmanager
+def test_layer(layer=None):
+    """Set up a test layer around a benchmark.
+
+    This gives benchmarks that need them a fully initialized system with a
+    scratch database and queue directories, exactly as the test suite sees
+    it.
+
+    :param layer: The layer to set up.  Defaults to `ConfigLayer`.
+    """
+    # Import this here so that the benchmarks that don't need a layer don't
+    # initialize anything.
+    from mailman.testing.layers import ConfigLayer
+    if layer is None:
+        layer = ConfigLayer
+    # Set up the layer and all its bases, most basic first.
+    layers = [klass for klass in reversed(layer.__mro__)
+              if 'setUp' in vars(klass)]
+    for klass in layers:
+        klass.setUp()
+    try:
+        for klass in layers:
+            if 'testSetUp' in vars(klass):
+                klass.testSetUp()
+        yield
+    finally:
+        for klass in reversed(layers):
+            if 'testTearDown' in vars(klass):
+                klass.testTearDown()
+        for klass in reversed(layers):
+            if 'tearDown' in vars(klass):
+                klass.tearDown()
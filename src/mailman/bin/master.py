@@ -20,15 +20,19 @@
 __all__ = [
     'Loop',
     'main',
+    'request_scaling',
+    'scaling_requests',
     ]
 
 
 import os
 import sys
 import errno
+import random
 import signal
 import socket
 import logging
+import traceback
 
 from datetime import timedelta
 from enum import Enum
@@ -37,6 +41,8 @@ from lazr.config import as_boolean
 from mailman.config import config
 from mailman.core.i18n import _
 from mailman.core.logging import reopen
+from mailman.utilities.filesystem import makedirs
+from mailman.utilities.modules import find_name
 from mailman.utilities.options import Options
 
 
@@ -62,9 +68,9 @@ class MasterOptions(Options):
 Master subprocess watcher.
 
 Start and watch the configured runners and ensure that they stay alive and
-kicking.  Each runner is forked and exec'd in turn, with the master waiting on
-their process ids.  When it detects a child runner has exited, it may restart
-it.
+kicking.  Each runner is forked and exec'd in turn, or only forked if the
+`[mailman]runner_start_method` is `fork`, with the master waiting on their
+process ids.  When it detects a child runner has exited, it may restart it.
 
 The runners respond to SIGINT, SIGTERM, SIGUSR1 and SIGHUP.  SIGINT, SIGTERM
 and SIGUSR1 all cause a runner to exit cleanly.  The master will restart
@@ -75,9 +81,10 @@ message.
 
 The master also responds to SIGINT, SIGTERM, SIGUSR1 and SIGHUP, which it
 simply passes on to the runners.  Note that the master will close and reopen
-its own log files on receipt of a SIGHUP.  The master also leaves its own
-process id in the file `data/master.pid` but you normally don't need to use
-this pid directly.""")
+its own log files on receipt of a SIGHUP.  On receipt of a SIGUSR2, the master
+starts or stops runners as requested by `mailman scale`.  The master also
+leaves its own process id in the file `data/master.pid` but you normally don't
+need to use this pid directly.""")
 
     def add_options(self):
         """See `Options`."""
@@ -231,6 +238,56 @@ Exiting.""")
         config.options.parser.error(message)
 
 
+
+def _scaling_directory():
+    return os.path.join(config.DATA_DIR, 'scale')
+
+
+def request_scaling(name, count):
+    """Ask the master to run a number of instances of a runner.
+
+    The request is left for the master, which reads it when it receives a
+    SIGUSR2.
+
+    :param name: The runner name.
+    :type name: str
+    :param count: The number of instances to run.
+    :type count: int
+    """
+    directory = _scaling_directory()
+    makedirs(directory)
+    path = os.path.join(directory, name)
+    with open(path + '.tmp', 'w') as fp:
+        print(count, file=fp)
+    os.rename(path + '.tmp', path)
+
+
+def scaling_requests():
+    """Read and remove the outstanding scaling requests.
+
+    :return: The number of instances requested for each runner.
+    :rtype: dict
+    """
+    requests = {}
+    directory = _scaling_directory()
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return requests
+    for name in names:
+        if name.endswith('.tmp'):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            with open(path) as fp:
+                requests[name] = int(fp.read())
+            os.unlink(path)
+        except (EnvironmentError, ValueError):
+            logging.getLogger('mailman.runner').exception(
+                'Bad scaling request: {0}'.format(path))
+    return requests
+
+
 
 class PIDWatcher:
     """A class which safely manages child process ids."""
@@ -290,6 +347,18 @@ class PIDWatcher:
         """
         return self._pids.pop(pid, None)
 
+    def get(self, pid):
+        """Return existing process information.
+
+        :param pid: The process id.
+        :type pid: int
+        :return: The process information, or None if the process id is not
+            being tracked.
+        :rtype: 4-tuple consisting of
+            (runner-name, slice-number, slice-count, restart-count)
+        """
+        return self._pids.get(pid)
+
 
 
 class Loop:
@@ -300,6 +369,8 @@ class Loop:
         self._restartable = restartable
         self._config_file = config_file
         self._kids = PIDWatcher()
+        # The runners which have been asked to stop by `scale_runner()`.
+        self._retiring = set()
 
     def install_signal_handlers(self):
         """Install various signals handlers for control from the master."""
@@ -338,6 +409,12 @@ class Loop:
                 os.kill(pid, signal.SIGINT)
             log.info('Master watcher caught SIGINT.  Restarting.')
         signal.signal(signal.SIGINT, sigint_handler)
+        # SIGUSR2 is used by 'mailman scale'.
+        def sigusr2_handler(signum, frame):
+            log.info('Master watcher caught SIGUSR2.  Scaling runners.')
+            for name, count in sorted(scaling_requests().items()):
+                self.scale_runner(name, count)
+        signal.signal(signal.SIGUSR2, sigusr2_handler)
 
     def _start_runner(self, spec):
         """Start a runner.
@@ -350,11 +427,22 @@ class Loop:
         :return: The process id of the child runner.
         :rtype: int
         """
+        forking = (config.mailman.runner_start_method == 'fork')
+        if forking:
+            # The child must not share the master's database connections, nor
+            # write out anything the master has buffered.  Closing them in
+            # the child instead could close them for the master too.
+            config.db.store.remove()
+            config.db.engine.dispose()
+            sys.stdout.flush()
+            sys.stderr.flush()
         pid = os.fork()
         if pid:
             # Parent.
             return pid
         # Child.
+        if forking:
+            self._run_forked(spec)
         #
         # Set the environment variable which tells the runner that it's
         # running under bin/master control.  This subtly changes the error
@@ -389,6 +477,44 @@ class Loop:
         # We should never get here.
         raise RuntimeError('os.execle() failed')
 
+    def _run_forked(self, spec):
+        """Run a runner in a child process forked from the master.
+
+        The child already has the master's configuration, components and
+        imported modules, so unlike bin/runner it does not initialize the
+        system.  It never returns.
+
+        :param spec: A runner spec, e.g. name:slice:count
+        :type spec: string
+        """
+        # Avoid circular imports.
+        from mailman.bin.runner import make_runner
+        status = 1
+        try:
+            os.environ['MAILMAN_UNDER_MASTER_CONTROL'] = '1'
+            # Don't repeat the master's random numbers, or handle its signals.
+            random.seed()
+            signal.signal(signal.SIGALRM, signal.SIG_DFL)
+            reopen()
+            name, slice_number, count = spec.rsplit(':', 2)
+            runner = make_runner(name, int(slice_number), int(count))
+            runner.set_signals()
+            log = logging.getLogger('mailman.runner')
+            log.info('%s runner started.', runner.name)
+            runner.run()
+            log.info('%s runner exiting.', runner.name)
+            status = runner.status
+        except SystemExit as error:
+            status = (0 if error.code is None else error.code)
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            # Leave without unwinding into the master's code, which would
+            # unlock the master lock and remove the pid file.
+            os._exit(status)
+
     def start_runners(self, runner_names=None):
         """Start all the configured runners.
 
@@ -413,10 +539,19 @@ class Loop:
             runner_config = getattr(config, section_name)
             if not as_boolean(runner_config.start):
                 continue
-            # Find out how many runners to instantiate.  This must be a power
-            # of 2.
+            if config.mailman.runner_start_method == 'fork':
+                # Import the runner's modules once, in the master, so that
+                # its processes share them.
+                try:
+                    find_name(runner_config['class'])
+                except ImportError:
+                    # The runner process reports this.
+                    pass
+            # Find out how many runners to instantiate.  With hash slicing,
+            # this must be a power of 2.
             count = int(runner_config.instances)
-            assert (count & (count - 1)) == 0, (
+            assert (runner_config.slicing == 'claim' or
+                    (count & (count - 1)) == 0), (
                 'Runner "{0}", not a power of 2: {1}'.format(name, count))
             for slice_number in range(count):
                 # runner name, slice #, # of slices, restart count
@@ -427,6 +562,48 @@ class Loop:
                 log.debug('[{0:d}] {1}'.format(pid, spec))
                 self._kids.add(pid, info)
 
+    def scale_runner(self, name, count):
+        """Change the number of running instances of a runner.
+
+        Only runners using claim slicing can be scaled, since all their
+        instances share the whole queue.  Missing instances are started, and
+        surplus instances are sent a SIGTERM, so that they exit once they are
+        done with the message they are processing.  The runner's
+        configuration is left alone, so the master starts the configured
+        number of instances the next time it starts.
+
+        :param name: The runner name.
+        :type name: str
+        :param count: The number of instances to run.
+        :type count: int
+        """
+        log = logging.getLogger('mailman.runner')
+        runner_config = getattr(config, 'runner.' + name, None)
+        if runner_config is None or runner_config.slicing != 'claim':
+            log.error('Runner {0} cannot be scaled'.format(name))
+            return
+        # Map the slice number of each of the runner's instances to its pid.
+        instances = {}
+        for pid in list(self._kids):
+            info = self._kids.get(pid)
+            if (info is not None and info[0] == name and
+                    pid not in self._retiring):
+                instances[info[1]] = pid
+        for slice_number in sorted(instances)[count:]:
+            pid = instances.pop(slice_number)
+            self._retiring.add(pid)
+            os.kill(pid, signal.SIGTERM)
+        slice_number = 0
+        while len(instances) < count:
+            if slice_number not in instances:
+                spec = '{0}:{1:d}:{2:d}'.format(name, slice_number, count)
+                pid = self._start_runner(spec)
+                log.debug('[{0:d}] {1}'.format(pid, spec))
+                self._kids.add(pid, (name, slice_number, count, 0))
+                instances[slice_number] = pid
+            slice_number += 1
+        log.info('Runner {0} scaled to {1:d} instances'.format(name, count))
+
     def _pause(self):
         """Sleep until a signal is received."""
         # Sleep until a signal is received.  This prevents the master from
@@ -472,6 +649,10 @@ class Loop:
             restart = False
             if why == signal.SIGUSR1 and self._restartable:
                 restart = True
+            # Runners which were scaled away stay stopped.
+            if pid in self._retiring:
+                self._retiring.discard(pid)
+                restart = False
             # Have we hit the maximum number of restarts?
             restarts += 1
             max_restarts = int(getattr(config, config_name).max_restarts)
@@ -535,6 +716,9 @@ def main():
     try:
         with open(config.PID_FILE, 'w') as fp:
             print(os.getpid(), file=fp)
+        # Scaling requests which an earlier master didn't get to are
+        # dropped; this master starts the configured number of runners.
+        scaling_requests()
         loop = Loop(lock, options.options.restartable, options.options.config)
         loop.install_signal_handlers()
         try:
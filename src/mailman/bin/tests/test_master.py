@@ -18,17 +18,23 @@
 """Test master watcher utilities."""
 
 __all__ = [
+    'TestForkedRunners',
     'TestMasterLock',
+    'TestScaling',
     ]
 
 
 import os
+import time
 import errno
 import tempfile
 import unittest
 
 from flufl.lock import Lock
 from mailman.bin import master
+from mailman.config import config
+from mailman.testing.helpers import TestableMaster
+from mailman.testing.layers import ConfigLayer
 
 
 
@@ -68,3 +74,94 @@ class TestMasterLock(unittest.TestCase):
             my_lock.unlock()
         self.assertEqual(state, master.WatcherState.conflict)
         # XXX test stale_lock and host_mismatch states.
+
+
+
+class TestForkedRunners(unittest.TestCase):
+    layer = ConfigLayer
+
+    def setUp(self):
+        config.push('fork', """
+        [mailman]
+        runner_start_method: fork
+        """)
+        self.addCleanup(config.pop, 'fork')
+
+    @unittest.skipUnless(os.path.exists('/proc/self/cmdline'),
+                         'No /proc file system')
+    def test_runners_are_not_executed(self):
+        # The runner processes are forked from the master, and run the same
+        # program it does instead of bin/runner.
+        with open('/proc/self/cmdline', 'rb') as fp:
+            cmdline = fp.read()
+        watcher = TestableMaster()
+        watcher.start('command', 'virgin')
+        try:
+            pids = list(watcher.runner_pids)
+            self.assertEqual(len(pids), 2)
+            for pid in pids:
+                with open('/proc/{0}/cmdline'.format(pid), 'rb') as fp:
+                    self.assertEqual(fp.read(), cmdline)
+        finally:
+            watcher.stop()
+        # The runners exited when they were told to.
+        for pid in pids:
+            with self.assertRaises(OSError) as cm:
+                os.kill(pid, 0)
+            self.assertEqual(cm.exception.errno, errno.ESRCH)
+
+
+
+class TestScaling(unittest.TestCase):
+    layer = ConfigLayer
+
+    def setUp(self):
+        # Forked runners see the pushed configuration.
+        config.push('scaling', """
+        [mailman]
+        runner_start_method: fork
+        [runner.virgin]
+        slicing: claim
+        """)
+        self.addCleanup(config.pop, 'scaling')
+
+    def _instances(self, watcher, name, count):
+        # Wait until the watcher has the given number of instances of the
+        # runner, and return their slice numbers.
+        until = time.time() + 10
+        while True:
+            slices = sorted(info[1] for info in
+                            (watcher._kids.get(pid) for pid in watcher._kids)
+                            if info is not None and info[0] == name)
+            if len(slices) == count or time.time() > until:
+                return slices
+            time.sleep(0.1)
+
+    def test_scaling_requests(self):
+        master.request_scaling('virgin', 4)
+        master.request_scaling('out', 2)
+        master.request_scaling('virgin', 3)
+        self.assertEqual(master.scaling_requests(), dict(virgin=3, out=2))
+        self.assertEqual(master.scaling_requests(), {})
+
+    def test_scale_up_and_down(self):
+        watcher = TestableMaster()
+        watcher.start('virgin')
+        try:
+            self.assertEqual(self._instances(watcher, 'virgin', 1), [0])
+            watcher.scale_runner('virgin', 3)
+            self.assertEqual(self._instances(watcher, 'virgin', 3), [0, 1, 2])
+            watcher.scale_runner('virgin', 1)
+            # The surplus runners exit, and are not restarted.
+            self.assertEqual(self._instances(watcher, 'virgin', 1), [0])
+        finally:
+            watcher.stop()
+
+    def test_hash_sliced_runners_are_not_scaled(self):
+        watcher = TestableMaster()
+        watcher.start('command')
+        try:
+            watcher.scale_runner('command', 2)
+            self.assertEqual(self._instances(watcher, 'command', 1), [0])
+        finally:
+            watcher.stop()
@@ -19,6 +19,7 @@
 
 __all__ = [
     'HeaderMatchChain',
+    'handle_ListDeletingEvent',
     ]
 
 
@@ -29,6 +30,7 @@ from mailman.chains.base import Chain, Link
 from mailman.config import config
 from mailman.core.i18n import _
 from mailman.interfaces.chain import LinkAction
+from mailman.interfaces.listmanager import ListDeletingEvent
 from mailman.interfaces.rules import IRule
 from zope.interface import implementer
 
@@ -36,25 +38,6 @@ from zope.interface import implementer
 log = logging.getLogger('mailman.error')
 
 
-
-def make_link(header, pattern):
-    """Create a Link object.
-
-    The link action is always to defer, since at the end of all the header
-    checks, we'll jump to the chain defined in the configuration file, should
-    any of them have matched.
-
-    :param header: The email header name to check, e.g. X-Spam.
-    :type header: string
-    :param pattern: A regular expression for matching the header value.
-    :type pattern: string
-    :return: The link representing this rule check.
-    :rtype: `ILink`
-    """
-    rule = HeaderMatchRule(header, pattern)
-    return Link(rule, LinkAction.defer)
-
-
 
 @implementer(IRule)
 class HeaderMatchRule:
@@ -69,12 +52,14 @@ class HeaderMatchRule:
         self.name = 'header-match-{0:02}'.format(HeaderMatchRule._count)
         HeaderMatchRule._count += 1
         self.description = '{0}: {1}'.format(header, pattern)
-        # XXX I think we should do better here, somehow recording that a
-        # particular header matched a particular pattern, but that gets ugly
-        # with RFC 2822 headers.  It also doesn't match well with the rule
-        # name concept.  For now, we just record the rather useless numeric
-        # rule name.  I suppose we could do the better hit recording in the
-        # check() method, and set self.record = False.
+        # The pattern is compiled once, and a bad one is rejected before the
+        # rule gets registered.
+        self._cre = re.compile(pattern, re.IGNORECASE)
+        # The header-match chain makes a single rule for each header and
+        # pattern, which stays registered while a header check or a mailing
+        # list's header match uses it, or until the chain is flushed.  While
+        # it does, the numeric rule name recorded for a hit leads back to the
+        # header and the pattern that matched.
         self.record = True
         # Register this rule so that other parts of the system can query it.
         assert self.name not in config.rules, (
@@ -85,7 +70,7 @@ class HeaderMatchRule:
     def check(self, mlist, msg, msgdata):
         """See `IRule`."""
         for value in msg.get_all(self.header, []):
-            if re.search(self.pattern, value, re.IGNORECASE):
+            if self._cre.search(value):
                 return True
         return False
 
@@ -95,6 +80,10 @@ class HeaderMatchChain(Chain):
     """Default header matching chain.
 
     This could be extended by header match rules in the database.
+
+    The links are only made again when the header checks in the
+    configuration file, or a mailing list's header matches, change.  The
+    rules which no links are left for are then unregistered.
     """
 
     def __init__(self):
@@ -104,6 +93,46 @@ class HeaderMatchChain(Chain):
         # configuration file, the database, and any explicitly added header
         # checks (via the .extend() method).
         self._extended_links = []
+        # (header, pattern) -> rule, for every rule made so far.
+        self._rules = {}
+        # The configuration file's header checks, and their links.
+        self._config_links = (None, [])
+        # list id -> (header matches, links) for the mailing lists.
+        self._list_links = {}
+
+    def _link(self, header, pattern):
+        # Return a link to the rule for the header and pattern, which is
+        # only made the first time.
+        rule = self._rules.get((header, pattern))
+        if rule is None:
+            rule = HeaderMatchRule(header, pattern)
+            self._rules[(header, pattern)] = rule
+        return Link(rule, LinkAction.defer)
+
+    def _make_links(self, entries, where):
+        # Return the links for the (header, pattern) pairs, leaving out
+        # those with bad patterns.
+        links = []
+        for header, pattern in entries:
+            try:
+                links.append(self._link(header, pattern))
+            except re.error as error:
+                log.error('Configuration error: {0} contains bad pattern: '
+                          '{1}: {2} ({3})'.format(
+                              where, header, pattern, error))
+        return links
+
+    def _prune(self):
+        # Unregister the rules which no links are left for.
+        links = self._config_links[1] + self._extended_links
+        for header_matches, list_links in self._list_links.values():
+            links.extend(list_links)
+        in_use = set(link.rule.name for link in links)
+        for key, rule in list(self._rules.items()):
+            if rule.name not in in_use:
+                del self._rules[key]
+                if config.rules.get(rule.name) is rule:
+                    del config.rules[rule.name]
 
     def extend(self, header, pattern):
         """Extend the existing header matches.
@@ -112,7 +141,7 @@ class HeaderMatchChain(Chain):
         :param pattern: The pattern to match the header's value again.  The
             match is not anchored and is done case-insensitively.
         """
-        self._extended_links.append(make_link(header, pattern))
+        self._extended_links.append(self._link(header, pattern))
 
     def flush(self):
         """See `IMutableChain`."""
@@ -122,23 +151,50 @@ class HeaderMatchChain(Chain):
             if rule_name.startswith('header-match-'):
                 del config.rules[rule_name]
         self._extended_links = []
+        self._rules = {}
+        self._config_links = (None, [])
+        self._list_links = {}
+
+    def forget(self, mlist):
+        """Forget a mailing list's links, and the rules only it used.
+
+        :param mlist: The mailing list.
+        :type mlist: `IMailingList`
+        """
+        if self._list_links.pop(mlist.list_id, None) is not None:
+            self._prune()
 
     def get_links(self, mlist, msg, msgdata):
         """See `IChain`."""
         # First return all the configuration file links.
-        for line in config.antispam.header_checks.splitlines():
-            if len(line.strip()) == 0:
-                continue
-            parts = line.split(':', 1)
-            if len(parts) != 2:
-                log.error('Configuration error: [antispam]header_checks '
-                          'contains bogus line: {0}'.format(line))
-                continue
-            yield make_link(parts[0], parts[1].lstrip())
+        header_checks = config.antispam.header_checks
+        if self._config_links[0] != header_checks:
+            entries = []
+            for line in header_checks.splitlines():
+                if len(line.strip()) == 0:
+                    continue
+                parts = line.split(':', 1)
+                if len(parts) != 2:
+                    log.error('Configuration error: [antispam]header_checks '
+                              'contains bogus line: {0}'.format(line))
+                    continue
+                entries.append((parts[0], parts[1].lstrip()))
+            self._config_links = (header_checks, self._make_links(
+                entries, '[antispam]header_checks'))
+            self._prune()
+        for link in self._config_links[1]:
+            yield link
         # Then return all the list-specific header matches.
-        # Python 3.3: Use 'yield from'
-        for entry in mlist.header_matches:
-            yield make_link(*entry)
+        header_matches = tuple(
+            tuple(entry) for entry in (mlist.header_matches or []))
+        cached = self._list_links.get(mlist.list_id)
+        if cached is None or cached[0] != header_matches:
+            cached = (header_matches, self._make_links(
+                header_matches, '{0} header_matches'.format(mlist.list_id)))
+            self._list_links[mlist.list_id] = cached
+            self._prune()
+        for link in cached[1]:
+            yield link
         # Then return all the explicitly added links.
         for link in self._extended_links:
             yield link
@@ -146,3 +202,12 @@ class HeaderMatchChain(Chain):
         # defined in the configuration file.
         yield Link(config.rules['any'], LinkAction.jump,
                    config.chains[config.antispam.jump_chain])
+
+
+
+def handle_ListDeletingEvent(event):
+    if not isinstance(event, ListDeletingEvent):
+        return
+    chain = config.chains.get('header-match')
+    if isinstance(chain, HeaderMatchChain):
+        chain.forget(event.mailing_list)
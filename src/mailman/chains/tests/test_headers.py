@@ -29,8 +29,10 @@ from mailman.chains.headers import HeaderMatchRule
 from mailman.config import config
 from mailman.email.message import Message
 from mailman.interfaces.chain import LinkAction
+from mailman.interfaces.listmanager import IListManager
 from mailman.testing.layers import ConfigLayer
 from mailman.testing.helpers import LogFileMark, configuration
+from zope.component import getUtility
 
 
 
@@ -119,3 +121,86 @@ class TestHeaderChain(unittest.TestCase):
                               HeaderMatchRule, 'x-spam-score', '.*')
         finally:
             config.rules = saved_rules
+
+    @configuration('antispam', header_checks="""
+    Foo: foo
+    """)
+    def test_rules_are_made_once(self):
+        # The rules are made for the first message, and reused for later
+        # ones, so they don't pile up in the registry.
+        chain = config.chains['header-match']
+        self._mlist.header_matches = [('Bar', 'bar')]
+        rules = [link.rule
+                 for link in chain.get_links(self._mlist, Message(), {})]
+        rule_names = set(config.rules)
+        again = [link.rule
+                 for link in chain.get_links(self._mlist, Message(), {})]
+        self.assertEqual(len(rules), 3)
+        for rule, same_rule in zip(rules, again):
+            self.assertIs(rule, same_rule)
+        self.assertEqual(set(config.rules), rule_names)
+
+    def test_list_header_matches_change(self):
+        # The list's links are made again when its header matches change.
+        chain = config.chains['header-match']
+        self._mlist.header_matches = [('Bar', 'bar')]
+        links = list(chain.get_links(self._mlist, Message(), {}))
+        self.assertEqual(links[0].rule.pattern, 'bar')
+        self._mlist.header_matches = [('Bar', 'baz')]
+        links = list(chain.get_links(self._mlist, Message(), {}))
+        self.assertEqual(links[0].rule.pattern, 'baz')
+
+    def test_stale_rules_are_unregistered(self):
+        # The rules which no links are left for are unregistered, unless
+        # another mailing list still uses them.
+        chain = config.chains['header-match']
+        other_list = create_list('other@example.com')
+        other_list.header_matches = [('Bar', 'bar')]
+        self._mlist.header_matches = [('Bar', 'bar'), ('Foo', 'foo')]
+        list(chain.get_links(other_list, Message(), {}))
+        bar, foo = [
+            link.rule.name
+            for link in chain.get_links(self._mlist, Message(), {})][:2]
+        self._mlist.header_matches = [('Foo', 'baz')]
+        baz = list(chain.get_links(self._mlist, Message(), {}))[0].rule.name
+        self.assertIn(bar, config.rules)
+        self.assertNotIn(foo, config.rules)
+        self.assertIn(baz, config.rules)
+
+    def test_deleted_list_is_forgotten(self):
+        # The links of a mailing list which is deleted are forgotten, along
+        # with the rules only it used.
+        chain = config.chains['header-match']
+        self._mlist.header_matches = [('Bar', 'bar')]
+        rule_name = list(
+            chain.get_links(self._mlist, Message(), {}))[0].rule.name
+        self.assertIn(rule_name, config.rules)
+        getUtility(IListManager).delete(self._mlist)
+        self.assertNotIn(rule_name, config.rules)
+        self.assertEqual(chain._list_links, {})
+
+    @configuration('antispam', header_checks="""
+    Foo: foo(
+    Bar: bar
+    """)
+    def test_bad_pattern(self):
+        # A pattern which doesn't compile is left out, with an error logged.
+        mark = LogFileMark('mailman.error')
+        chain = config.chains['header-match']
+        post_checks = [(link.rule.header, link.rule.pattern)
+                       for link in chain.get_links(self._mlist, Message(), {})
+                       if link.rule.name != 'any']
+        self.assertEqual(post_checks, [('Bar', 'bar')])
+        self.assertIn('Configuration error: [antispam]header_checks '
+                      'contains bad pattern: Foo: foo(', mark.readline())
+
+    def test_rule_check(self):
+        # The rule matches any value of the header, case-insensitively.
+        chain = config.chains['header-match']
+        self._mlist.header_matches = [('X-Spam', 'spam[*]{3}')]
+        rule = list(chain.get_links(self._mlist, Message(), {}))[0].rule
+        msg = Message()
+        msg['X-Spam'] = 'SPAM**'
+        self.assertFalse(rule.check(self._mlist, msg, {}))
+        msg['X-Spam'] = 'SPAM***'
+        self.assertTrue(rule.check(self._mlist, msg, {}))
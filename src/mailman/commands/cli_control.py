@@ -15,11 +15,12 @@
 # You should have received a copy of the GNU General Public License along with
 # GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
 
-"""Start/stop/reopen/restart commands."""
+"""Start/stop/reopen/restart/scale commands."""
 
 __all__ = [
     'Reopen',
     'Restart',
+    'Scale',
     'Start',
     'Stop',
     ]
@@ -31,7 +32,7 @@ import errno
 import signal
 import logging
 
-from mailman.bin.master import WatcherState, master_state
+from mailman.bin.master import WatcherState, master_state, request_scaling
 from mailman.config import config
 from mailman.core.i18n import _
 from mailman.interfaces.command import ICLISubCommand
@@ -219,3 +220,48 @@ class Restart(SignalCommand):
     name = 'restart'
     message = _('Restarting the Mailman runners')
     signal = signal.SIGUSR1
+
+
+
+@implementer(ICLISubCommand)
+class Scale:
+    """Change the number of instances of a runner."""
+
+    name = 'scale'
+
+    def add(self, parser, command_parser):
+        """See `ICLISubCommand`."""
+        self.parser = parser
+        command_parser.add_argument(
+            '-q', '--quiet',
+            default=False, action='store_true',
+            help=_("""\
+            Don't print status messages.  Error messages are still printed to
+            standard error."""))
+        command_parser.add_argument(
+            'runner', metavar='RUNNER', nargs=1,
+            help=_("""\
+            The name of the runner.  It must use claim slicing."""))
+        command_parser.add_argument(
+            'instances', metavar='INSTANCES', nargs=1, type=int,
+            help=_("""\
+            The number of instances of the runner to run.  This lasts until
+            the master is stopped; the configured number of instances is
+            started the next time."""))
+
+    def process(self, args):
+        """See `ICLISubCommand`."""
+        name = args.runner[0]
+        count = args.instances[0]
+        runner_config = getattr(config, 'runner.' + name, None)
+        if runner_config is None:
+            self.parser.error(_('No such runner: $name'))
+        if runner_config.slicing != 'claim':
+            self.parser.error(
+                _('Runner $name does not use claim slicing'))
+        if count < 0:
+            self.parser.error(_('Bad number of instances: $count'))
+        if not args.quiet:
+            print(_('Scaling the $name runner to $count instances'))
+        request_scaling(name, count)
+        kill_watcher(signal.SIGUSR2)
@@ -22,9 +22,8 @@ __all__ = [
     ]
 
 
-import pickle
-
 from mailman.core.i18n import _
+from mailman.core.queuefile import load
 from mailman.interfaces.command import ICLISubCommand
 from mailman.utilities.interact import interact
 from pprint import PrettyPrinter
@@ -69,11 +68,7 @@ class QFile:
         printer = PrettyPrinter(indent=4)
         assert len(args.qfile) == 1, 'Wrong number of positional arguments'
         with open(args.qfile[0], 'rb') as fp:
-            while True:
-                try:
-                    m.append(pickle.load(fp))
-                except EOFError:
-                    break
+            m.extend(load(fp))
         if args.doprint:
             print(_('[----- start pickle -----]'))
             for i, obj in enumerate(m):
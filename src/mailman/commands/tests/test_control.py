@@ -18,6 +18,7 @@
 """Test some additional corner cases for starting/stopping."""
 
 __all__ = [
+    'TestScale',
     'TestStart',
     'find_master',
     'make_config',
@@ -34,8 +35,10 @@ import socket
 import unittest
 
 from datetime import timedelta, datetime
-from mailman.commands.cli_control import Start, kill_watcher
+from mailman.bin.master import scaling_requests
+from mailman.commands.cli_control import Scale, Start, kill_watcher
 from mailman.config import config
+from mailman.testing.helpers import configuration
 from mailman.testing.layers import ConfigLayer
 
 
@@ -159,3 +162,46 @@ class TestStart(unittest.TestCase):
         self.command.process(self.args)
         pid = find_master()
         self.assertNotEqual(pid, None)
+
+
+
+class TestScale(unittest.TestCase):
+    """Test scaling runners."""
+
+    layer = ConfigLayer
+
+    def setUp(self):
+        self.command = Scale()
+        self.command.parser = FakeParser()
+        self.args = FakeArgs()
+        self.args.runner = ['out']
+        self.args.instances = [4]
+        # Stand in for the master.
+        self._signals = []
+        handler = signal.signal(
+            signal.SIGUSR2, lambda *args: self._signals.append(args[0]))
+        self.addCleanup(signal.signal, signal.SIGUSR2, handler)
+        with open(config.PID_FILE, 'w') as fp:
+            print(os.getpid(), file=fp)
+        self.addCleanup(os.remove, config.PID_FILE)
+
+    @configuration('runner.out', slicing='claim')
+    def test_scale(self):
+        self.command.process(self.args)
+        self.assertEqual(self._signals, [signal.SIGUSR2])
+        self.assertEqual(scaling_requests(), dict(out=4))
+
+    def test_hash_sliced_runner(self):
+        with self.assertRaises(SystemExit):
+            self.command.process(self.args)
+        self.assertEqual(self.command.parser.message,
+                         'Runner out does not use claim slicing')
+        self.assertEqual(self._signals, [])
+        self.assertEqual(scaling_requests(), {})
+
+    def test_no_such_runner(self):
+        self.args.runner = ['bogus']
+        with self.assertRaises(SystemExit):
+            self.command.process(self.args)
+        self.assertEqual(self.command.parser.message,
+                         'No such runner: bogus')
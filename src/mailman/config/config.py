@@ -84,6 +84,7 @@ class Configuration:
         self.pipelines = {}
         self.commands = {}
         self.password_context = None
+        self.connection_pool = None
 
     def _clear(self):
         """Clear the cached configuration variables."""
@@ -0,0 +1,289 @@
+# Copyright (C) 2015 by the Free Software Foundation, Inc.
+#
+# This file is part of GNU Mailman.
+#
+# GNU Mailman is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# GNU Mailman is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Counts and timings of the work Mailman does.
+
+Every process keeps its own registry of counters and latency histograms,
+which costs little more than a dictionary update per event.  Runner processes
+write a snapshot of theirs to a file in the metrics directory every once in a
+while.  `collect()` adds up the snapshots of all the processes, together with
+the depth of each queue and the age of its oldest entry, in the Prometheus
+text format.
+"""
+
+__all__ = [
+    'BUCKETS',
+    'Registry',
+    'collect',
+    'metrics',
+    'metrics_directory',
+    ]
+
+
+import os
+import time
+import json
+import bisect
+import logging
+import threading
+
+from contextlib import contextmanager
+from lazr.config import as_timedelta
+from mailman.config import config
+from mailman.utilities.filesystem import makedirs
+
+
+# The upper bounds, in seconds, of the histogram buckets.  There is another
+# bucket for everything that takes longer.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+           1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+NL = '\n'
+
+elog = logging.getLogger('mailman.error')
+
+
+def _escape(value):
+    # Escape a label value.
+    return (str(value).replace('\\', '\\\\')
+            .replace('"', '\\"').replace(NL, '\\n'))
+
+
+
+class Registry:
+    """The counters and histograms of one process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (name, labels) -> value, where labels is a sorted tuple of
+        # (label, value) pairs.
+        self._counters = {}
+        # (name, labels) -> [count per bucket..., sum]
+        self._histograms = {}
+        self._published_name = None
+        self._publish_time = 0
+
+    def increment(self, name, amount=1, **labels):
+        """Add to a counter.
+
+        :param name: The metric name.
+        :type name: str
+        :param amount: How much to add.
+        :type amount: int
+        :param labels: The label values.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, seconds, **labels):
+        """Record a time in a histogram.
+
+        :param name: The metric name.
+        :type name: str
+        :param seconds: The time.
+        :type seconds: float
+        :param labels: The label values.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        index = bisect.bisect_left(BUCKETS, seconds)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = [0] * (len(BUCKETS) + 1) + [0.0]
+                self._histograms[key] = histogram
+            histogram[index] += 1
+            histogram[-1] += seconds
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Record the time taken by the body of a `with` statement.
+
+        The time is recorded even if the body raises an exception.
+
+        :param name: The histogram's metric name.
+        :type name: str
+        :param labels: The label values.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self):
+        """Return the current values.
+
+        :return: The counters and histograms, in a form which can be stored
+            as JSON and merged with `Registry.merge()`.
+        :rtype: dict
+        """
+        with self._lock:
+            return dict(
+                counters=[[name, dict(labels), value]
+                          for (name, labels), value
+                          in self._counters.items()],
+                histograms=[[name, dict(labels), list(histogram)]
+                            for (name, labels), histogram
+                            in self._histograms.items()],
+                )
+
+    def merge(self, snapshot):
+        """Add another registry's snapshot to this one.
+
+        :param snapshot: The snapshot.
+        :type snapshot: dict
+        """
+        with self._lock:
+            for name, labels, value in snapshot['counters']:
+                key = (name, tuple(sorted(labels.items())))
+                self._counters[key] = self._counters.get(key, 0) + value
+            for name, labels, values in snapshot['histograms']:
+                key = (name, tuple(sorted(labels.items())))
+                histogram = self._histograms.setdefault(
+                    key, [0] * (len(BUCKETS) + 1) + [0.0])
+                for i, value in enumerate(values):
+                    histogram[i] += value
+
+    def publish(self, name, force=False):
+        """Write a snapshot to the metrics directory.
+
+        The snapshot is written at most once every `[metrics]interval`,
+        unless `force` is true.
+
+        :param name: The name of this process's snapshot file, e.g. the
+            runner name and slice.
+        :type name: str
+        :param force: Write the snapshot now.
+        :type force: bool
+        """
+        interval = as_timedelta(config.metrics.interval).total_seconds()
+        now = time.monotonic()
+        if interval <= 0 or (not force and now < self._publish_time):
+            return
+        self._publish_time = now + interval
+        self._published_name = name
+        directory = metrics_directory()
+        path = os.path.join(directory, name + '.json')
+        try:
+            makedirs(directory)
+            with open(path + '.tmp', 'w') as fp:
+                json.dump(self.snapshot(), fp)
+            os.rename(path + '.tmp', path)
+        except EnvironmentError:
+            elog.exception('Failed to write metrics: %s', path)
+
+    def render(self):
+        """Return the values in the Prometheus text format.
+
+        :return: The text.
+        :rtype: str
+        """
+        lines = []
+        def sample(name, labels, value):
+            if labels:
+                name += '{{{0}}}'.format(','.join(
+                    '{0}="{1}"'.format(label, _escape(value))
+                    for label, value in labels))
+            lines.append('{0} {1!r}'.format(name, value))
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items())
+        family = None
+        for (name, labels), value in counters:
+            if name != family:
+                family = name
+                lines.append('# TYPE {0} counter'.format(name))
+            sample(name, labels, value)
+        for (name, labels), histogram in histograms:
+            if name != family:
+                family = name
+                lines.append('# TYPE {0} histogram'.format(name))
+            count = 0
+            for bound, value in zip(BUCKETS + ('+Inf',), histogram):
+                count += value
+                sample(name + '_bucket',
+                       labels + (('le', str(bound)),), count)
+            sample(name + '_sum', labels, histogram[-1])
+            sample(name + '_count', labels, count)
+        return NL.join(lines) + NL
+
+
+# The registry of this process.
+metrics = Registry()
+
+
+
+def metrics_directory():
+    """Return the directory holding the processes' metrics snapshots.
+
+    :return: The directory's path.
+    :rtype: str
+    """
+    return os.path.join(config.VAR_DIR, 'metrics')
+
+
+def collect():
+    """Add up the metrics of all processes.
+
+    This merges the snapshots in the metrics directory with this process's
+    own registry, and adds gauges for the number of files in each queue, the
+    number scheduled for later, and the age of the oldest due file.
+
+    :return: The metrics, in the Prometheus text format.
+    :rtype: str
+    """
+    total = Registry()
+    directory = metrics_directory()
+    try:
+        filenames = sorted(os.listdir(directory))
+    except FileNotFoundError:
+        filenames = []
+    for filename in filenames:
+        name, ext = os.path.splitext(filename)
+        # This process's own snapshot may be out of date.
+        if ext != '.json' or name == metrics._published_name:
+            continue
+        try:
+            with open(os.path.join(directory, filename)) as fp:
+                total.merge(json.load(fp))
+        except (EnvironmentError, ValueError):
+            elog.exception('Failed to read metrics: %s', filename)
+    total.merge(metrics.snapshot())
+    lines = [total.render()]
+    now = time.time()
+    depths = []
+    scheduled = []
+    ages = []
+    for name in sorted(config.switchboards):
+        switchboard = config.switchboards[name]
+        files = switchboard.files
+        label = '{{queue="{0}"}}'.format(_escape(name))
+        depths.append('mailman_queue_depth{0} {1}'.format(label, len(files)))
+        scheduled.append('mailman_queue_scheduled{0} {1}'.format(
+            label, len(switchboard.scheduled)))
+        if len(files) > 0:
+            # The file base starts with the time the file was first queued.
+            when = float(files[0].split('+', 1)[0])
+            ages.append('mailman_queue_oldest_seconds{0} {1!r}'.format(
+                label, max(now - when, 0.0)))
+    lines.append('# TYPE mailman_queue_depth gauge\n')
+    lines.extend(line + NL for line in depths)
+    lines.append('# TYPE mailman_queue_scheduled gauge\n')
+    lines.extend(line + NL for line in scheduled)
+    lines.append('# TYPE mailman_queue_oldest_seconds gauge\n')
+    lines.extend(line + NL for line in ages)
+    return ''.join(lines)
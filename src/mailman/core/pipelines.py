@@ -33,6 +33,7 @@ from mailman.app.bounces import bounce_message
 from mailman.config import config
 from mailman.core import errors
 from mailman.core.i18n import _
+from mailman.core.metrics import metrics
 from mailman.interfaces.handler import IHandler
 from mailman.interfaces.pipeline import IPipeline
 from mailman.utilities.modules import find_components
@@ -59,7 +60,9 @@ def process(mlist, msg, msgdata, pipeline_name='built-in'):
         dlog.debug('{0} pipeline {1} processing: {2}'.format(
             message_id, pipeline_name, handler.name))
         try:
-            handler.process(mlist, msg, msgdata)
+            with metrics.timer('mailman_handler_seconds',
+                               handler=handler.name):
+                handler.process(mlist, msg, msgdata)
         except errors.DiscardMessage as error:
             vlog.info(
                 '{0} discarded by "{1}" pipeline handler "{2}": {3}'.format(
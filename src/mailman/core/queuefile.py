@@ -0,0 +1,659 @@
+# Copyright (C) 2015 by the Free Software Foundation, Inc.
+#
+# This file is part of GNU Mailman.
+#
+# GNU Mailman is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# GNU Mailman is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Queue file formats.
+
+Originally, queue files held two pickles: the whole message object tree and
+then the metadata dictionary.  Every hop from queue to queue pickled and
+unpickled the complete message again, whether or not the runner in between
+had looked at it.
+
+The `RFC822Format` instead writes a small header holding the pickled metadata,
+followed by the message's bytes.  The message is handed to the runner as a
+`LazyMessage`, which only parses its headers when they are first used, and
+its body when the payload is.  When a message goes back into a queue, the
+bytes of whatever hasn't been parsed are written out as they are.
+
+Files in the `PickleFormat` can always be read, so queue files written by
+older versions of Mailman are still processed.
+
+A `SpooledMessage` is generated by Mailman with its body in files, such as a
+digest's spool file.  Its bytes are copied from the files straight into its
+queue file, so the message is never held in memory as a whole.
+
+A message going to several queues at once can be written with its body in a
+file of its own, which all of its queue files in the `SharedFormat` refer to.
+See `mailman.core.switchboard.enqueue_shared()`.
+"""
+
+__all__ = [
+    'GeneratedMessage',
+    'LazyMessage',
+    'PickleFormat',
+    'RFC822Format',
+    'SharedFormat',
+    'SpooledMessage',
+    'find_format',
+    'lazy_copy',
+    'load',
+    'hash_chunks',
+    'message_bytes',
+    'shared_directory',
+    'write_chunks',
+    ]
+
+
+import os
+import re
+import email
+import pickle
+import shutil
+import struct
+
+from email.generator import BytesGenerator
+from email.parser import BytesParser
+from io import BytesIO
+from mailman.config import config
+from mailman.email.message import Message, VERSION
+from mailman.interfaces.switchboard import IQueueFileFormat
+from zope.interface import implementer
+
+
+# RFC822Format files start with this, followed by the length of the metadata
+# header.  A pickle never starts with it.
+MAGIC = b'MMQ1'
+LENGTH = struct.Struct('>I')
+
+# SharedFormat files start with this instead.
+SHARED_MAGIC = b'MMQS'
+
+# The first empty line in a message ends its headers.
+EMPTY_LINE = re.compile(rb'^\r?\n', re.MULTILINE)
+
+# The attributes of a message which are set when its headers are parsed, and
+# the ones which are set when its body is.
+HEADER_ATTRIBUTES = ('policy', '_headers', '_unixfrom', '_charset',
+                     '_default_type')
+BODY_ATTRIBUTES = ('_payload', 'preamble', 'epilogue', 'defects')
+
+# A lazy message's own bookkeeping.
+LAZY_ATTRIBUTES = ('_raw', '_raw_headers', '_raw_unixfrom', '_body_offset',
+                   '_chunks')
+
+# How much of a file is read at a time when it is copied.
+COPY_CHUNK = 1024 * 1024
+
+# The attributes every message object has.  Anything else, such as
+# `original_size`, was added by Mailman and is stored with the metadata.
+MESSAGE_ATTRIBUTES = frozenset(
+    set(vars(Message())) | set(HEADER_ATTRIBUTES) | set(BODY_ATTRIBUTES) |
+    set(LAZY_ATTRIBUTES))
+
+
+
+class LazyMessage(Message):
+    """A message which is parsed from its bytes as it is used.
+
+    Until something looks at it, the message is nothing but its bytes.  The
+    headers are parsed the first time they are used, and the body the first
+    time the payload is.  Otherwise, this is a normal `Message`.
+    """
+
+    def __init__(self, raw):
+        # Don't call the base class constructor; that would give us empty
+        # headers and payload.
+        self.__version__ = VERSION
+        self._raw = raw
+
+    def __getattr__(self, name):
+        # This is only called for attributes which haven't been set yet.
+        state = self.__dict__
+        if '_raw' in state:
+            if name in HEADER_ATTRIBUTES:
+                self._parse_headers()
+            elif name in BODY_ATTRIBUTES:
+                self._parse_body()
+            if name in state:
+                return state[name]
+        raise AttributeError(name)
+
+    def _parse_headers(self):
+        raw = self._raw
+        match = EMPTY_LINE.search(raw)
+        offset = (len(raw) if match is None else match.end())
+        headers = BytesParser(Message).parsebytes(
+            raw[:offset], headersonly=True)
+        if headers.get_payload():
+            # The parser found the end of the headers before the empty line,
+            # e.g. because of a malformed header.  Only a full parse will do.
+            self._parse_body()
+            return
+        for name in HEADER_ATTRIBUTES:
+            self.__dict__.setdefault(name, getattr(headers, name))
+        # Remember what the headers looked like so that we can tell whether
+        # they have to be generated again.
+        self._raw_headers = list(self._headers)
+        self._raw_unixfrom = self._unixfrom
+        self._body_offset = offset
+
+    def _parse_body(self):
+        state = self.__dict__
+        parsed = email.message_from_bytes(self._raw, Message)
+        # Anything that has been set already, in particular the headers if
+        # they were parsed before, stays as it is.
+        for name in HEADER_ATTRIBUTES + BODY_ATTRIBUTES:
+            state.setdefault(name, getattr(parsed, name))
+        for name in LAZY_ATTRIBUTES:
+            state.pop(name, None)
+
+    def as_raw_bytes(self):
+        """Return the bytes of the message, reusing its unparsed bytes.
+
+        :return: The message bytes, or None if the body has been parsed and
+            the whole message has to be generated again.
+        :rtype: bytes
+        """
+        state = self.__dict__
+        if '_raw' not in state or '_payload' in state:
+            return None
+        raw = state['_raw']
+        if '_headers' not in state:
+            # Nobody has even looked at the message.
+            return raw
+        if (self._headers == self._raw_headers and
+                self._unixfrom == self._raw_unixfrom):
+            return raw
+        # Only the headers have changed, so only they have to be generated.
+        # This is what `BytesGenerator` does with `maxheaderlen=0`.
+        policy = self.policy.clone(max_line_length=0)
+        chunks = []
+        if self._unixfrom is not None:
+            chunks.append(self._unixfrom.encode('ascii', 'surrogateescape'))
+            chunks.append(b'\n')
+        for name, value in self._headers:
+            chunks.append(policy.fold_binary(name, value))
+        chunks.append(b'\n')
+        chunks.append(memoryview(raw)[self._body_offset:])
+        return b''.join(chunks)
+
+
+
+class GeneratedMessage(LazyMessage):
+    """A lazy message whose bytes were generated by Mailman itself.
+
+    Its bytes are what flattening the message would give, so as long as
+    nothing changes its body and it is all ASCII, they are also its text.
+    """
+
+    @classmethod
+    def with_headers(cls, headers, *body):
+        """Make a message from the headers of another one and a body.
+
+        :param headers: The message whose headers the new message gets.  Its
+            payload is ignored.
+        :type headers: `Message`
+        :param body: The body, as `BytesGenerator` would generate it.  It may
+            be given in several chunks, which saves copying them first.
+        :type body: bytes or other bytes-like objects
+        :return: The message.
+        :rtype: `GeneratedMessage`
+        """
+        # Generate the headers the way `as_raw_bytes()` does, and set the
+        # message up as if they had been parsed.  This keeps any `Header`
+        # objects as they are.
+        policy = headers.policy.clone(max_line_length=0)
+        chunks = [policy.fold_binary(name, value)
+                  for name, value in headers._headers]
+        chunks.append(b'\n')
+        offset = sum(len(chunk) for chunk in chunks)
+        chunks.extend(body)
+        msg = cls(b''.join(chunks))
+        for name in HEADER_ATTRIBUTES:
+            msg.__dict__[name] = getattr(headers, name)
+        msg._headers = list(headers._headers)
+        msg._unixfrom = None
+        msg._raw_headers = list(msg._headers)
+        msg._raw_unixfrom = None
+        msg._body_offset = offset
+        return msg
+
+    def as_string(self, unixfrom=False, maxheaderlen=0, policy=None):
+        raw = self.as_raw_bytes()
+        if (raw is not None and not unixfrom and maxheaderlen == 0 and
+                policy is None):
+            try:
+                return raw.decode('ascii')
+            except UnicodeError:
+                # A changed header or the body has non-ASCII text in it.
+                pass
+        return super(GeneratedMessage, self).as_string(
+            unixfrom, maxheaderlen, policy)
+
+
+
+class SpooledMessage(GeneratedMessage):
+    """A generated message whose body is kept in files.
+
+    The body is only read into memory when something needs the message's
+    bytes or parses its body.  Until then, `raw_chunks()` gives the files,
+    which are copied into the message's queue file as they are.  The files
+    must stay open and unchanged for as long as the message is used.
+    """
+
+    @classmethod
+    def with_headers(cls, headers, *body):
+        """Make a message from the headers of another one and a body.
+
+        :param headers: The message whose headers the new message gets.  Its
+            payload is ignored.
+        :type headers: `Message`
+        :param body: The body, as `BytesGenerator` would generate it, in
+            chunks.  A chunk is either bytes or a file opened for reading in
+            binary mode, whose whole contents are part of the body.
+        :type body: bytes, other bytes-like objects, or files
+        :return: The message.
+        :rtype: `SpooledMessage`
+        """
+        msg = super(SpooledMessage, cls).with_headers(headers)
+        head = msg.__dict__.pop('_raw')
+        msg._chunks = [head] + list(body)
+        return msg
+
+    def _read(self):
+        # Read the body in, and carry on as a plain lazy message.
+        state = self.__dict__
+        if '_chunks' in state:
+            state['_raw'] = b''.join(_read_chunks(state.pop('_chunks')))
+
+    def __getattr__(self, name):
+        if '_chunks' in self.__dict__ and (name == '_raw' or
+                                           name in BODY_ATTRIBUTES):
+            self._read()
+            if name == '_raw':
+                return self._raw
+        return super(SpooledMessage, self).__getattr__(name)
+
+    def __getstate__(self):
+        # The files can't be pickled, so the body is read in first.
+        self._read()
+        return self.__dict__
+
+    def as_raw_bytes(self):
+        """See `LazyMessage`."""
+        self._read()
+        return super(SpooledMessage, self).as_raw_bytes()
+
+    def raw_chunks(self):
+        """Return the bytes of the message in chunks, without reading it.
+
+        :return: The chunks, as for `with_headers()` plus the headers in
+            front of them, or None if the message has been read, or its
+            headers have changed.
+        :rtype: list
+        """
+        state = self.__dict__
+        if ('_chunks' not in state or self._headers != self._raw_headers or
+                self._unixfrom != self._raw_unixfrom):
+            return None
+        return list(state['_chunks'])
+
+
+
+def message_bytes(msg, charset=None):
+    """Return the bytes of a message.
+
+    A lazy message's bytes are reused as far as possible; any other message
+    is flattened.
+
+    :param msg: The message, or its text.
+    :type msg: `email.message.Message` or str
+    :param charset: If given, a message parsed from text which isn't ASCII
+        is flattened to text and encoded in this charset, instead of
+        raising an exception.
+    :type charset: str
+    :return: The message's bytes.
+    :rtype: bytes
+    :raise UnicodeError: if the message can't be represented as bytes
+        without loss, and no charset is given.
+    """
+    try:
+        if isinstance(msg, str):
+            return msg.encode('ascii')
+        if isinstance(msg, LazyMessage):
+            raw = msg.as_raw_bytes()
+            if raw is not None:
+                return raw
+        fp = BytesIO()
+        generator = BytesGenerator(fp, mangle_from_=False, maxheaderlen=0)
+        generator.flatten(msg, unixfrom=(msg.get_unixfrom() is not None))
+        return fp.getvalue()
+    except UnicodeError:
+        if charset is None:
+            raise
+    if not isinstance(msg, str):
+        msg = msg.as_string(unixfrom=(msg.get_unixfrom() is not None))
+    return msg.encode(charset)
+
+
+def _read_chunks(chunks):
+    # Yield the bytes of the chunks, reading the files a piece at a time.
+    for chunk in chunks:
+        if hasattr(chunk, 'read'):
+            chunk.seek(0)
+            yield from iter(lambda: chunk.read(COPY_CHUNK), b'')
+        else:
+            yield chunk
+
+
+def write_chunks(fp, chunks):
+    """Write chunks of bytes to a file, copying the ones which are files.
+
+    :param fp: The file to write to.
+    :param chunks: The chunks, as returned by `IQueueFileFormat.dumps()`.
+    :type chunks: sequence of bytes-like objects and files
+    """
+    for chunk in chunks:
+        if hasattr(chunk, 'read'):
+            chunk.seek(0)
+            shutil.copyfileobj(chunk, fp, COPY_CHUNK)
+        else:
+            fp.write(chunk)
+
+
+def hash_chunks(hashfood, chunks):
+    """Update a hash with chunks of bytes, some of which may be files.
+
+    :param hashfood: The hash object.
+    :param chunks: The chunks, as returned by `IQueueFileFormat.dumps()`.
+    :type chunks: sequence of bytes-like objects and files
+    """
+    for chunk in _read_chunks(chunks):
+        hashfood.update(chunk)
+
+
+def lazy_copy(msg, raw):
+    """Return a copy of a message which is only parsed as it is used.
+
+    Unlike a deep copy, this doesn't copy the message's object tree, and
+    copies made from the same bytes share them.  Changing a copy's headers
+    only generates its headers again when it is flattened.
+
+    :param msg: The message.
+    :type msg: `email.message.Message`
+    :param raw: The message's bytes, as returned by `message_bytes()`.
+    :type raw: bytes
+    :return: The copy.
+    :rtype: `GeneratedMessage`
+    """
+    copy = GeneratedMessage(raw)
+    vars(copy).update(_message_attributes(msg))
+    return copy
+
+
+def _message_attributes(msg):
+    # Return the attributes Mailman added to the message.
+    if isinstance(msg, str):
+        return {}
+    return {name: value for name, value in vars(msg).items()
+            if name not in MESSAGE_ATTRIBUTES}
+
+
+def _dumps_header(magic, header):
+    # Return the start of a queue file holding a pickled header.
+    header = pickle.dumps(header, pickle.HIGHEST_PROTOCOL)
+    return magic + LENGTH.pack(len(header)) + header
+
+
+def _read_header(fp, magic):
+    # Read the pickled header at the start of a queue file.
+    marker = fp.read(len(magic))
+    assert marker == magic, 'Not a {!r} queue file'.format(magic)
+    length = LENGTH.unpack(fp.read(LENGTH.size))[0]
+    return pickle.loads(fp.read(length))
+
+
+def shared_directory():
+    """Return the directory holding the shared message bodies.
+
+    :return: The directory's path.
+    :rtype: str
+    """
+    return os.path.join(config.QUEUE_DIR, 'shared')
+
+
+
+@implementer(IQueueFileFormat)
+class PickleFormat:
+    """A pickle of the message followed by a pickle of its metadata."""
+
+    def recognize(self, fp):
+        """See `IQueueFileFormat`."""
+        # This is the fallback for any file with no other format's marker.
+        return True
+
+    def dumps(self, msg, metadata):
+        """See `IQueueFileFormat`."""
+        if (isinstance(msg, SpooledMessage) and
+                msg.raw_chunks() is not None):
+            # Pickling the message would read its body into memory, so it is
+            # written in a format which copies the body instead.  Any
+            # switchboard can read it.
+            return RFC822Format().dumps(msg, metadata)
+        if metadata.get('_parsemsg'):
+            protocol = 0
+        else:
+            protocol = pickle.HIGHEST_PROTOCOL
+        return [pickle.dumps(msg, protocol), pickle.dumps(metadata, protocol)]
+
+    def load(self, fp):
+        """See `IQueueFileFormat`."""
+        msg = pickle.load(fp)
+        data = pickle.load(fp)
+        if data.get('_parsemsg'):
+            # Calculate the original size of the text now so that we won't
+            # have to generate the message later when we do size restriction
+            # checking.
+            original_size = len(msg)
+            msg = email.message_from_string(msg, Message)
+            msg.original_size = original_size
+            data['original_size'] = original_size
+        return msg, data
+
+    def load_metadata(self, fp):
+        """See `IQueueFileFormat`."""
+        # Throw away the message object.
+        pickle.load(fp)
+        return pickle.load(fp)
+
+    def replace_metadata(self, fp, metadata):
+        """See `IQueueFileFormat`."""
+        pickle.load(fp)
+        if metadata.get('_parsemsg'):
+            protocol = 0
+        else:
+            protocol = 1
+        pickle.dump(metadata, fp, protocol)
+        fp.truncate()
+
+
+
+@implementer(IQueueFileFormat)
+class RFC822Format:
+    """The pickled metadata, then the message's bytes.
+
+    The file starts with a marker and the length of the metadata pickle.
+    Messages which can't be represented as bytes, e.g. because they have
+    non-ASCII text in their headers, are written in the `PickleFormat`.
+    """
+
+    def recognize(self, fp):
+        """See `IQueueFileFormat`."""
+        marker = fp.read(len(MAGIC))
+        fp.seek(0)
+        return marker == MAGIC
+
+    def dumps(self, msg, metadata):
+        """See `IQueueFileFormat`."""
+        chunks = (msg.raw_chunks()
+                  if isinstance(msg, SpooledMessage)
+                  else None)
+        if chunks is None:
+            try:
+                chunks = [message_bytes(msg)]
+            except UnicodeError:
+                return PickleFormat().dumps(msg, metadata)
+        header = (metadata, _message_attributes(msg))
+        return [_dumps_header(MAGIC, header)] + chunks
+
+    def load(self, fp):
+        """See `IQueueFileFormat`."""
+        data, attributes = _read_header(fp, MAGIC)
+        raw = fp.read()
+        msg = LazyMessage(raw)
+        vars(msg).update(attributes)
+        if data.get('_parsemsg'):
+            msg.original_size = len(raw)
+            data['original_size'] = len(raw)
+        return msg, data
+
+    def load_metadata(self, fp):
+        """See `IQueueFileFormat`."""
+        data, attributes = _read_header(fp, MAGIC)
+        return data
+
+    def replace_metadata(self, fp, metadata):
+        """See `IQueueFileFormat`."""
+        data, attributes = _read_header(fp, MAGIC)
+        raw = fp.read()
+        fp.seek(0)
+        fp.write(_dumps_header(MAGIC, (metadata, attributes)))
+        fp.write(raw)
+        fp.truncate()
+
+
+
+@implementer(IQueueFileFormat)
+class SharedFormat:
+    """The pickled metadata, then the name of a shared message body.
+
+    The message's bytes are in the shared body directory, where each queue
+    file has a hard link of its own to them, its reference.  The body is
+    stored under its own name as well so that it can be found again.
+    """
+
+    def __init__(self, reference=None, body=None):
+        """Create a shared format.
+
+        :param reference: When writing queue files, the name of the queue
+            file's link to the message body.
+        :type reference: str
+        :param body: When writing queue files, the name of the body.
+        :type body: str
+        """
+        self.reference = reference
+        self.body = body
+
+    @staticmethod
+    def dumps_body(msg):
+        """Serialize a message body to be shared.
+
+        :param msg: The message.
+        :type msg: `email.message.Message`
+        :return: The message's bytes.
+        :rtype: bytes
+        :raise UnicodeError: if the message can't be represented as bytes.
+        """
+        return message_bytes(msg)
+
+    def recognize(self, fp):
+        """See `IQueueFileFormat`."""
+        marker = fp.read(len(SHARED_MAGIC))
+        fp.seek(0)
+        return marker == SHARED_MAGIC
+
+    def dumps(self, msg, metadata):
+        """See `IQueueFileFormat`."""
+        assert self.reference is not None, 'No shared body to refer to'
+        header = (metadata, _message_attributes(msg),
+                  self.reference, self.body)
+        return [_dumps_header(SHARED_MAGIC, header)]
+
+    def load_shared(self, fp):
+        """Read a message, its metadata, and the names of its body.
+
+        :param fp: The queue file, positioned at its start.
+        :return: The message, its metadata, and the names of the queue
+            file's reference and of the body.
+        :rtype: 3-tuple of (`email.message.Message`, dict, 2-tuple of str)
+        """
+        data, attributes, reference, body = _read_header(fp, SHARED_MAGIC)
+        path = os.path.join(shared_directory(), reference)
+        with open(path, 'rb') as body_fp:
+            msg = LazyMessage(body_fp.read())
+        vars(msg).update(attributes)
+        return msg, data, (reference, body)
+
+    def load(self, fp):
+        """See `IQueueFileFormat`."""
+        msg, data, names = self.load_shared(fp)
+        return msg, data
+
+    def load_metadata(self, fp):
+        """See `IQueueFileFormat`."""
+        return _read_header(fp, SHARED_MAGIC)[0]
+
+    def replace_metadata(self, fp, metadata):
+        """See `IQueueFileFormat`."""
+        header = _read_header(fp, SHARED_MAGIC)
+        fp.seek(0)
+        fp.write(_dumps_header(SHARED_MAGIC, (metadata,) + header[1:]))
+        fp.truncate()
+
+
+
+def find_format(fp, preferred=None):
+    """Return the format of a queue file.
+
+    :param fp: The queue file, opened in binary mode and positioned at its
+        start.
+    :param preferred: A queue file format to try first, usually the one the
+        switchboard writes.
+    :type preferred: `IQueueFileFormat`
+    :return: The queue file format which can read the file.
+    :rtype: `IQueueFileFormat`
+    """
+    formats = [RFC822Format(), SharedFormat()]
+    if preferred is not None and not isinstance(preferred, PickleFormat):
+        formats.insert(0, preferred)
+    for queue_format in formats:
+        if queue_format.recognize(fp):
+            return queue_format
+    # The pickle format recognizes everything, so it has to be tried last.
+    return PickleFormat()
+
+
+def load(fp, preferred=None):
+    """Read the message and metadata from a queue file in any format.
+
+    :param fp: The queue file, opened in binary mode and positioned at its
+        start.
+    :param preferred: A queue file format to try first.
+    :type preferred: `IQueueFileFormat`
+    :return: The message and its metadata.
+    :rtype: 2-tuple of (`email.message.Message`, dict)
+    """
+    return find_format(fp, preferred).load(fp)
@@ -0,0 +1,263 @@
+# Copyright (C) 2015 by the Free Software Foundation, Inc.
+#
+# This file is part of GNU Mailman.
+#
+# GNU Mailman is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# GNU Mailman is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Incremental index of the files in a queue directory slice.
+
+Listing a queue directory, parsing every file name, testing it against the
+slice's hash range and sorting the result gets expensive when a queue backs up
+to many thousands of files.  A `QueueIndex` does that work once per file and
+then keeps the FIFO ordered list of file bases up to date as files come and
+go, either by following inotify events or by re-reading the directory only
+when its modification time changes.  Since the index is ordered by time, the
+files scheduled for later are simply those at its end.
+"""
+
+__all__ = [
+    'QueueIndex',
+    'SCAN_METHODS',
+    ]
+
+
+import os
+import time
+
+from mailman.utilities.inotify import (
+    IN_CREATE, IN_DELETE, IN_MOVED_FROM, IN_MOVED_TO, get_watcher)
+
+
+SCAN_METHODS = ('auto', 'inotify', 'poll', 'scan')
+
+# Directory modification times are only as precise as the file system (and
+# the kernel's clock tick) make them.  A file added within this many seconds
+# of the last directory read could share its mtime, so until the directory
+# has been read at least this long after it last changed, we read it again.
+MTIME_SLOP = 1.0
+
+
+
+class QueueIndex:
+    """A FIFO ordered index of the queue files in one slice.
+
+    The index is ordered by the time stamp encoded in each file name, with
+    the hash digest breaking ties.
+    """
+
+    def __init__(self, directory, extension='.pck',
+                 lower=None, upper=None, method='auto'):
+        """Create a queue index.
+
+        :param directory: The queue directory.
+        :type directory: str
+        :param extension: Only files with this extension are indexed.
+        :type extension: str
+        :param lower: The lowest hash value in this slice, or None if the
+            index covers the whole queue.
+        :param upper: The highest hash value in this slice, or None.
+        :param method: How to detect changes to the directory; one of
+            `SCAN_METHODS`.  'scan' makes the index read the whole directory
+            on every refresh.
+        :type method: str
+        """
+        assert method in SCAN_METHODS, 'Bad scan method: {}'.format(method)
+        self.directory = directory
+        self.extension = extension
+        self.method = method
+        self._lower = lower
+        self._upper = upper
+        # File base -> sort key for all indexed files in our slice.
+        self._entries = {}
+        # The sorted (key, filebase) list, or None when it must be rebuilt.
+        # It may contain entries which have since been removed, but never
+        # duplicates.
+        self._order = []
+        # The list of file bases last handed out, or None when it's changed.
+        self._files = None
+        # All the directory entries seen at the last full read, so that a
+        # re-read only has to look at what changed.
+        self._names = set()
+        self._watching = False
+        self._stale = True
+        self._mtime = None
+        self._read_at = 0
+
+    @property
+    def watching(self):
+        """True when the index is following inotify events."""
+        return self._watching
+
+    def __len__(self):
+        self.refresh()
+        return len(self._entries)
+
+    def __contains__(self, filebase):
+        self.refresh()
+        return filebase in self._entries
+
+    @property
+    def files(self):
+        """The FIFO ordered list of file bases currently in the slice."""
+        self.refresh()
+        if self._files is None:
+            if self._order is None:
+                self._order = sorted(
+                    (key, filebase) for filebase, key in self._entries.items())
+            elif len(self._order) != len(self._entries):
+                entries = self._entries
+                self._order = [
+                    item for item in self._order if item[1] in entries]
+            self._files = [filebase for key, filebase in self._order]
+        # Callers are free to mutate what they get.
+        return list(self._files)
+
+    def split(self, when):
+        """Split the files into those which are due and those which aren't.
+
+        The time stamp in a file's name is normally the time it was written,
+        but a file can be scheduled by giving it a later one.
+
+        :param when: The time, in seconds since the epoch, up to which files
+            are due.
+        :type when: float
+        :return: The FIFO ordered lists of the file bases which are due, and
+            of those which are scheduled for later.
+        :rtype: 2-tuple of lists
+        """
+        files = self.files
+        entries = self._entries
+        # Usually nothing is scheduled, so check the last file first.
+        if len(files) == 0 or entries[files[-1]] <= when:
+            return files, []
+        low = 0
+        high = len(files) - 1
+        while low < high:
+            middle = (low + high) // 2
+            if entries[files[middle]] <= when:
+                low = middle + 1
+            else:
+                high = middle
+        return files[:low], files[low:]
+
+    def refresh(self):
+        """Bring the index up to date with the queue directory."""
+        if self._watching:
+            self._watcher.process_events()
+            # Processing events can make us lose the watch.
+            if not self._stale:
+                return
+        if self.method in ('auto', 'inotify') and not self._watching:
+            self._watch()
+        if self._watching:
+            if self._stale:
+                self._read()
+            return
+        if self.method != 'scan':
+            try:
+                stat = os.stat(self.directory)
+            except FileNotFoundError:
+                self._stale = True
+            else:
+                if (not self._stale and
+                        stat.st_mtime_ns == self._mtime and
+                        self._read_at - stat.st_mtime > MTIME_SLOP):
+                    return
+                self._mtime = stat.st_mtime_ns
+        self._read()
+
+    def _watch(self):
+        self._watcher = get_watcher()
+        if self._watcher is None:
+            if self.method == 'inotify':
+                raise RuntimeError('inotify is not available')
+            return
+        try:
+            self._watcher.subscribe(self.directory, self)
+        except FileNotFoundError:
+            # Try again once the directory exists.
+            return
+        except OSError:
+            if self.method == 'inotify':
+                raise
+            return
+        self._watching = True
+        # Whatever was there before the watch was added must be read.
+        self._stale = True
+
+    def _read(self):
+        # Read the whole directory, but only parse the names we haven't seen
+        # at the last read.
+        self._read_at = time.time()
+        try:
+            names = set(os.listdir(self.directory))
+        except FileNotFoundError:
+            names = set()
+        for name in self._names - names:
+            self._remove(name)
+        for name in names - self._names:
+            self._add(name)
+        self._names = names
+        self._stale = False
+
+    def _add(self, name):
+        # By ignoring anything that doesn't end in the right extension, we
+        # ignore tempfiles and avoid a race condition.
+        filebase, ext = os.path.splitext(name)
+        if ext != self.extension or filebase in self._entries:
+            return
+        try:
+            when, digest = filebase.split('+', 1)
+            key = float(when)
+            # Throw out any files which don't match our bitrange.  Both
+            # comparisons need to be <= to get the complete range.
+            if self._lower is not None and not (
+                    self._lower <= int(digest, 16) <= self._upper):
+                return
+        except ValueError:
+            return
+        self._entries[filebase] = key
+        order = self._order
+        if order is not None:
+            # Files almost always arrive in time order, so the list usually
+            # just grows at the end.  Otherwise it's re-sorted when needed.
+            if len(order) == 0 or (key, filebase) > order[-1]:
+                order.append((key, filebase))
+                if (self._files is not None and
+                        len(self._files) == len(self._entries) - 1):
+                    self._files.append(filebase)
+                    return
+            else:
+                self._order = None
+        self._files = None
+
+    def _remove(self, name):
+        filebase, ext = os.path.splitext(name)
+        if ext == self.extension and filebase in self._entries:
+            del self._entries[filebase]
+            self._files = None
+
+    def watch_event(self, mask, name):
+        """See `Watcher`."""
+        if mask & (IN_CREATE | IN_MOVED_TO):
+            self._names.add(name)
+            self._add(name)
+        elif mask & (IN_DELETE | IN_MOVED_FROM):
+            self._names.discard(name)
+            self._remove(name)
+
+    def watch_lost(self):
+        """See `Watcher`."""
+        self._watching = False
+        self._stale = True
@@ -32,10 +32,13 @@ from lazr.config import as_boolean, as_timedelta
 from mailman.config import config
 from mailman.core.i18n import _
 from mailman.core.logging import reopen
-from mailman.core.switchboard import Switchboard
+from mailman.core.metrics import metrics
+from mailman.core.switchboard import Switchboard, deferred_sync
 from mailman.interfaces.languages import ILanguageManager
 from mailman.interfaces.listmanager import IListManager
 from mailman.interfaces.runner import IRunner, RunnerCrashEvent
+from mailman.interfaces.switchboard import AlreadyDequeuedError
+from mailman.utilities.modules import call_name
 from mailman.utilities.string import expand
 from zope.component import getUtility
 from zope.event import notify
@@ -62,6 +65,9 @@ class Runner:
         """
         # Grab the configuration section.
         self.name = name
+        # The name of this runner process's metrics snapshot.
+        self._metrics_name = (name if slice is None
+                              else '{0}.{1}'.format(name, slice))
         section = getattr(config, 'runner.' + name)
         substitutions = config.paths
         substitutions['name'] = name
@@ -71,7 +77,9 @@ class Runner:
         if self.is_queue_runner:
             self.queue_directory = expand(section.path, substitutions)
             self.switchboard = Switchboard(
-                name, self.queue_directory, slice, numslices, True)
+                name, self.queue_directory, slice, numslices, True,
+                section.scan_method, call_name(section.queue_format),
+                section.slicing)
         else:
             self.queue_directory = None
             self.switchboard= None
@@ -81,6 +89,7 @@ class Runner:
                             self.sleep_time.seconds +
                             self.sleep_time.microseconds / 1.0e6)
         self.max_restarts = int(section.max_restarts)
+        self.batch_size = max(int(section.batch_size), 1)
         self.start = as_boolean(section.start)
         self._stop = False
         self.status = 0
@@ -123,6 +132,7 @@ class Runner:
                 filecnt = self._one_iteration()
                 # Do the periodic work for the subclass.
                 self._do_periodic()
+                self._publish_metrics()
                 # If the stop flag is set, we're done.
                 if self._stop:
                     break
@@ -134,6 +144,7 @@ class Runner:
             pass
         finally:
             self._clean_up()
+            self._publish_metrics(force=True)
 
     def _one_iteration(self):
         """See `IRunner`."""
@@ -142,69 +153,112 @@ class Runner:
         # List all the files in our queue directory.  The switchboard is
         # guaranteed to hand us the files in FIFO order.
         files = self.switchboard.files
-        for filebase in files:
-            dlog.debug('[%s] processing filebase: %s', me, filebase)
-            try:
-                # Ask the switchboard for the message and metadata objects
-                # associated with this queue file.
-                msg, msgdata = self.switchboard.dequeue(filebase)
-            except Exception as error:
-                # This used to just catch email.Errors.MessageParseError, but
-                # other problems can occur in message parsing, e.g.
-                # ValueError, and exceptions can occur in unpickling too.  We
-                # don't want the runner to die, so we just log and skip this
-                # entry, but preserve it for analysis.
-                self._log(error)
-                elog.error('Skipping and preserving unparseable message: %s',
-                           filebase)
-                self.switchboard.finish(filebase, preserve=True)
-                config.db.abort()
-                continue
-            try:
-                dlog.debug('[%s] processing onefile', me)
-                self._process_one_file(msg, msgdata)
-                dlog.debug('[%s] finishing filebase: %s', me, filebase)
-                self.switchboard.finish(filebase)
-            except Exception as error:
-                # All runners that implement _dispose() must guarantee that
-                # exceptions are caught and dealt with properly.  Still, there
-                # may be a bug in the infrastructure, and we do not want those
-                # to cause messages to be lost.  Any uncaught exceptions will
-                # cause the message to be stored in the shunt queue for human
-                # intervention.
-                self._log(error)
-                # Put a marker in the metadata for unshunting.
-                msgdata['whichq'] = self.switchboard.name
-                # It is possible that shunting can throw an exception, e.g. a
-                # permissions problem or a MemoryError due to a really large
-                # message.  Try to be graceful.
+        # The queue files which have been processed, but whose results
+        # haven't been committed yet.  Everything the runner enqueues while
+        # processing them only becomes visible when the batch is committed.
+        batch = []
+        # The number of messages handled since the last commit.
+        count = 0
+        with deferred_sync() as pending:
+            for filebase in files:
+                dlog.debug('[%s] processing filebase: %s', me, filebase)
                 try:
-                    shunt = config.switchboards['shunt']
-                    new_filebase = shunt.enqueue(msg, msgdata)
-                    elog.error('SHUNTING: %s', new_filebase)
-                    self.switchboard.finish(filebase)
+                    # Ask the switchboard for the message and metadata
+                    # objects associated with this queue file.
+                    msg, msgdata = self.switchboard.dequeue(filebase)
+                except AlreadyDequeuedError:
+                    # Another instance of this runner got to it first.
+                    continue
                 except Exception as error:
-                    # The message wasn't successfully shunted.  Log the
-                    # exception and try to preserve the original queue entry
-                    # for possible analysis.
+                    # This used to just catch email.Errors.MessageParseError,
+                    # but other problems can occur in message parsing,
+                    # e.g. ValueError, and exceptions can occur in unpickling
+                    # too.  We don't want the runner to die, so we just log
+                    # and skip this entry, but preserve it for analysis.
                     self._log(error)
                     elog.error(
-                        'SHUNTING FAILED, preserving original entry: %s',
+                        'Skipping and preserving unparseable message: %s',
                         filebase)
                     self.switchboard.finish(filebase, preserve=True)
-                config.db.abort()
-            # Other work we want to do each time through the loop.
-            dlog.debug('[%s] doing periodic', me)
-            self._do_periodic()
-            dlog.debug('[%s] committing transaction', me)
-            config.db.commit()
-            dlog.debug('[%s] checking short circuit', me)
-            if self._short_circuit():
-                dlog.debug('[%s] short circuiting', me)
-                break
+                    # Nothing has been done for this entry yet, so only abort
+                    # if that doesn't throw away the rest of the batch.
+                    if count == 0:
+                        config.db.abort()
+                    continue
+                try:
+                    dlog.debug('[%s] processing onefile', me)
+                    if self.batch_size > 1:
+                        # Each message gets its own savepoint, so that a
+                        # failure only rolls back that message's database
+                        # changes, and the transactions the runner completes
+                        # itself only end with the batch.
+                        with config.db.savepoint():
+                            self._process_one_file(msg, msgdata)
+                    else:
+                        self._process_one_file(msg, msgdata)
+                    batch.append(filebase)
+                except Exception as error:
+                    # All runners that implement _dispose() must guarantee
+                    # that exceptions are caught and dealt with properly.
+                    # Still, there may be a bug in the infrastructure, and we
+                    # do not want those to cause messages to be lost.  Any
+                    # uncaught exceptions will cause the message to be stored
+                    # in the shunt queue for human intervention.
+                    self._log(error)
+                    if self.batch_size == 1:
+                        config.db.abort()
+                    # Put a marker in the metadata for unshunting.
+                    msgdata['whichq'] = self.switchboard.name
+                    # It is possible that shunting can throw an exception,
+                    # e.g. a permissions problem or a MemoryError due to a
+                    # really large message.  Try to be graceful.
+                    try:
+                        shunt = config.switchboards['shunt']
+                        new_filebase = shunt.enqueue(msg, msgdata)
+                        elog.error('SHUNTING: %s', new_filebase)
+                        batch.append(filebase)
+                    except Exception as error:
+                        # The message wasn't successfully shunted.  Log the
+                        # exception and try to preserve the original queue
+                        # entry for possible analysis.
+                        self._log(error)
+                        elog.error(
+                            'SHUNTING FAILED, preserving original entry: %s',
+                            filebase)
+                        self.switchboard.finish(filebase, preserve=True)
+                # Other work we want to do each time through the loop.
+                dlog.debug('[%s] doing periodic', me)
+                self._do_periodic()
+                count += 1
+                dlog.debug('[%s] checking short circuit', me)
+                short_circuit = self._short_circuit()
+                if count >= self.batch_size or short_circuit:
+                    self._commit_batch(pending, batch)
+                    count = 0
+                if short_circuit:
+                    dlog.debug('[%s] short circuiting', me)
+                    break
+            if count > 0:
+                self._commit_batch(pending, batch)
         dlog.debug('[%s] ending oneloop: %s', me, len(files))
         return len(files)
 
+    def _commit_batch(self, pending, batch):
+        """Make the work done for a batch of queue files permanent.
+
+        The files enqueued while processing the batch are synced and moved
+        into place, the batch's own queue files are removed, and the database
+        transaction is committed.
+        """
+        pending.commit()
+        for filebase in batch:
+            dlog.debug('[%s] finishing filebase: %s',
+                       self.__class__.__name__, filebase)
+            self.switchboard.finish(filebase)
+        del batch[:]
+        dlog.debug('[%s] committing transaction', self.__class__.__name__)
+        config.db.commit()
+
     def _process_one_file(self, msg, msgdata):
         """See `IRunner`."""
         # Do some common sanity checking on the message metadata.  It's got to
@@ -255,7 +309,9 @@ class Runner:
         with _.using(language.code):
             msgdata['lang'] = language.code
             try:
-                keepqueued = self._dispose(mlist, msg, msgdata)
+                with metrics.timer('mailman_runner_dispose_seconds',
+                                   runner=self.name):
+                    keepqueued = self._dispose(mlist, msg, msgdata)
             except Exception as error:
                 # Trigger the Zope event and re-raise
                 notify(RunnerCrashEvent(self, mlist, msg, msgdata, error))
@@ -273,6 +329,14 @@ class Runner:
         """See `IRunner`."""
         pass
 
+    def _publish_metrics(self, force=False):
+        """Write out this process's metrics, if it is time to.
+
+        :param force: Write them out now.
+        :type force: bool
+        """
+        metrics.publish(self._metrics_name, force)
+
     def _dispose(self, mlist, msg, msgdata):
         """See `IRunner`."""
         raise NotImplementedError
@@ -15,33 +15,52 @@
 # You should have received a copy of the GNU General Public License along with
 # GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
 
-"""Queuing and dequeuing message/metadata pickle files.
+"""Queuing and dequeuing message/metadata queue files.
 
 Messages are represented as email.message.Message objects (or an instance ofa
 subclass).  Metadata is represented as a Python dictionary.  For every
-message/metadata pair in a queue, a single file containing two pickles is
-written.  First, the message is written to the pickle, then the metadata
-dictionary is written.
+message/metadata pair in a queue, a single file holding both is written.  How
+they are written depends on the switchboard's queue file format; see
+`mailman.core.queuefile`.  A message going to several queues at once can
+share a single copy of its body; see `enqueue_shared()`.
+
+When a queue is served by several runner instances, each file has to be
+handed to exactly one of them.  With 'hash' slicing, each instance only looks
+at the files whose names hash into its own slice of the hash space.  With
+'claim' slicing, every instance may take any file, by moving it into a claim
+directory of its own.  The rename is atomic, so only one instance gets the
+file.  Each claim directory holds a lock file which its instance keeps locked
+as long as it lives, so the files claimed by an instance that died can be
+told apart from those which are still being processed, and recovered.
 """
 
 __all__ = [
+    'DeferredSync',
     'Switchboard',
+    'deferred_sync',
+    'enqueue_shared',
     'handle_ConfigurationUpdatedEvent',
     ]
 
 
 import os
 import time
-import email
-import pickle
+import uuid
+import fcntl
 import hashlib
 import logging
 
+from contextlib import contextmanager
 from mailman.config import config
-from mailman.email.message import Message
+from mailman.core.metrics import metrics
+from mailman.core.queuefile import (
+    PickleFormat, SharedFormat, find_format, hash_chunks, shared_directory,
+    write_chunks)
+from mailman.core.queueindex import QueueIndex
 from mailman.interfaces.configuration import ConfigurationUpdatedEvent
-from mailman.interfaces.switchboard import ISwitchboard
-from mailman.utilities.filesystem import makedirs
+from mailman.interfaces.switchboard import AlreadyDequeuedError, ISwitchboard
+from mailman.utilities.filesystem import makedirs, sync_files
+from mailman.utilities.modules import call_name
 from mailman.utilities.string import expand
 from zope.interface import implementer
 
@@ -56,9 +75,22 @@ DELTA = .0001
 # In order to prevent loops and a message flood, when the count reaches this
 # value, we move the file to the bad queue as a .psv.
 MAX_BAK_COUNT = 3
+# The ways a queue can be split among several runner instances.
+SLICING_METHODS = ('hash', 'claim')
+# The subdirectory of the queue directory holding the claim directories.
+CLAIMS = 'claims'
+# How often, in seconds, a runner's switchboard checks for the claims of dead
+# runner instances, when using 'claim' slicing.
+RECLAIM_INTERVAL = 60
+# How old, in seconds, a temporary file in the shared body directory must be
+# before it is taken to have been left behind by a process which died.
+STALE_SHARED_AGE = 3600
 
 elog = logging.getLogger('mailman.error')
 
+# The active `DeferredSync`, if any.
+_deferred = None
+
 
 
 @implementer(ISwitchboard)
@@ -66,7 +98,8 @@ class Switchboard:
     """See `ISwitchboard`."""
 
     def __init__(self, name, queue_directory,
-                 slice=None, numslices=1, recover=False):
+                 slice=None, numslices=1, recover=False, scan_method='auto',
+                 queue_format=None, slicing='hash'):
         """Create a switchboard object.
 
         :param name: The queue name.
@@ -79,10 +112,24 @@ class Switchboard:
         :param numslices: The total number of slices to split this queue
             directory into.  It must be a power of 2.
         :type numslices: int
-        :param recover: True if backup files should be recovered.
+        :param recover: True if backup files should be recovered.  With
+            'claim' slicing, the files claimed by dead switchboards are
+            also recovered every `RECLAIM_INTERVAL` seconds.
         :type recover: bool
+        :param scan_method: How changes to the queue directory are detected.
+            See `mailman.core.queueindex.SCAN_METHODS`.
+        :type scan_method: str
+        :param queue_format: The format to write queue files in.  Files in
+            any known format can be read.  Defaults to `PickleFormat`.
+        :type queue_format: `IQueueFileFormat`
+        :param slicing: How the queue is split among the switchboards
+            dequeuing from it; one of `SLICING_METHODS`.  With 'claim'
+            slicing, `slice` and `numslices` are ignored.
+        :type slicing: str
         """
-        assert (numslices & (numslices - 1)) == 0, (
+        assert slicing in SLICING_METHODS, (
+            'Bad slicing method: {0}'.format(slicing))
+        assert slicing == 'claim' or (numslices & (numslices - 1)) == 0, (
             'Not a power of 2: {0}'.format(numslices))
         self.name = name
         self.queue_directory = queue_directory
@@ -93,40 +140,42 @@ class Switchboard:
         self._lower = None
         self._upper = None
         # BAW: test performance and end-cases of this algorithm
-        if numslices != 1:
+        if numslices != 1 and slicing == 'hash':
             self._lower = ((shamax + 1) * slice) / numslices
             self._upper = (((shamax + 1) * (slice + 1)) / numslices) - 1
+        # The index of .pck files in our slice is created on first use, so
+        # that switchboards only used for enqueuing don't watch anything.
+        self._scan_method = scan_method
+        self._index = None
+        self.queue_format = (PickleFormat() if queue_format is None
+                             else queue_format)
+        # The shared body names of the dequeued files which have them.
+        self._shared = {}
+        self.slicing = slicing
+        # Our claim directory and the descriptor of its lock file, when using
+        # 'claim' slicing.  They are created on the first dequeue.
+        self._claims = None
+        self._claim_lock = None
+        self._recover = recover
+        self._reclaim_time = time.time() + RECLAIM_INTERVAL
         if recover:
             self.recover_backup_files()
 
     def enqueue(self, _msg, _metadata=None, **_kws):
         """See `ISwitchboard`."""
+        _msg, data = self._prepare(_msg, _metadata, _kws)
+        return self._write(self.queue_format.dumps(_msg, data), data,
+                           due=_kws.get('_due'))
+
+    def _prepare(self, _msg, _metadata, _kws):
+        # Return the message and metadata to write to the queue file.
         if _metadata is None:
             _metadata = {}
-        # Calculate the SHA hexdigest of the message to get a unique base
-        # filename.  We're also going to use the digest as a hash into the set
-        # of parallel runner processes.
         data = _metadata.copy()
         data.update(_kws)
-        list_id = data.get('listid', '--nolist--')
-        # Get some data for the input to the sha hash.
-        now = repr(time.time())
-        if data.get('_plaintext'):
-            protocol = 0
-            msgsave = pickle.dumps(str(_msg), protocol)
-        else:
-            protocol = pickle.HIGHEST_PROTOCOL
-            msgsave = pickle.dumps(_msg, protocol)
-        # The list-id field is a string but the input to the hash function must
-        # be bytes.
-        hashfood = msgsave + list_id.encode('utf-8') + now.encode('utf-8')
-        # Encode the current time into the file name for FIFO sorting.  The
-        # file name consists of two parts separated by a '+': the received
-        # time for this message (i.e. when it first showed up on this system)
-        # and the sha hex digest.
-        filebase = now + '+' + hashlib.sha1(hashfood).hexdigest()
-        filename = os.path.join(self.queue_directory, filebase + '.pck')
-        tmpfile = filename + '.tmp'
+        plaintext = bool(data.get('_plaintext'))
+        if plaintext:
+            _msg = str(_msg)
         # Always add the metadata schema version number
         data['version'] = config.QFILE_SCHEMA_VERSION
         # Filter out volatile entries.  Use .keys() so that we can mutate the
@@ -136,42 +185,77 @@ class Switchboard:
                 del data[k]
         # We have to tell the dequeue() method whether to parse the message
         # object or not.
-        data['_parsemsg'] = (protocol == 0)
-        # Write to the pickle file the message object and metadata.
+        data['_parsemsg'] = plaintext
+        return _msg, data
+
+    def _write(self, chunks, data, pending=None, due=None):
+        # Write a queue file and return its base name.  Unless there are
+        # pending files to add it to, the file is synced and put in place.
+        # The file is hidden from the queue's files until it is due.
+        #
+        # Calculate the SHA hexdigest of the message to get a unique base
+        # filename.  We're also going to use the digest as a hash into the set
+        # of parallel runner processes.
+        list_id = data.get('listid', '--nolist--')
+        # Get some data for the input to the sha hash.
+        now = repr(time.time() if due is None else due)
+        hashfood = hashlib.sha1()
+        hash_chunks(hashfood, chunks)
+        # The list-id field is a string but the input to the hash function must
+        # be bytes.
+        hashfood.update(list_id.encode('utf-8'))
+        hashfood.update(now.encode('utf-8'))
+        # Encode the current time into the file name for FIFO sorting.  The
+        # file name consists of two parts separated by a '+': the received
+        # time for this message (i.e. when it first showed up on this system),
+        # or the time it is scheduled for, and the sha hex digest.
+        filebase = now + '+' + hashfood.hexdigest()
+        filename = os.path.join(self.queue_directory, filebase + '.pck')
+        tmpfile = filename + '.tmp'
+        if pending is None:
+            pending = _deferred
+        # Write the message object and metadata to the queue file.
         with open(tmpfile, 'wb') as fp:
-            fp.write(msgsave)
-            pickle.dump(data, fp, protocol)
+            write_chunks(fp, chunks)
             fp.flush()
-            os.fsync(fp.fileno())
-        os.rename(tmpfile, filename)
+            if pending is None:
+                os.fsync(fp.fileno())
+        if pending is None:
+            os.rename(tmpfile, filename)
+        else:
+            pending.add(tmpfile, filename)
+        metrics.increment('mailman_queue_enqueued_total', queue=self.name)
         return filebase
 
     def dequeue(self, filebase):
         """See `ISwitchboard`."""
         # Calculate the filename from the given filebase.
         filename = os.path.join(self.queue_directory, filebase + '.pck')
-        backfile = os.path.join(self.queue_directory, filebase + '.bak')
-        # Read the message object and metadata.
-        with open(filename, 'rb') as fp:
-            # Move the file to the backup file name for processing.  If this
-            # process crashes uncleanly the .bak file will be used to
-            # re-instate the .pck file in order to try again.
+        backfile = self._backup_file(filebase)
+        # Move the file to the backup file name for processing.  If this
+        # process crashes uncleanly the .bak file will be used to re-instate
+        # the .pck file in order to try again.  The rename is atomic, so if
+        # someone else dequeues the file at the same time, only one of us
+        # gets it.
+        try:
             os.rename(filename, backfile)
-            msg = pickle.load(fp)
-            data = pickle.load(fp)
-        if data.get('_parsemsg'):
-            # Calculate the original size of the text now so that we won't
-            # have to generate the message later when we do size restriction
-            # checking.
-            original_size = len(msg)
-            msg = email.message_from_string(msg, Message)
-            msg.original_size = original_size
-            data['original_size'] = original_size
+        except FileNotFoundError:
+            raise AlreadyDequeuedError(filebase)
+        metrics.increment('mailman_queue_dequeued_total', queue=self.name)
+        # Read the message object and metadata.
+        with open(backfile, 'rb') as fp:
+            queue_format = find_format(fp, self.queue_format)
+            if isinstance(queue_format, SharedFormat):
+                msg, data, names = queue_format.load_shared(fp)
+                self._shared[filebase] = names
+            else:
+                msg, data = queue_format.load(fp)
         return msg, data
 
     def finish(self, filebase, preserve=False):
         """See `ISwitchboard`."""
-        bakfile = os.path.join(self.queue_directory, filebase + '.bak')
+        bakfile = self._backup_file(filebase)
+        names = self._shared.pop(filebase, None)
         try:
             if preserve:
                 bad_dir = config.switchboards['bad'].queue_directory
@@ -182,14 +266,41 @@ class Switchboard:
         except EnvironmentError:
             elog.exception(
                 'Failed to unlink/preserve backup file: %s', bakfile)
+        else:
+            # A preserved file still refers to its shared body.
+            if names is not None and not preserve:
+                _release(*names)
 
     @property
     def files(self):
         """See `ISwitchboard`."""
         return self.get_files()
 
+    @property
+    def scheduled(self):
+        """See `ISwitchboard`."""
+        return self._split()[1]
+
     def get_files(self, extension='.pck'):
         """See `ISwitchboard`."""
+        if extension == '.pck':
+            if (self._recover and self.slicing == 'claim' and
+                    time.time() >= self._reclaim_time):
+                self.recover_backup_files()
+            return self._split()[0]
+        return self._scan(extension)
+
+    def _split(self):
+        # Return the .pck files in our slice which are due, and those which
+        # are scheduled for later.
+        if self._index is None:
+            self._index = QueueIndex(
+                self.queue_directory, '.pck',
+                self._lower, self._upper, self._scan_method)
+        return self._index.split(time.time())
+
+    def _scan(self, extension):
+        # Read, filter and sort the whole queue directory.
         times = {}
         lower = self._lower
         upper = self._upper
@@ -211,6 +322,118 @@ class Switchboard:
         # FIFO sort
         return [times[k] for k in sorted(times)]
 
+    def _backup_file(self, filebase):
+        # Return the path of a dequeued file.
+        if self.slicing == 'claim':
+            directory = self._claim_directory()
+        else:
+            directory = self.queue_directory
+        return os.path.join(directory, filebase + '.bak')
+
+    def _claim_directory(self):
+        # Return our claim directory, creating it if necessary.  It is locked
+        # before it gets its final name, so that its lock is held for as long
+        # as anybody else can see it.
+        if self._claims is None:
+            root = os.path.join(self.queue_directory, CLAIMS)
+            makedirs(root, 0o770)
+            name = '{0}.{1}'.format(os.getpid(), uuid.uuid4().hex)
+            tmpdir = os.path.join(root, name + '.tmp')
+            os.mkdir(tmpdir, 0o770)
+            fd = os.open(os.path.join(tmpdir, 'lock'),
+                         os.O_RDWR | os.O_CREAT, 0o660)
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            directory = os.path.join(root, name)
+            os.rename(tmpdir, directory)
+            self._claims = directory
+            self._claim_lock = fd
+        return self._claims
+
+    def _abandoned_files(self):
+        # Yield the paths of the backup files which aren't ours and whose
+        # switchboards are gone: any left in the queue directory itself, e.g.
+        # by 'hash' slicing, and those in the claim directories of dead
+        # switchboards.  A claim directory is removed once all of its files
+        # have been yielded, and so is one whose switchboard died while
+        # setting it up.
+        for filebase in self._scan('.bak'):
+            yield os.path.join(self.queue_directory, filebase + '.bak')
+        root = os.path.join(self.queue_directory, CLAIMS)
+        try:
+            names = os.listdir(root)
+        except FileNotFoundError:
+            return
+        for name in names:
+            directory = os.path.join(root, name)
+            if name.endswith('.tmp'):
+                # Directories which are still being set up can't hold any
+                # files.
+                self._remove_unfinished_claim(directory)
+                continue
+            if directory == self._claims:
+                continue
+            lock_file = os.path.join(directory, 'lock')
+            try:
+                fd = os.open(lock_file, os.O_RDWR)
+            except FileNotFoundError:
+                # Someone else removed it.
+                continue
+            try:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    # Its switchboard is alive, or someone else is
+                    # recovering its files right now.
+                    continue
+                try:
+                    files = os.listdir(directory)
+                except FileNotFoundError:
+                    # Someone else recovered it while we waited for the lock.
+                    continue
+                for filename in sorted(files):
+                    if filename.endswith('.bak'):
+                        yield os.path.join(directory, filename)
+                try:
+                    os.unlink(lock_file)
+                    os.rmdir(directory)
+                except EnvironmentError:
+                    elog.exception(
+                        'Failed to remove claim directory: %s', directory)
+            finally:
+                os.close(fd)
+
+    def _remove_unfinished_claim(self, directory):
+        # Remove a claim directory whose switchboard died before giving it
+        # its final name, once it is old enough for the switchboard to have
+        # done so.  It holds nothing but the lock file, if that.
+        try:
+            if os.stat(directory).st_mtime > time.time() - RECLAIM_INTERVAL:
+                return
+        except FileNotFoundError:
+            return
+        lock_file = os.path.join(directory, 'lock')
+        try:
+            fd = os.open(lock_file, os.O_RDWR)
+        except FileNotFoundError:
+            fd = None
+        try:
+            if fd is not None:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    # Its switchboard is alive after all.
+                    return
+                os.unlink(lock_file)
+            os.rmdir(directory)
+        except FileNotFoundError:
+            # Someone else removed it.
+            pass
+        except EnvironmentError:
+            elog.exception('Failed to remove claim directory: %s', directory)
+        finally:
+            if fd is not None:
+                os.close(fd)
+
     def recover_backup_files(self):
         """See `ISwitchboard`."""
         # Move all .bak files in our slice to .pck.  It's impossible for both
@@ -219,38 +442,234 @@ class Switchboard:
         # _bak_count in the metadata of the number of times we recover this
         # file.  When the count reaches MAX_BAK_COUNT, we move the .bak file
         # to a .psv file in the bad queue.
-        for filebase in self.get_files('.bak'):
-            src = os.path.join(self.queue_directory, filebase + '.bak')
-            dst = os.path.join(self.queue_directory, filebase + '.pck')
-            with open(src, 'rb+') as fp:
-                try:
-                    # Throw away the message object.
-                    pickle.load(fp)
-                    data_pos = fp.tell()
-                    data = pickle.load(fp)
-                except Exception as error:
-                    # If unpickling throws any exception, just log and
-                    # preserve this entry
-                    elog.error('Unpickling .bak exception: %s\n'
-                               'Preserving file: %s', error, filebase)
+        _remove_stale_shared()
+        if self.slicing == 'hash':
+            for filebase in self.get_files('.bak'):
+                self._recover_backup_file(filebase)
+            return
+        # With 'claim' slicing, first claim each abandoned file, so that no
+        # two switchboards recover the same one.
+        self._reclaim_time = time.time() + RECLAIM_INTERVAL
+        for path in self._abandoned_files():
+            filebase = os.path.basename(path)[:-4]
+            try:
+                os.rename(path, self._backup_file(filebase))
+            except FileNotFoundError:
+                continue
+            self._recover_backup_file(filebase)
+
+    def _recover_backup_file(self, filebase):
+        # Move a .bak file to .pck, or preserve it if it has been recovered
+        # too often.
+        src = self._backup_file(filebase)
+        dst = os.path.join(self.queue_directory, filebase + '.pck')
+        with open(src, 'rb+') as fp:
+            try:
+                queue_format = find_format(fp, self.queue_format)
+                data = queue_format.load_metadata(fp)
+            except Exception as error:
+                # If unpickling throws any exception, just log and
+                # preserve this entry
+                elog.error('Unpickling .bak exception: %s\n'
+                           'Preserving file: %s', error, filebase)
+                self.finish(filebase, preserve=True)
+            else:
+                data['_bak_count'] = data.get('_bak_count', 0) + 1
+                fp.seek(0)
+                queue_format.replace_metadata(fp, data)
+                fp.flush()
+                os.fsync(fp.fileno())
+                if data['_bak_count'] >= MAX_BAK_COUNT:
+                    elog.error('.bak file max count, preserving file: %s',
+                               filebase)
                     self.finish(filebase, preserve=True)
                 else:
-                    data['_bak_count'] = data.get('_bak_count', 0) + 1
-                    fp.seek(data_pos)
-                    if data.get('_parsemsg'):
-                        protocol = 0
-                    else:
-                        protocol = 1
-                    pickle.dump(data, fp, protocol)
-                    fp.truncate()
-                    fp.flush()
-                    os.fsync(fp.fileno())
-                    if data['_bak_count'] >= MAX_BAK_COUNT:
-                        elog.error('.bak file max count, preserving file: %s',
-                                   filebase)
-                        self.finish(filebase, preserve=True)
-                    else:
-                        os.rename(src, dst)
+                    os.rename(src, dst)
+
+
+
+class DeferredSync:
+    """Queue files which have been written but are not yet in place.
+
+    See `deferred_sync()`.
+    """
+
+    def __init__(self):
+        # (tmpfile, filename) pairs.
+        self._pending = []
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, tmpfile, filename):
+        """Remember a queue file written to `tmpfile`."""
+        self._pending.append((tmpfile, filename))
+
+    def commit(self):
+        """Flush all the pending queue files to disk and move them in place.
+
+        The files are flushed together, then renamed to their .pck names in
+        the order they were enqueued.
+        """
+        pending, self._pending = self._pending, []
+        sync_files([tmpfile for tmpfile, filename in pending])
+        for tmpfile, filename in pending:
+            os.rename(tmpfile, filename)
+
+    def discard(self):
+        """Throw away all the pending queue files."""
+        pending, self._pending = self._pending, []
+        for tmpfile, filename in pending:
+            try:
+                os.unlink(tmpfile)
+            except EnvironmentError:
+                elog.exception('Failed to discard queue file: %s', tmpfile)
+
+
+@contextmanager
+def deferred_sync():
+    """Defer the syncing of enqueued files.
+
+    Normally, `Switchboard.enqueue()` syncs each queue file to disk and moves
+    it into place before it returns.  Within this context, files enqueued to
+    any switchboard are written but neither synced nor made visible until
+    `DeferredSync.commit()` is called on the context's value, so that many of
+    them can share one disk flush.  Anything still pending is committed when
+    the context exits normally, and discarded when it exits with an
+    exception.
+    """
+    global _deferred
+    assert _deferred is None, 'Nested deferred_sync()'
+    _deferred = pending = DeferredSync()
+    try:
+        yield pending
+    except:
+        _deferred = None
+        pending.discard()
+        raise
+    else:
+        _deferred = None
+        pending.commit()
+
+
+
+def enqueue_shared(msg, destinations):
+    """Enqueue a message to several queues, writing its body only once.
+
+    The body is stored in the shared body directory, named after the
+    message's X-Message-ID-Hash header and the digest of its bytes.  A body
+    which is already stored there is reused.  Each queue gets a small queue
+    file in the `SharedFormat`, holding the metadata and the name of a hard
+    link to the body.  The link count of the body is thus its reference count:
+    the file system frees it after the last queue file referring to it is
+    finished, and the body's own name is removed when nothing else refers to
+    it.
+
+    The body and the queue files are synced together, unless this is called
+    within `deferred_sync()`.  A message with a single destination, or without
+    an X-Message-ID-Hash header, or which can't be represented as bytes, is
+    enqueued to each queue in full.
+
+    :param msg: The message.
+    :type msg: `email.message.Message`
+    :param destinations: The switchboards to enqueue the message to, each
+        with its message metadata.
+    :type destinations: sequence of (`ISwitchboard`, dict) 2-tuples
+    :return: The base names of the queue files, in the order of
+        `destinations`.
+    :rtype: list of str
+    """
+    key = msg.get('x-message-id-hash')
+    raw = None
+    if (len(destinations) > 1 and key is not None and
+            not any(metadata.get('_plaintext')
+                    for switchboard, metadata in destinations)):
+        try:
+            raw = SharedFormat.dumps_body(msg)
+        except UnicodeError:
+            pass
+    if raw is None:
+        return [switchboard.enqueue(msg, metadata)
+                for switchboard, metadata in destinations]
+    directory = shared_directory()
+    if not os.path.isdir(directory):
+        makedirs(directory, 0o770)
+    body = '{}+{}.msg'.format(key, hashlib.sha1(raw).hexdigest())
+    source = os.path.join(directory, body)
+    pending = (DeferredSync() if _deferred is None else _deferred)
+    filebases = []
+    try:
+        for switchboard, metadata in destinations:
+            reference = '{}.{}.ref'.format(body[:-4], uuid.uuid4().hex)
+            path = os.path.join(directory, reference)
+            try:
+                os.link(source, path + '.tmp')
+            except FileNotFoundError:
+                # Store the body.  It gets its own name once it is synced.
+                source = os.path.join(
+                    directory, '{}.{}.tmp'.format(body, uuid.uuid4().hex))
+                with open(source, 'wb') as fp:
+                    fp.write(raw)
+                pending.add(source, os.path.join(directory, body))
+                os.link(source, path + '.tmp')
+            pending.add(path + '.tmp', path)
+            data = switchboard._prepare(msg, metadata, {})[1]
+            chunks = SharedFormat(reference, body).dumps(msg, data)
+            filebases.append(switchboard._write(chunks, data, pending))
+    except:
+        if pending is not _deferred:
+            pending.discard()
+        raise
+    if pending is not _deferred:
+        pending.commit()
+    return filebases
+
+
+def _remove_stale_shared():
+    # Remove the temporary bodies and references which a process enqueuing a
+    # shared message left behind when it died.  Each holds a link to its
+    # body, which would otherwise never be released.  The change time of a
+    # link is that of its body, which is updated whenever the body gets
+    # another link, so a body which is still being enqueued is left alone.
+    directory = shared_directory()
+    try:
+        filenames = os.listdir(directory)
+    except FileNotFoundError:
+        return
+    due = time.time() - STALE_SHARED_AGE
+    for filename in filenames:
+        if not filename.endswith('.tmp'):
+            continue
+        path = os.path.join(directory, filename)
+        try:
+            if os.stat(path).st_ctime < due:
+                os.unlink(path)
+        except FileNotFoundError:
+            # Someone else put it in place, or removed it.
+            pass
+        except EnvironmentError:
+            elog.exception('Failed to remove stale shared file: %s', path)
+
+
+def _release(reference, body):
+    # Remove a queue file's reference to a shared body, and the body's own
+    # name if nothing else refers to it any more.
+    directory = shared_directory()
+    path = os.path.join(directory, reference)
+    try:
+        inode = os.stat(path).st_ino
+        os.unlink(path)
+    except EnvironmentError:
+        elog.exception('Failed to release shared body: %s', path)
+        return
+    path = os.path.join(directory, body)
+    try:
+        status = os.stat(path)
+        if status.st_ino == inode and status.st_nlink == 1:
+            os.unlink(path)
+    except FileNotFoundError:
+        # Someone else removed it, or it was never put in place.
+        pass
 
 
 
@@ -269,4 +688,7 @@ def handle_ConfigurationUpdatedEvent(event):
             substitutions = config.paths
             substitutions['name'] = name
             path = expand(conf.path, substitutions)
-            config.switchboards[name] = Switchboard(name, path)
+            config.switchboards[name] = Switchboard(
+                name, path, scan_method=conf.scan_method,
+                queue_format=call_name(conf.queue_format),
+                slicing=conf.slicing)
@@ -0,0 +1,174 @@
+# Copyright (C) 2015 by the Free Software Foundation, Inc.
+#
+# This file is part of GNU Mailman.
+#
+# GNU Mailman is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# GNU Mailman is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test the metrics registry."""
+
+__all__ = [
+    'TestCollect',
+    'TestRegistry',
+    ]
+
+
+import os
+import json
+import shutil
+import unittest
+
+from mailman.config import config
+from mailman.core.metrics import (
+    BUCKETS, Registry, collect, metrics, metrics_directory)
+from mailman.testing.helpers import (
+    configuration, specialized_message_from_string as mfs)
+from mailman.testing.layers import ConfigLayer
+
+
+
+class TestRegistry(unittest.TestCase):
+    layer = ConfigLayer
+
+    def setUp(self):
+        self._registry = Registry()
+
+    def test_counter(self):
+        self._registry.increment('ants_total', queue='in')
+        self._registry.increment('ants_total', 2, queue='in')
+        self._registry.increment('ants_total', queue='out')
+        self.assertEqual(self._registry.render(), """\
+# TYPE ants_total counter
+ants_total{queue="in"} 3
+ants_total{queue="out"} 1
+""")
+
+    def test_histogram(self):
+        self._registry.observe('ant_seconds', 0.003)
+        self._registry.observe('ant_seconds', 0.005)
+        self._registry.observe('ant_seconds', 100)
+        lines = self._registry.render().splitlines()
+        self.assertEqual(lines[0], '# TYPE ant_seconds histogram')
+        buckets = lines[1:len(BUCKETS) + 2]
+        self.assertEqual(buckets[:4], [
+            'ant_seconds_bucket{le="0.001"} 0',
+            'ant_seconds_bucket{le="0.0025"} 0',
+            'ant_seconds_bucket{le="0.005"} 2',
+            'ant_seconds_bucket{le="0.01"} 2',
+            ])
+        self.assertEqual(buckets[-2], 'ant_seconds_bucket{le="60.0"} 2')
+        self.assertEqual(buckets[-1], 'ant_seconds_bucket{le="+Inf"} 3')
+        self.assertEqual(lines[-2], 'ant_seconds_sum 100.008')
+        self.assertEqual(lines[-1], 'ant_seconds_count 3')
+
+    def test_timer(self):
+        # Times are recorded even when the timed code fails.
+        with self.assertRaises(RuntimeError):
+            with self._registry.timer('ant_seconds', runner='in'):
+                raise RuntimeError
+        self.assertIn('ant_seconds_count{runner="in"} 1',
+                      self._registry.render())
+
+    def test_escaping(self):
+        self._registry.increment('ants_total', queue='a "b"\\c\n')
+        self.assertIn(r'ants_total{queue="a \"b\"\\c\n"} 1',
+                      self._registry.render())
+
+    def test_merge(self):
+        self._registry.increment('ants_total', queue='in')
+        self._registry.observe('ant_seconds', 0.5)
+        other = Registry()
+        other.increment('ants_total', 4, queue='in')
+        other.observe('ant_seconds', 0.5)
+        other.merge(json.loads(json.dumps(self._registry.snapshot())))
+        text = other.render()
+        self.assertIn('ants_total{queue="in"} 5', text)
+        self.assertIn('ant_seconds_count 2', text)
+        self.assertIn('ant_seconds_sum 1.0', text)
+
+
+
+class TestCollect(unittest.TestCase):
+    layer = ConfigLayer
+
+    def setUp(self):
+        self.addCleanup(shutil.rmtree, metrics_directory(), True)
+
+    def test_publish(self):
+        registry = Registry()
+        registry.increment('ants_total')
+        registry.publish('ant.0')
+        path = os.path.join(metrics_directory(), 'ant.0.json')
+        with open(path) as fp:
+            self.assertEqual(json.load(fp), registry.snapshot())
+        # The snapshot is only written once per interval, unless forced.
+        registry.increment('ants_total')
+        registry.publish('ant.0')
+        with open(path) as fp:
+            self.assertEqual(json.load(fp)['counters'],
+                             [['ants_total', {}, 1]])
+        registry.publish('ant.0', force=True)
+        with open(path) as fp:
+            self.assertEqual(json.load(fp)['counters'],
+                             [['ants_total', {}, 2]])
+
+    @configuration('metrics', interval='0s')
+    def test_publishing_disabled(self):
+        Registry().publish('ant.0', force=True)
+        self.assertFalse(os.path.exists(metrics_directory()))
+
+    def test_collect(self):
+        # The snapshots of all processes are added up.
+        for name in ('ant.0', 'ant.1'):
+            registry = Registry()
+            registry.increment('ants_total', queue='in')
+            registry.publish(name)
+        self.assertIn('ants_total{queue="in"} 2', collect())
+
+    def test_queue_gauges(self):
+        text = collect()
+        self.assertIn('mailman_queue_depth{queue="in"} 0', text)
+        self.assertNotIn('mailman_queue_oldest_seconds{queue="in"}', text)
+        msg = mfs("""\
+From: anne@example.com
+To: test@example.com
+Message-ID: <ant>
+
+""")
+        config.switchboards['in'].enqueue(msg)
+        config.switchboards['in'].enqueue(msg)
+        text = collect()
+        self.assertIn('mailman_queue_depth{queue="in"} 2', text)
+        self.assertIn('mailman_queue_scheduled{queue="in"} 0', text)
+        self.assertIn('mailman_queue_oldest_seconds{queue="in"} ', text)
+
+    def test_switchboard_counters(self):
+        def count(name):
+            for counter, labels, value in metrics.snapshot()['counters']:
+                if counter == name and labels == dict(queue='virgin'):
+                    return value
+            return 0
+        msg = mfs("""\
+From: anne@example.com
+To: test@example.com
+Message-ID: <ant>
+
+""")
+        switchboard = config.switchboards['virgin']
+        enqueued = count('mailman_queue_enqueued_total')
+        dequeued = count('mailman_queue_dequeued_total')
+        filebase = switchboard.enqueue(msg)
+        switchboard.dequeue(filebase)
+        switchboard.finish(filebase)
+        self.assertEqual(count('mailman_queue_enqueued_total'), enqueued + 1)
+        self.assertEqual(count('mailman_queue_dequeued_total'), dequeued + 1)
@@ -0,0 +1,367 @@
+# Copyright (C) 2015 by the Free Software Foundation, Inc.
+#
+# This file is part of GNU Mailman.
+#
+# GNU Mailman is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# GNU Mailman is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test the queue file formats."""
+
+__all__ = [
+    'TestGeneratedMessage',
+    'TestLazyMessage',
+    'TestQueueFileFormats',
+    'TestSpooledMessage',
+    ]
+
+
+import os
+import email
+import pickle
+import shutil
+import tempfile
+import unittest
+
+from email.header import Header
+from mailman.core.queuefile import (
+    GeneratedMessage, LazyMessage, PickleFormat, RFC822Format, SpooledMessage,
+    find_format, lazy_copy, message_bytes)
+from mailman.core.switchboard import Switchboard
+from mailman.email.message import Message
+from mailman.testing.helpers import specialized_message_from_string as mfs
+from mailman.testing.layers import ConfigLayer
+
+
+RAW = b"""\
+From: anne@example.com
+To: test@example.com
+Subject: A very long subject which was folded
+ over two lines
+Message-ID: <ant>
+
+Hello\r
+there.
+"""
+
+MULTIPART = b"""\
+From: anne@example.com
+To: test@example.com
+Message-ID: <ant>
+MIME-Version: 1.0
+Content-Type: multipart/mixed; boundary="BOUNDARY"
+
+--BOUNDARY
+Content-Type: text/plain
+
+one
+--BOUNDARY
+Content-Type: text/plain
+
+two
+--BOUNDARY--
+"""
+
+
+
+class TestLazyMessage(unittest.TestCase):
+    """Test messages which are parsed as they are used."""
+
+    layer = ConfigLayer
+
+    def test_untouched(self):
+        msg = LazyMessage(RAW)
+        self.assertNotIn('_headers', vars(msg))
+        self.assertIs(msg.as_raw_bytes(), RAW)
+
+    def test_headers_only(self):
+        msg = LazyMessage(RAW)
+        self.assertEqual(msg['message-id'], '<ant>')
+        self.assertEqual(msg.sender, 'anne@example.com')
+        self.assertNotIn('_payload', vars(msg))
+        # Reading the headers doesn't change the bytes.
+        self.assertIs(msg.as_raw_bytes(), RAW)
+
+    def test_changed_headers(self):
+        msg = LazyMessage(RAW)
+        msg['X-Mailman-Rule-Hits'] = 'emergency'
+        del msg['to']
+        raw = msg.as_raw_bytes()
+        self.assertNotIn('_payload', vars(msg))
+        # The body, with its odd line ending, is copied as it is.
+        self.assertTrue(raw.endswith(b'\n\nHello\r\nthere.\n'))
+        parsed = email.message_from_bytes(raw)
+        self.assertEqual(parsed['x-mailman-rule-hits'], 'emergency')
+        self.assertIsNone(parsed['to'])
+        self.assertEqual(parsed['subject'], msg['subject'])
+        self.assertEqual(parsed.get_payload(), 'Hello\r\nthere.\n')
+
+    def test_payload(self):
+        msg = LazyMessage(MULTIPART)
+        msg['X-Test'] = 'yes'
+        self.assertTrue(msg.is_multipart())
+        self.assertEqual([part.get_payload() for part in msg.walk()
+                          if not part.is_multipart()],
+                         ['one', 'two'])
+        # Header changes made before the body was parsed are kept.
+        self.assertEqual(msg['x-test'], 'yes')
+        self.assertNotIn('_raw', vars(msg))
+        self.assertIsNone(msg.as_raw_bytes())
+
+    def test_same_as_parsed(self):
+        msg = LazyMessage(MULTIPART)
+        parsed = email.message_from_bytes(MULTIPART, Message)
+        self.assertEqual(msg.as_string(), parsed.as_string())
+
+    def test_missing_empty_line(self):
+        # Without an empty line after the headers, the parser has to decide
+        # where the body starts.
+        msg = LazyMessage(b'From: anne@example.com\nnot a header\n')
+        self.assertEqual(msg['from'], 'anne@example.com')
+        self.assertEqual(msg.get_payload(), 'not a header\n')
+
+    def test_unknown_attribute(self):
+        msg = LazyMessage(RAW)
+        self.assertRaises(AttributeError, getattr, msg, 'original_size')
+        self.assertNotIn('_headers', vars(msg))
+
+
+
+class TestGeneratedMessage(unittest.TestCase):
+    """Test messages made from the bytes Mailman generated for them."""
+
+    layer = ConfigLayer
+
+    def setUp(self):
+        self._headers = Message()
+        self._headers['From'] = 'anne@example.com'
+        self._headers['Subject'] = Header('Caf\xe9', 'iso-8859-1')
+        self._headers['Content-Type'] = 'text/plain'
+
+    def test_with_headers(self):
+        msg = GeneratedMessage.with_headers(self._headers, b'Hello\n')
+        # The headers are the very same objects.
+        self.assertIsInstance(msg['subject'], Header)
+        self.assertEqual(str(msg['subject']), 'Caf\xe9')
+        self.assertEqual(msg.as_raw_bytes(), b"""\
+From: anne@example.com
+Subject: =?iso-8859-1?q?Caf=E9?=
+Content-Type: text/plain
+
+Hello
+""")
+        self.assertNotIn('_payload', vars(msg))
+        self.assertEqual(msg.get_payload(), 'Hello\n')
+
+    def test_as_string(self):
+        msg = GeneratedMessage.with_headers(self._headers, b'Hello\n')
+        self.assertEqual(msg.as_string(), self._headers.as_string() +
+                         'Hello\n')
+        self.assertNotIn('_payload', vars(msg))
+        # Changed headers are generated again.
+        msg['X-Test'] = 'yes'
+        self.assertTrue(msg.as_string().endswith(
+            'Content-Type: text/plain\nX-Test: yes\n\nHello\n'))
+        self.assertNotIn('_payload', vars(msg))
+
+    def test_lazy_copy(self):
+        # Lazy copies of a message share its bytes.
+        msg = mfs(RAW.decode('ascii'))
+        msg.original_size = 42
+        raw = message_bytes(msg)
+        copy_1 = lazy_copy(msg, raw)
+        copy_2 = lazy_copy(msg, raw)
+        self.assertEqual(copy_1.original_size, 42)
+        self.assertIs(copy_1.as_raw_bytes(), raw)
+        self.assertEqual(copy_1.as_string(), msg.as_string())
+        # Changing a copy's headers changes neither the message nor the
+        # other copy, and leaves the body unparsed.
+        del copy_1['message-id']
+        copy_1['Message-ID'] = '<bee>'
+        self.assertEqual(msg['message-id'], '<ant>')
+        self.assertEqual(copy_2['message-id'], '<ant>')
+        self.assertIn(b'Message-ID: <bee>', copy_1.as_raw_bytes())
+        self.assertIs(copy_2.as_raw_bytes(), raw)
+        self.assertNotIn('_payload', vars(copy_1))
+
+    def test_message_bytes_non_ascii_text(self):
+        # A message parsed from text which isn't ASCII has no bytes, unless
+        # its text may be encoded.
+        msg = mfs('Subject: Hello\n\nCaf\xe9\n')
+        self.assertRaises(UnicodeError, message_bytes, msg)
+        self.assertEqual(message_bytes(msg, 'utf-8'),
+                         b'Subject: Hello\n\nCaf\xc3\xa9\n')
+
+
+
+class TestSpooledMessage(unittest.TestCase):
+    """Test generated messages with their bodies in files."""
+
+    layer = ConfigLayer
+
+    def setUp(self):
+        self._headers = Message()
+        self._headers['From'] = 'anne@example.com'
+        self._headers['Content-Type'] = 'text/plain'
+        self._spool = tempfile.TemporaryFile()
+        self.addCleanup(self._spool.close)
+        self._spool.write(b'there.\n')
+        self._qdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self._qdir)
+        self._text = self._headers.as_string() + 'Hello\nthere.\n'
+
+    def _message(self):
+        return SpooledMessage.with_headers(
+            self._headers, b'Hello\n', self._spool)
+
+    def _round_trip(self, msg, queue_format):
+        # Enqueue and dequeue the message, returning the format of its queue
+        # file and the message.
+        switchboard = Switchboard(
+            'test', self._qdir, queue_format=queue_format)
+        filebase = switchboard.enqueue(msg, listid='test.example.com')
+        path = os.path.join(self._qdir, filebase + '.pck')
+        with open(path, 'rb') as fp:
+            file_format = find_format(fp)
+        msg, msgdata = switchboard.dequeue(filebase)
+        switchboard.finish(filebase)
+        return file_format, msg
+
+    def test_queue_file(self):
+        # The spool file is copied into the queue file without being read
+        # into the message, whatever format the queue is written in.
+        for queue_format in (RFC822Format(), PickleFormat()):
+            msg = self._message()
+            file_format, dequeued = self._round_trip(msg, queue_format)
+            self.assertIsInstance(file_format, RFC822Format)
+            self.assertNotIn('_raw', vars(msg))
+            self.assertEqual(dequeued.as_string(), self._text)
+
+    def test_changed_headers(self):
+        # Once the headers change, the message is written as a whole.
+        msg = self._message()
+        msg['X-Test'] = 'yes'
+        self.assertIsNone(msg.raw_chunks())
+        file_format, dequeued = self._round_trip(msg, RFC822Format())
+        self.assertEqual(dequeued['x-test'], 'yes')
+        self.assertEqual(dequeued.get_payload(), 'Hello\nthere.\n')
+
+    def test_read(self):
+        # The body is read when it is needed.
+        msg = self._message()
+        self.assertEqual(msg.get_payload(), 'Hello\nthere.\n')
+        self.assertIsNone(msg.raw_chunks())
+        self.assertEqual(msg.as_string(), self._text)
+        # A pickled message has its body too.
+        msg = pickle.loads(pickle.dumps(self._message()))
+        self.assertEqual(msg.as_string(), self._text)
+
+
+
+class TestQueueFileFormats(unittest.TestCase):
+    """Test reading and writing queue files."""
+
+    layer = ConfigLayer
+
+    def setUp(self):
+        self._qdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self._qdir)
+        self._switchboard = Switchboard(
+            'test', self._qdir, queue_format=RFC822Format())
+
+    def _filename(self, filebase, extension='.pck'):
+        return os.path.join(self._qdir, filebase + extension)
+
+    def _format_of(self, filebase):
+        with open(self._filename(filebase), 'rb') as fp:
+            return find_format(fp)
+
+    def test_passthrough(self):
+        self._switchboard.enqueue(LazyMessage(RAW), listid='test.example.com')
+        filebase = self._switchboard.files[0]
+        self.assertIsInstance(self._format_of(filebase), RFC822Format)
+        msg, msgdata = self._switchboard.dequeue(filebase)
+        self._switchboard.finish(filebase)
+        self.assertIsInstance(msg, LazyMessage)
+        self.assertEqual(msgdata['listid'], 'test.example.com')
+        # The message goes back out without being parsed.
+        filebase = self._switchboard.enqueue(msg, msgdata)
+        self.assertNotIn('_headers', vars(msg))
+        with open(self._filename(filebase), 'rb') as fp:
+            self.assertTrue(fp.read().endswith(RAW))
+
+    def test_message_object(self):
+        msg = mfs("""\
+From: anne@example.com
+To: test@example.com
+Message-ID: <ant>
+
+Hello.
+""")
+        msg.original_size = 42
+        filebase = self._switchboard.enqueue(msg, foo=7)
+        msg, msgdata = self._switchboard.dequeue(filebase)
+        self.assertEqual(msg['message-id'], '<ant>')
+        self.assertEqual(msg.get_payload(), 'Hello.\n')
+        self.assertEqual(msg.original_size, 42)
+        self.assertEqual(msgdata['foo'], 7)
+        self.assertEqual(msgdata['version'], 3)
+        self.assertFalse(msgdata['_parsemsg'])
+
+    def test_non_ascii_falls_back_to_pickle(self):
+        msg = mfs("""\
+From: anne@example.com
+To: test@example.com
+Subject: Caf\xe9
+Message-ID: <ant>
+
+Caf\xe9.
+""")
+        filebase = self._switchboard.enqueue(msg)
+        self.assertIsInstance(self._format_of(filebase), PickleFormat)
+        msg, msgdata = self._switchboard.dequeue(filebase)
+        self.assertNotIsInstance(msg, LazyMessage)
+        self.assertEqual(msg['subject'], 'Caf\xe9')
+
+    def test_read_pickle_format(self):
+        # Queue files written by older versions of Mailman can be read.
+        switchboard = Switchboard('test', self._qdir)
+        filebase = switchboard.enqueue(LazyMessage(RAW), bar='baz')
+        self.assertIsInstance(self._format_of(filebase), PickleFormat)
+        msg, msgdata = self._switchboard.dequeue(filebase)
+        self.assertEqual(msg['message-id'], '<ant>')
+        self.assertEqual(msgdata['bar'], 'baz')
+
+    def test_plaintext(self):
+        filebase = self._switchboard.enqueue(RAW.decode('ascii'),
+                                             _plaintext=True)
+        msg, msgdata = self._switchboard.dequeue(filebase)
+        self.assertEqual(msg['message-id'], '<ant>')
+        self.assertEqual(msg.original_size, len(RAW))
+        self.assertEqual(msgdata['original_size'], len(RAW))
+        self.assertTrue(msgdata['_parsemsg'])
+
+    def test_recover_backup_files(self):
+        # The backup count is updated in files of both formats.
+        self._switchboard.enqueue(LazyMessage(RAW), format='rfc822')
+        switchboard = Switchboard('test', self._qdir)
+        switchboard.enqueue(LazyMessage(RAW), format='pickle')
+        for filebase in self._switchboard.files:
+            self._switchboard.dequeue(filebase)
+        self.assertEqual(len(self._switchboard.files), 0)
+        self._switchboard.recover_backup_files()
+        files = self._switchboard.files
+        self.assertEqual(len(files), 2)
+        for filebase in files:
+            msg, msgdata = self._switchboard.dequeue(filebase)
+            self.assertEqual(msgdata['_bak_count'], 1)
+            self.assertEqual(msg['message-id'], '<ant>')
@@ -0,0 +1,153 @@
+# Copyright (C) 2015 by the Free Software Foundation, Inc.
+#
+# This file is part of GNU Mailman.
+#
+# GNU Mailman is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# GNU Mailman is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test the queue index."""
+
+__all__ = [
+    'TestInotifyQueueIndex',
+    'TestQueueIndex',
+    ]
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from mailman.core.queueindex import QueueIndex
+from mailman.utilities.inotify import get_watcher
+from unittest.mock import patch
+
+
+def _touch(directory, filebase, extension='.pck'):
+    with open(os.path.join(directory, filebase + extension), 'w'):
+        pass
+
+
+
+class TestQueueIndex(unittest.TestCase):
+    """Test the incremental queue index."""
+
+    method = 'poll'
+
+    def setUp(self):
+        self._qdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self._qdir)
+        self._index = QueueIndex(self._qdir, method=self.method)
+
+    def test_fifo_order(self):
+        _touch(self._qdir, '1000.3+cc')
+        _touch(self._qdir, '1000.1+bb')
+        _touch(self._qdir, '1000.2+aa')
+        self.assertEqual(self._index.files,
+                         ['1000.1+bb', '1000.2+aa', '1000.3+cc'])
+
+    def test_identical_times(self):
+        # Entries with the same time stamp are both returned, ordered by
+        # digest.
+        _touch(self._qdir, '1000.1+bb')
+        _touch(self._qdir, '1000.1+aa')
+        self.assertEqual(self._index.files, ['1000.1+aa', '1000.1+bb'])
+
+    def test_ignore_other_extensions(self):
+        _touch(self._qdir, '1000.1+aa', '.bak')
+        _touch(self._qdir, '1000.2+bb', '.pck.tmp')
+        _touch(self._qdir, 'garbage')
+        self.assertEqual(self._index.files, [])
+
+    def test_follow_changes(self):
+        _touch(self._qdir, '1000.1+aa')
+        self.assertEqual(self._index.files, ['1000.1+aa'])
+        _touch(self._qdir, '1000.2+bb')
+        os.rename(os.path.join(self._qdir, '1000.1+aa.pck'),
+                  os.path.join(self._qdir, '1000.1+aa.bak'))
+        self.assertEqual(self._index.files, ['1000.2+bb'])
+        # Recovering a backup file puts it back in the right place.
+        os.rename(os.path.join(self._qdir, '1000.1+aa.bak'),
+                  os.path.join(self._qdir, '1000.1+aa.pck'))
+        self.assertEqual(self._index.files, ['1000.1+aa', '1000.2+bb'])
+        os.remove(os.path.join(self._qdir, '1000.2+bb.pck'))
+        self.assertEqual(self._index.files, ['1000.1+aa'])
+        self.assertEqual(len(self._index), 1)
+        self.assertIn('1000.1+aa', self._index)
+
+    def test_slice(self):
+        index = QueueIndex(self._qdir, lower=0x10, upper=0x1f,
+                           method=self.method)
+        _touch(self._qdir, '1000.1+0f')
+        _touch(self._qdir, '1000.2+10')
+        _touch(self._qdir, '1000.3+1f')
+        _touch(self._qdir, '1000.4+20')
+        self.assertEqual(index.files, ['1000.2+10', '1000.3+1f'])
+
+    def test_names_parsed_once(self):
+        # Names that have been seen are not parsed again.
+        _touch(self._qdir, '1000.1+aa')
+        self.assertEqual(self._index.files, ['1000.1+aa'])
+        _touch(self._qdir, '1000.2+bb')
+        with patch.object(self._index, '_add',
+                          wraps=self._index._add) as add:
+            self.assertEqual(self._index.files, ['1000.1+aa', '1000.2+bb'])
+        self.assertEqual([call[0][0] for call in add.call_args_list],
+                         ['1000.2+bb.pck'])
+
+    def test_split(self):
+        # Files with time stamps after the given time are scheduled.
+        for when in ('1000.1', '1000.2', '1000.3', '1000.4', '1000.5'):
+            _touch(self._qdir, when + '+aa')
+        self.assertEqual(self._index.split(999), (
+            [], ['1000.1+aa', '1000.2+aa', '1000.3+aa', '1000.4+aa',
+                 '1000.5+aa']))
+        self.assertEqual(self._index.split(1000.1), (
+            ['1000.1+aa'],
+            ['1000.2+aa', '1000.3+aa', '1000.4+aa', '1000.5+aa']))
+        self.assertEqual(self._index.split(1000.35), (
+            ['1000.1+aa', '1000.2+aa', '1000.3+aa'],
+            ['1000.4+aa', '1000.5+aa']))
+        self.assertEqual(self._index.split(1000.45), (
+            ['1000.1+aa', '1000.2+aa', '1000.3+aa', '1000.4+aa'],
+            ['1000.5+aa']))
+        self.assertEqual(self._index.split(1001), (
+            ['1000.1+aa', '1000.2+aa', '1000.3+aa', '1000.4+aa',
+             '1000.5+aa'], []))
+
+    def test_split_empty(self):
+        self.assertEqual(self._index.split(1000), ([], []))
+
+    def test_missing_directory(self):
+        shutil.rmtree(self._qdir)
+        self.assertEqual(self._index.files, [])
+        os.mkdir(self._qdir)
+        _touch(self._qdir, '1000.1+aa')
+        self.assertEqual(self._index.files, ['1000.1+aa'])
+
+
+
+@unittest.skipIf(get_watcher() is None, 'inotify is not available')
+class TestInotifyQueueIndex(TestQueueIndex):
+    """Test the queue index when it follows inotify events."""
+
+    method = 'inotify'
+
+    def test_no_directory_reads(self):
+        _touch(self._qdir, '1000.1+aa')
+        self.assertEqual(self._index.files, ['1000.1+aa'])
+        self.assertTrue(self._index.watching)
+        _touch(self._qdir, '1000.2+bb')
+        with patch('mailman.core.queueindex.os.listdir') as listdir:
+            self.assertEqual(self._index.files, ['1000.1+aa', '1000.2+bb'])
+        self.assertFalse(listdir.called)
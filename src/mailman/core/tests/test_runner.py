@@ -18,6 +18,7 @@
 """Test some Runner base class behavior."""
 
 __all__ = [
+    'TestBatchingRunner',
     'TestRunner',
     ]
 
@@ -27,13 +28,18 @@ import unittest
 from mailman.app.lifecycle import create_list
 from mailman.config import config
 from mailman.core.runner import Runner
+from mailman.core.switchboard import Switchboard
+from mailman.database.transaction import transaction
 from mailman.interfaces.runner import RunnerCrashEvent
+from mailman.interfaces.usermanager import IUserManager
 from mailman.runners.virgin import VirginRunner
 from mailman.testing.helpers import (
     LogFileMark, configuration, event_subscribers, get_queue_messages,
     make_digest_messages, make_testable_runner,
     specialized_message_from_string as mfs)
 from mailman.testing.layers import ConfigLayer
+from unittest.mock import patch
+from zope.component import getUtility
 
 
 
@@ -42,6 +48,18 @@ class CrashingRunner(Runner):
         raise RuntimeError('borked')
 
 
+class BatchingRunner(Runner):
+    def _dispose(self, mlist, msg, msgdata):
+        # Make a database change and pass the message on, then crash if asked
+        # to.  The outgoing queue must not see any messages before the batch
+        # is committed.
+        self.visible.append(len(config.switchboards['out'].files))
+        getUtility(IUserManager).create_address(msg['x-address'])
+        config.switchboards['out'].enqueue(msg, msgdata)
+        if msg['x-crash'] is not None:
+            raise RuntimeError('borked')
+
+
 
 class TestRunner(unittest.TestCase):
     """Test the Runner base class behavior."""
@@ -120,3 +138,136 @@ Message-ID: <ant>
         # The list's -request address is the original sender.
         self.assertEqual(bag.msgdata['original_sender'],
                          'test-request@example.com')
+
+
+
+class TestBatchingRunner(unittest.TestCase):
+    """Test runners which commit in batches."""
+
+    layer = ConfigLayer
+
+    def setUp(self):
+        create_list('test@example.com')
+        self._inq = config.switchboards['in']
+
+    def _enqueue(self, count, crash=None):
+        for i in range(count):
+            msg = mfs("""\
+From: anne@example.com
+To: test@example.com
+Message-ID: <ant{0}>
+X-Address: person{0}@example.com
+
+""".format(i))
+            if i == crash:
+                msg['X-Crash'] = 'yes'
+            self._inq.enqueue(msg, listid='test.example.com')
+
+    def _make_runner(self):
+        runner = make_testable_runner(BatchingRunner, 'in')
+        runner.visible = []
+        return runner
+
+    @configuration('runner.in', batch_size=3)
+    def test_commit_per_batch(self):
+        self._enqueue(7)
+        runner = self._make_runner()
+        with patch.object(config.db, 'commit',
+                          wraps=config.db.commit) as commit:
+            runner.run()
+        # Seven messages make two full batches and one partial batch.
+        self.assertEqual(commit.call_count, 3)
+        # The outgoing queue only saw the messages of a batch after it was
+        # committed.
+        self.assertEqual(runner.visible, [0, 0, 0, 3, 3, 3, 6])
+        self.assertEqual(len(get_queue_messages('out')), 7)
+        self.assertEqual(len(self._inq.files), 0)
+        self.assertEqual(len(self._inq.get_files('.bak')), 0)
+        user_manager = getUtility(IUserManager)
+        for i in range(7):
+            self.assertIsNotNone(user_manager.get_address(
+                'person{0}@example.com'.format(i)))
+
+    @configuration('runner.in', batch_size=3)
+    def test_failure_in_batch(self):
+        # When one message in a batch fails, only that message is shunted
+        # and has its database changes rolled back.
+        self._enqueue(3, crash=1)
+        runner = self._make_runner()
+        runner.run()
+        shunted = get_queue_messages('shunt')
+        self.assertEqual(len(shunted), 1)
+        self.assertEqual(shunted[0].msg['message-id'], '<ant1>')
+        self.assertEqual(shunted[0].msgdata['whichq'], 'in')
+        user_manager = getUtility(IUserManager)
+        self.assertIsNotNone(user_manager.get_address('person0@example.com'))
+        self.assertIsNone(user_manager.get_address('person1@example.com'))
+        self.assertIsNotNone(user_manager.get_address('person2@example.com'))
+        self.assertEqual(len(self._inq.files), 0)
+        self.assertEqual(len(self._inq.get_files('.bak')), 0)
+        # Like the unbatched runner, whatever the failed message enqueued
+        # before the failure is kept.
+        outgoing = get_queue_messages('out', sort_on='message-id')
+        self.assertEqual([bag.msg['message-id'] for bag in outgoing],
+                         ['<ant0>', '<ant1>', '<ant2>'])
+
+    @configuration('runner.in', batch_size=3)
+    def test_runner_commits_in_batch(self):
+        # A runner which commits its own transactions still only commits
+        # once per batch, and a failed message only has its own changes
+        # rolled back.
+        self._enqueue(5, crash=1)
+        runner = make_testable_runner(CommittingRunner, 'in')
+        runner.visible = []
+        with patch.object(config.db.store, 'commit',
+                          wraps=config.db.store.commit) as commit:
+            runner.run()
+        self.assertEqual(commit.call_count, 2)
+        self.assertEqual(runner.visible, [0, 0, 0, 3, 3])
+        shunted = get_queue_messages('shunt')
+        self.assertEqual(len(shunted), 1)
+        self.assertEqual(shunted[0].msg['message-id'], '<ant1>')
+        user_manager = getUtility(IUserManager)
+        for i in range(5):
+            address = user_manager.get_address(
+                'person{0}@example.com'.format(i))
+            if i == 1:
+                self.assertIsNone(address)
+            else:
+                self.assertIsNotNone(address)
+        self.assertEqual(len(self._inq.files), 0)
+        self.assertEqual(len(self._inq.get_files('.bak')), 0)
+
+    def test_unbatched(self):
+        self._enqueue(3)
+        runner = self._make_runner()
+        with patch.object(config.db, 'commit',
+                          wraps=config.db.commit) as commit:
+            runner.run()
+        self.assertEqual(commit.call_count, 3)
+        self.assertEqual(runner.visible, [0, 1, 2])
+
+    def test_file_dequeued_by_another_instance(self):
+        # When another instance of the runner dequeues a file first, the
+        # runner just skips it.
+        self._enqueue(2)
+        runner = self._make_runner()
+        other = Switchboard('in', self._inq.queue_directory)
+        stolen = []
+        dequeue = runner.switchboard.dequeue
+        def steal_first(filebase):
+            if not stolen:
+                other.dequeue(filebase)
+                stolen.append(filebase)
+            return dequeue(filebase)
+        error_log = LogFileMark('mailman.error')
+        with patch.object(runner.switchboard, 'dequeue', steal_first):
+            runner.run()
+        self.assertEqual(len(error_log.read()), 0)
+        self.assertEqual(len(get_queue_messages('out')), 1)
+        self.assertEqual(len(get_queue_messages('shunt')), 0)
+        self.assertEqual(config.switchboards['bad'].get_files('.psv'), [])
+        # The other instance still has its file.
+        self.assertEqual(self._inq.get_files('.bak'), stolen)
+        other.finish(stolen[0])
+
@@ -18,15 +18,25 @@
 """Switchboard tests."""
 
 __all__ = [
+    'TestClaimSlicing',
+    'TestSharedBodies',
     'TestSwitchboard',
     ]
 
 
+import os
+import time
+import shutil
+import tempfile
 import unittest
 
 from mailman.config import config
+from mailman.core.queuefile import shared_directory
+from mailman.core.switchboard import (
+    CLAIMS, Switchboard, deferred_sync, enqueue_shared)
+from mailman.interfaces.switchboard import AlreadyDequeuedError
 from mailman.testing.helpers import (
-    LogFileMark,
+    LogFileMark, get_queue_messages,
     specialized_message_from_string as mfs)
 from mailman.testing.layers import ConfigLayer
 from unittest.mock import patch
@@ -56,3 +66,322 @@ Message-ID: <ant>
         traceback = error_log.read().splitlines()
         self.assertEqual(traceback[1], 'Traceback (most recent call last):')
         self.assertEqual(traceback[-1], 'OSError: Oops!')
+
+    def test_deferred_sync(self):
+        # Within a deferred_sync() block, enqueued files only show up when
+        # the pending files are committed.
+        msg = mfs("""\
+From: anne@example.com
+To: test@example.com
+Message-ID: <ant>
+
+""")
+        switchboard = config.switchboards['shunt']
+        with deferred_sync() as pending:
+            switchboard.enqueue(msg)
+            switchboard.enqueue(msg)
+            self.assertEqual(len(pending), 2)
+            self.assertEqual(len(switchboard.files), 0)
+            pending.commit()
+            self.assertEqual(len(pending), 0)
+            self.assertEqual(len(switchboard.files), 2)
+            switchboard.enqueue(msg)
+        # Leaving the block commits the rest.
+        self.assertEqual(len(switchboard.files), 3)
+
+    def test_deferred_sync_discard(self):
+        # When the block exits with an exception, the pending files are
+        # thrown away.
+        msg = mfs("""\
+From: anne@example.com
+To: test@example.com
+Message-ID: <ant>
+
+""")
+        switchboard = config.switchboards['shunt']
+        with self.assertRaises(RuntimeError):
+            with deferred_sync():
+                switchboard.enqueue(msg)
+                raise RuntimeError
+        self.assertEqual(len(switchboard.files), 0)
+        self.assertEqual(len(switchboard.get_files('.tmp')), 0)
+
+    def test_dequeue_twice(self):
+        # Only one of two switchboards dequeuing the same file gets it.
+        msg = mfs("""\
+From: anne@example.com
+To: test@example.com
+Message-ID: <ant>
+
+""")
+        switchboard = config.switchboards['shunt']
+        filebase = switchboard.enqueue(msg)
+        other = Switchboard('shunt', switchboard.queue_directory)
+        switchboard.dequeue(filebase)
+        with self.assertRaises(AlreadyDequeuedError) as cm:
+            other.dequeue(filebase)
+        self.assertEqual(cm.exception.filebase, filebase)
+        self.assertEqual(switchboard.get_files('.bak'), [filebase])
+        switchboard.finish(filebase)
+
+    def test_scheduled(self):
+        # A file enqueued for a later time is hidden until it's due.
+        msg = mfs("""\
+From: anne@example.com
+To: test@example.com
+Message-ID: <ant>
+
+""")
+        switchboard = config.switchboards['shunt']
+        later = time.time() + 3600
+        scheduled = switchboard.enqueue(msg, _due=later)
+        filebase = switchboard.enqueue(msg)
+        self.assertEqual(switchboard.files, [filebase])
+        self.assertEqual(switchboard.scheduled, [scheduled])
+        with patch('mailman.core.switchboard.time.time',
+                   return_value=later):
+            self.assertEqual(switchboard.files, [filebase, scheduled])
+            self.assertEqual(switchboard.scheduled, [])
+        # The schedule isn't part of the metadata.
+        msg, msgdata = switchboard.dequeue(scheduled)
+        switchboard.finish(scheduled)
+        self.assertNotIn('_due', msgdata)
+
+
+
+class TestClaimSlicing(unittest.TestCase):
+    layer = ConfigLayer
+
+    def setUp(self):
+        self._qdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self._qdir)
+        self._msg = mfs("""\
+From: anne@example.com
+To: test@example.com
+Message-ID: <ant>
+
+""")
+
+    def _switchboard(self, recover=False):
+        return Switchboard('test', self._qdir, recover=recover,
+                           scan_method='scan', slicing='claim')
+
+    def _claim_directories(self):
+        return sorted(os.listdir(os.path.join(self._qdir, CLAIMS)))
+
+    def _die(self, switchboard):
+        # Release the switchboard's lock, as if its process had died.
+        os.close(switchboard._claim_lock)
+
+    def test_every_switchboard_sees_every_file(self):
+        anne = self._switchboard()
+        bart = self._switchboard()
+        filebases = [anne.enqueue(self._msg) for i in range(8)]
+        self.assertEqual(anne.files, filebases)
+        self.assertEqual(bart.files, filebases)
+
+    def test_dequeue_claims_file(self):
+        anne = self._switchboard()
+        bart = self._switchboard()
+        filebase = anne.enqueue(self._msg)
+        msg, data = bart.dequeue(filebase)
+        self.assertEqual(msg['message-id'], '<ant>')
+        with self.assertRaises(AlreadyDequeuedError):
+            anne.dequeue(filebase)
+        # The backup file is in bart's own claim directory.
+        self.assertEqual(anne.files, [])
+        self.assertEqual(anne.get_files('.bak'), [])
+        self.assertEqual(os.path.dirname(bart._claims),
+                         os.path.join(self._qdir, CLAIMS))
+        self.assertIn(filebase + '.bak', os.listdir(bart._claims))
+        bart.finish(filebase)
+        self.assertNotIn(filebase + '.bak', os.listdir(bart._claims))
+
+    def test_live_claims_are_not_recovered(self):
+        anne = self._switchboard()
+        filebase = anne.enqueue(self._msg)
+        anne.dequeue(filebase)
+        bart = self._switchboard(recover=True)
+        self.assertEqual(bart.files, [])
+        anne.finish(filebase)
+        self.assertEqual(bart.files, [])
+
+    def test_dead_claims_are_recovered(self):
+        anne = self._switchboard()
+        filebases = [anne.enqueue(self._msg) for i in range(2)]
+        for filebase in filebases:
+            anne.dequeue(filebase)
+        self._die(anne)
+        bart = self._switchboard(recover=True)
+        self.assertEqual(bart.files, filebases)
+        # Anne's claim directory is gone.
+        self.assertEqual(self._claim_directories(),
+                         [os.path.basename(bart._claims)])
+        msg, data = bart.dequeue(filebases[0])
+        self.assertEqual(data['_bak_count'], 1)
+        bart.finish(filebases[0])
+
+    def test_recovery_is_periodic(self):
+        anne = self._switchboard()
+        bart = self._switchboard(recover=True)
+        filebase = anne.enqueue(self._msg)
+        anne.dequeue(filebase)
+        self._die(anne)
+        self.assertEqual(bart.files, [])
+        bart._reclaim_time = 0
+        self.assertEqual(bart.files, [filebase])
+
+    def test_unfinished_claims_are_removed(self):
+        # A claim directory whose switchboard died before giving it its
+        # final name is removed once it is old enough.
+        root = os.path.join(self._qdir, CLAIMS)
+        os.makedirs(os.path.join(root, '1.dead.tmp'))
+        open(os.path.join(root, '1.dead.tmp', 'lock'), 'w').close()
+        os.mkdir(os.path.join(root, '2.dead.tmp'))
+        bart = self._switchboard(recover=True)
+        bart.files
+        self.assertEqual(self._claim_directories(),
+                         ['1.dead.tmp', '2.dead.tmp'])
+        bart._reclaim_time = 0
+        later = time.time() + 61
+        with patch('mailman.core.switchboard.time.time', return_value=later):
+            bart.files
+        self.assertEqual(self._claim_directories(), [])
+
+    def test_hash_sliced_backup_files_are_recovered(self):
+        # Backup files left in the queue directory before switching to claim
+        # slicing are recovered too.
+        anne = Switchboard('test', self._qdir, scan_method='scan')
+        filebase = anne.enqueue(self._msg)
+        anne.dequeue(filebase)
+        bart = self._switchboard(recover=True)
+        self.assertEqual(bart.files, [filebase])
+        self.assertEqual(bart.get_files('.bak'), [])
+
+    def test_recovery_count(self):
+        # A file which keeps on being recovered is preserved in the end.
+        filebase = self._switchboard().enqueue(self._msg)
+        for i in range(3):
+            anne = self._switchboard()
+            anne.dequeue(filebase)
+            self._die(anne)
+            bart = self._switchboard(recover=True)
+        self.assertEqual(bart.files, [])
+        self.assertEqual(config.switchboards['bad'].get_files('.psv'),
+                         [filebase])
+
+
+
+class TestSharedBodies(unittest.TestCase):
+    layer = ConfigLayer
+
+    def setUp(self):
+        self._msg = mfs("""\
+From: anne@example.com
+To: test@example.com
+Message-ID: <ant>
+X-Message-ID-Hash: MS6QLWERIJLGCRF44J7USBFDELMNT2BW
+
+Hello.
+""")
+        self._msg.original_size = 123
+        self._destinations = [
+            (config.switchboards['in'], dict(listid='test.example.com')),
+            (config.switchboards['command'], dict(subaddress='request')),
+            ]
+
+    def _shared_files(self, extension):
+        try:
+            filenames = os.listdir(shared_directory())
+        except FileNotFoundError:
+            return []
+        return sorted(filename for filename in filenames
+                      if filename.endswith(extension))
+
+    def test_body_is_written_once(self):
+        filebases = enqueue_shared(self._msg, self._destinations)
+        self.assertEqual(len(filebases), 2)
+        bodies = self._shared_files('.msg')
+        self.assertEqual(len(bodies), 1)
+        self.assertTrue(
+            bodies[0].startswith('MS6QLWERIJLGCRF44J7USBFDELMNT2BW+'))
+        self.assertEqual(len(self._shared_files('.ref')), 2)
+        # The body and each reference are links to the same file.
+        path = os.path.join(shared_directory(), bodies[0])
+        self.assertEqual(os.stat(path).st_nlink, 3)
+        self.assertEqual(self._shared_files('.tmp'), [])
+
+    def test_shared_body_is_read(self):
+        enqueue_shared(self._msg, self._destinations)
+        items = get_queue_messages('in') + get_queue_messages('command')
+        self.assertEqual(len(items), 2)
+        for item in items:
+            self.assertEqual(item.msg['message-id'], '<ant>')
+            self.assertEqual(item.msg.get_payload(), 'Hello.\n')
+            self.assertEqual(item.msg.original_size, 123)
+        self.assertEqual(items[0].msgdata['listid'], 'test.example.com')
+        self.assertEqual(items[1].msgdata['subaddress'], 'request')
+
+    def test_body_is_removed_after_last_finish(self):
+        enqueue_shared(self._msg, self._destinations)
+        get_queue_messages('in')
+        self.assertEqual(len(self._shared_files('.msg')), 1)
+        self.assertEqual(len(self._shared_files('.ref')), 1)
+        get_queue_messages('command')
+        self.assertEqual(self._shared_files(''), [])
+
+    def test_preserved_file_keeps_its_reference(self):
+        enqueue_shared(self._msg, self._destinations)
+        switchboard = config.switchboards['in']
+        filebase = switchboard.files[0]
+        switchboard.dequeue(filebase)
+        switchboard.finish(filebase, preserve=True)
+        get_queue_messages('command')
+        self.assertEqual(len(self._shared_files('.ref')), 1)
+
+    def test_body_is_reused(self):
+        # A message with the same X-Message-ID-Hash and bytes shares the body
+        # which is already there.
+        enqueue_shared(self._msg, self._destinations)
+        enqueue_shared(self._msg, self._destinations)
+        self.assertEqual(len(self._shared_files('.msg')), 1)
+        self.assertEqual(len(self._shared_files('.ref')), 4)
+        # But a different message with the same hash doesn't.
+        self._msg.set_payload('Goodbye.\n')
+        enqueue_shared(self._msg, self._destinations)
+        self.assertEqual(len(self._shared_files('.msg')), 2)
+
+    def test_single_destination_is_not_shared(self):
+        enqueue_shared(self._msg, self._destinations[:1])
+        self.assertEqual(self._shared_files(''), [])
+        self.assertEqual(len(get_queue_messages('in')), 1)
+
+    def test_no_message_id_hash(self):
+        del self._msg['x-message-id-hash']
+        enqueue_shared(self._msg, self._destinations)
+        self.assertEqual(self._shared_files(''), [])
+        self.assertEqual(len(get_queue_messages('in')), 1)
+        self.assertEqual(len(get_queue_messages('command')), 1)
+
+    def test_deferred_sync_discard(self):
+        with self.assertRaises(RuntimeError):
+            with deferred_sync():
+                enqueue_shared(self._msg, self._destinations)
+                raise RuntimeError
+        self.assertEqual(self._shared_files(''), [])
+        self.assertEqual(len(config.switchboards['in'].files), 0)
+
+    def test_stale_temporary_files_are_removed(self):
+        # The temporary references and bodies left behind by a process which
+        # died while enqueuing are removed when backup files are recovered,
+        # so that the bodies can be released.
+        with patch('mailman.core.switchboard.DeferredSync.commit'):
+            enqueue_shared(self._msg, self._destinations)
+        self.assertEqual(len(self._shared_files('.tmp')), 3)
+        switchboard = config.switchboards['in']
+        switchboard.recover_backup_files()
+        self.assertEqual(len(self._shared_files('.tmp')), 3)
+        later = time.time() + 3601
+        with patch('mailman.core.switchboard.time.time', return_value=later):
+            switchboard.recover_backup_files()
+        self.assertEqual(self._shared_files(''), [])
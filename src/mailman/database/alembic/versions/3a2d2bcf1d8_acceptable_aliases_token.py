@@ -0,0 +1,26 @@
+"""Acceptable aliases token
+
+Revision ID: 3a2d2bcf1d8
+Revises: 2bb9b382198
+Create Date: 2015-06-02 14:31:07.530182
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '3a2d2bcf1d8'
+down_revision = '2bb9b382198'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    # Existing mailing lists get a token the first time one is asked for.
+    op.add_column('mailinglist', sa.Column(
+        'acceptable_aliases_token', sa.Unicode(), nullable=True))
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        # SQLite does not support dropping columns.
+        op.drop_column('mailinglist', 'acceptable_aliases_token')
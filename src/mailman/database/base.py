@@ -24,11 +24,12 @@ __all__ = [
 
 import logging
 
+from contextlib import contextmanager
 from mailman.config import config
 from mailman.interfaces.database import IDatabase
 from mailman.utilities.string import expand
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import scoped_session, sessionmaker
 from zope.interface import implementer
 
 
@@ -53,11 +54,48 @@ class SABaseDatabase:
 
     def commit(self):
         """See `IDatabase`."""
-        self.store.commit()
+        if self.store.info.get('savepoint') is None:
+            self.store.commit()
+        else:
+            # The changes are committed along with the savepoint's enclosing
+            # transaction.
+            self.store.flush()
 
     def abort(self):
         """See `IDatabase`."""
-        self.store.rollback()
+        savepoint = self.store.info.get('savepoint')
+        if savepoint is None:
+            self.store.rollback()
+        else:
+            # Only throw away what was done since the savepoint, and carry on
+            # in a new one.
+            if savepoint.is_active:
+                savepoint.rollback()
+            self.store.info['savepoint'] = self.store.begin_nested()
+
+    @contextmanager
+    def savepoint(self):
+        """See `IDatabase`."""
+        assert self.store.info.get('savepoint') is None, 'Nested savepoint'
+        self.store.info['savepoint'] = self.store.begin_nested()
+        try:
+            yield
+        except:
+            savepoint = self.store.info.pop('savepoint')
+            if savepoint.is_active:
+                savepoint.rollback()
+            raise
+        else:
+            savepoint = self.store.info.pop('savepoint')
+            if savepoint.is_active:
+                savepoint.commit()
+
+    def _configure(self, engine):
+        """Configure the engine after it is created.
+
+        Override this to set up any database-specific engine behavior.
+        """
+        pass
 
     def _pre_reset(self, store):
         """Clean up method for testing.
@@ -108,6 +146,9 @@ class SABaseDatabase:
         # half dozen and all...
         self.url = url
         self.engine = create_engine(url)
-        session = sessionmaker(bind=self.engine)
-        self.store = session()
+        self._configure(self.engine)
+        # Every thread gets a session of its own, so that for example the
+        # REST server can serve requests in several threads.  Calling the
+        # store returns the current thread's session.
+        self.store = scoped_session(sessionmaker(bind=self.engine))
         self.store.commit()
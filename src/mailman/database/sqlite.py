@@ -25,6 +25,7 @@ __all__ = [
 import os
 
 from mailman.database.base import SABaseDatabase
+from sqlalchemy import event
 from urllib.parse import urlparse
 
 
@@ -43,3 +44,15 @@ class SQLiteDatabase(SABaseDatabase):
         # Ignore errors
         if fd > 0:
             os.close(fd)
+
+    def _configure(self, engine):
+        """See `SABaseDatabase`."""
+        # The sqlite3 module begins transactions itself, and commits before
+        # a SAVEPOINT statement, which would break savepoints.  Let SQLite
+        # alone handle the transactions, which SQLAlchemy begins explicitly.
+        @event.listens_for(engine, 'connect')
+        def connect(dbapi_connection, connection_record):
+            dbapi_connection.isolation_level = None
+        @event.listens_for(engine, 'begin')
+        def begin(connection):
+            connection.execute('BEGIN')
@@ -84,9 +84,10 @@ for delivery.  The original message as received by Mailman is attached.
 """)
                 raise errors.RejectMessage(wrap(text))
         # Calculate the regular recipients of the message
-        recipients = set(member.address.email
-                         for member in mlist.regular_members.members
-                         if member.delivery_status == DeliveryStatus.enabled)
+        recipients = set(
+            recipient.email
+            for recipient in mlist.regular_members.recipients
+            if recipient.delivery_status == DeliveryStatus.enabled)
         # Remove the sender if they don't want to receive their own posts
         if not include_sender and member.address.email in recipients:
             recipients.remove(member.address.email)
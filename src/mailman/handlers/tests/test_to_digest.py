@@ -25,10 +25,13 @@ __all__ = [
 import os
 import unittest
 
+from mailbox import MMDF
 from mailman.app.lifecycle import create_list
 from mailman.handlers.to_digest import ToDigest
-from mailman.testing.helpers import specialized_message_from_string as mfs
+from mailman.testing.helpers import (
+    digest_mbox, get_queue_messages, specialized_message_from_string as mfs)
 from mailman.testing.layers import ConfigLayer
+from mailman.utilities.mailbox import DigestAccumulator
 
 
 
@@ -54,6 +57,44 @@ Message-ID: <ant>
         self._msg.set_payload(b'non-ascii chars \xc3\xa9 \xc3\xa8 \xc3\xa7')
         self._msg['X-Test'] = 'dummy'
         self._handler.process(self._mlist, self._msg, {})
-        # Make sure the digest mbox is not empty.
-        mailbox_path = os.path.join(self._mlist.data_path, 'digest.mmdf')
-        self.assertGreater(os.path.getsize(mailbox_path), 0)
+        # Make sure the digest is not empty.
+        digest = digest_mbox(self._mlist)
+        self.assertGreater(digest.size, 0)
+        self.assertEqual(len(digest), 1)
+
+    def test_cut_digest(self):
+        # When the digest is big enough, it is moved out of the way and the
+        # digest runner is told about it.
+        self._mlist.digest_size_threshold = 0
+        self._mlist.volume = 2
+        self._mlist.next_digest_number = 3
+        self._handler.process(self._mlist, self._msg, {})
+        self.assertEqual(len(digest_mbox(self._mlist)), 0)
+        items = get_queue_messages('digest')
+        self.assertEqual(len(items), 1)
+        digest_path = items[0].msgdata['digest_path']
+        self.assertEqual(digest_path,
+                         os.path.join(self._mlist.data_path, 'digest.2.3'))
+        self.assertEqual(
+            [msg['message-id'] for msg in DigestAccumulator(digest_path)],
+            ['<ant>'])
+        self.assertEqual(self._mlist.next_digest_number, 4)
+
+    def test_digest_mailbox(self):
+        # The digest mailbox left by an older version of Mailman is picked up
+        # along with the next message.
+        path = os.path.join(self._mlist.data_path, 'digest.mmdf')
+        mailbox = MMDF(path)
+        mailbox.add(mfs("""\
+From: bart@example.com
+To: test@example.com
+Message-ID: <bee>
+
+"""))
+        mailbox.flush()
+        self._handler.process(self._mlist, self._msg, {})
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(
+            [msg['message-id'] for msg in digest_mbox(self._mlist)],
+            ['<bee>', '<ant>'])
+
@@ -30,7 +30,7 @@ from mailman.email.message import Message
 from mailman.interfaces.digests import DigestFrequency
 from mailman.interfaces.handler import IHandler
 from mailman.utilities.datetime import now as right_now
-from mailman.utilities.mailbox import Mailbox
+from mailman.utilities.mailbox import DigestAccumulator
 from zope.interface import implementer
 
 
@@ -47,32 +47,36 @@ class ToDigest:
         # Short circuit for non-digestable messages.
         if not mlist.digestable or msgdata.get('isdigest'):
             return
-        # Open the mailbox that will be used to collect the current digest.
-        mailbox_path = os.path.join(mlist.data_path, 'digest.mmdf')
-        # Lock the mailbox and append the message.
-        with Mailbox(mailbox_path, create=True) as mbox:
-            mbox.add(msg)
-        # Calculate the current size of the mailbox file.  This will not tell
-        # us exactly how big the resulting MIME and rfc1153 digest will
-        # actually be, but it's the most easily available metric to decide
-        # whether the size threshold has been reached.
-        size = os.path.getsize(mailbox_path)
-        if size >= mlist.digest_size_threshold * 1024.0:
+        # Append the message to the current digest.  This doesn't wait for
+        # other processes adding to the same digest.
+        digest = DigestAccumulator(os.path.join(mlist.data_path, 'digest'))
+        # Pick up the messages left in the digest mailbox of an older version
+        # of Mailman.
+        digest.add_mailbox(os.path.join(mlist.data_path, 'digest.mmdf'))
+        digest.add(msg)
+        # Calculate the current size of the digest.  This will not tell us
+        # exactly how big the resulting MIME and rfc1153 digest will actually
+        # be, but it's the most easily available metric to decide whether the
+        # size threshold has been reached.
+        if digest.size >= mlist.digest_size_threshold * 1024.0:
             # The digest is ready to send.  Because we don't want to hold up
             # this process with crafting the digest, we're going to move the
-            # digest file to a safe place, then craft a fake message for the
+            # digest to a safe place, then craft a fake message for the
             # DigestRunner as a trigger for it to build and send the digest.
-            mailbox_dest = os.path.join(
+            digest_path = os.path.join(
                 mlist.data_path,
-                'digest.{0.volume}.{0.next_digest_number}.mmdf'.format(mlist))
+                'digest.{0.volume}.{0.next_digest_number}'.format(mlist))
+            if digest.cut(digest_path) is None:
+                # Another process got here first, or cut the digest to the
+                # same path before this process saw the new digest number.
+                return
             volume = mlist.volume
             digest_number = mlist.next_digest_number
             bump_digest_number_and_volume(mlist)
-            os.rename(mailbox_path, mailbox_dest)
             config.switchboards['digest'].enqueue(
                 Message(),
                 listid=mlist.list_id,
-                digest_path=mailbox_dest,
+                digest_path=digest_path,
                 volume=volume,
                 digest_number=digest_number)
 
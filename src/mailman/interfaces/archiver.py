@@ -78,4 +78,30 @@ class IArchiver(Interface):
             be calculated.
         """
 
+    def archive_messages(mlist, messages):
+        """Send several messages to the archiver at once.
+
+        The archive runner hands each archiver all of a mailing list's
+        messages in a batch through this method.  Archivers which don't have
+        it get them one at a time through `archive_message()`.
+
+        :param mlist: The IMailingList object.
+        :param messages: The message objects.
+        :type messages: sequence
+        """
+
+    def flush():
+        """Archive the messages which have been held back long enough.
+
+        This is optional.  Archivers which hold on to messages, so as to
+        archive them several at a time, get the chance to let them go when
+        the archive runner calls this every once in a while.
+        """
+
+    def close():
+        """Stop any helpers the archiver keeps running.
+
+        This is optional.  The archive runner calls this when it stops.
+        """
+
     # XXX How to handle attachments?
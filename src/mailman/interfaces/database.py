@@ -54,6 +54,16 @@ class IDatabase(Interface):
     def abort():
         """Abort the current transaction."""
 
+    def savepoint():
+        """Run the body of a `with` statement in a savepoint.
+
+        The body's database changes are rolled back if it raises an
+        exception, and otherwise become part of the current transaction.
+        Within the body, `commit()` only flushes the changes and `abort()`
+        only rolls back those made since the savepoint, so that code which
+        completes its own transactions can run within a larger one.
+        """
+
     store = Attribute(
         """The underlying database object on which you can do queries.""")
 
@@ -806,6 +806,14 @@ class IAcceptableAliasSet(Interface):
     aliases = Attribute(
         """An iterator over all the acceptable aliases.""")
 
+    token = Attribute(
+        """A string which changes whenever the acceptable aliases change.
+
+        Anything which caches the aliases can compare this to the token it
+        cached them with, to tell whether they are still current, without
+        loading them from the database.
+        """)
+
 
 
 class IListArchiver(Interface):
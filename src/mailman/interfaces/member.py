@@ -18,6 +18,7 @@
 """Interface describing the basics of a member."""
 
 __all__ = [
+    'AddressChangeEvent',
     'AlreadySubscribedError',
     'DeliveryMode',
     'DeliveryStatus',
@@ -100,6 +101,18 @@ class UnsubscriptionEvent(MembershipChangeEvent):
         return '{0} left {1}'.format(self.member.address, self.mlist.list_id)
 
 
+class AddressChangeEvent(MembershipChangeEvent):
+    """Event which gets triggered when a member changes their address.
+
+    The event is triggered just after the member's subscribed address is
+    changed.
+    """
+
+    def __str__(self):
+        return '{0} changed address on {1}'.format(
+            self.member.address, self.mlist.list_id)
+
+
 
 class MembershipError(MailmanError):
     """Base exception for all membership errors."""
@@ -19,12 +19,21 @@
 
 __all__ = [
     'IRoster',
+    'RecipientRecord',
     ]
 
 
+from collections import namedtuple
 from zope.interface import Interface, Attribute
 
 
+
+RecipientRecord = namedtuple(
+    'RecipientRecord',
+    'email original_email delivery_mode delivery_status '
+    'receive_own_postings receive_list_copy language')
+
+
 
 class IRoster(Interface):
     """A roster is a collection of `IMembers`."""
@@ -53,6 +62,19 @@ class IRoster(Interface):
         managed by this roster.
         """)
 
+    recipients = Attribute(
+        """An iterator over the delivery details of the roster's members.
+
+        This returns a `RecipientRecord` for every member managed by this
+        roster, giving the member's subscribed email address, both lower
+        cased and case preserved, and the member's delivery mode, delivery
+        status, `receive_own_postings` and `receive_list_copy` preferences
+        and preferred language.  The preferences are those that would be
+        found through the `IMember`, i.e. the first one set of the member's,
+        the address's and the user's, else the system default.  This is much
+        cheaper than looking at each member.
+        """)
+
     def get_member(email):
         """Get the member for the given address.
 
@@ -68,6 +90,21 @@ class IRoster(Interface):
         :rtype: `IMember` or None
         """
 
+    def get_members(emails):
+        """Get the members for several addresses at once.
+
+        This is the bulk version of ``get_member()``, for when many
+        addresses have to be looked up, e.g. for every recipient of a
+        message.  Where an email is subscribed both explicitly and through a
+        user's preferred address, the explicit membership is returned.
+
+        :param emails: The email addresses to search for.
+        :type emails: iterable of strings
+        :return: A mapping from each email address which is subscribed to
+            its member.  Addresses which aren't subscribed are left out.
+        :rtype: dict of string to `IMember`
+        """
+
     def get_memberships(email):
         """Get the memberships for the given address.
 
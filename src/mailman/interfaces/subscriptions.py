@@ -78,8 +78,9 @@ class ISubscriptionService(Interface):
         a digest member), the member can appear multiple times in this list.
         Roles are sorted by: owner, moderator, member.
 
-        :return: The list of all members.
-        :rtype: list of `IMember`
+        :return: The sequence of all members.  Its length and slices are
+            found by the database, without loading all the members.
+        :rtype: sequence of `IMember`
         """
 
     def get_member(member_id):
@@ -107,8 +108,8 @@ class ISubscriptionService(Interface):
         :type list_id: string
         :param role: The member role.
         :type role: `MemberRole`
-        :return: The list of all memberships, which may be empty.
-        :rtype: list of `IMember`
+        :return: The sequence of all memberships, which may be empty.
+        :rtype: sequence of `IMember`
         """
 
     def __iter__():
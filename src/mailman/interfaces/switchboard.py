@@ -18,13 +18,28 @@
 """Interface for switchboards."""
 
 __all__ = [
+    'AlreadyDequeuedError',
+    'IQueueFileFormat',
     'ISwitchboard',
     ]
 
 
+from mailman.interfaces.errors import MailmanError
 from zope.interface import Interface, Attribute
 
 
+
+class AlreadyDequeuedError(MailmanError):
+    """The queue file has already been dequeued by someone else."""
+
+    def __init__(self, filebase):
+        super(AlreadyDequeuedError, self).__init__()
+        self.filebase = filebase
+
+    def __str__(self):
+        return self.filebase
+
+
 
 class ISwitchboard(Interface):
     """The switchboard."""
@@ -46,6 +61,11 @@ class ISwitchboard(Interface):
         keyword arguments are added to the metadata dictonary, with precedence
         given to the keyword arguments.
 
+        Keyword arguments starting with an underscore are not added to the
+        metadata.  `_due` schedules the message: it is the time, in seconds
+        since the epoch, before which the message is not among the queue's
+        files.
+
         The base name of the message file is returned.
         """
 
@@ -57,7 +77,9 @@ class ISwitchboard(Interface):
         metadata.  The message file is preserved in a backup file, which must
         be removed by calling the .finish() method.
 
-        Returned is a 2-tuple of the form (message, metadata).
+        Returned is a 2-tuple of the form (message, metadata).  Several
+        switchboards may try to dequeue the same file, but only one of them
+        gets it; the others raise `AlreadyDequeuedError`.
         """
 
     def finish(filebase, preserve=False):
@@ -70,7 +92,14 @@ class ISwitchboard(Interface):
     files = Attribute(
         """An iterator over all the .pck files in the queue directory.
 
-        The base names of the matching files are returned.
+        The base names of the matching files are returned.  Files which are
+        scheduled for later are left out until they are due.
+        """)
+
+    scheduled = Attribute(
+        """The base names of the .pck files which are not due yet.
+
+        They are returned in the order in which they become due.
         """)
 
     def get_files(extension='.pck'):
@@ -88,3 +117,62 @@ class ISwitchboard(Interface):
         time, so moving them is enough to ensure that a normal dequeing
         operation will handle them.
         """
+
+
+
+class IQueueFileFormat(Interface):
+    """The on-disk format of queue files.
+
+    A switchboard writes its queue files in the format it is configured
+    with, but any queue file format that Mailman knows about can be read.
+    """
+
+    def recognize(fp):
+        """Return whether the open queue file is in this format.
+
+        :param fp: The queue file, opened for reading in binary mode and
+            positioned at its start.  It is left at its start.
+        :return: True if this format can read the file.
+        :rtype: bool
+        """
+
+    def dumps(msg, metadata):
+        """Serialize a message and its metadata.
+
+        :param msg: The message, or its text if the metadata's `_parsemsg`
+            key is True.
+        :type msg: `email.message.Message` or str
+        :param metadata: The message metadata.
+        :type metadata: dict
+        :return: The chunks of bytes which make up the queue file, to be
+            written one after the other.  A chunk may also be a file opened
+            for reading in binary mode, whose whole contents are copied.
+        :rtype: list of bytes or files
+        """
+
+    def load(fp):
+        """Read a message and its metadata.
+
+        :param fp: The queue file, positioned at its start.
+        :return: The message and its metadata.
+        :rtype: 2-tuple of (`email.message.Message`, dict)
+        """
+
+    def load_metadata(fp):
+        """Read only the metadata of a queue file.
+
+        :param fp: The queue file, positioned at its start.
+        :return: The message metadata.
+        :rtype: dict
+        """
+
+    def replace_metadata(fp, metadata):
+        """Replace the metadata in a queue file.
+
+        The message in the queue file is left as it is.
+
+        :param fp: The queue file, opened for reading and writing in binary
+            mode and positioned at its start.
+        :param metadata: The new metadata.
+        :type metadata: dict
+        """
@@ -22,7 +22,7 @@ __all__ = [
     ]
 
 
-from zope.interface import Interface
+from zope.interface import Attribute, Interface
 
 
 
@@ -42,3 +42,16 @@ class ITemplateLoader(Interface):
         :return: The template string as a unicode.
         :rtype: str
         """
+
+    def flush():
+        """Forget all cached templates.
+
+        Templates are cached for a while after they are downloaded.  After
+        this, they are downloaded again the next time they are asked for.
+        """
+
+    hits = Attribute(
+        """The number of templates returned from the cache.""")
+
+    misses = Attribute(
+        """The number of templates which had to be downloaded.""")
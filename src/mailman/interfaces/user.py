@@ -18,6 +18,7 @@
 """Interface describing the basics of a user."""
 
 __all__ = [
+    'AddressLinkEvent',
     'IUser',
     'PasswordChangeEvent',
     'UnverifiedAddressError',
@@ -34,6 +35,24 @@ class UnverifiedAddressError(AddressError):
 
 
 
+class AddressLinkEvent:
+    """Event which gets triggered when a user's addresses change.
+
+    The event is triggered just after an address is linked to, or unlinked
+    from, the user.
+    """
+
+    def __init__(self, user, address):
+        self.user = user
+        self.address = address
+
+    def __str__(self):
+        return '<{0} {1} {2}>'.format(self.__class__.__name__,
+                                      self.user.display_name,
+                                      self.address.email)
+
+
+
 class PasswordChangeEvent:
     """Event which gets triggered when a user changes their password."""
 
@@ -85,7 +85,9 @@ class IUserManager(Interface):
         """
 
     users = Attribute(
-        """An iterator over all the `IUsers` managed by this user manager.""")
+        """A sequence of all the `IUsers` managed by this user manager.
+
+        The users are in the order they were created in.""")
 
     def create_address(email, display_name=None):
         """Create and return an address unlinked to any user.
@@ -122,7 +124,9 @@ class IUserManager(Interface):
         """
 
     addresses = Attribute(
-        """An iterator over all the `IAddresses` managed by this manager.""")
+        """A sequence of all the `IAddresses` managed by this manager.
+
+        The addresses are in the order they were created in.""")
 
     members = Attribute(
         """An iterator of all the `IMembers` in the database.""")
@@ -23,6 +23,7 @@ __all__ = [
 
 
 import os
+import uuid
 
 from mailman.config import config
 from mailman.database.model import Model
@@ -97,6 +98,9 @@ class MailingList(Model):
     digest_last_sent_at = Column(DateTime)
     volume = Column(Integer)
     last_post_at = Column(DateTime)
+    # Changed whenever the acceptable aliases change, so that the processes
+    # caching them can tell.
+    acceptable_aliases_token = Column(Unicode)
     # Attributes which are directly modifiable via the web u/i.  The more
     # complicated attributes are currently stored as pickles, though that
     # will change as the schema and implementation is developed.
@@ -524,11 +528,16 @@ class AcceptableAliasSet:
     def __init__(self, mailing_list):
         self._mailing_list = mailing_list
 
+    def _changed(self):
+        # Give the aliases a new token.
+        self._mailing_list.acceptable_aliases_token = uuid.uuid4().hex
+
     @dbconnection
     def clear(self, store):
         """See `IAcceptableAliasSet`."""
         store.query(AcceptableAlias).filter(
             AcceptableAlias.mailing_list == self._mailing_list).delete()
+        self._changed()
 
     @dbconnection
     def add(self, store, alias):
@@ -536,12 +545,14 @@ class AcceptableAliasSet:
             raise ValueError(alias)
         alias = AcceptableAlias(self._mailing_list, alias.lower())
         store.add(alias)
+        self._changed()
 
     @dbconnection
     def remove(self, store, alias):
         store.query(AcceptableAlias).filter(
             AcceptableAlias.mailing_list == self._mailing_list,
             AcceptableAlias.alias == alias.lower()).delete()
+        self._changed()
 
     @property
     @dbconnection
@@ -551,6 +562,14 @@ class AcceptableAliasSet:
         for alias in aliases:
             yield alias.alias
 
+    @property
+    def token(self):
+        """See `IAcceptableAliasSet`."""
+        # Mailing lists from before there were tokens get one now.
+        if self._mailing_list.acceptable_aliases_token is None:
+            self._changed()
+        return self._mailing_list.acceptable_aliases_token
+
 
 
 @implementer(IListArchiver)
@@ -30,7 +30,8 @@ from mailman.interfaces.action import Action
 from mailman.interfaces.address import IAddress
 from mailman.interfaces.listmanager import IListManager
 from mailman.interfaces.member import (
-    IMember, MemberRole, MembershipError, UnsubscriptionEvent)
+    AddressChangeEvent, IMember, MemberRole, MembershipError,
+    UnsubscriptionEvent)
 from mailman.interfaces.user import IUser, UnverifiedAddressError
 from mailman.interfaces.usermanager import IUserManager
 from mailman.utilities.uid import UniqueIDFactory
@@ -127,6 +128,7 @@ class Member(Model):
         if user is None or user != self.user:
             raise MembershipError('Address is not controlled by user')
         self._address = new_address
+        notify(AddressChangeEvent(self.mailing_list, self))
 
     @property
     def user(self):
@@ -26,23 +26,204 @@ __all__ = [
     'AdministratorRoster',
     'DigestMemberRoster',
     'MemberRoster',
+    'MembershipCache',
     'Memberships',
     'ModeratorRoster',
     'OwnerRoster',
     'RegularMemberRoster',
     'Subscribers',
+    'handle_AddressLinkEvent',
+    'handle_MembershipChangeEvent',
+    'membership_cache',
     ]
 
 
+from mailman.config import config
+from mailman.core.constants import system_preferences
 from mailman.database.transaction import dbconnection
-from mailman.interfaces.member import DeliveryMode, MemberRole
-from mailman.interfaces.roster import IRoster
+from mailman.interfaces.languages import ILanguageManager
+from mailman.interfaces.member import (
+    DeliveryMode, MemberRole, MembershipChangeEvent)
+from mailman.interfaces.roster import IRoster, RecipientRecord
+from mailman.interfaces.user import AddressLinkEvent
 from mailman.model.address import Address
 from mailman.model.member import Member
-from sqlalchemy import and_, or_
+from mailman.model.preferences import Preferences
+from sqlalchemy import and_, func, or_
+from sqlalchemy.event import listen
+from sqlalchemy.orm import aliased, joinedload
+from zope.component import getUtility
 from zope.interface import implementer
 
 
+# How many email addresses to look up per query.  SQLite allows no more than
+# 999 bound parameters per statement.
+BATCH_SIZE = 500
+
+
+
+class MembershipCache:
+    """The members looked up by email address in the current transaction.
+
+    While a message is being processed, the same addresses are looked up in
+    the same rosters over and over again.  This remembers the results of
+    `get_member()`, keyed by the mailing list, the role and the email address,
+    until the transaction ends or the memberships change.
+    """
+
+    def __init__(self):
+        self._members = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, lookup):
+        """Return a cached member.
+
+        :param key: The mailing list's id, the role and the email address.
+        :type key: tuple
+        :param lookup: Called with no arguments to look the member up when it
+            is not cached.  The result, which may be None, is cached.
+        :type lookup: callable
+        :return: The member, or None.
+        :rtype: `IMember`
+        """
+        try:
+            member = self._members[key]
+        except KeyError:
+            self.misses += 1
+            member = self._members[key] = lookup()
+        else:
+            self.hits += 1
+        return member
+
+    def invalidate(self, list_id=None, email=None):
+        """Forget the cached members of a mailing list or an address.
+
+        :param list_id: Forget the members of this mailing list.
+        :type list_id: str
+        :param email: Forget the members subscribed with this address.
+        :type email: str
+        """
+        for key in list(self._members):
+            if key[0] == list_id or key[2] == email:
+                del self._members[key]
+
+    def clear(self, *args):
+        """Forget all cached members."""
+        self._members.clear()
+
+
+def membership_cache():
+    """Return the membership cache of the database session.
+
+    The cache is cleared whenever the session's transaction is committed or
+    rolled back, including rollbacks to a savepoint.
+    """
+    # The events must be listened for on this thread's session, not on all
+    # of them.
+    store = config.db.store()
+    cache = store.info.get('membership_cache')
+    if cache is None:
+        cache = store.info['membership_cache'] = MembershipCache()
+        listen(store, 'after_commit', cache.clear)
+        listen(store, 'after_soft_rollback', cache.clear)
+    return cache
+
+
+def handle_MembershipChangeEvent(event):
+    if isinstance(event, MembershipChangeEvent):
+        membership_cache().invalidate(list_id=event.mlist.list_id)
+
+
+def handle_AddressLinkEvent(event):
+    # Members subscribed with their preferred address are found by any of
+    # their user's addresses.
+    if isinstance(event, AddressLinkEvent):
+        membership_cache().invalidate(email=event.address.email)
+
+
+
+def _with_delivery_details(query):
+    """Join a query of members with their delivery details.
+
+    This resolves the cascade of `Member._lookup()` in the database: the
+    first preference that is set of the member's, the address's and the
+    user's.
+
+    :param query: A query for `Member` objects.
+    :return: The joined query, and a dictionary mapping each of the fields of
+        a `RecipientRecord` to its column expression.  Preferences which none
+        of the member, address or user set are NULL.
+    """
+    # Avoid circular imports.
+    from mailman.model.user import User
+    explicit = aliased(Address)
+    subscribed = aliased(User)
+    preferred = aliased(Address)
+    owner = aliased(User)
+    member_preferences = aliased(Preferences)
+    address_preferences = aliased(Preferences)
+    user_preferences = aliased(Preferences)
+    query = query.outerjoin(
+        # Members subscribed with an explicit address...
+        explicit, Member.address_id == explicit.id).outerjoin(
+        # ...or with the preferred address of their user.
+        subscribed, Member.user_id == subscribed.id).outerjoin(
+        preferred, subscribed._preferred_address_id == preferred.id).outerjoin(
+        # The user owning the subscribed address.
+        owner, func.coalesce(explicit.user_id, Member.user_id) == owner.id)
+    query = query.outerjoin(
+        member_preferences,
+        Member.preferences_id == member_preferences.id).outerjoin(
+        address_preferences,
+        func.coalesce(explicit.preferences_id, preferred.preferences_id) ==
+        address_preferences.id).outerjoin(
+        user_preferences, owner.preferences_id == user_preferences.id)
+    def cascade(name):
+        return func.coalesce(getattr(member_preferences, name),
+                             getattr(address_preferences, name),
+                             getattr(user_preferences, name))
+    columns = dict(
+        email=func.coalesce(explicit.email, preferred.email),
+        original_email=func.coalesce(
+            explicit._original, explicit.email,
+            preferred._original, preferred.email),
+        delivery_mode=cascade('delivery_mode'),
+        delivery_status=cascade('delivery_status'),
+        receive_own_postings=cascade('receive_own_postings'),
+        receive_list_copy=cascade('receive_list_copy'),
+        language=cascade('_preferred_language'),
+        )
+    return query, columns
+
+
+def _delivery_mode_filter(column, delivery_modes):
+    # Members with no delivery mode preference get the system default.
+    condition = column.in_(delivery_modes)
+    if system_preferences.delivery_mode in delivery_modes:
+        condition = or_(condition, column == None)
+    return condition
+
+
+def _recipients(mlist, query, columns):
+    """Return the `RecipientRecord` for each row of a joined query."""
+    language_manager = getUtility(ILanguageManager)
+    mlist_language = mlist.preferred_language if mlist is not None else None
+    fields = RecipientRecord._fields
+    defaults = [getattr(system_preferences, field, None) for field in fields]
+    for row in query.with_entities(
+            *[columns[field].label(field) for field in fields]):
+        values = [default if value is None else value
+                  for value, default in zip(row, defaults)]
+        record = RecipientRecord(*values)
+        if row.language is None:
+            language = (mlist_language or
+                        system_preferences.preferred_language)
+        else:
+            language = language_manager[row.language]
+        yield record._replace(language=language)
+
+
 
 @implementer(IRoster)
 class AbstractRoster:
@@ -96,6 +277,15 @@ class AbstractRoster:
         for member in self.members:
             yield member.address
 
+    def _delivery_query(self):
+        return _with_delivery_details(self._query())
+
+    @property
+    def recipients(self):
+        """See `IRoster`."""
+        query, columns = self._delivery_query()
+        yield from _recipients(self._mlist, query, columns)
+
     @dbconnection
     def _get_all_memberships(self, store, email):
         # Avoid circular imports.
@@ -118,6 +308,13 @@ class AbstractRoster:
 
     def get_member(self, email):
         """See ``IRoster``."""
+        if self.role is None:
+            return self._get_member(email)
+        return membership_cache().get(
+            (self._mlist.list_id, self.role, email),
+            lambda: self._get_member(email))
+
+    def _get_member(self, email):
         memberships = self._get_all_memberships(email)
         count = len(memberships)
         if count == 0:
@@ -132,6 +329,33 @@ class AbstractRoster:
                 if memberships[0]._address is not None
                 else memberships[1])
 
+    def get_members(self, emails):
+        """See ``IRoster``."""
+        emails = list(emails)
+        members = {}
+        for start in range(0, len(emails), BATCH_SIZE):
+            batch = emails[start:start + BATCH_SIZE]
+            # Load everything delivery needs to know about the members along
+            # with them, rather than one lazy load at a time.
+            query = self._query().options(
+                joinedload(Member.preferences),
+                joinedload(Member._user),
+                joinedload(Member._address).joinedload(Address.user))
+            # First the members subscribed with their user's preferred
+            # address, then those subscribed with an explicit address.  The
+            # latter win, as they do in get_member().
+            indirect = query.join(
+                Address, Address.user_id == Member.user_id).filter(
+                    Address.email.in_(batch))
+            direct = query.join(
+                Address, Address.id == Member.address_id).filter(
+                    Address.email.in_(batch))
+            for results in (indirect, direct):
+                members.update(
+                    (email, member)
+                    for member, email in results.add_columns(Address.email))
+        return members
+
     def get_memberships(self, email):
         """See ``IRoster``."""
         memberships = self._get_all_memberships(email)
@@ -209,42 +433,33 @@ class DeliveryMemberRoster(AbstractRoster):
     """Return all the members having a particular kind of delivery."""
 
     role = MemberRole.member
+    delivery_modes = ()
+
+    def _delivery_query(self):
+        query, columns = super(DeliveryMemberRoster, self)._delivery_query()
+        query = query.filter(_delivery_mode_filter(
+            columns['delivery_mode'], self.delivery_modes))
+        return query, columns
 
     @property
-    def member_count(self):
+    def members(self):
         """See `IRoster`."""
-        # XXX 2012-03-15 BAW: It would be nice to make this more efficient.
-        # The problem is that you'd have to change the loop in _get_members()
-        # checking the delivery mode to a query parameter.
-        return len(tuple(self.members))
-
-    @dbconnection
-    def _get_members(self, store, *delivery_modes):
-        """The set of members for a mailing list, filter by delivery mode.
-
-        :param delivery_modes: The modes to filter on.
-        :type delivery_modes: sequence of `DeliveryMode`.
-        :return: A generator of members.
-        :rtype: generator
-        """
-        results = store.query(Member).filter_by(
-            list_id = self._mlist.list_id,
-            role = MemberRole.member)
-        for member in results:
-            if member.delivery_mode in delivery_modes:
-                yield member
+        query, columns = self._delivery_query()
+        for member in query:
+            yield member
 
+    @property
+    def member_count(self):
+        """See `IRoster`."""
+        query, columns = self._delivery_query()
+        return query.count()
 
+
 class RegularMemberRoster(DeliveryMemberRoster):
     """Return all the regular delivery members of a list."""
 
     name = 'regular_members'
-
-    @property
-    def members(self):
-        """See `IRoster`."""
-        for member in self._get_members(DeliveryMode.regular):
-            yield member
+    delivery_modes = (DeliveryMode.regular,)
 
 
 
@@ -252,14 +467,9 @@ class DigestMemberRoster(DeliveryMemberRoster):
     """Return all the regular delivery members of a list."""
 
     name = 'digest_members'
-
-    @property
-    def members(self):
-        """See `IRoster`."""
-        for member in self._get_members(DeliveryMode.plaintext_digests,
-                                        DeliveryMode.mime_digests,
-                                        DeliveryMode.summary_digests):
-            yield member
+    delivery_modes = (DeliveryMode.plaintext_digests,
+                      DeliveryMode.mime_digests,
+                      DeliveryMode.summary_digests)
 
 
 
@@ -313,6 +523,19 @@ class Memberships:
         for address in self._user.addresses:
             yield address
 
+    @property
+    def recipients(self):
+        """See `IRoster`."""
+        # The memberships are on different mailing lists, each with its own
+        # preferred language, so just ask every member.
+        for member in self.members:
+            address = member.address
+            yield RecipientRecord(
+                address.email, address.original_email,
+                member.delivery_mode, member.delivery_status,
+                member.receive_own_postings, member.receive_list_copy,
+                member.preferred_language)
+
     @dbconnection
     def get_member(self, store, email):
         """See `IRoster`."""
@@ -328,6 +551,15 @@ class Memberships:
                 'Too many matching member results: {0}'.format(
                     results.count()))
 
+    def get_members(self, emails):
+        """See `IRoster`."""
+        members = {}
+        for email in emails:
+            member = self.get_member(email)
+            if member is not None:
+                members[email] = member
+        return members
+
     @dbconnection
     def get_memberships(self, store, address):
         """See `IRoster`."""
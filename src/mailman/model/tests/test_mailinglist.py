@@ -163,3 +163,19 @@ class TestAcceptableAliases(unittest.TestCase):
         self.assertEqual(['bee@example.com'], list(alias_set.aliases))
         getUtility(IListManager).delete(self._mlist)
         self.assertEqual(len(list(alias_set.aliases)), 0)
+
+    def test_token_changes(self):
+        # The alias set's token changes whenever the aliases change.
+        alias_set = IAcceptableAliasSet(self._mlist)
+        tokens = [alias_set.token]
+        self.assertIsNotNone(tokens[0])
+        self.assertEqual(alias_set.token, tokens[0])
+        alias_set.add('bee@example.com')
+        tokens.append(alias_set.token)
+        alias_set.remove('bee@example.com')
+        tokens.append(alias_set.token)
+        alias_set.clear()
+        tokens.append(alias_set.token)
+        self.assertEqual(len(set(tokens)), 4)
+        # Another adapter of the same list has the same token.
+        self.assertEqual(IAcceptableAliasSet(self._mlist).token, tokens[-1])
@@ -19,17 +19,21 @@
 
 __all__ = [
     'TestMailingListRoster',
+    'TestMembershipCache',
     'TestMembershipsRoster',
     ]
 
 
 import unittest
+import threading
 
 from mailman.app.lifecycle import create_list
+from mailman.config import config
 from mailman.interfaces.address import IAddress
 from mailman.interfaces.member import DeliveryMode, MemberRole
 from mailman.interfaces.user import IUser
 from mailman.interfaces.usermanager import IUserManager
+from mailman.model.roster import membership_cache
 from mailman.testing.layers import ConfigLayer
 from mailman.utilities.datetime import now
 from zope.component import getUtility
@@ -127,6 +131,77 @@ class TestMailingListRoster(unittest.TestCase):
         self.assertEqual(self._mlist.digest_members.member_count, 1)
         self.assertEqual(self._mlist.subscribers.member_count, 4)
 
+    def test_get_members(self):
+        # Several members can be looked up at once.
+        self._mlist.subscribe(self._anne, role=MemberRole.member)
+        self._mlist.subscribe(self._bart, role=MemberRole.member)
+        self._mlist.subscribe(self._cris, role=MemberRole.owner)
+        members = self._mlist.members.get_members(
+            ['anne@example.com', 'bart@example.com', 'cris@example.com',
+             'dave@example.com'])
+        self.assertEqual(sorted(members), ['anne@example.com',
+                                           'bart@example.com'])
+        self.assertEqual(members['anne@example.com'],
+                         self._mlist.members.get_member('anne@example.com'))
+        owners = self._mlist.administrators.get_members(['cris@example.com'])
+        self.assertEqual(owners['cris@example.com'].role, MemberRole.owner)
+
+    def test_get_no_members(self):
+        self.assertEqual(self._mlist.members.get_members([]), {})
+
+    def test_recipients(self):
+        # The recipients give the members' delivery details, with the same
+        # preferences as the members themselves.
+        anne = getUtility(IUserManager).create_user('aNNe@example.com')
+        anne.preferences.delivery_mode = DeliveryMode.plaintext_digests
+        anne.preferences.preferred_language = 'fr'
+        address = anne.preferred_address
+        address.preferences.receive_own_postings = False
+        member = self._mlist.subscribe(address)
+        member.preferences.delivery_mode = DeliveryMode.mime_digests
+        self._mlist.subscribe(self._bart)
+        self._mlist.subscribe(self._cris, role=MemberRole.owner)
+        self._mlist.preferred_language = 'ja'
+        recipients = sorted(self._mlist.members.recipients)
+        self.assertEqual(len(recipients), 2)
+        for recipient in recipients:
+            member = self._mlist.members.get_member(recipient.email)
+            self.assertEqual(recipient.original_email,
+                             member.address.original_email)
+            self.assertEqual(recipient.delivery_mode, member.delivery_mode)
+            self.assertEqual(recipient.delivery_status,
+                             member.delivery_status)
+            self.assertEqual(recipient.receive_own_postings,
+                             member.receive_own_postings)
+            self.assertEqual(recipient.receive_list_copy,
+                             member.receive_list_copy)
+            self.assertEqual(recipient.language, member.preferred_language)
+        anne, bart = recipients
+        self.assertEqual(anne.original_email, 'aNNe@example.com')
+        self.assertEqual(anne.delivery_mode, DeliveryMode.mime_digests)
+        self.assertFalse(anne.receive_own_postings)
+        self.assertEqual(anne.language.code, 'fr')
+        self.assertEqual(bart.delivery_mode, DeliveryMode.regular)
+        self.assertTrue(bart.receive_own_postings)
+        self.assertEqual(bart.language.code, 'ja')
+
+    def test_recipients_by_delivery_mode(self):
+        # The delivery rosters only give the recipients with their delivery
+        # modes, including members subscribed as a user.
+        anne = getUtility(IUserManager).create_user('anne@example.org')
+        anne.preferences.delivery_mode = DeliveryMode.plaintext_digests
+        self._mlist.subscribe(anne)
+        self._mlist.subscribe(self._bart)
+        self.assertEqual(
+            [recipient.email
+             for recipient in self._mlist.regular_members.recipients],
+            ['bart@example.com'])
+        self.assertEqual(
+            [recipient.email
+             for recipient in self._mlist.digest_members.recipients],
+            ['anne@example.org'])
+        self.assertEqual(self._mlist.digest_members.member_count, 1)
+
 
 
 class TestMembershipsRoster(unittest.TestCase):
@@ -200,3 +275,122 @@ class TestMembershipsRoster(unittest.TestCase):
         self.assertEqual(
             [record.address.email for record in memberships],
             ['anne@example.com', 'anne@example.com'])
+
+    def test_get_members_as_user(self):
+        # A user subscribed with their preferred address is found.
+        self._ant.subscribe(self._anne)
+        members = self._ant.members.get_members(['anne@example.com'])
+        self.assertEqual(members['anne@example.com'].user, self._anne)
+
+    def test_get_members_as_user_and_address(self):
+        # Like get_member(), get_members() prefers the explicit address.
+        self._ant.subscribe(self._anne)
+        self._ant.subscribe(self._anne.preferred_address)
+        members = self._ant.members.get_members(['anne@example.com'])
+        self.assertTrue(
+            IAddress.providedBy(members['anne@example.com'].subscriber))
+
+
+
+class TestMembershipCache(unittest.TestCase):
+    """Test the caching of member lookups."""
+
+    layer = ConfigLayer
+
+    def setUp(self):
+        self._mlist = create_list('test@example.com')
+        self._user_manager = getUtility(IUserManager)
+        self._anne = self._user_manager.create_address('anne@example.com')
+        self._cache = membership_cache()
+
+    def _counts(self):
+        return self._cache.hits, self._cache.misses
+
+    def test_lookups_are_cached(self):
+        member = self._mlist.subscribe(self._anne)
+        hits, misses = self._counts()
+        self.assertEqual(
+            self._mlist.members.get_member('anne@example.com'), member)
+        self.assertEqual(
+            self._mlist.members.get_member('anne@example.com'), member)
+        self.assertEqual(self._counts(), (hits + 1, misses + 1))
+
+    def test_nonmembers_are_cached(self):
+        hits, misses = self._counts()
+        self.assertIsNone(self._mlist.members.get_member('anne@example.com'))
+        self.assertIsNone(self._mlist.members.get_member('anne@example.com'))
+        self.assertEqual(self._counts(), (hits + 1, misses + 1))
+
+    def test_roles_are_cached_separately(self):
+        self._mlist.subscribe(self._anne, MemberRole.owner)
+        self.assertIsNone(self._mlist.members.get_member('anne@example.com'))
+        self.assertIsNotNone(
+            self._mlist.owners.get_member('anne@example.com'))
+
+    def test_subscribe(self):
+        self.assertIsNone(self._mlist.members.get_member('anne@example.com'))
+        member = self._mlist.subscribe(self._anne)
+        self.assertEqual(
+            self._mlist.members.get_member('anne@example.com'), member)
+
+    def test_unsubscribe(self):
+        member = self._mlist.subscribe(self._anne)
+        self.assertEqual(
+            self._mlist.members.get_member('anne@example.com'), member)
+        member.unsubscribe()
+        self.assertIsNone(self._mlist.members.get_member('anne@example.com'))
+
+    def test_link(self):
+        # A user subscribed with their preferred address is a member under all
+        # of their addresses, including ones linked later.
+        user = self._user_manager.create_user('bart@example.com')
+        address = user.preferred_address
+        address.verified_on = now()
+        user.preferred_address = address
+        self._mlist.subscribe(user)
+        self.assertIsNone(self._mlist.members.get_member('anne@example.com'))
+        user.link(self._anne)
+        self.assertIsNotNone(
+            self._mlist.members.get_member('anne@example.com'))
+        user.unlink(self._anne)
+        self.assertIsNone(self._mlist.members.get_member('anne@example.com'))
+
+    def test_address_change(self):
+        user = self._user_manager.create_user('bart@example.com')
+        bart = user.preferred_address
+        bart.verified_on = now()
+        user.link(self._anne)
+        self._anne.verified_on = now()
+        member = self._mlist.subscribe(bart)
+        self.assertIsNone(self._mlist.members.get_member('anne@example.com'))
+        member.address = self._anne
+        self.assertEqual(
+            self._mlist.members.get_member('anne@example.com'), member)
+        self.assertIsNone(self._mlist.members.get_member('bart@example.com'))
+
+    def test_commit_clears_the_cache(self):
+        self._mlist.subscribe(self._anne)
+        self._mlist.members.get_member('anne@example.com')
+        config.db.commit()
+        hits, misses = self._counts()
+        self._mlist.members.get_member('anne@example.com')
+        self.assertEqual(self._counts(), (hits, misses + 1))
+
+    def test_abort_clears_the_cache(self):
+        config.db.commit()
+        self._mlist.subscribe(self._anne)
+        self.assertIsNotNone(
+            self._mlist.members.get_member('anne@example.com'))
+        config.db.abort()
+        self.assertIsNone(self._mlist.members.get_member('anne@example.com'))
+
+    def test_threads_have_their_own_cache(self):
+        # Each thread has a database session of its own, and so a cache of
+        # its own too.
+        caches = []
+        thread = threading.Thread(
+            target=lambda: caches.append(membership_cache()))
+        thread.start()
+        thread.join()
+        self.assertIsNot(caches[0], self._cache)
+        self.assertIs(membership_cache(), self._cache)
@@ -29,7 +29,7 @@ from mailman.database.types import UUID
 from mailman.interfaces.address import (
     AddressAlreadyLinkedError, AddressNotLinkedError)
 from mailman.interfaces.user import (
-    IUser, PasswordChangeEvent, UnverifiedAddressError)
+    AddressLinkEvent, IUser, PasswordChangeEvent, UnverifiedAddressError)
 from mailman.model.address import Address
 from mailman.model.preferences import Preferences
 from mailman.model.roster import Memberships
@@ -119,12 +119,14 @@ class User(Model):
         if address.user is not None:
             raise AddressAlreadyLinkedError(address)
         address.user = self
+        notify(AddressLinkEvent(self, address))
 
     def unlink(self, address):
         """See `IUser`."""
         if address.user is None or address.user is not self:
             raise AddressNotLinkedError(address)
         address.user = None
+        notify(AddressLinkEvent(self, address))
 
     @property
     def preferred_address(self):
@@ -173,6 +175,7 @@ class User(Model):
         if address.user is not None:
             raise AddressAlreadyLinkedError(address)
         address.user = self
+        notify(AddressLinkEvent(self, address))
         return address
 
     @property
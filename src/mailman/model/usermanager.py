@@ -29,6 +29,7 @@ from mailman.model.address import Address
 from mailman.model.member import Member
 from mailman.model.preferences import Preferences
 from mailman.model.user import User
+from mailman.utilities.queries import QuerySequence
 from zope.interface import implementer
 
 
@@ -92,8 +93,7 @@ class UserManager:
     @dbconnection
     def users(self, store):
         """See `IUserManager`."""
-        for user in store.query(User).all():
-            yield user
+        return QuerySequence(store.query(User).order_by(User.id))
 
     @dbconnection
     def create_address(self, store, email, display_name=None):
@@ -133,8 +133,7 @@ class UserManager:
     @dbconnection
     def addresses(self, store):
         """See `IUserManager`."""
-        for address in store.query(Address).all():
-            yield address
+        return QuerySequence(store.query(Address).order_by(Address.id))
 
     @property
     @dbconnection
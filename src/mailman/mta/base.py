@@ -28,9 +28,12 @@ import socket
 import logging
 import smtplib
 
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from mailman.config import config
 from mailman.interfaces.mta import IMailTransportAgentDelivery
-from mailman.mta.connection import Connection
+from mailman.mta.rendering import (
+    MessageTemplate, RenderedMessage, slot_values, stand_in_member)
 from zope.interface import implementer
 
 
@@ -44,12 +47,9 @@ class BaseDelivery:
 
     def __init__(self):
         """Create a basic deliverer."""
-        username = (config.mta.smtp_user if config.mta.smtp_user else None)
-        password = (config.mta.smtp_pass if config.mta.smtp_pass else None)
-        self._connection = Connection(
-            config.mta.smtp_host, int(config.mta.smtp_port),
-            int(config.mta.max_sessions_per_connection),
-            username, password)
+        self._host = config.mta.smtp_host
+        self._port = int(config.mta.smtp_port)
+        self._threads = int(config.mta.max_delivery_threads)
 
     def _deliver_to_recipients(self, mlist, msg, msgdata, recipients):
         """Low-level delivery to a set of recipients.
@@ -65,12 +65,31 @@ class BaseDelivery:
         :return: delivery failures as defined by `smtplib.SMTP.sendmail`
         :rtype: dictionary
         """
-        # Do the actual sending.
         sender = self._get_sender(mlist, msg, msgdata)
-        message_id = msg['message-id']
+        return self._send(
+            sender, recipients, msg.as_string(), msg['message-id'])
+
+    def _send(self, sender, recipients, msgtext, message_id):
+        """Send the text of a message over a pooled connection.
+
+        This touches neither the mailing list nor the message object, so it
+        is safe to call from a delivery thread.
+
+        :param sender: The envelope sender.
+        :type sender: string
+        :param recipients: The recipients of this message.
+        :type recipients: sequence
+        :param msgtext: The text of the message.
+        :type msgtext: string
+        :param message_id: The Message-ID, for logging.
+        :type message_id: string
+        :return: delivery failures as defined by `smtplib.SMTP.sendmail`
+        :rtype: dictionary
+        """
         try:
-            refused = self._connection.sendmail(
-                sender, recipients, msg.as_string())
+            with config.connection_pool.connection(
+                    self._host, self._port) as connection:
+                refused = connection.sendmail(sender, recipients, msgtext)
         except smtplib.SMTPRecipientsRefused as error:
             log.error('%s recipients refused: %s', message_id, error)
             refused = error.recipients
@@ -93,6 +112,42 @@ class BaseDelivery:
                 for recipient in recipients)
         return refused
 
+    def _deliver_all(self, mlist, deliveries):
+        """Deliver several messages, in parallel if so configured.
+
+        With `max_delivery_threads` of 2 or more, the sender and message text
+        of each delivery are worked out here, and the SMTP transactions run in
+        that many threads.  Otherwise, the deliveries are made one after the
+        other.  Either way, the failures are merged in delivery order.
+
+        :param mlist: The mailing list being delivered to.
+        :type mlist: `IMailingList`
+        :param deliveries: The message, metadata and recipients of each
+            delivery.  This is consumed lazily, so that no more messages are
+            waiting for a thread than there are threads.
+        :type deliveries: iterable of 3-tuples
+        :return: delivery failures as defined by `smtplib.SMTP.sendmail`
+        :rtype: dictionary
+        """
+        refused = {}
+        if self._threads <= 1:
+            for msg, msgdata, recipients in deliveries:
+                refused.update(self._deliver_to_recipients(
+                    mlist, msg, msgdata, recipients))
+            return refused
+        pending = deque()
+        with ThreadPoolExecutor(self._threads) as executor:
+            for msg, msgdata, recipients in deliveries:
+                if len(pending) >= self._threads:
+                    refused.update(pending.popleft().result())
+                sender = self._get_sender(mlist, msg, msgdata)
+                pending.append(executor.submit(
+                    self._send, sender, recipients, msg.as_string(),
+                    msg['message-id']))
+            while pending:
+                refused.update(pending.popleft().result())
+        return refused
+
     def _get_sender(self, mlist, msg, msgdata):
         """Return the envelope sender to use.
 
@@ -130,6 +185,11 @@ class IndividualDelivery(BaseDelivery):
     The core concept here is that for each recipient, the deliver() method
     iterates over the list of registered callbacks, each of which have a
     chance to modify the message before final delivery.
+
+    Running the callbacks for every recipient is expensive though, so where
+    possible they are only run for a stand-in recipient, and each recipient's
+    message is made from the resulting template.  See
+    `mailman.mta.rendering`.
     """
 
     def __init__(self):
@@ -144,27 +204,79 @@ class IndividualDelivery(BaseDelivery):
         delivery address in the return envelope so there can be no ambiguity
         in bounce processing.
         """
-        refused = {}
         recipients = msgdata.get('recipients', set())
+        return self._deliver_all(
+            mlist, self._individualize(mlist, msg, msgdata, recipients))
+
+    def _individualize(self, mlist, msg, msgdata, recipients):
+        # See if the recipients are members of the mailing list, and if so,
+        # squirrel this information away for use by other modules, such as
+        # the header/footer decorator.  Look them all up at once, rather
+        # than one query per recipient.
+        members = mlist.members.get_members(recipients)
+        duplicates = msgdata.get('add-dup-header', {})
+        templates = {}
         for recipient in recipients:
             log.debug('IndividualDelivery to: %s', recipient)
-            # Make a copy of the original messages and operator on it, since
-            # we're going to munge it repeatedly for each recipient.
-            message_copy = copy.deepcopy(msg)
             msgdata_copy = msgdata.copy()
             # Squirrel the current recipient away in the message metadata.
             # That way the subclass's _get_sender() override can encode the
             # recipient address in the sender, e.g. for VERP.
             msgdata_copy['recipient'] = recipient
-            # See if the recipient is a member of the mailing list, and if so,
-            # squirrel this information away for use by other modules, such as
-            # the header/footer decorator.  XXX 2012-03-05 this is probably
-            # highly inefficient on the database.
-            member = mlist.members.get_member(recipient)
+            member = members.get(recipient)
             msgdata_copy['member'] = member
+            values = slot_values(recipient, member)
+            if values is not None:
+                # Recipients who get an X-Mailman-Copy header, and those
+                # without a display name, get messages of a different shape.
+                key = (recipient in duplicates, bool(values['display_name']))
+                if key not in templates:
+                    templates[key] = self._make_template(
+                        mlist, msg, msgdata, *key)
+                template = templates[key]
+                if template is not None:
+                    yield (RenderedMessage(template.render(values)),
+                           msgdata_copy, [recipient])
+                    continue
+            # Make a copy of the original messages and operator on it, since
+            # we're going to munge it repeatedly for each recipient.
+            message_copy = copy.deepcopy(msg)
             for callback in self.callbacks:
                 callback(mlist, message_copy, msgdata_copy)
-            status = self._deliver_to_recipients(
-                mlist, message_copy, msgdata_copy, [recipient])
-            refused.update(status)
-        return refused
+            yield message_copy, msgdata_copy, [recipient]
+
+    def _make_template(self, mlist, msg, msgdata, duplicate, named):
+        """Render the message template for a kind of recipient.
+
+        :param mlist: The mailing list being delivered to.
+        :type mlist: `IMailingList`
+        :param msg: The original message being delivered.
+        :type msg: `Message`
+        :param msgdata: Additional message metadata for this delivery.
+        :type msgdata: dictionary
+        :param duplicate: Whether the recipient gets the message marked as a
+            copy of one they have already received.
+        :type duplicate: bool
+        :param named: Whether the recipient has a display name.
+        :type named: bool
+        :return: The template, or None if the callbacks can't be rendered
+            into one.
+        :rtype: `MessageTemplate`
+        """
+        def render(values):
+            message_copy = copy.deepcopy(msg)
+            msgdata_copy = msgdata.copy()
+            msgdata_copy['recipient'] = values['address']
+            msgdata_copy['member'] = stand_in_member(values)
+            msgdata_copy['add-dup-header'] = (
+                {values['address']: True} if duplicate else {})
+            for callback in self.callbacks:
+                callback(mlist, message_copy, msgdata_copy)
+            return message_copy.as_string()
+        try:
+            return MessageTemplate(render, named)
+        except Exception:
+            # Whatever the reason, the messages can still be rendered one by
+            # one.
+            log.debug('No message template for %s', msg.get('message-id'))
+            return None
@@ -19,12 +19,20 @@
 
 __all__ = [
     'BulkDelivery',
+    'DomainBulkDelivery',
+    'read_mx_groups',
     ]
 
 
+import os
+import logging
+
 from mailman.mta.base import BaseDelivery
 
 
+log = logging.getLogger('mailman.error')
+
+
 # A mapping of top-level domains to bucket numbers.  The zeroth bucket is
 # reserved for everything else.  At one time, these were the most common
 # domains.
@@ -37,6 +45,10 @@ CHUNKMAP = dict(
     ca=3,
     )
 
+# The MX groups read from each file, keyed by the file's path and the time it
+# was last modified, or None if the file couldn't be read.
+_mx_groups = {}
+
 
 
 class BulkDelivery(BaseDelivery):
@@ -99,9 +111,125 @@ class BulkDelivery(BaseDelivery):
 
     def deliver(self, mlist, msg, msgdata):
         """See `IMailTransportAgentDelivery`."""
-        refused = {}
-        for recipients in self.chunkify(msgdata.get('recipients', set())):
-            chunk_refused = self._deliver_to_recipients(
-                mlist, msg, msgdata, recipients)
-            refused.update(chunk_refused)
-        return refused
+        return self._deliver_all(mlist, (
+            (msg, msgdata, recipients)
+            for recipients in self.chunkify(msgdata.get('recipients', set()))
+            ))
+
+
+
+def read_mx_groups(path):
+    """Read the domains which share mail exchangers from a file.
+
+    Each line of the file names a mail exchanger followed by the domains it
+    receives mail for, separated by whitespace.  Blank lines and lines
+    starting with a # are ignored.  For example::
+
+        aspmx.l.google.com  gmail.com googlemail.com
+
+    The file is only read again when it changes.  A file which can't be
+    read is logged, once, and has no groups.
+
+    :param path: The path to the file.
+    :type path: str
+    :return: A mapping of domains to the name of their mail exchanger.
+    :rtype: dict
+    """
+    try:
+        key = (path, os.stat(path).st_mtime)
+        groups = _mx_groups.get(key)
+        if groups is None:
+            groups = {}
+            with open(path, encoding='utf-8') as fp:
+                for line in fp:
+                    words = line.split()
+                    if len(words) == 0 or words[0].startswith('#'):
+                        continue
+                    exchanger = words[0].lower()
+                    for domain in words[1:]:
+                        groups[domain.lower()] = exchanger
+    except (OSError, ValueError) as error:
+        key = (path, None)
+        groups = _mx_groups.get(key)
+        if groups is None:
+            log.error('Cannot read the MX groups file %s: %s', path, error)
+            groups = {}
+    _mx_groups.clear()
+    _mx_groups[key] = groups
+    return groups
+
+
+
+class DomainBulkDelivery(BulkDelivery):
+    """Deliver messages in chunks grouped by the recipients' domains.
+
+    Recipients in the same domain, or in domains which share mail exchangers,
+    are kept together in as few chunks as possible, so that the MTA can pass
+    each chunk on in as few SMTP transactions as possible.  Groups of
+    recipients too small to fill a chunk share one with other groups.
+    """
+
+    def __init__(self, max_recipients=None, max_per_domain=None,
+                 mx_groups=None):
+        """See `BaseDelivery`.
+
+        :param max_recipients: The maximum number of recipients per delivery
+            chunk.  None, zero or less means no limit.
+        :type max_recipients: integer
+        :param max_per_domain: The maximum number of recipients in the same
+            domain, or group of domains, per delivery chunk.  None, zero or
+            less means no limit.
+        :type max_per_domain: integer
+        :param mx_groups: A mapping of domains to the name of a group of
+            domains which share mail exchangers, as returned by
+            `read_mx_groups()`.  Domains not in the mapping are in a group of
+            their own.
+        :type mx_groups: dict
+        """
+        super(DomainBulkDelivery, self).__init__(max_recipients)
+        self._max_per_domain = (max_per_domain
+                                if max_per_domain is not None
+                                else 0)
+        self._mx_groups = (mx_groups if mx_groups is not None else {})
+
+    def chunkify(self, recipients):
+        """See `BulkDelivery`.
+
+        Each chunk also contains no more than `max_per_domain` addresses in
+        the same group of domains.
+        """
+        limits = [limit for limit in (self._max_recipients,
+                                      self._max_per_domain)
+                  if limit > 0]
+        if len(limits) == 0:
+            yield set(recipients)
+            return
+        by_group = {}
+        for address in recipients:
+            localpart, at, domain = address.rpartition('@')
+            domain = domain.lower()
+            group = self._mx_groups.get(domain, domain)
+            by_group.setdefault(group, []).append(address)
+        # Split every group into pieces that may go into one chunk.
+        piece_size = min(limits)
+        pieces = []
+        for group, addresses in by_group.items():
+            addresses.sort()
+            for start in range(0, len(addresses), piece_size):
+                pieces.append((group, addresses[start:start + piece_size]))
+        # Fill the chunks with the biggest pieces first.  A piece which
+        # doesn't fit into the current chunk starts a new one rather than
+        # being split, and so does a piece of a group already in the chunk.
+        pieces.sort(key=lambda piece: (-len(piece[1]), piece[0]))
+        chunk = set()
+        groups = set()
+        for group, addresses in pieces:
+            if (group in groups or
+                    0 < self._max_recipients < len(chunk) + len(addresses)):
+                yield chunk
+                chunk = set()
+                groups = set()
+            chunk.update(addresses)
+            groups.add(group)
+        if len(chunk) > 0:
+            yield chunk
@@ -19,14 +19,22 @@
 
 __all__ = [
     'Connection',
+    'ConnectionPool',
+    'handle_ConfigurationUpdatedEvent',
     ]
 
 
+import time
+import socket
 import logging
 import smtplib
+import threading
 
-from lazr.config import as_boolean
+from contextlib import contextmanager
+from lazr.config import as_boolean, as_timedelta
 from mailman.config import config
+from mailman.core.metrics import metrics
+from mailman.interfaces.configuration import ConfigurationUpdatedEvent
 
 
 log = logging.getLogger('mailman.smtp')
@@ -67,10 +75,11 @@ class Connection:
         """Open a new connection."""
         self._connection = smtplib.SMTP()
         log.debug('Connecting to %s:%s', self._host, self._port)
-        self._connection.connect(self._host, self._port)
-        if self._username is not None and self._password is not None:
-            log.debug('Logging in')
-            self._connection.login(self._username, self._password)
+        with metrics.timer('mailman_smtp_connect_seconds'):
+            self._connection.connect(self._host, self._port)
+            if self._username is not None and self._password is not None:
+                log.debug('Logging in')
+                self._connection.login(self._username, self._password)
         self._session_count = self._sessions_per_connection
 
     def sendmail(self, envsender, recipients, msgtext):
@@ -84,8 +93,11 @@ class Connection:
         try:
             log.debug('envsender: %s, recipients: %s, size(msgtext): %s',
                       envsender, recipients, len(msgtext))
-            results = self._connection.sendmail(envsender, recipients, msgtext)
+            with metrics.timer('mailman_smtp_transaction_seconds'):
+                results = self._connection.sendmail(
+                    envsender, recipients, msgtext)
         except smtplib.SMTPException:
+            metrics.increment('mailman_smtp_errors_total')
             # For safety, close this connection.  The next send attempt will
             # automatically re-open it.  Pass the exception on up.
             self.quit()
@@ -99,12 +111,159 @@ class Connection:
             self.quit()
         return results
 
+    def check(self):
+        """Check that an open connection is still usable.
+
+        The server is sent a NOOP.  If it doesn't answer, the connection is
+        closed, and the next send attempt will open a new one.
+
+        :return: Whether the connection was usable.  A connection which isn't
+            open at all counts as usable, since it is opened on demand.
+        :rtype: bool
+        """
+        if self._connection is None:
+            return True
+        try:
+            code, response = self._connection.noop()
+        except (socket.error, smtplib.SMTPException):
+            code = None
+        if code == 250:
+            return True
+        log.debug('Dropping stale connection to %s:%s',
+                  self._host, self._port)
+        self._connection.close()
+        self._connection = None
+        return False
+
     def quit(self):
         """Mimic `smtplib.SMTP.quit`."""
         if self._connection is None:
             return
         try:
             self._connection.quit()
-        except smtplib.SMTPException:
+        except (socket.error, smtplib.SMTPException):
             pass
         self._connection = None
+
+
+
+class ConnectionPool:
+    """Share connections to SMTP servers between delivery threads.
+
+    Each thread checks a connection out of the pool for as long as it needs
+    it, so no two threads ever talk over the same connection.  When it is
+    handed back, the connection stays open for the next thread to reuse.
+    """
+    def __init__(self, sessions_per_connection, smtp_user=None,
+                 smtp_pass=None, max_connections=1,
+                 max_connections_per_host=0, keepalive=0):
+        """Create a connection pool.
+
+        :param sessions_per_connection: See `Connection`.
+        :type sessions_per_connection: integer
+        :param smtp_user: See `Connection`.
+        :type smtp_user: str
+        :param smtp_pass: See `Connection`.
+        :type smtp_pass: str
+        :param max_connections: The maximum number of connections checked
+            out at the same time, to all hosts together.
+        :type max_connections: integer
+        :param max_connections_per_host: The maximum number of connections
+            checked out at the same time to any one host and port.  Zero
+            means that only `max_connections` applies.
+        :type max_connections_per_host: integer
+        :param keepalive: How many seconds an idle connection is kept open
+            for reuse.  Connections idle for longer are closed before they
+            are handed out again.  Zero means they are closed as soon as they
+            are handed back.
+        :type keepalive: float
+        """
+        self._sessions_per_connection = sessions_per_connection
+        self._username = smtp_user
+        self._password = smtp_pass
+        self._max_connections = max(max_connections, 1)
+        self._max_connections_per_host = max_connections_per_host
+        self._keepalive = keepalive
+        self._lock = threading.Condition()
+        # (host, port) -> list of (connection, time it was handed back)
+        self._idle = {}
+        # (host, port) -> number of connections checked out
+        self._busy = {}
+
+    def _available(self, key):
+        if sum(self._busy.values()) >= self._max_connections:
+            return False
+        return (self._max_connections_per_host <= 0 or
+                self._busy.get(key, 0) < self._max_connections_per_host)
+
+    @contextmanager
+    def connection(self, host, port):
+        """Check a connection out of the pool.
+
+        This blocks while all the connections the limits allow are checked
+        out.  Idle connections are checked for health before they are reused.
+
+        :param host: The host name of the SMTP server.
+        :type host: string
+        :param port: The port number of the SMTP server.
+        :type port: integer
+        :return: A context manager giving a `Connection`, which is handed
+            back to the pool when the context exits.
+        """
+        key = (host, port)
+        with self._lock:
+            while not self._available(key):
+                self._lock.wait()
+            self._busy[key] = self._busy.get(key, 0) + 1
+            idle = self._idle.get(key)
+            connection, since = (idle.pop() if idle else (None, None))
+        try:
+            if connection is None:
+                connection = Connection(
+                    host, port, self._sessions_per_connection,
+                    self._username, self._password)
+            elif time.monotonic() - since > self._keepalive:
+                # The server may well have given up on this connection.
+                connection.quit()
+            else:
+                connection.check()
+            yield connection
+        finally:
+            if connection is not None and self._keepalive <= 0:
+                connection.quit()
+                connection = None
+            with self._lock:
+                self._busy[key] -= 1
+                if connection is not None:
+                    self._idle.setdefault(key, []).append(
+                        (connection, time.monotonic()))
+                # The waiters may be waiting for different hosts, so wake
+                # them all, or the one woken may not be able to proceed
+                # while one that could stays asleep.
+                self._lock.notify_all()
+
+    def close(self):
+        """Close all the idle connections in the pool."""
+        with self._lock:
+            idle = [connection
+                    for connections in self._idle.values()
+                    for connection, since in connections]
+            self._idle.clear()
+        for connection in idle:
+            connection.quit()
+
+
+
+def handle_ConfigurationUpdatedEvent(event):
+    if isinstance(event, ConfigurationUpdatedEvent):
+        # Open connections may use the old settings, so start a new pool.
+        mta = event.config.mta
+        if event.config.connection_pool is not None:
+            event.config.connection_pool.close()
+        event.config.connection_pool = ConnectionPool(
+            int(mta.max_sessions_per_connection),
+            (mta.smtp_user if mta.smtp_user else None),
+            (mta.smtp_pass if mta.smtp_pass else None),
+            int(mta.max_delivery_threads),
+            int(mta.max_connections_per_host),
+            as_timedelta(mta.connection_keepalive).total_seconds())
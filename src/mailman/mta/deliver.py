@@ -26,13 +26,15 @@ import time
 import logging
 
 from mailman.config import config
+from mailman.core.metrics import metrics
 from mailman.interfaces.mailinglist import Personalization
 from mailman.interfaces.mta import SomeRecipientsFailed
 from mailman.mta.decorating import DecoratingMixin
 from mailman.mta.personalized import PersonalizedMixin
 from mailman.mta.verp import VERPMixin
 from mailman.mta.base import IndividualDelivery
-from mailman.mta.bulk import BulkDelivery
+from mailman.mta.bulk import (
+    BulkDelivery, DomainBulkDelivery, read_mx_groups)
 from mailman.utilities.string import expand
 
 
@@ -77,8 +79,18 @@ def deliver(mlist, msg, msgdata):
         agent = Deliver()
     elif mlist.personalize != Personalization.none:
         agent = Deliver()
-    else:
+    elif config.mta.bulk_chunking == 'domain':
+        mx_groups_file = config.mta.mx_groups_file.strip()
+        agent = DomainBulkDelivery(
+            int(config.mta.max_recipients),
+            int(config.mta.max_recipients_per_domain),
+            (read_mx_groups(expand(mx_groups_file, config.paths))
+             if mx_groups_file else None))
+    elif config.mta.bulk_chunking == 'tld':
         agent = BulkDelivery(int(config.mta.max_recipients))
+    else:
+        raise ValueError('Bad [mta]bulk_chunking: {0} (expected tld or '
+                         'domain)'.format(config.mta.bulk_chunking))
     log.debug('Using agent: %s', agent)
     # Keep track of the original recipients and the original sender for
     # logging purposes.
@@ -89,6 +101,10 @@ def deliver(mlist, msg, msgdata):
     t0 = time.time()
     refused = agent.deliver(mlist, msg, msgdata)
     t1 = time.time()
+    metrics.observe('mailman_delivery_seconds', t1 - t0)
+    metrics.increment('mailman_delivery_recipients_total',
+                      len(original_recipients))
+    metrics.increment('mailman_delivery_refused_total', len(refused))
     # Log this posting.
     size = getattr(msg, 'original_size', msgdata.get('original_size'))
     if size is None:
@@ -51,8 +51,11 @@ class PersonalizedMixin:
         if mlist.personalize != Personalization.full:
             return
         recipient = msgdata['recipient']
-        user_manager = getUtility(IUserManager)
-        user = user_manager.get_user(recipient)
+        member = msgdata.get('member')
+        if member is None:
+            user = getUtility(IUserManager).get_user(recipient)
+        else:
+            user = member.user
         if user is None:
             msg.replace_header('To', recipient)
         else:
@@ -0,0 +1,196 @@
+# Copyright (C) 2015 by the Free Software Foundation, Inc.
+#
+# This file is part of GNU Mailman.
+#
+# GNU Mailman is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# GNU Mailman is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Render personalized messages once for all their recipients.
+
+Individual delivery used to copy, decorate and flatten the message for every
+single recipient.  Instead, the message can be rendered once for a stand-in
+recipient whose details are all placeholders.  The placeholders are then
+found in the message text, which leaves a template that each recipient's
+details are spliced into.
+
+This only works when the recipient's details end up in the message text as
+they are.  To make sure of that, the message is rendered a second time with
+placeholders of another length, and the template must give the same text
+when these are spliced into it.  This catches, for example, footers which
+are base64 encoded.  Only recipients whose details consist of characters
+that are never quoted or encoded get their message from the template; all
+others are rendered the slow way, as is the message when there is no usable
+template at all.
+"""
+
+__all__ = [
+    'MessageTemplate',
+    'RenderedMessage',
+    'SLOTS',
+    'slot_values',
+    'stand_in_member',
+    ]
+
+
+import re
+
+from mailman.core.queuefile import GeneratedMessage
+from types import SimpleNamespace
+
+
+# The recipient details which can be spliced into a template, and the values
+# which may be spliced.  None of them are quoted by `formataddr()` or encoded
+# by the quoted-printable content transfer encoding.
+_ADDRESS = r"[-A-Za-z0-9!#$%&'*+/?^_`{|}~.@]+"
+SLOTS = dict(
+    address=_ADDRESS,
+    delivered_to=_ADDRESS,
+    display_name=r"[-A-Za-z0-9'_]+(?: [-A-Za-z0-9'_]+)*",
+    language=r"[-A-Za-z0-9'_]+(?: [-A-Za-z0-9'_()]+)*",
+    options_url=r"[-A-Za-z0-9!#$%&'*+/?^_`{|}~.@:;,]+",
+    )
+_SLOT_NAMES = sorted(SLOTS)
+_SLOT_PATTERNS = {name: re.compile(pattern + r'\Z')
+                  for name, pattern in SLOTS.items()}
+
+# The placeholders.  The short ones are what the template is cut from, and
+# the long ones are used to check it.  Recipient details must be no shorter
+# than the one and no longer than the other.  Display names are kept short
+# enough that `email.header.Header` never folds them.
+_SHORT = {name: '`' + chr(ord('A') + i) for i, name in enumerate(_SLOT_NAMES)}
+_LONG = {name: _SHORT[name].ljust(64 if name == 'display_name' else 128, 'x')
+         for name in _SLOT_NAMES}
+_PLACEHOLDERS = re.compile('|'.join(_SHORT.values()))
+_SLOT_BY_PLACEHOLDER = {value: name for name, value in _SHORT.items()}
+
+
+
+def stand_in_member(values):
+    """Return an object standing in for a member while rendering templates.
+
+    It has those attributes of an `IMember` which decoration and
+    personalization use.  Anything else raises an AttributeError, in which
+    case no template can be made.
+
+    :param values: The value of each slot.
+    :type values: dict
+    :return: The stand-in member.
+    """
+    user = SimpleNamespace(display_name=values['display_name'])
+    address = SimpleNamespace(
+        email=values['delivered_to'],
+        original_email=values['delivered_to'],
+        user=user)
+    return SimpleNamespace(
+        address=address,
+        user=user,
+        preferred_language=SimpleNamespace(description=values['language']),
+        options_url=values['options_url'])
+
+
+def slot_values(recipient, member):
+    """Return the recipient's details to splice into a template.
+
+    :param recipient: The recipient's email address.
+    :type recipient: string
+    :param member: The recipient's membership.
+    :type member: `IMember`
+    :return: The value of each slot, or None if the recipient's message can't
+        be made from a template.
+    :rtype: dict
+    """
+    address = (None if member is None else member.address)
+    if address is None:
+        return None
+    # This is the member's user, without the query that `IMember.user` needs
+    # for members subscribed with an explicit address.
+    user = address.user
+    values = dict(
+        address=recipient,
+        delivered_to=address.original_email,
+        display_name=('' if user is None else user.display_name) or '',
+        language=member.preferred_language.description,
+        options_url=member.options_url,
+        )
+    for name, value in values.items():
+        if name == 'display_name' and value == '':
+            # Nameless users have templates of their own.
+            continue
+        if not (len(_SHORT[name]) <= len(value) <= len(_LONG[name]) and
+                _SLOT_PATTERNS[name].match(value)):
+            return None
+    return values
+
+
+
+class MessageTemplate:
+    """A message rendered once, with slots for each recipient's details."""
+
+    def __init__(self, render, named=True):
+        """Render a message template.
+
+        :param render: Render the message for a stand-in recipient.  This is
+            called with the value of each slot, and returns the text of the
+            message.
+        :type render: callable
+        :param named: Whether the stand-in recipient has a display name.
+        :type named: bool
+        :raise ValueError: if no template can be made.
+        """
+        def placeholders(values):
+            values = dict(values)
+            if not named:
+                values['display_name'] = ''
+            return values
+        text = render(placeholders(_SHORT))
+        try:
+            text.encode('ascii')
+        except UnicodeError:
+            raise ValueError('Not an ASCII message')
+        # Cut the text at each placeholder.  The even numbered chunks are
+        # literal text, and the odd numbered ones are slot names.
+        self._chunks = []
+        start = 0
+        for match in _PLACEHOLDERS.finditer(text):
+            self._chunks.append(text[start:match.start()])
+            self._chunks.append(_SLOT_BY_PLACEHOLDER[match.group()])
+            start = match.end()
+        self._chunks.append(text[start:])
+        long_values = placeholders(_LONG)
+        if self.render(long_values) != render(long_values):
+            raise ValueError('Recipient details are not spliced verbatim')
+
+    def render(self, values):
+        """Return the message text for one recipient.
+
+        :param values: The value of each slot, as returned by `slot_values()`.
+        :type values: dict
+        :return: The message text.
+        :rtype: str
+        """
+        chunks = list(self._chunks)
+        for i in range(1, len(chunks), 2):
+            chunks[i] = values[chunks[i]]
+        return ''.join(chunks)
+
+
+
+class RenderedMessage(GeneratedMessage):
+    """A recipient's message, rendered from a template.
+
+    The message is only parsed if something looks inside it.  As long as
+    nothing changes its body, its text is the rendered text.
+    """
+
+    def __init__(self, text):
+        super(RenderedMessage, self).__init__(text.encode('ascii'))
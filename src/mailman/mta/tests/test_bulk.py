@@ -0,0 +1,212 @@
+# Copyright (C) 2015 by the Free Software Foundation, Inc.
+#
+# This file is part of GNU Mailman.
+#
+# GNU Mailman is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# GNU Mailman is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test domain aware bulk delivery."""
+
+__all__ = [
+    'TestDomainBulkDelivery',
+    'TestDomainChunking',
+    'TestMXGroups',
+    ]
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from mailman.app.lifecycle import create_list
+from mailman.mta.bulk import DomainBulkDelivery, read_mx_groups
+from mailman.mta.deliver import deliver
+from mailman.testing.helpers import (
+    LogFileMark, configuration, specialized_message_from_string as mfs)
+from mailman.testing.layers import ConfigLayer, SMTPLayer
+
+
+
+def _domains(chunk):
+    return sorted(set(address.partition('@')[2] for address in chunk))
+
+
+
+class TestDomainChunking(unittest.TestCase):
+    layer = ConfigLayer
+
+    def setUp(self):
+        self._recipients = (
+            ['person_{0}@example.com'.format(i) for i in range(5)] +
+            ['person_{0}@example.org'.format(i) for i in range(3)] +
+            ['anne@example.net', 'bart@example.us', 'cris@example.ca'])
+
+    def test_no_limits(self):
+        # Without any limits, all the recipients are in one chunk.
+        chunks = list(DomainBulkDelivery().chunkify(self._recipients))
+        self.assertEqual(chunks, [set(self._recipients)])
+
+    def test_domains_are_kept_together(self):
+        # Recipients in the same domain are in the same chunk, and the
+        # smaller domains share the remaining chunks.
+        agent = DomainBulkDelivery(5)
+        chunks = list(agent.chunkify(self._recipients))
+        self.assertEqual([_domains(chunk) for chunk in chunks], [
+            ['example.com'],
+            ['example.ca', 'example.net', 'example.org'],
+            ['example.us'],
+            ])
+        self.assertEqual(set().union(*chunks), set(self._recipients))
+
+    def test_max_recipients(self):
+        # A domain too big for one chunk is split over as few as possible.
+        agent = DomainBulkDelivery(2)
+        chunks = list(agent.chunkify(self._recipients))
+        self.assertTrue(all(0 < len(chunk) <= 2 for chunk in chunks))
+        self.assertEqual(
+            len([chunk for chunk in chunks
+                 if 'example.com' in _domains(chunk)]), 3)
+        self.assertEqual(set().union(*chunks), set(self._recipients))
+
+    def test_max_per_domain(self):
+        # No chunk has more than the given number of recipients in the same
+        # domain, but domains can still share chunks.
+        agent = DomainBulkDelivery(0, 2)
+        chunks = list(agent.chunkify(self._recipients))
+        self.assertEqual(len(chunks), 3)
+        for chunk in chunks:
+            domains = [address.partition('@')[2] for address in chunk]
+            self.assertTrue(all(domains.count(domain) <= 2
+                                for domain in domains))
+        self.assertEqual(set().union(*chunks), set(self._recipients))
+
+    def test_mx_groups(self):
+        # Domains sharing a mail exchanger are grouped like one domain.
+        mx_groups = {'example.org': 'mx.example.com',
+                     'example.com': 'mx.example.com'}
+        agent = DomainBulkDelivery(0, 6, mx_groups)
+        chunks = list(agent.chunkify(self._recipients))
+        self.assertEqual(len(chunks), 2)
+        for chunk in chunks:
+            self.assertLessEqual(
+                len([address for address in chunk
+                     if address.endswith(('.com', '.org'))]), 6)
+
+    def test_domains_ignore_case(self):
+        agent = DomainBulkDelivery(1, 1)
+        chunks = list(agent.chunkify(['anne@EXAMPLE.com',
+                                      'bart@example.com']))
+        self.assertEqual(len(chunks), 2)
+
+
+
+class TestMXGroups(unittest.TestCase):
+    layer = ConfigLayer
+
+    def setUp(self):
+        self._tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self._tempdir)
+        self._path = os.path.join(self._tempdir, 'mx_groups')
+        with open(self._path, 'w') as fp:
+            print("""\
+# Comments and blank lines are ignored.
+
+mx.example.com  example.com Example.ORG
+mx.example.net  example.net""", file=fp)
+
+    def test_read(self):
+        self.assertEqual(read_mx_groups(self._path), {
+            'example.com': 'mx.example.com',
+            'example.org': 'mx.example.com',
+            'example.net': 'mx.example.net',
+            })
+
+    def test_reread_when_changed(self):
+        read_mx_groups(self._path)
+        with open(self._path, 'a') as fp:
+            print('mx.example.us example.us', file=fp)
+        # Make sure the modification time changes.
+        os.utime(self._path, (0, 0))
+        self.assertEqual(read_mx_groups(self._path)['example.us'],
+                         'mx.example.us')
+
+    def test_missing_file(self):
+        # A file which can't be read has no groups, and is logged once.
+        os.remove(self._path)
+        mark = LogFileMark('mailman.error')
+        self.assertEqual(read_mx_groups(self._path), {})
+        self.assertEqual(read_mx_groups(self._path), {})
+        log = mark.read()
+        self.assertEqual(log.count('Cannot read the MX groups file'), 1)
+        self.assertIn(self._path, log)
+
+
+
+class TestDomainBulkDelivery(unittest.TestCase):
+    layer = SMTPLayer
+
+    def test_deliver(self):
+        # Domain chunking is selected in the configuration.
+        mlist = create_list('test@example.com')
+        msg = mfs("""\
+From: anne@example.org
+To: test@example.com
+Subject: test
+Message-ID: <ant>
+
+""")
+        recipients = set(['anne@example.com', 'bart@example.com',
+                          'cris@example.org'])
+        with configuration('mta', bulk_chunking='domain',
+                           max_recipients=2):
+            deliver(mlist, msg, dict(recipients=recipients))
+        delivered = sorted(
+            sorted(address.strip()
+                   for address in message['x-rcptto'].split(','))
+            for message in SMTPLayer.smtpd.messages)
+        self.assertEqual(delivered, [
+            ['anne@example.com', 'bart@example.com'],
+            ['cris@example.org'],
+            ])
+
+    def test_missing_mx_groups_file(self):
+        # The message is delivered without MX groups when their file can't be
+        # read.
+        mlist = create_list('test@example.com')
+        msg = mfs("""\
+From: anne@example.org
+To: test@example.com
+Subject: test
+Message-ID: <ant>
+
+""")
+        with configuration('mta', bulk_chunking='domain',
+                           mx_groups_file='/does/not/exist'):
+            deliver(mlist, msg, dict(recipients=set(['anne@example.com'])))
+        self.assertEqual(len(SMTPLayer.smtpd.messages), 1)
+
+    def test_bad_chunking(self):
+        # An unknown way of chunking is rejected.
+        mlist = create_list('test@example.com')
+        msg = mfs("""\
+From: anne@example.org
+To: test@example.com
+Subject: test
+Message-ID: <ant>
+
+""")
+        with configuration('mta', bulk_chunking='domains'):
+            with self.assertRaises(ValueError) as cm:
+                deliver(mlist, msg, dict(recipients=set(['anne@example.com'])))
+        self.assertIn('bulk_chunking: domains', str(cm.exception))
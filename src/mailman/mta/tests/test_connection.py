@@ -19,17 +19,27 @@
 
 __all__ = [
     'TestConnection',
+    'TestConnectionPool',
     ]
 
 
 import unittest
+import threading
 
 from mailman.config import config
-from mailman.mta.connection import Connection
+from mailman.mta.connection import Connection, ConnectionPool
 from mailman.testing.layers import SMTPLayer
 from smtplib import SMTPAuthenticationError
 
 
+MESSAGE = """\
+From: anne@example.com
+To: bart@example.com
+Subject: aardvarks
+
+"""
+
+
 
 class TestConnection(unittest.TestCase):
     layer = SMTPLayer
@@ -49,3 +59,60 @@ Subject: aardvarks
 """)
         self.assertEqual(cm.exception.smtp_code, 571)
         self.assertEqual(cm.exception.smtp_error, b'Bad authentication')
+
+
+
+class TestConnectionPool(unittest.TestCase):
+    layer = SMTPLayer
+
+    def setUp(self):
+        self._host = config.mta.smtp_host
+        self._port = int(config.mta.smtp_port)
+
+    def _send(self, pool):
+        with pool.connection(self._host, self._port) as connection:
+            connection.sendmail(
+                'anne@example.com', ['bart@example.com'], MESSAGE)
+        return connection
+
+    def test_reuse(self):
+        # An idle connection is handed out again.
+        pool = ConnectionPool(0, keepalive=60)
+        self.addCleanup(pool.close)
+        first = self._send(pool)
+        second = self._send(pool)
+        self.assertIs(first, second)
+        self.assertEqual(SMTPLayer.smtpd.get_connection_count(), 1)
+        self.assertEqual(len(list(SMTPLayer.smtpd.messages)), 2)
+
+    def test_no_keepalive(self):
+        # Without a keepalive, every delivery opens its own connection.
+        pool = ConnectionPool(0)
+        self._send(pool)
+        self._send(pool)
+        self.assertEqual(SMTPLayer.smtpd.get_connection_count(), 2)
+
+    def test_stale_connection(self):
+        # A connection which the server has dropped is replaced.
+        pool = ConnectionPool(0, keepalive=60)
+        self.addCleanup(pool.close)
+        connection = self._send(pool)
+        connection._connection.close()
+        self._send(pool)
+        self.assertEqual(SMTPLayer.smtpd.get_connection_count(), 2)
+        self.assertEqual(len(list(SMTPLayer.smtpd.messages)), 2)
+
+    def test_per_host_limit(self):
+        # Only as many connections to one host are checked out as allowed.
+        pool = ConnectionPool(0, max_connections=4,
+                              max_connections_per_host=1)
+        checked_out = threading.Event()
+        def check_out():
+            with pool.connection(self._host, self._port):
+                checked_out.set()
+        thread = threading.Thread(target=check_out)
+        with pool.connection(self._host, self._port):
+            thread.start()
+            self.assertFalse(checked_out.wait(0.1))
+        self.assertTrue(checked_out.wait(10))
+        thread.join()
@@ -18,6 +18,7 @@
 """Test various aspects of email delivery."""
 
 __all__ = [
+    'TestDeliveryThreads',
     'TestIndividualDelivery',
     ]
 
@@ -30,10 +31,14 @@ import unittest
 from mailman.app.lifecycle import create_list
 from mailman.config import config
 from mailman.interfaces.mailinglist import Personalization
+from mailman.interfaces.usermanager import IUserManager
+from mailman.mta.bulk import BulkDelivery
 from mailman.mta.deliver import Deliver
+from mailman.mta.rendering import RenderedMessage
 from mailman.testing.helpers import (
     specialized_message_from_string as mfs, subscribe)
-from mailman.testing.layers import ConfigLayer
+from mailman.testing.layers import ConfigLayer, SMTPLayer
+from zope.component import getUtility
 
 
 
@@ -51,6 +56,13 @@ class DeliverTester(Deliver):
         return []
 
 
+# This one renders every recipient's message the slow way, by running all the
+# callbacks on a copy of the message.
+class SlowDeliverTester(DeliverTester):
+    def _make_template(self, *args):
+        return None
+
+
 
 class TestIndividualDelivery(unittest.TestCase):
     """Test personalized delivery details."""
@@ -132,3 +144,98 @@ name     : Anne Person
 options  : http://example.com/anne@example.org
 
 """)
+
+    def test_rendered_from_template(self):
+        # Anne's message is spliced from the template.
+        msgdata = dict(recipients=['anne@example.org'])
+        DeliverTester().deliver(self._mlist, self._msg, msgdata)
+        _mlist, _msg, _msgdata, _recipients = _deliveries[0]
+        self.assertIsInstance(_msg, RenderedMessage)
+        self.assertEqual(_msg['to'], 'test@example.com')
+
+    def test_same_as_slow_rendering(self):
+        # Whether or not a recipient's message comes from a template, it is
+        # the same as if all the callbacks had been run on it.
+        self._mlist.personalize = Personalization.full
+        user_manager = getUtility(IUserManager)
+        subscribe(self._mlist, 'Bart', email='bart@example.org')
+        user_manager.get_user('bart@example.org').display_name = ''
+        subscribe(self._mlist, 'Dave', email='dave@example.org')
+        user_manager.get_user(
+            'dave@example.org').display_name = 'Dave Q. Person'
+        recipients = ['anne@example.org', 'bart@example.org',
+                      'dave@example.org', 'zed@example.org']
+        msgdata = dict(recipients=recipients,
+                       verp=True,
+                       **{'add-dup-header': {'bart@example.org': True}})
+        SlowDeliverTester().deliver(self._mlist, self._msg, msgdata)
+        expected = [(msgdata['recipient'], msg.as_string())
+                    for mlist, msg, msgdata, recipients in _deliveries]
+        del _deliveries[:]
+        DeliverTester().deliver(self._mlist, self._msg, msgdata)
+        rendered = [(msgdata['recipient'], msg.as_string())
+                    for mlist, msg, msgdata, recipients in _deliveries]
+        self.assertEqual(rendered, expected)
+        templated = [msgdata['recipient']
+                     for mlist, msg, msgdata, recipients in _deliveries
+                     if isinstance(msg, RenderedMessage)]
+        # Dave's display name would be quoted in the To header, and Zed is
+        # not a member.
+        self.assertEqual(templated, recipients[:2])
+
+
+
+class TestDeliveryThreads(unittest.TestCase):
+    """Test delivery over several connections at once."""
+
+    layer = SMTPLayer
+
+    def setUp(self):
+        config.push('threads', """
+        [mta]
+        max_delivery_threads: 4
+        connection_keepalive: 1m
+        """)
+        self.addCleanup(config.pop, 'threads')
+        self._mlist = create_list('test@example.com')
+        self._msg = mfs("""\
+From: anne@example.org
+To: test@example.com
+Subject: test
+Message-ID: <ant>
+
+""")
+        self._recipients = ['person_{0}@example.org'.format(i)
+                            for i in range(10)]
+
+    def test_bulk_chunks(self):
+        # Every chunk is delivered, over no more connections than threads.
+        agent = BulkDelivery(1)
+        msgdata = dict(recipients=self._recipients)
+        refused = agent.deliver(self._mlist, self._msg, msgdata)
+        self.assertEqual(refused, {})
+        delivered = sorted(message['x-rcptto']
+                           for message in SMTPLayer.smtpd.messages)
+        self.assertEqual(delivered, sorted(self._recipients))
+        self.assertLessEqual(SMTPLayer.smtpd.get_connection_count(), 4)
+
+    def test_bulk_refused(self):
+        # The failures of all the chunks are merged.
+        SMTPLayer.smtpd.err_queue.put(('rcpt', 500))
+        SMTPLayer.smtpd.err_queue.put(('mail', 450))
+        agent = BulkDelivery(1)
+        msgdata = dict(recipients=self._recipients)
+        refused = agent.deliver(self._mlist, self._msg, msgdata)
+        self.assertEqual(sorted(code for code, error in refused.values()),
+                         [450, 500])
+        self.assertEqual(len(list(SMTPLayer.smtpd.messages)), 8)
+
+    def test_individual(self):
+        # Each recipient gets their own copy.
+        agent = Deliver()
+        msgdata = dict(recipients=self._recipients)
+        refused = agent.deliver(self._mlist, self._msg, msgdata)
+        self.assertEqual(refused, {})
+        delivered = sorted(message['x-rcptto']
+                           for message in SMTPLayer.smtpd.messages)
+        self.assertEqual(delivered, sorted(self._recipients))
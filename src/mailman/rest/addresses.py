@@ -28,7 +28,7 @@ from mailman.interfaces.address import (
     ExistingAddressError, InvalidEmailAddressError)
 from mailman.interfaces.usermanager import IUserManager
 from mailman.rest.helpers import (
-    BadRequest, CollectionMixin, NotFound, bad_request, child, created, etag,
+    BadRequest, CollectionMixin, NotFound, bad_request, child, created,
     no_content, not_found, okay, path_to)
 from mailman.rest.members import MemberCollection
 from mailman.rest.preferences import Preferences
@@ -65,7 +65,7 @@ class _AddressBase(CollectionMixin):
 
     def _get_collection(self, request):
         """See `CollectionMixin`."""
-        return list(getUtility(IUserManager).addresses)
+        return getUtility(IUserManager).addresses
 
 
 
@@ -74,8 +74,7 @@ class AllAddresses(_AddressBase):
 
     def on_get(self, request, response):
         """/addresses"""
-        resource = self._make_collection(request)
-        okay(response, etag(resource))
+        self._okay_collection(request, response)
 
 
 
@@ -190,7 +189,7 @@ class UserAddresses(_AddressBase):
         if self._user is None:
             not_found(response)
         else:
-            okay(response, etag(self._make_collection(request)))
+            self._okay_collection(request, response)
 
     def on_post(self, request, response):
         """POST to /addresses
@@ -214,7 +213,7 @@ class UserAddresses(_AddressBase):
             bad_request(response, b'Address already exists')
         else:
             # Link the address to the current user and return it.
-            address.user = self._user
+            self._user.link(address)
             created(response, path_to('addresses/{0}'.format(address.email)))
 
 
@@ -26,7 +26,7 @@ __all__ = [
 from mailman.interfaces.domain import (
     BadDomainSpecificationError, IDomainManager)
 from mailman.rest.helpers import (
-    BadRequest, CollectionMixin, NotFound, bad_request, child, created, etag,
+    BadRequest, CollectionMixin, NotFound, bad_request, child, created,
     no_content, not_found, okay, path_to)
 from mailman.rest.lists import ListsForDomain
 from mailman.rest.users import OwnersForDomain
@@ -129,5 +129,4 @@ class AllDomains(_DomainBase):
 
     def on_get(self, request, response):
         """/domains"""
-        resource = self._make_collection(request)
-        okay(response, etag(resource))
+        self._okay_collection(request, response)
@@ -30,6 +30,7 @@ __all__ = [
     'forbidden',
     'no_content',
     'not_found',
+    'not_modified',
     'okay',
     'path_to',
     ]
@@ -43,7 +44,13 @@ from datetime import datetime, timedelta
 from enum import Enum
 from lazr.config import as_boolean
 from mailman.config import config
-from pprint import pformat
+from mailman.utilities.queries import QuerySequence
+
+
+# Whole collections from the database with more resources than this are
+# streamed, in chunks of about this many characters.
+STREAM_SIZE = 100
+STREAM_CHUNK = 64 * 1024
 
 
 
@@ -91,10 +98,10 @@ def etag(resource):
 
     The input is a dictionary representing the resource.  This
     dictionary must not contain an `http_etag` key.  This function
-    calculates the etag by using the sha1 hexdigest of the
-    pretty-printed (and thus key-sorted and predictable) representation
-    of the dictionary.  It then inserts this value under the `http_etag`
-    key, and returns the JSON representation of the modified dictionary.
+    calculates the etag by using the sha1 hexdigest of the key-sorted (and
+    thus predictable) JSON representation of the dictionary.  It then
+    inserts this value under the `http_etag` key, and returns the JSON
+    representation of the modified dictionary.
 
     :param resource: The original resource representation.
     :type resource: dictionary
@@ -102,39 +109,37 @@ def etag(resource):
     :rtype string
     """
     assert 'http_etag' not in resource, 'Resource already etagged'
-    # Calculate the tag from a predictable (i.e. sorted) representation of the
-    # dictionary.  The actual details aren't so important.  pformat() is
-    # guaranteed to sort the keys, however it returns a str and the hash
-    # library requires a bytes.  Use the safest possible encoding.
-    hashfood = pformat(resource).encode('raw-unicode-escape')
-    etag = hashlib.sha1(hashfood).hexdigest()
-    resource['http_etag'] = '"{0}"'.format(etag)
-    return json.dumps(resource, cls=ExtendedEncoder)
-
-
-def paginate(method):
-    """Method decorator to paginate through collection result lists.
-
-    Use this to return only a slice of a collection, specified in the request
-    itself.  The request should use query parameters `count` and `page` to
-    specify the slice they want.  The slice will start at index
-    ``(page - 1) * count`` and end (exclusive) at ``(page * count)``.
-
-    Decorated methods must take ``self`` and ``request`` as the first two
-    arguments.
-    """
-    def wrapper(self, request, *args, **kwargs):
-        # Allow falcon's HTTPBadRequest exceptions to percolate up.  They'll
-        # get turned into HTTP 400 errors.
-        count = request.get_param_as_int('count', min=0)
-        page = request.get_param_as_int('page', min=1)
-        result = method(self, request, *args, **kwargs)
-        if count is None and page is None:
-            return result
-        list_start = (page - 1) * count
-        list_end = page * count
-        return result[list_start:list_end]
-    return wrapper
+    # The dictionary is encoded only once.  The etag is spliced into the
+    # JSON text it was calculated from, since the order of the keys of a JSON
+    # object doesn't matter.
+    text = json.dumps(resource, cls=ExtendedEncoder, sort_keys=True)
+    resource['http_etag'] = _hash(text)
+    return _insert_etag(text, resource['http_etag'])
+
+
+def _hash(*texts):
+    # Return the quoted etag of some JSON texts.
+    hashfood = hashlib.sha1()
+    for text in texts:
+        hashfood.update(text.encode('utf-8'))
+    return '"{0}"'.format(hashfood.hexdigest())
+
+
+def _insert_etag(text, tag):
+    # Insert the etag into the JSON text of an object.
+    prefix = '{{"http_etag": {0}'.format(json.dumps(tag))
+    if text == '{}':
+        return prefix + '}'
+    return prefix + ', ' + text[1:]
+
+
+def _etag_matches(request, tag):
+    # Does the request's If-None-Match header match the etag?
+    header = request.get_header('If-None-Match')
+    if header is None:
+        return False
+    tags = [value.strip() for value in header.split(',')]
+    return '*' in tags or tag in tags or 'W/' + tag in tags
 
 
 
@@ -158,32 +163,139 @@ class CollectionMixin:
         return etag(self._resource_as_dict(resource))
 
     def _get_collection(self, request):
-        """Return the collection as a concrete list.
+        """Return the collection as a concrete sequence.
 
-        This must be implemented by subclasses.
+        This must be implemented by subclasses.  Big collections should be
+        returned as a `QuerySequence`, so that they are paginated by the
+        database.
 
         :param request: An http request.
         :return: The collection
-        :rtype: list
+        :rtype: sequence
         """
         raise NotImplementedError
 
-    def _make_collection(self, request):
-        """Provide the collection to the REST layer."""
-        collection = self._get_collection(request)
-        if len(collection) == 0:
-            return dict(start=0, total_size=0)
+    def _paginate(self, request, collection):
+        """Return the page of the collection asked for by the request.
+
+        The request should use query parameters `count` and `page` to specify
+        the page they want.  The page will start at index
+        ``(page - 1) * count`` and end (exclusive) at ``(page * count)``.
+        Without them, the page is the whole collection.
+
+        :param request: An http request.
+        :param collection: The collection.  Its length is asked for, and it is
+            sliced, only once, so a `QuerySequence` is paginated by the
+            database.
+        :type collection: sequence
+        :return: The index of the first resource in the page, the size of
+            the whole collection, and the page.
+        :rtype: 3-tuple of (int, int, sequence)
+        """
+        # Allow falcon's HTTPBadRequest exceptions to percolate up.  They'll
+        # get turned into HTTP 400 errors.
+        count = request.get_param_as_int('count', min=0)
+        page = request.get_param_as_int('page', min=1)
+        total_size = len(collection)
+        if count is None:
+            return 0, total_size, collection
+        if page is None:
+            page = 1
+        list_start = (page - 1) * count
+        list_end = page * count
+        return list_start, total_size, collection[list_start:list_end]
+
+    def _get_version(self, page):
+        """Return a cheap version of a page of the collection.
+
+        Subclasses can return a value which changes whenever any resource in
+        the page changes, and which is cheaper to get than the resources
+        themselves.  The page's etag is then calculated from it, so that a
+        conditional request for an unchanged page is answered without making
+        the resources.
+
+        :param page: The page of the collection.
+        :type page: sequence
+        :return: A JSON serializable version of the page, or None if there is
+            no cheap version.
+        """
+        return None
+
+    def _okay_collection(self, request, response, **extra):
+        """Respond with the collection, or the page of it asked for.
+
+        The response has an ETag header, and a request with a matching
+        If-None-Match header gets a 304 response without a body.
+
+        A whole collection from the database with more than `STREAM_SIZE`
+        resources is sent as a stream.  Its resources are fetched in batches
+        and JSON encoded one at a time, so they are never all in memory
+        together.  A streamed response has no Content-Length, so the
+        connection is closed after it, and unless the collection has a
+        cheap version, it has no ETag header.
+
+        :param request: An http request.
+        :param response: The http response.
+        :param extra: Additional items of the collection resource.
+        """
+        start, total_size, page = self._paginate(
+            request, self._get_collection(request))
+        head = json.dumps(dict(extra, start=start, total_size=total_size),
+                          cls=ExtendedEncoder, sort_keys=True)
+        version = self._get_version(page)
+        if version is None:
+            tag = None
+        else:
+            tag = _hash(head, json.dumps(version, cls=ExtendedEncoder))
+            if _etag_matches(request, tag):
+                not_modified(response, tag)
+                return
+        if isinstance(page, QuerySequence) and total_size > STREAM_SIZE:
+            response.status = falcon.HTTP_200
+            if tag is not None:
+                response.set_header('ETag', tag)
+            response.stream = self._stream(head, page, tag)
+            return
+        # Each resource is JSON encoded once, and the collection is put
+        # together from their JSON texts.
+        entries = [self._resource_as_json(resource) for resource in page]
+        if tag is None:
+            tag = _hash(head, *entries)
+            if _etag_matches(request, tag):
+                not_modified(response, tag)
+                return
+        if len(entries) == 0:
+            body = _insert_etag(head, tag)
         else:
-            entries = [self._resource_as_dict(resource)
-                       for resource in collection]
-            # Tag the resources but use the dictionaries.
-            [etag(resource) for resource in entries]
-            # Create the collection resource
-            return dict(
-                start=0,
-                total_size=len(collection),
-                entries=entries,
-                )
+            body = '{0}, "entries": [{1}], "http_etag": {2}}}'.format(
+                head[:-1], ', '.join(entries), json.dumps(tag))
+        okay(response, body)
+        response.set_header('ETag', tag)
+
+    def _stream(self, head, collection, tag):
+        # Encode the collection as `_okay_collection()` does, except that
+        # unless it is already known, the collection's etag is calculated
+        # while the resources are sent, and so comes last.
+        hashfood = hashlib.sha1(head.encode('utf-8'))
+        chunk = [head[:-1], ', "entries": [']
+        size = 0
+        for i, resource in enumerate(collection):
+            text = self._resource_as_json(resource)
+            hashfood.update(text.encode('utf-8'))
+            if i > 0:
+                chunk.append(', ')
+            chunk.append(text)
+            size += len(text)
+            if size >= STREAM_CHUNK:
+                yield ''.join(chunk).encode('utf-8')
+                chunk = []
+                size = 0
+        if tag is None:
+            tag = '"{0}"'.format(hashfood.hexdigest())
+        chunk.append('], "http_etag": ')
+        chunk.append(json.dumps(tag))
+        chunk.append('}')
+        yield ''.join(chunk).encode('utf-8')
 
 
 
@@ -294,6 +406,11 @@ def no_content(response):
     response.status = falcon.HTTP_204
 
 
+def not_modified(response, tag):
+    response.status = falcon.HTTP_304
+    response.set_header('ETag', tag)
+
+
 def not_found(response, body=b'404 Not Found'):
     response.status = falcon.HTTP_404
     if body is not None:
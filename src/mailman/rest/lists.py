@@ -40,12 +40,11 @@ from mailman.interfaces.subscriptions import ISubscriptionService
 from mailman.rest.listconf import ListConfiguration
 from mailman.rest.helpers import (
     CollectionMixin, GetterSetter, NotFound, bad_request, child, created,
-    etag, no_content, not_found, okay, paginate, path_to)
+    etag, no_content, not_found, okay, path_to)
 from mailman.rest.members import AMember, MemberCollection
 from mailman.rest.post_moderation import HeldMessages
 from mailman.rest.sub_moderation import SubscriptionRequests
 from mailman.rest.validator import Validator
-from operator import attrgetter
 from zope.component import getUtility
 
 
@@ -112,7 +111,6 @@ class _ListBase(CollectionMixin):
             self_link=path_to('lists/{0}'.format(mlist.list_id)),
             )
 
-    @paginate
     def _get_collection(self, request):
         """See `CollectionMixin`."""
         return list(getUtility(IListManager))
@@ -217,8 +215,7 @@ class AllLists(_ListBase):
 
     def on_get(self, request, response):
         """/lists"""
-        resource = self._make_collection(request)
-        okay(response, etag(resource))
+        self._okay_collection(request, response)
 
 
 
@@ -230,14 +227,13 @@ class MembersOfList(MemberCollection):
         self._mlist = mailing_list
         self._role = role
 
-    @paginate
     def _get_collection(self, request):
         """See `CollectionMixin`."""
         # Overrides _MemberBase._get_collection() because we only want to
-        # return the members from the requested roster.
-        roster = self._mlist.get_roster(self._role)
-        address_of_member = attrgetter('address.email')
-        return list(sorted(roster.members, key=address_of_member))
+        # return the members from the requested roster.  These are sorted by
+        # their email addresses.
+        return getUtility(ISubscriptionService).find_members(
+            list_id=self._mlist.list_id, role=self._role)
 
 
 class ListsForDomain(_ListBase):
@@ -248,10 +244,8 @@ class ListsForDomain(_ListBase):
 
     def on_get(self, request, response):
         """/domains/<domain>/lists"""
-        resource = self._make_collection(request)
-        okay(response, etag(resource))
+        self._okay_collection(request, response)
 
-    @paginate
     def _get_collection(self, request):
         """See `CollectionMixin`."""
         return list(self._domain.mailing_lists)
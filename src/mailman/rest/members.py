@@ -38,7 +38,7 @@ from mailman.interfaces.user import IUser, UnverifiedAddressError
 from mailman.interfaces.usermanager import IUserManager
 from mailman.rest.helpers import (
     CollectionMixin, NotFound, accepted, bad_request, child, conflict,
-    created, etag, no_content, not_found, okay, paginate, path_to)
+    created, etag, no_content, not_found, okay, path_to)
 from mailman.rest.preferences import Preferences, ReadOnlyPreferences
 from mailman.rest.validator import (
     Validator, enum_validator, subscriber_validator)
@@ -76,10 +76,9 @@ class _MemberBase(CollectionMixin):
             response['user'] = path_to('users/{}'.format(user.user_id.int))
         return response
 
-    @paginate
     def _get_collection(self, request):
         """See `CollectionMixin`."""
-        return list(getUtility(ISubscriptionService))
+        return getUtility(ISubscriptionService).get_members()
 
 
 
@@ -96,8 +95,7 @@ class MemberCollection(_MemberBase):
 
     def on_get(self, request, response):
         """roster/[members|owners|moderators]"""
-        resource = self._make_collection(request)
-        okay(response, etag(resource))
+        self._okay_collection(request, response)
 
 
 
@@ -333,8 +331,7 @@ class AllMembers(_MemberBase):
 
     def on_get(self, request, response):
         """/members"""
-        resource = self._make_collection(request)
-        okay(response, etag(resource))
+        self._okay_collection(request, response)
 
 
 
@@ -367,5 +364,4 @@ class FindMembers(_MemberBase):
         except ValueError as error:
             bad_request(response, str(error))
         else:
-            resource = _FoundMembers(members)._make_collection(request)
-            okay(response, etag(resource))
+            _FoundMembers(members)._okay_collection(request, response)
@@ -145,10 +145,16 @@ class HeldMessages(_HeldMessageBase, CollectionMixin):
         self._requests = requests
         return list(requests.of_type(RequestType.held_message))
 
+    def _get_version(self, page):
+        """See `CollectionMixin`."""
+        # Held messages never change; they are only added and removed.  Each
+        # one's pended data has a unique token, so that a new request which
+        # reuses the row id of a handled one still changes the version.
+        return [(request.id, request.data_hash) for request in page]
+
     def on_get(self, request, response):
         """/lists/listname/held"""
-        resource = self._make_collection(request)
-        okay(response, etag(resource))
+        self._okay_collection(request, response)
 
     @child(r'^(?P<id>[^/]+)')
     def message(self, request, segments, **kw):
@@ -28,8 +28,8 @@ from mailman.config import config
 from mailman.app.inject import inject_text
 from mailman.interfaces.listmanager import IListManager
 from mailman.rest.helpers import (
-    CollectionMixin, bad_request, created, etag, no_content, not_found, okay,
-    paginate, path_to)
+    CollectionMixin, bad_request, created, no_content, not_found, okay,
+    path_to)
 from mailman.rest.validator import Validator
 from zope.component import getUtility
 
@@ -50,7 +50,6 @@ class _QueuesBase(CollectionMixin):
             self_link=path_to('queues/{}'.format(name)),
             )
 
-    @paginate
     def _get_collection(self, request):
         """See `CollectionMixin`."""
         return sorted(config.switchboards)
@@ -122,6 +121,4 @@ class AllQueues(_QueuesBase):
 
     def on_get(self, request, response):
         """<api>/queues"""
-        resource = self._make_collection(request)
-        resource['self_link'] = path_to('queues')
-        okay(response, etag(resource))
+        self._okay_collection(request, response, self_link=path_to('queues'))
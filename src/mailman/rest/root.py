@@ -27,6 +27,7 @@ import falcon
 from base64 import b64decode
 from mailman.config import config
 from mailman.core.constants import system_preferences
+from mailman.core.metrics import collect
 from mailman.core.system import system
 from mailman.interfaces.listmanager import IListManager
 from mailman.model.uid import UID
@@ -93,6 +94,13 @@ class Versions:
         okay(response, etag(resource))
 
 
+class Metrics:
+    def on_get(self, request, response):
+        """/<api>/system/metrics"""
+        response.content_type = 'text/plain; version=0.0.4'
+        okay(response, collect())
+
+
 class SystemConfiguration:
     def __init__(self, section=None):
         self._section = section
@@ -154,6 +162,10 @@ class TopLevel:
             if len(segments) <= 2:
                 return SystemConfiguration(*segments[1:]), []
             return BadRequest(), []
+        elif segments[0] == 'metrics':
+            if len(segments) > 1:
+                return BadRequest(), []
+            return Metrics(), []
         else:
             return NotFound(), []
 
@@ -140,8 +140,7 @@ class SubscriptionRequests(_ModerationBase, CollectionMixin):
 
     def on_get(self, request, response):
         """/lists/listname/requests"""
-        resource = self._make_collection(request)
-        okay(response, etag(resource))
+        self._okay_collection(request, response)
 
     @child(r'^(?P<token>[^/]+)')
     def subscription(self, request, segments, **kw):
@@ -0,0 +1,134 @@
+# Copyright (C) 2015 by the Free Software Foundation, Inc.
+#
+# This file is part of GNU Mailman.
+#
+# GNU Mailman is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# GNU Mailman is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test conditional GET requests."""
+
+__all__ = [
+    'TestConditionalRequests',
+    ]
+
+
+import json
+import unittest
+
+from base64 import b64encode
+from http.client import HTTPConnection
+from mailman.app.lifecycle import create_list
+from mailman.app.moderator import handle_message, hold_message
+from mailman.config import config
+from mailman.database.transaction import transaction
+from mailman.interfaces.action import Action
+from mailman.testing.helpers import specialized_message_from_string as mfs
+from mailman.testing.layers import RESTLayer
+
+
+
+class TestConditionalRequests(unittest.TestCase):
+    layer = RESTLayer
+
+    def setUp(self):
+        with transaction():
+            self._mlist = create_list('ant@example.com')
+        basic_auth = '{0}:{1}'.format(
+            config.webservice.admin_user, config.webservice.admin_pass)
+        token = b64encode(basic_auth.encode('utf-8')).decode('ascii')
+        self._headers = {'Authorization': 'Basic ' + token}
+        self._connection = HTTPConnection('localhost', 9001)
+
+    def tearDown(self):
+        self._connection.close()
+
+    def _get(self, path, **headers):
+        headers.update(self._headers)
+        self._connection.request('GET', '/3.0/' + path, headers=headers)
+        response = self._connection.getresponse()
+        return response, response.read()
+
+    def test_etag_header(self):
+        # Collections have an ETag header, which is their http_etag.
+        response, content = self._get('lists')
+        self.assertEqual(response.status, 200)
+        resource = json.loads(content.decode('utf-8'))
+        self.assertEqual(response.getheader('ETag'), resource['http_etag'])
+
+    def test_not_modified(self):
+        # A request for an unchanged collection gets a 304 without a body.
+        response, content = self._get('lists')
+        etag = response.getheader('ETag')
+        response, content = self._get('lists', **{'If-None-Match': etag})
+        self.assertEqual(response.status, 304)
+        self.assertEqual(response.getheader('ETag'), etag)
+        self.assertEqual(content, b'')
+
+    def test_modified(self):
+        # When the collection changes, so does its etag.
+        response, content = self._get('lists')
+        etag = response.getheader('ETag')
+        with transaction():
+            create_list('bee@example.com')
+        response, content = self._get('lists', **{'If-None-Match': etag})
+        self.assertEqual(response.status, 200)
+        self.assertNotEqual(response.getheader('ETag'), etag)
+        resource = json.loads(content.decode('utf-8'))
+        self.assertEqual(resource['total_size'], 2)
+
+    def test_pages_have_their_own_etags(self):
+        response, content = self._get('lists?count=1&page=1')
+        etag = response.getheader('ETag')
+        response, content = self._get(
+            'lists?count=1&page=2', **{'If-None-Match': etag})
+        self.assertEqual(response.status, 200)
+
+    def test_weak_and_multiple_etags(self):
+        # The If-None-Match header can list several etags, and weak ones.
+        response, content = self._get('lists')
+        etag = response.getheader('ETag')
+        response, content = self._get(
+            'lists', **{'If-None-Match': '"bogus", W/' + etag})
+        self.assertEqual(response.status, 304)
+        response, content = self._get('lists', **{'If-None-Match': '*'})
+        self.assertEqual(response.status, 304)
+
+    def test_held_messages(self):
+        # The etag of the held messages is calculated from the requests, but
+        # it still changes when they do.
+        msg = mfs("""\
+From: anne@example.com
+To: ant@example.com
+Subject: Something
+Message-ID: <alpha>
+
+Something else.
+""")
+        with transaction():
+            request_id = hold_message(self._mlist, msg)
+        response, content = self._get('lists/ant.example.com/held')
+        self.assertEqual(response.status, 200)
+        resource = json.loads(content.decode('utf-8'))
+        self.assertEqual(resource['entries'][0]['request_id'], request_id)
+        etag = response.getheader('ETag')
+        self.assertEqual(resource['http_etag'], etag)
+        response, content = self._get(
+            'lists/ant.example.com/held', **{'If-None-Match': etag})
+        self.assertEqual(response.status, 304)
+        with transaction():
+            handle_message(self._mlist, request_id, Action.discard)
+        response, content = self._get(
+            'lists/ant.example.com/held', **{'If-None-Match': etag})
+        self.assertEqual(response.status, 200)
+        resource = json.loads(content.decode('utf-8'))
+        self.assertEqual(resource['total_size'], 0)
@@ -0,0 +1,73 @@
+# Copyright (C) 2015 by the Free Software Foundation, Inc.
+#
+# This file is part of GNU Mailman.
+#
+# GNU Mailman is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# GNU Mailman is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test the metrics resource."""
+
+__all__ = [
+    'TestMetrics',
+    ]
+
+
+import unittest
+
+from base64 import b64encode
+from http.client import HTTPConnection
+from mailman.config import config
+from mailman.testing.helpers import specialized_message_from_string as mfs
+from mailman.testing.layers import RESTLayer
+
+
+
+class TestMetrics(unittest.TestCase):
+    layer = RESTLayer
+
+    def setUp(self):
+        basic_auth = '{0}:{1}'.format(
+            config.webservice.admin_user, config.webservice.admin_pass)
+        token = b64encode(basic_auth.encode('utf-8')).decode('ascii')
+        self._headers = {'Authorization': 'Basic ' + token}
+        self._connection = HTTPConnection('localhost', 9001)
+
+    def tearDown(self):
+        self._connection.close()
+
+    def _get(self, path):
+        self._connection.request('GET', '/3.0/' + path, headers=self._headers)
+        response = self._connection.getresponse()
+        return response, response.read()
+
+    def test_metrics(self):
+        # The metrics are in the Prometheus text format.
+        msg = mfs("""\
+From: anne@example.com
+To: test@example.com
+Message-ID: <ant>
+
+""")
+        config.switchboards['in'].enqueue(msg)
+        response, content = self._get('system/metrics')
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.getheader('Content-Type'),
+                         'text/plain; version=0.0.4')
+        lines = content.decode('utf-8').splitlines()
+        self.assertIn('# TYPE mailman_queue_depth gauge', lines)
+        self.assertIn('mailman_queue_depth{queue="in"} 1', lines)
+        self.assertIn('mailman_queue_depth{queue="out"} 0', lines)
+
+    def test_metrics_subresource(self):
+        response, content = self._get('system/metrics/ant')
+        self.assertEqual(response.status, 400)
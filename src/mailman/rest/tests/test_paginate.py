@@ -15,7 +15,7 @@
 # You should have received a copy of the GNU General Public License along with
 # GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
 
-"""paginate helper tests."""
+"""Pagination helper tests."""
 
 __all__ = [
     'TestPaginateHelper',
@@ -27,7 +27,7 @@ import unittest
 from falcon import HTTPInvalidParam, Request
 from mailman.app.lifecycle import create_list
 from mailman.database.transaction import transaction
-from mailman.rest.helpers import paginate
+from mailman.rest.helpers import CollectionMixin
 from mailman.testing.layers import RESTLayer
 
 
@@ -43,7 +43,7 @@ class _FakeRequest(Request):
 
 
 class TestPaginateHelper(unittest.TestCase):
-    """Test the @paginate decorator."""
+    """Test the pagination of collections."""
 
     layer = RESTLayer
 
@@ -51,79 +51,72 @@ class TestPaginateHelper(unittest.TestCase):
         with transaction():
             self._mlist = create_list('test@example.com')
 
+    def _paginate(self, request):
+        return CollectionMixin()._paginate(
+            request, ['one', 'two', 'three', 'four', 'five'])
+
     def test_no_pagination(self):
         # When there is no pagination params in the request, all 5 items in
         # the collection are returned.
-        @paginate
-        def get_collection(self, request):
-            return ['one', 'two', 'three', 'four', 'five']
-        # Expect 5 items
-        page = get_collection(None, _FakeRequest())
+        start, total_size, page = self._paginate(_FakeRequest())
+        self.assertEqual(start, 0)
+        self.assertEqual(total_size, 5)
         self.assertEqual(page, ['one', 'two', 'three', 'four', 'five'])
 
     def test_valid_pagination_request_page_one(self):
         # ?count=2&page=1 returns the first page, with two items in it.
-        @paginate
-        def get_collection(self, request):
-            return ['one', 'two', 'three', 'four', 'five']
-        page = get_collection(None, _FakeRequest(2, 1))
+        start, total_size, page = self._paginate(_FakeRequest(2, 1))
+        self.assertEqual(start, 0)
+        self.assertEqual(total_size, 5)
         self.assertEqual(page, ['one', 'two'])
 
     def test_valid_pagination_request_page_two(self):
         # ?count=2&page=2 returns the second page, where a page has two items
-        # in it.
-        @paginate
-        def get_collection(self, request):
-            return ['one', 'two', 'three', 'four', 'five']
-        page = get_collection(None, _FakeRequest(2, 2))
+        # in it.  The total size is still that of the whole collection.
+        start, total_size, page = self._paginate(_FakeRequest(2, 2))
+        self.assertEqual(start, 2)
+        self.assertEqual(total_size, 5)
         self.assertEqual(page, ['three', 'four'])
 
     def test_2nd_index_larger_than_total(self):
         # ?count=2&page=3 returns the third page with page size 2, but the
         # last page only has one item in it.
-        @paginate
-        def get_collection(self, request):
-            return ['one', 'two', 'three', 'four', 'five']
-        page = get_collection(None, _FakeRequest(2, 3))
+        start, total_size, page = self._paginate(_FakeRequest(2, 3))
+        self.assertEqual(start, 4)
+        self.assertEqual(total_size, 5)
         self.assertEqual(page, ['five'])
 
     def test_out_of_range_returns_empty_list(self):
         # ?count=2&page=4 returns the fourth page, which doesn't exist, so an
         # empty collection is returned.
-        @paginate
-        def get_collection(self, request):
-            return ['one', 'two', 'three', 'four', 'five']
-        page = get_collection(None, _FakeRequest(2, 4))
+        start, total_size, page = self._paginate(_FakeRequest(2, 4))
+        self.assertEqual(start, 6)
+        self.assertEqual(total_size, 5)
         self.assertEqual(page, [])
 
+    def test_count_without_page(self):
+        # ?count=2 returns the first page.
+        start, total_size, page = self._paginate(_FakeRequest(2))
+        self.assertEqual(start, 0)
+        self.assertEqual(total_size, 5)
+        self.assertEqual(page, ['one', 'two'])
+
     def test_count_as_string_returns_bad_request(self):
         # ?count=two&page=2 are not valid values, so a bad request occurs.
-        @paginate
-        def get_collection(self, request):
-            return []
-        self.assertRaises(HTTPInvalidParam, get_collection,
-                          None, _FakeRequest('two', 1))
+        self.assertRaises(HTTPInvalidParam, self._paginate,
+                          _FakeRequest('two', 1))
 
     def test_negative_count(self):
         # ?count=-1&page=1
-        @paginate
-        def get_collection(self, request):
-            return ['one', 'two', 'three', 'four', 'five']
-        self.assertRaises(HTTPInvalidParam, get_collection,
-                          None, _FakeRequest(-1, 1))
+        self.assertRaises(HTTPInvalidParam, self._paginate,
+                          _FakeRequest(-1, 1))
 
     def test_negative_page(self):
         # ?count=1&page=-1
-        @paginate
-        def get_collection(self, request):
-            return ['one', 'two', 'three', 'four', 'five']
-        self.assertRaises(HTTPInvalidParam, get_collection,
-                          None, _FakeRequest(1, -1))
+        self.assertRaises(HTTPInvalidParam, self._paginate,
+                          _FakeRequest(1, -1))
 
     def test_negative_page_and_count(self):
         # ?count=1&page=-1
-        @paginate
-        def get_collection(self, request):
-            return ['one', 'two', 'three', 'four', 'five']
-        self.assertRaises(HTTPInvalidParam, get_collection,
-                          None, _FakeRequest(-1, -1))
+        self.assertRaises(HTTPInvalidParam, self._paginate,
+                          _FakeRequest(-1, -1))
@@ -52,8 +52,11 @@ class TestSystemConfiguration(unittest.TestCase):
             pending_request_life='3d',
             post_hook='',
             pre_hook='',
+            runner_start_method='exec',
             sender_headers='from from_ reply-to sender',
             site_owner='noreply@example.com',
+            template_cache_check='10s',
+            template_cache_size='1000',
             ))
 
     def test_dotted_section(self):
@@ -159,6 +162,7 @@ class TestSystemConfiguration(unittest.TestCase):
             'logging.subscribe',
             'logging.vette',
             'mailman',
+            'metrics',
             'mta',
             'nntp',
             'passwords',
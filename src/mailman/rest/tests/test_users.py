@@ -32,6 +32,7 @@ from mailman.app.lifecycle import create_list
 from mailman.config import config
 from mailman.database.transaction import transaction
 from mailman.interfaces.usermanager import IUserManager
+from mailman.rest.helpers import STREAM_SIZE
 from mailman.testing.helpers import call_api, configuration
 from mailman.testing.layers import RESTLayer
 from urllib.error import HTTPError
@@ -59,6 +60,28 @@ class TestUsers(unittest.TestCase):
             call_api('http://localhost:9001/3.0/users/missing@example.org')
         self.assertEqual(cm.exception.code, 404)
 
+    def test_streamed_collection(self):
+        # Big collections are streamed, but they look the same as any other.
+        with transaction():
+            user_manager = getUtility(IUserManager)
+            for i in range(STREAM_SIZE + 1):
+                user_manager.create_user(
+                    'person_{0}@example.com'.format(i))
+        resource, response = call_api('http://localhost:9001/3.0/users')
+        self.assertEqual(response.status, 200)
+        self.assertEqual(resource['start'], 0)
+        self.assertEqual(resource['total_size'], STREAM_SIZE + 1)
+        self.assertEqual(len(resource['entries']), STREAM_SIZE + 1)
+        self.assertEqual(resource['entries'][-1]['user_id'], STREAM_SIZE + 1)
+        self.assertEqual(resource['http_etag'][0], '"')
+        # A page of the collection is not streamed.
+        resource, response = call_api(
+            'http://localhost:9001/3.0/users?count={0}&page=2'.format(
+                STREAM_SIZE))
+        self.assertEqual(resource['start'], STREAM_SIZE)
+        self.assertEqual(resource['total_size'], STREAM_SIZE + 1)
+        self.assertEqual(len(resource['entries']), 1)
+
     def test_patch_missing_user_by_id(self):
         # You can't PATCH a missing user by user id.
         with self.assertRaises(HTTPError) as cm:
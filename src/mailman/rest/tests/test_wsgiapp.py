@@ -0,0 +1,178 @@
+# Copyright (C) 2015 by the Free Software Foundation, Inc.
+#
+# This file is part of GNU Mailman.
+#
+# GNU Mailman is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# GNU Mailman is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test the REST server's connection handling and routing."""
+
+__all__ = [
+    'TestConnections',
+    'TestRouting',
+    ]
+
+
+import json
+import unittest
+
+from base64 import b64encode
+from http.client import HTTPConnection
+from mailman.config import config
+from mailman.rest.helpers import child
+from mailman.rest.wsgiapp import RootedAPI
+from mailman.testing.helpers import call_api
+from mailman.testing.layers import ConfigLayer, RESTLayer
+from types import SimpleNamespace
+
+
+
+class TestConnections(unittest.TestCase):
+    layer = RESTLayer
+
+    def setUp(self):
+        basic_auth = '{0}:{1}'.format(
+            config.webservice.admin_user, config.webservice.admin_pass)
+        token = b64encode(basic_auth.encode('utf-8')).decode('ascii')
+        self._headers = {'Authorization': 'Basic ' + token}
+        self._connection = HTTPConnection('localhost', 9001)
+
+    def tearDown(self):
+        self._connection.close()
+
+    def _get(self, path, **headers):
+        headers.update(self._headers)
+        self._connection.request('GET', path, headers=headers)
+        response = self._connection.getresponse()
+        return response, response.read()
+
+    def test_keep_alive(self):
+        # Several requests can be sent over one connection.
+        response, content = self._get('/3.0/system/versions')
+        self.assertEqual(response.status, 200)
+        self.assertIsNone(response.getheader('Connection'))
+        sock = self._connection.sock
+        self.assertIsNotNone(sock)
+        response, content = self._get('/3.0/domains')
+        self.assertEqual(response.status, 200)
+        self.assertEqual(json.loads(content.decode('utf-8'))['total_size'], 1)
+        self.assertIs(self._connection.sock, sock)
+
+    def test_keep_alive_after_post(self):
+        # The body of a request is never mistaken for the next request.
+        self._connection.request(
+            'POST', '/3.0/domains', body='mail_host=example.net',
+            headers=dict(self._headers, **{
+                'Content-Type': 'application/x-www-form-urlencoded'}))
+        response = self._connection.getresponse()
+        response.read()
+        self.assertEqual(response.status, 201)
+        response, content = self._get('/3.0/domains/example.net')
+        self.assertEqual(response.status, 200)
+        self.assertEqual(
+            json.loads(content.decode('utf-8'))['mail_host'], 'example.net')
+
+    def test_keep_alive_after_error(self):
+        response, content = self._get('/3.0/does-not-exist')
+        self.assertEqual(response.status, 404)
+        response, content = self._get('/3.0/system/versions')
+        self.assertEqual(response.status, 200)
+
+    def test_connection_close(self):
+        # The client can ask for the connection to be closed.
+        response, content = self._get(
+            '/3.0/system/versions', Connection='close')
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.getheader('Connection'), 'close')
+
+    def test_idle_connection_does_not_block(self):
+        # Another worker serves requests while a connection is kept open.
+        response, content = self._get('/3.0/system/versions')
+        self.assertEqual(response.status, 200)
+        content, response = call_api('http://localhost:9001/3.0/domains')
+        self.assertEqual(content['total_size'], 1)
+
+
+
+class _Thing:
+    def __init__(self, name):
+        self.name = name
+
+    def on_get(self, request, response):
+        pass
+
+
+class _Things:
+    # Children are tried in dir() order, whatever their kind of matcher.
+    @child('all')
+    def aaa_all(self, request, segments):
+        return _Thing('all of them')
+
+    @child(r'^(?P<name>[^/]+)')
+    def thing(self, request, segments, name):
+        if name == 'nothing':
+            return None
+        return _Thing(name)
+
+    @child()
+    def zzz(self, request, segments):
+        return _Thing('never found')
+
+
+class _Root:
+    @child()
+    def things(self, request, segments):
+        return _Things()
+
+
+class TestRouting(unittest.TestCase):
+    layer = ConfigLayer
+
+    def setUp(self):
+        self._api = RootedAPI(_Root())
+
+    def _route(self, path, method='GET'):
+        request = SimpleNamespace(path=path, method=method)
+        responder, params, resource = self._api._get_responder(request)
+        return responder, resource
+
+    def test_static_child_before_regexp(self):
+        responder, resource = self._route('/things/all')
+        self.assertEqual(resource.name, 'all of them')
+
+    def test_regexp_child(self):
+        responder, resource = self._route('/things/anne')
+        self.assertEqual(resource.name, 'anne')
+        self.assertEqual(responder, resource.on_get)
+
+    def test_regexp_before_static_child(self):
+        responder, resource = self._route('/things/zzz')
+        self.assertEqual(resource.name, 'zzz')
+
+    def test_next_child_when_no_match(self):
+        # A child returning None did not match, so the next one is tried.
+        responder, resource = self._route('/things/nothing')
+        self.assertIsNone(resource)
+
+    def test_responders_are_bound_to_their_resource(self):
+        responder, anne = self._route('/things/anne')
+        self.assertIs(responder.__self__, anne)
+        responder, bart = self._route('/things/bart')
+        self.assertIs(responder.__self__, bart)
+
+    def test_method_not_allowed(self):
+        responder, resource = self._route('/things/anne', 'DELETE')
+        self.assertNotEqual(responder, resource.on_get)
+        self.assertIs(
+            self._route('/things/bart', 'DELETE')[0], responder)
+
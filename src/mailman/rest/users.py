@@ -35,8 +35,7 @@ from mailman.interfaces.usermanager import IUserManager
 from mailman.rest.addresses import UserAddresses
 from mailman.rest.helpers import (
     BadRequest, CollectionMixin, GetterSetter, NotFound, bad_request, child,
-    conflict, created, etag, forbidden, no_content, not_found, okay, paginate,
-    path_to)
+    conflict, created, forbidden, no_content, not_found, okay, path_to)
 from mailman.rest.preferences import Preferences
 from mailman.rest.validator import (
     PatchValidator, Validator, list_of_strings_validator)
@@ -148,10 +147,9 @@ class _UserBase(CollectionMixin):
             resource['display_name'] = user.display_name
         return resource
 
-    @paginate
     def _get_collection(self, request):
         """See `CollectionMixin`."""
-        return list(getUtility(IUserManager).users)
+        return getUtility(IUserManager).users
 
 
 
@@ -160,8 +158,7 @@ class AllUsers(_UserBase):
 
     def on_get(self, request, response):
         """/users"""
-        resource = self._make_collection(request)
-        okay(response, etag(resource))
+        self._okay_collection(request, response)
 
     def on_post(self, request, response):
         """Create a new user."""
@@ -424,8 +421,7 @@ class OwnersForDomain(_UserBase):
         if self._domain is None:
             not_found(response)
             return
-        resource = self._make_collection(request)
-        okay(response, etag(resource))
+        self._okay_collection(request, response)
 
     def on_post(self, request, response):
         """POST to /domains/<domain>/owners """
@@ -459,7 +455,6 @@ class OwnersForDomain(_UserBase):
             self._domain.remove_owner(email)
         return no_content(response)
 
-    @paginate
     def _get_collection(self, request):
         """See `CollectionMixin`."""
         return list(self._domain.owners)
@@ -18,22 +18,26 @@
 """Basic WSGI Application object for REST server."""
 
 __all__ = [
+    'AdminWebServiceWSGIServer',
     'make_application',
     'make_server',
     ]
 
 
 import re
+import socket
 import logging
 
+from concurrent.futures import ThreadPoolExecutor
 from falcon import API
 from falcon.responders import path_not_found
 from falcon.routing import create_http_method_map
+from io import BytesIO
+from lazr.config import as_timedelta
 from mailman.config import config
-from mailman.database.transaction import transactional
 from mailman.rest.root import Root
-from wsgiref.simple_server import WSGIRequestHandler
-from wsgiref.simple_server import make_server as wsgi_server
+from wsgiref.simple_server import (
+    ServerHandler, WSGIRequestHandler, WSGIServer)
 
 
 log = logging.getLogger('mailman.http')
@@ -41,28 +45,281 @@ _missing = object()
 SLASH = '/'
 
 
+
+class _ServerHandler(ServerHandler):
+    # Tell the client when the connection will be closed after the response.
+    def cleanup_headers(self):
+        super(_ServerHandler, self).cleanup_headers()
+        if 'Content-Length' not in self.headers:
+            # Closing the connection is what ends the response.
+            self.request_handler.close_connection = True
+        if self.request_handler.close_connection:
+            self.headers['Connection'] = 'close'
+
+
 
 class AdminWebServiceWSGIRequestHandler(WSGIRequestHandler):
-    """Handler class which just logs output to the right place."""
+    """Handler class which logs output to the right place.
+
+    Unlike wsgiref's handler, this one keeps the connection open for further
+    requests, unless the client asks for it to be closed or the response has
+    no Content-Length.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        """See `StreamRequestHandler`."""
+        self.timeout = self.server.request_timeout
+        super(AdminWebServiceWSGIRequestHandler, self).setup()
+
+    def handle(self):
+        """See `BaseHTTPRequestHandler`."""
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection:
+            self.handle_one_request()
+
+    def handle_one_request(self):
+        """See `BaseHTTPRequestHandler`."""
+        try:
+            if not self.close_connection:
+                # Wait this long for the next request on a kept alive
+                # connection.
+                self.connection.settimeout(self.server.keepalive_timeout)
+            self.raw_requestline = self.rfile.readline(65537)
+        except socket.timeout:
+            self.close_connection = True
+            return
+        self.connection.settimeout(self.server.request_timeout)
+        if len(self.raw_requestline) == 0:
+            self.close_connection = True
+            return
+        if len(self.raw_requestline) > 65536:
+            self.requestline = ''
+            self.request_version = ''
+            self.command = ''
+            self.send_error(414)
+            self.close_connection = True
+            return
+        if not self.parse_request():
+            return
+        if self.request_version != 'HTTP/1.1':
+            self.close_connection = True
+        # Read all of the request body, so that anything the application
+        # leaves unread isn't taken for the next request.
+        if 'Transfer-Encoding' in self.headers:
+            self.send_error(411)
+            self.close_connection = True
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.send_error(400, 'Bad Content-Length')
+            self.close_connection = True
+            return
+        body = BytesIO(self.rfile.read(length))
+        if self.server.keepalive_timeout <= 0:
+            self.close_connection = True
+        handler = _ServerHandler(
+            body, self.wfile, self.get_stderr(), self.get_environ(),
+            multithread=self.server.multithread)
+        handler.request_handler = self
+        handler.http_version = self.request_version[5:]
+        handler.run(self.server.get_app())
 
     def log_message(self, format, *args):
         """See `BaseHTTPRequestHandler`."""
         log.info('%s - - %s', self.address_string(), format % args)
 
 
+
+class AdminWebServiceWSGIServer(WSGIServer):
+    """A WSGI server which serves connections from a pool of threads.
+
+    Each thread has a database session of its own.  With only one worker,
+    the connections are served one at a time in the thread running the
+    server, as wsgiref's server does.
+    """
+
+    def __init__(self, server_address, handler_class, workers=1,
+                 request_timeout=None, keepalive_timeout=0):
+        """Create the server.
+
+        :param server_address: The host name and port to listen on.
+        :type server_address: 2-tuple
+        :param handler_class: The request handler class.
+        :param workers: The number of threads serving connections.
+        :type workers: int
+        :param request_timeout: How many seconds to wait on the client while
+            reading a request or sending a response, or None to wait
+            forever.
+        :type request_timeout: float
+        :param keepalive_timeout: How many seconds to wait for the next
+            request on a kept alive connection.  With 0, the connection is
+            closed after each response.
+        :type keepalive_timeout: float
+        """
+        super(AdminWebServiceWSGIServer, self).__init__(
+            server_address, handler_class)
+        self.request_timeout = request_timeout
+        self.keepalive_timeout = keepalive_timeout
+        self.multithread = (workers > 1)
+        if self.multithread:
+            self._workers = ThreadPoolExecutor(workers)
+        else:
+            self._workers = None
+            # The thread running the server must not wait on idle
+            # connections.
+            self.keepalive_timeout = 0
+
+    def process_request(self, request, client_address):
+        """See `BaseServer`."""
+        if self._workers is None:
+            super(AdminWebServiceWSGIServer, self).process_request(
+                request, client_address)
+        else:
+            self._workers.submit(
+                self._process_request_thread, request, client_address)
+
+    def _process_request_thread(self, request, client_address):
+        # This is what the server thread does in `BaseServer`.
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        """See `BaseServer`.
+
+        This also waits for the connections being served to be closed.
+        """
+        super(AdminWebServiceWSGIServer, self).server_close()
+        if self._workers is not None:
+            self._workers.shutdown(wait=True)
+
+
+
+class _Routes:
+    """The children and responders of a resource class.
+
+    Finding these means looking at every attribute of the resource, so it is
+    done once per class instead of for every path segment of every request.
+    """
+
+    def __init__(self, resource):
+        """Find the children and responders of a resource's class.
+
+        :param resource: An instance of the resource class.
+        """
+        klass = type(resource)
+        # The children matched by plain strings are looked up by path
+        # segment.  The others have to be tried one after the other.  Either
+        # way, each is kept with its position in dir() order, which is the
+        # order they are tried in.
+        self._static = {}
+        self._dynamic = []
+        for position, name in enumerate(dir(klass)):
+            if name.startswith('__') and name.endswith('__'):
+                continue
+            attribute = getattr(klass, name, None)
+            matcher = getattr(attribute, '__matcher__', _missing)
+            if matcher is _missing:
+                continue
+            if not isinstance(matcher, str):
+                self._dynamic.append((position, name, None, matcher))
+            elif matcher.startswith('^'):
+                # The matcher is a regular expression.
+                self._dynamic.append(
+                    (position, name, re.compile(matcher), None))
+            else:
+                self._static.setdefault(matcher, []).append(
+                    (position, name, None, None))
+        # The responders of the methods the resource does not support don't
+        # depend on the instance, so they can be shared.
+        self._allowed = set()
+        self._defaults = {}
+        for method, responder in create_http_method_map(
+                resource, None, None).items():
+            if callable(getattr(klass, 'on_' + method.lower(), None)):
+                self._allowed.add(method)
+            else:
+                self._defaults[method] = responder
+
+    def children(self, segment):
+        """Return the children which may match a path segment.
+
+        :param segment: The path segment.
+        :type segment: str
+        :return: The children to try, in order.  Each is a 4-tuple of the
+            child's position, its attribute name, and its regular expression
+            and callable matchers, either of which may be None.
+        :rtype: list
+        """
+        static = self._static.get(segment, [])
+        if len(self._dynamic) == 0:
+            return static
+        if len(static) == 0:
+            return self._dynamic
+        return sorted(static + self._dynamic)
+
+    def responder(self, resource, method):
+        """Return the resource's responder for an HTTP method.
+
+        :param resource: An instance of the resource class.
+        :param method: The HTTP method.
+        :type method: str
+        :return: The responder.
+        """
+        if method in self._allowed:
+            return getattr(resource, 'on_' + method.lower())
+        return self._defaults[method]
+
+
 class RootedAPI(API):
     def __init__(self, root, *args, **kws):
         self._root = root
+        self._routes_by_class = {}
         super(RootedAPI, self).__init__(*args, **kws)
+        self._routes(root)
 
-    @transactional
     def __call__(self, environ, start_response):
         # The only difference between this and the super class's wsgi API is
-        # that this wraps a transactional handler around the call.  If an
-        # error occurs, the current transaction is aborted, otherwise it is
-        # committed.
-        return super(RootedAPI, self).__call__(
-            environ, start_response)
+        # that this wraps a transaction around the call.  If an error occurs,
+        # the current transaction is aborted, otherwise it is committed.
+        # Streamed responses read from the database while they are sent, so
+        # their transaction is completed only once the body is exhausted.
+        try:
+            body = super(RootedAPI, self).__call__(environ, start_response)
+        except:
+            config.db.abort()
+            raise
+        if isinstance(body, list):
+            config.db.commit()
+            return body
+        return self._transactional_stream(body)
+
+    def _transactional_stream(self, body):
+        try:
+            yield from body
+        except:
+            # This includes the GeneratorExit of a client going away.
+            config.db.abort()
+            raise
+        config.db.commit()
+
+    def _routes(self, resource):
+        # Return the routes of the resource's class, finding them the first
+        # time the class is seen.
+        klass = type(resource)
+        routes = self._routes_by_class.get(klass)
+        if routes is None:
+            routes = self._routes_by_class[klass] = _Routes(resource)
+        return routes
 
     def _get_responder(self, req):
         path = req.path
@@ -74,32 +331,23 @@ class RootedAPI(API):
         this_segment = path_segments.pop(0)
         resource = self._root
         while True:
-            # See if there's a child matching the current segment.
             # See if any of the resource's child links match the next segment.
-            for name in dir(resource):
-                if name.startswith('__') and name.endswith('__'):
-                    continue
-                attribute = getattr(resource, name, _missing)
-                assert attribute is not _missing, name
-                matcher = getattr(attribute, '__matcher__', _missing)
-                if matcher is _missing:
-                    continue
+            routes = self._routes(resource)
+            for position, name, cre, matcher in routes.children(this_segment):
+                attribute = getattr(resource, name)
                 result = None
-                if isinstance(matcher, str):
-                    # Is the matcher string a regular expression or plain
-                    # string?  If it starts with a caret, it's a regexp.
-                    if matcher.startswith('^'):
-                        cre = re.compile(matcher)
-                        # Search against the entire remaining path.
-                        tmp_path_segments = path_segments[:]
-                        tmp_path_segments.insert(0, this_segment)
-                        remaining_path = SLASH.join(tmp_path_segments)
-                        mo = cre.match(remaining_path)
-                        if mo:
-                            result = attribute(
-                                req, path_segments, **mo.groupdict())
-                    elif matcher == this_segment:
-                        result = attribute(req, path_segments)
+                if cre is not None:
+                    # Search against the entire remaining path.
+                    tmp_path_segments = path_segments[:]
+                    tmp_path_segments.insert(0, this_segment)
+                    remaining_path = SLASH.join(tmp_path_segments)
+                    mo = cre.match(remaining_path)
+                    if mo:
+                        result = attribute(
+                            req, path_segments, **mo.groupdict())
+                elif matcher is None:
+                    # The plain string matcher is the current segment.
+                    result = attribute(req, path_segments)
                 else:
                     # The matcher is a callable.  It returns None if it
                     # doesn't match, and if it does, it returns a 3-tuple
@@ -132,8 +380,8 @@ class RootedAPI(API):
                 if len(path_segments) == 0:
                     # We're at the end of the path, so the root must be the
                     # responder.
-                    method_map = create_http_method_map(resource, None, None)
-                    responder = method_map[method]
+                    responder = self._routes(resource).responder(
+                        resource, method)
                     return responder, {}, resource
                 this_segment = path_segments.pop(0)
                 break
@@ -160,7 +408,13 @@ def make_server():
     """
     host = config.webservice.hostname
     port = int(config.webservice.port)
-    server = wsgi_server(
-        host, port, make_application(),
-        handler_class=AdminWebServiceWSGIRequestHandler)
+    request_timeout = as_timedelta(
+        config.webservice.request_timeout).total_seconds()
+    server = AdminWebServiceWSGIServer(
+        (host, port), AdminWebServiceWSGIRequestHandler,
+        workers=int(config.webservice.workers),
+        request_timeout=(request_timeout if request_timeout > 0 else None),
+        keepalive_timeout=as_timedelta(
+            config.webservice.keepalive_timeout).total_seconds())
+    server.set_app(make_application())
     return server
@@ -31,6 +31,74 @@ from mailman.interfaces.rules import IRule
 from zope.interface import implementer
 
 
+# The flags every pattern is compiled with.
+_FLAGS = re.IGNORECASE | re.UNICODE
+
+# list id -> (alias set token, matcher) for the mailing lists whose aliases
+# have been compiled.
+_matchers = {}
+
+
+
+class _AliasMatcher:
+    """A mailing list's acceptable aliases, compiled.
+
+    The aliases which are addresses go into a set.  The patterns, i.e. the
+    aliases starting with a caret, are combined into a single regular
+    expression.  Patterns with groups of their own, whose numbering would
+    change, or with flags of their own, which would apply to all of them,
+    are left apart.
+    """
+
+    def __init__(self, aliases):
+        self.aliases = set()
+        combined = []
+        self._patterns = []
+        for alias in aliases:
+            if not alias.startswith('^'):
+                self.aliases.add(alias)
+                continue
+            try:
+                cre = re.compile(alias, re.IGNORECASE)
+            except re.error:
+                # The pattern is a malformed regular expression.  Match it
+                # as it is written.
+                alias = re.escape(alias)
+                cre = re.compile(alias, re.IGNORECASE)
+            if cre.groups == 0 and cre.flags & ~_FLAGS == 0:
+                combined.append(alias)
+            else:
+                self._patterns.append(cre)
+        if len(combined) > 0:
+            self._patterns.insert(0, re.compile(
+                '|'.join('(?:{0})'.format(alias) for alias in combined),
+                re.IGNORECASE))
+
+    def match(self, address):
+        """Does the address match any of the patterns?
+
+        :param address: The lower cased email address.
+        :type address: str
+        :rtype: bool
+        """
+        for cre in self._patterns:
+            if cre.match(address):
+                return True
+        return False
+
+
+def _alias_matcher(mlist):
+    # Return the mailing list's alias matcher, which is only made again when
+    # the acceptable aliases change.
+    alias_set = IAcceptableAliasSet(mlist)
+    token = alias_set.token
+    cached = _matchers.get(mlist.list_id)
+    if cached is None or cached[0] != token:
+        cached = (token, _AliasMatcher(alias_set.aliases))
+        _matchers[mlist.list_id] = cached
+    return cached[1]
+
+
 
 @implementer(IRule)
 class ImplicitDestination:
@@ -49,20 +117,8 @@ class ImplicitDestination:
         # are never checked.
         if msgdata.get('fromusenet'):
             return False
-        # Calculate the list of acceptable aliases.  If the alias starts with
-        # a caret (i.e. ^), then it's a regular expression to match against.
-        aliases = set()
-        alias_patterns = set()
-        # Adapt the mailing list to the appropriate interface.
-        alias_set = IAcceptableAliasSet(mlist)
-        for alias in alias_set.aliases:
-            if alias.startswith('^'):
-                alias_patterns.add(alias)
-            else:
-                aliases.add(alias)
-        # Add the list's posting address, i.e. the explicit address, to the
-        # set of acceptable aliases.
-        aliases.add(mlist.posting_address)
+        matcher = _alias_matcher(mlist)
+        posting_address = mlist.posting_address
         # Look at all the recipients.  If the recipient is any acceptable
         # alias (or the explicit posting address), then this rule does not
         # match.  If not, then add it to the set of recipients we'll check
@@ -73,24 +129,13 @@ class ImplicitDestination:
                 if isinstance(address, bytes):
                     address = address.decode('ascii')
                 address = address.lower()
-                if address in aliases:
+                if address == posting_address or address in matcher.aliases:
                     return False
                 recipients.add(address)
-        # Now for all alias patterns, see if any of the recipients matches a
-        # pattern.  If so, then this rule does not match.
-        for pattern in alias_patterns:
-            escaped = re.escape(pattern)
-            for recipient in recipients:
-                try:
-                    if re.match(pattern, recipient, re.IGNORECASE):
-                        return False
-                except re.error:
-                    # The pattern is a malformed regular expression.  Try
-                    # matching again with the pattern escaped.
-                    try:
-                        if re.match(escaped, recipient, re.IGNORECASE):
-                            return False
-                    except re.error:
-                        pass
+        # Now see if any of the recipients matches an alias pattern.  If so,
+        # then this rule does not match.
+        for recipient in recipients:
+            if matcher.match(recipient):
+                return False
         # Nothing matched.
         return True
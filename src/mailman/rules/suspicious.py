@@ -19,6 +19,7 @@
 
 __all__ = [
     'SuspiciousHeader',
+    'handle_ListDeletingEvent',
     ]
 
 
@@ -26,12 +27,17 @@ import re
 import logging
 
 from mailman.core.i18n import _
+from mailman.interfaces.listmanager import ListDeletingEvent
 from mailman.interfaces.rules import IRule
 from zope.interface import implementer
 
 
 log = logging.getLogger('mailman.error')
 
+# list id -> (bounce_matching_headers, patterns by header name) for the
+# mailing lists whose patterns have been compiled.
+_patterns = {}
+
 
 
 @implementer(IRule)
@@ -82,6 +88,22 @@ bad regexp in bounce_matching_header line: %s
     return all
 
 
+def _patterns_by_header(mlist):
+    """Return the mailing list's compiled patterns, by header name.
+
+    The patterns are only compiled again when bounce_matching_headers
+    changes.
+    """
+    text = mlist.bounce_matching_headers
+    cached = _patterns.get(mlist.list_id)
+    if cached is None or cached[0] != text:
+        patterns = {}
+        for header, cre, line in _parse_matching_header_opt(mlist):
+            patterns.setdefault(header.lower(), []).append(cre)
+        cached = _patterns[mlist.list_id] = (text, patterns)
+    return cached[1]
+
+
 def has_matching_bounce_header(mlist, msg):
     """Does the message have a matching bounce header?
 
@@ -90,8 +112,17 @@ def has_matching_bounce_header(mlist, msg):
     :return: True if a header field matches a regexp in the
         bounce_matching_header mailing list variable.
     """
-    for header, cre, line in _parse_matching_header_opt(mlist):
-        for value in msg.get_all(header, []):
+    patterns = _patterns_by_header(mlist)
+    for header, value in msg.items():
+        for cre in patterns.get(header.lower(), ()):
             if cre.search(value):
                 return True
     return False
+
+
+
+def handle_ListDeletingEvent(event):
+    if not isinstance(event, ListDeletingEvent):
+        return
+    # The mailing list's compiled patterns are no longer needed.
+    _patterns.pop(event.mailing_list.list_id, None)
@@ -0,0 +1,88 @@
+# Copyright (C) 2012-2015 by the Free Software Foundation, Inc.
+#
+# This file is part of GNU Mailman.
+#
+# GNU Mailman is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# GNU Mailman is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test the implicit-dest rule."""
+
+__all__ = [
+    'TestImplicitDestination',
+    ]
+
+
+import unittest
+
+from mailman.app.lifecycle import create_list
+from mailman.config import config
+from mailman.interfaces.mailinglist import IAcceptableAliasSet
+from mailman.rules import implicit_dest
+from mailman.testing.helpers import specialized_message_from_string as mfs
+from mailman.testing.layers import ConfigLayer
+from unittest.mock import patch
+
+
+
+class TestImplicitDestination(unittest.TestCase):
+    """Test the implicit-dest rule."""
+
+    layer = ConfigLayer
+
+    def setUp(self):
+        self._mlist = create_list('test@example.com')
+        self._mlist.require_explicit_destination = True
+        self._alias_set = IAcceptableAliasSet(self._mlist)
+        self._rule = config.rules['implicit-dest']
+        self._msg = mfs("""\
+From: anne@example.com
+To: bart@example.com, cate@example.org
+Cc: dave@example.net
+Message-ID: <ant>
+
+A message.
+""")
+
+    def test_matcher_made_once(self):
+        # The aliases are compiled for the first message, and again only when
+        # they change.
+        self._alias_set.add('^.*@example.net')
+        with patch('mailman.rules.implicit_dest._AliasMatcher',
+                   wraps=implicit_dest._AliasMatcher) as matcher:
+            self.assertFalse(self._rule.check(self._mlist, self._msg, {}))
+            self.assertFalse(self._rule.check(self._mlist, self._msg, {}))
+            self.assertEqual(matcher.call_count, 1)
+            self._alias_set.remove('^.*@example.net')
+            self.assertTrue(self._rule.check(self._mlist, self._msg, {}))
+            self.assertEqual(matcher.call_count, 2)
+
+    def test_many_patterns(self):
+        # Any of many patterns can match any of the recipients.
+        for i in range(30):
+            self._alias_set.add('^.*@host{0}[.]example[.]org$'.format(i))
+        self.assertTrue(self._rule.check(self._mlist, self._msg, {}))
+        self._msg['Cc'] = 'Elle <ELLE@HOST17.example.org>'
+        self.assertFalse(self._rule.check(self._mlist, self._msg, {}))
+
+    def test_pattern_with_groups(self):
+        # A pattern's own groups keep their numbers.
+        self._alias_set.add('^.*@example.edu$')
+        self._alias_set.add(r'^(.)\1@example.net$')
+        self.assertTrue(self._rule.check(self._mlist, self._msg, {}))
+        self._msg['Cc'] = 'ee@example.net'
+        self.assertFalse(self._rule.check(self._mlist, self._msg, {}))
+
+    def test_malformed_pattern(self):
+        # A malformed pattern is matched as it is written.
+        self._alias_set.add('^dave(@example.net')
+        self.assertTrue(self._rule.check(self._mlist, self._msg, {}))
@@ -0,0 +1,92 @@
+# Copyright (C) 2012-2015 by the Free Software Foundation, Inc.
+#
+# This file is part of GNU Mailman.
+#
+# GNU Mailman is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# GNU Mailman is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test the suspicious-header rule."""
+
+__all__ = [
+    'TestSuspiciousHeader',
+    ]
+
+
+import unittest
+
+from mailman.app.lifecycle import create_list
+from mailman.config import config
+from mailman.interfaces.listmanager import IListManager
+from mailman.rules import suspicious
+from mailman.testing.helpers import specialized_message_from_string as mfs
+from mailman.testing.layers import ConfigLayer
+from unittest.mock import patch
+from zope.component import getUtility
+
+
+
+class TestSuspiciousHeader(unittest.TestCase):
+    """Test the suspicious-header rule."""
+
+    layer = ConfigLayer
+
+    def setUp(self):
+        self._mlist = create_list('test@example.com')
+        self._rule = config.rules['suspicious-header']
+        self._msg = mfs("""\
+From: aperson@example.com
+To: test@example.com
+Subject: A message
+Message-ID: <ant>
+
+A message.
+""")
+
+    def test_patterns_compiled_once(self):
+        # The patterns are compiled for the first message, and again only
+        # when they change.
+        self._mlist.bounce_matching_headers = 'From: .*person@example.com'
+        with patch('mailman.rules.suspicious._parse_matching_header_opt',
+                   wraps=suspicious._parse_matching_header_opt) as parse:
+            self.assertTrue(self._rule.check(self._mlist, self._msg, {}))
+            self.assertTrue(self._rule.check(self._mlist, self._msg, {}))
+            self.assertEqual(parse.call_count, 1)
+            self._mlist.bounce_matching_headers = 'From: .*bperson@'
+            self.assertFalse(self._rule.check(self._mlist, self._msg, {}))
+            self.assertEqual(parse.call_count, 2)
+
+    def test_header_names_are_case_insensitive(self):
+        # The header names are matched case-insensitively.
+        self._mlist.bounce_matching_headers = """\
+# A comment.
+subject: ^a MESSAGE$
+"""
+        self.assertTrue(self._rule.check(self._mlist, self._msg, {}))
+
+    def test_all_values_are_checked(self):
+        # Every value of a header which occurs more than once is checked.
+        self._mlist.bounce_matching_headers = 'X-Spam: yes'
+        self._msg['X-Spam'] = 'no'
+        self.assertFalse(self._rule.check(self._mlist, self._msg, {}))
+        self._msg['X-Spam'] = 'yes'
+        self.assertTrue(self._rule.check(self._mlist, self._msg, {}))
+
+    def test_deleted_list_is_forgotten(self):
+        # The compiled patterns of a mailing list which is deleted are
+        # forgotten.
+        self._mlist.bounce_matching_headers = 'X-Spam: yes'
+        self._rule.check(self._mlist, self._msg, {})
+        list_id = self._mlist.list_id
+        self.assertIn(list_id, suspicious._patterns)
+        getUtility(IListManager).delete(self._mlist)
+        self.assertNotIn(list_id, suspicious._patterns)
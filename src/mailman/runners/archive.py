@@ -23,12 +23,15 @@ __all__ = [
 
 
 import copy
+import time
 import logging
 
+from collections import OrderedDict
 from email.utils import parsedate_tz, mktime_tz
 from datetime import datetime
 from lazr.config import as_timedelta
 from mailman.config import config
+from mailman.core.queuefile import lazy_copy, message_bytes
 from mailman.core.runner import Runner
 from mailman.interfaces.archiver import ClobberDate
 from mailman.utilities.datetime import RFC822_DATE_FMT, now
@@ -83,27 +86,107 @@ def _should_clobber(msg, msgdata, archiver):
 
 
 class ArchiveRunner(Runner):
-    """The archive runner."""
+    """The archive runner.
+
+    The message is flattened once, and every enabled archiver gets a lazy
+    copy of it, which shares the flattened bytes.  A message which can't be
+    flattened to bytes is deep copied instead.  The copies are handed to the
+    archivers when the runner's batch is committed, with all of a mailing
+    list's messages in the batch going to each archiver at once.
+    """
+
+    def __init__(self, name, slice=None):
+        super(ArchiveRunner, self).__init__(name, slice)
+        # (archiver name, list id) -> (archiver, mailing list, messages) for
+        # the messages waiting to be archived.
+        self._pending = OrderedDict()
+        self._next_flush = 0
 
     def _dispose(self, mlist, msg, msgdata):
         received_time = msgdata.get('received_time', now(strip_tzinfo=False))
         archiver_set = IListArchiverSet(mlist)
+        raw = None
+        copies = []
         for archiver in archiver_set.archivers:
             # The archiver is disabled if either the list-specific or
             # site-wide archiver is disabled.
             if not archiver.is_enabled:
                 continue
-            msg_copy = copy.deepcopy(msg)
+            if raw is None:
+                try:
+                    raw = message_bytes(msg)
+                except UnicodeError:
+                    # The message was parsed from text which isn't ASCII, so
+                    # it has no bytes to share.  Copy it the slow way.
+                    raw = False
+            if raw is False:
+                msg_copy = copy.deepcopy(msg)
+            else:
+                msg_copy = lazy_copy(msg, raw)
             if _should_clobber(msg, msgdata, archiver.name):
+                # Only the copy's headers get parsed, and generated again.
                 original_date = msg_copy['date']
                 del msg_copy['date']
                 del msg_copy['x-original-date']
                 msg_copy['Date'] = received_time.strftime(RFC822_DATE_FMT)
                 if original_date:
                     msg_copy['X-Original-Date'] = original_date
+            copies.append((archiver, msg_copy))
+        for archiver, msg_copy in copies:
+            key = (archiver.name, mlist.list_id)
+            if key not in self._pending:
+                self._pending[key] = (archiver.system_archiver, mlist, [])
+            self._pending[key][2].append(msg_copy)
+
+    def _commit_batch(self, pending, batch):
+        """See `Runner`.
+
+        The batch's messages are archived before its queue files are
+        removed.
+        """
+        for key, (archiver, mlist, messages) in self._pending.items():
             # A problem in one archiver should not prevent other archivers
             # from running.
             try:
-                archiver.system_archiver.archive_message(mlist, msg_copy)
+                archive_messages = getattr(archiver, 'archive_messages', None)
+                if archive_messages is None:
+                    for msg in messages:
+                        archiver.archive_message(mlist, msg)
+                else:
+                    archive_messages(mlist, messages)
+            except Exception:
+                log.exception('Broken archiver: %s' % key[0])
+        self._pending.clear()
+        super(ArchiveRunner, self)._commit_batch(pending, batch)
+
+    def _clean_up(self):
+        """See `Runner`.
+
+        Archivers which keep helpers running are closed.
+        """
+        for archiver in config.archivers:
+            close = getattr(archiver, 'close', None)
+            if close is None:
+                continue
+            try:
+                close()
+            except Exception:
+                log.exception('Broken archiver: %s' % archiver.name)
+
+    def _do_periodic(self):
+        """See `Runner`.
+
+        Archivers which hold on to messages get to flush them, no more often
+        than the runner sleeps.
+        """
+        if time.time() < self._next_flush:
+            return
+        self._next_flush = time.time() + self.sleep_float
+        for archiver in config.archivers:
+            flush = getattr(archiver, 'flush', None)
+            if not archiver.is_enabled or flush is None:
+                continue
+            try:
+                flush()
             except Exception:
                 log.exception('Broken archiver: %s' % archiver.name)
@@ -15,36 +15,149 @@
 # You should have received a copy of the GNU General Public License along with
 # GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
 
-"""Digest runner."""
+"""Digest runner.
+
+The digests are built in a single pass over the digest mailbox.  Each message
+is parsed once, and is written out to both digests as it is added.  What the
+digesters write goes to spool files next to the mailbox, so that no matter how
+big the digest gets, neither of them is held in memory as a tree of message
+objects.  The digests are finally handed on as the bytes they were generated
+as, with their spool files in place of their bodies, so that the spool files
+are copied into the virgin queue without being read into memory.  Delivery
+then sends those bytes without parsing them again.
+"""
 
 __all__ = [
     'DigestRunner',
     ]
 
 
+import os
 import re
+import sys
+import random
 import logging
 
-from copy import deepcopy
+from contextlib import contextmanager
+from email.charset import BASE64, Charset
+from email.generator import BytesGenerator
 from email.header import Header
 from email.mime.message import MIMEMessage
 from email.mime.text import MIMEText
 from email.utils import formatdate, getaddresses, make_msgid
-from io import StringIO
+from io import BytesIO, StringIO
+from itertools import chain
 from mailman.config import config
 from mailman.core.i18n import _
+from mailman.core.queuefile import SpooledMessage
 from mailman.core.runner import Runner
 from mailman.email.message import Message, MultipartDigestMessage
 from mailman.handlers.decorate import decorate
 from mailman.interfaces.member import DeliveryMode, DeliveryStatus
 from mailman.utilities.i18n import make
-from mailman.utilities.mailbox import Mailbox
+from mailman.utilities.mailbox import DigestAccumulator, Mailbox
 from mailman.utilities.string import oneline, wrap
+from tempfile import TemporaryFile
 from urllib.error import URLError
 
 
 log = logging.getLogger('mailman.error')
 
+# How much of a spool file is read at a time.
+SPOOL_CHUNK = 1024 * 1024
+
+# How many bytes go on a line of base64.
+BASE64_LINE = 57
+
+# What goes in place of the MIME boundary in the spool file until the boundary
+# is picked.  It is as long as the boundaries `_make_boundary()` returns.
+PLACEHOLDER = b'=' * 36
+
+
+
+def _flatten(msg):
+    # Return the bytes of a digest part, as `Message.as_string()` would
+    # generate them.
+    fp = BytesIO()
+    BytesGenerator(fp, mangle_from_=False, maxheaderlen=0).flatten(msg)
+    return fp.getvalue()
+
+
+
+@contextmanager
+def _digest_items(path):
+    # Yield an iterator over the Subject and From headers and the message,
+    # for each message in the digest.
+    if os.path.isdir(path):
+        yield ((entry.subject, entry.sender, msg)
+               for entry, msg in DigestAccumulator(path).iteritems())
+    else:
+        # The digest was cut by an older version of Mailman.
+        with Mailbox(path) as mailbox:
+            yield ((msg.get('subject'), msg.get('from'), msg)
+                   for key, msg in mailbox.iteritems())
+
+
+
+def _spool_contains(fp, text):
+    # Return whether the text appears in the spool file.  Each piece is
+    # searched along with the end of the one before, in case the text spans
+    # the two.
+    overlap = b''
+    fp.seek(0)
+    for chunk in iter(lambda: fp.read(SPOOL_CHUNK), b''):
+        chunk = overlap + chunk
+        if text in chunk:
+            return True
+        overlap = chunk[-len(text) + 1:]
+    return False
+
+
+def _is_plain_text(text):
+    # Return whether the bytes are ASCII text, which the generator writes out
+    # as it is, carriage returns aside.
+    if b'\r' in text:
+        return False
+    try:
+        text.decode('ascii')
+    except UnicodeError:
+        return False
+    return True
+
+
+def _encode_body(charset, chunks):
+    # Yield the pieces of a body in the transfer encoding of the character
+    # set, given the pieces of its text encoded in the character set.  Each
+    # piece is encoded as soon as it makes whole lines of the encoded body,
+    # so the pieces come out just as encoding the text all at once would.
+    if charset.body_encoding is BASE64:
+        def end(text):
+            return len(text) - len(text) % BASE64_LINE
+    else:
+        def end(text):
+            return text.rfind(b'\n') + 1
+    pending = b''
+    for chunk in chunks:
+        pending += chunk
+        cut = end(pending)
+        if cut > 0:
+            yield charset.body_encode(pending[:cut]).encode('ascii')
+            pending = pending[cut:]
+    if len(pending) > 0:
+        yield charset.body_encode(pending).encode('ascii')
+
+
+def _make_boundary(texts, spool):
+    # Return a boundary in the same style as the one `Generator` picks,
+    # which doesn't appear in any of the texts or in the spool file.
+    while True:
+        boundary = '{0}{1:019d}=='.format(
+            '=' * 15, random.randrange(sys.maxsize))
+        delimiter = ('--' + boundary).encode('ascii')
+        if (not any(delimiter in text for text in texts) and
+                not _spool_contains(spool, delimiter)):
+            return boundary
+
 
 
 class Digester:
@@ -93,7 +206,18 @@ class Digester:
 
     def add_to_toc(self, msg, count):
         """Add a message to the table of contents."""
-        subject = msg.get('subject', _('(no subject)'))
+        self.add_toc_entry(msg.get('subject'), msg.get('from'), count)
+
+    def add_toc_entry(self, subject, sender, count):
+        """Add a message to the table of contents, given its headers.
+
+        :param subject: The message's Subject header, or None.
+        :param sender: The message's From header, or None.
+        :param count: The message's number in the digest.
+        :type count: int
+        """
+        if subject is None:
+            subject = _('(no subject)')
         subject = oneline(subject, in_unicode=True)
         # Don't include the redundant subject prefix in the toc
         mo = re.match('(re:? *)?({0})'.format(
@@ -104,7 +228,7 @@ class Digester:
         # Take only the first author we find.
         username = ''
         addresses = getaddresses(
-            [oneline(msg.get('from', ''), in_unicode=True)])
+            [oneline(sender or '', in_unicode=True)])
         if addresses:
             username = addresses[0][0]
             if not username:
@@ -144,6 +268,10 @@ class Digester:
         # Add some useful extra stuff.
         msg['Message'] = count.decode('utf-8')
 
+    def close(self):
+        """Throw away the digest's spool file."""
+        self._spool.close()
+
 
 
 
@@ -164,6 +292,11 @@ class MIMEDigester(Digester):
             self._message.attach(header)
         # Calculate the set of headers we're to keep in the MIME digest.
         self._keepers = set(config.digests.mime_digest_keep_headers.split())
+        # The messages are flattened as they are added, and their bytes are
+        # kept in the spool file.  Each is preceded by its delimiter, with a
+        # placeholder for the boundary; where those are is kept in a list.
+        self._spool = TemporaryFile(dir=mlist.data_path)
+        self._placeholders = []
 
     def _make_message(self):
         return MultipartDigestMessage('mixed')
@@ -181,12 +314,20 @@ class MIMEDigester(Digester):
 
     def add_message(self, msg, count):
         """Add the message to the digest."""
-        # Make a copy of the message object, since the RFC 1153 processing
-        # scrubs out attachments.
-        self._message.attach(MIMEMessage(deepcopy(msg)))
+        # The message is flattened right away, so there's no need to copy it
+        # before the RFC 1153 digester looks at it.
+        text = _flatten(MIMEMessage(msg))
+        self._spool.write(b'\n--')
+        self._placeholders.append(self._spool.tell())
+        self._spool.write(PLACEHOLDER + b'\n')
+        self._spool.write(text)
 
     def finish(self):
         """Finish up the digest, producing the email-ready copy."""
+        # The masthead, the optional digest header and the table of contents
+        # come before the messages, and the optional footer after them.
+        head = [_flatten(part) for part in self._message.get_payload()]
+        tail = []
         if self._mlist.digest_footer_uri is not None:
             try:
                 footer_text = decorate(
@@ -200,14 +341,25 @@ class MIMEDigester(Digester):
             footer = MIMEText(footer_text.encode(self._charset),
                               _charset=self._charset)
             footer['Content-Description'] = _('Digest Footer')
-            self._message.attach(footer)
-        # This stuff is outside the normal MIME goo, and it's what the old
-        # MIME digester did.  No one seemed to complain, probably because you
-        # won't see it in an MUA that can't display the raw message.  We've
-        # never got complaints before, but if we do, just wax this.  It's
-        # primarily included for (marginally useful) backwards compatibility.
-        self._message.postamble = _('End of ') + self._digest_id
-        return self._message
+            tail.append(_flatten(footer))
+        self._spool.flush()
+        boundary = _make_boundary(head + tail, self._spool)
+        self._message.set_boundary(boundary)
+        # Put the body together just as `Generator` would.  The messages'
+        # delimiters in the spool file get the boundary, and the spool file
+        # then goes in the middle of the body as it is.
+        marker = boundary.encode('ascii')
+        assert len(marker) == len(PLACEHOLDER), 'Bad boundary length'
+        for offset in self._placeholders:
+            self._spool.seek(offset)
+            self._spool.write(marker)
+        self._spool.flush()
+        delimiter = '--{0}\n'.format(boundary).encode('ascii')
+        before = delimiter + (b'\n' + delimiter).join(head)
+        after = b''.join(b'\n' + delimiter + text for text in tail)
+        after += '\n--{0}--\n'.format(boundary).encode('ascii')
+        return SpooledMessage.with_headers(
+            self._message, before, self._spool, after)
 
 
 
@@ -227,6 +379,13 @@ class RFC1153Digester(Digester):
             print(file=self._text)
         # Calculate the set of headers we're to keep in the RFC1153 digest.
         self._keepers = set(config.digests.plain_digest_keep_headers.split())
+        # The messages are written to the spool file as they are added, and
+        # the table of contents goes after the masthead when they're done.
+        self._spool = TemporaryFile(
+            'w+', encoding='utf-8', errors='surrogateescape',
+            dir=mlist.data_path)
+        # The finished body, in the transfer encoding.
+        self._body = TemporaryFile(dir=mlist.data_path)
 
     def _make_message(self):
         return Message()
@@ -241,16 +400,16 @@ class RFC1153Digester(Digester):
     def add_message(self, msg, count):
         """Add the message to the digest."""
         if count > 1:
-            print(self._separator30, file=self._text)
-            print(file=self._text)
+            print(self._separator30, file=self._spool)
+            print(file=self._spool)
         # Each message section contains a few headers.
         for header in config.digests.plain_digest_keep_headers.split():
             if header in msg:
                 value = oneline(msg[header], in_unicode=True)
                 value = wrap('{0}: {1}'.format(header, value))
                 value = '\n\t'.join(value.split('\n'))
-                print(value, file=self._text)
-        print(file=self._text)
+                print(value, file=self._spool)
+        print(file=self._spool)
         # Add the payload.  If the decoded payload is empty, this may be a
         # multipart message.  In that case, just stringify it.
         payload = msg.get_payload(decode=True)
@@ -265,9 +424,9 @@ class RFC1153Digester(Digester):
             except (LookupError, TypeError):
                 # Unknown or empty charset.
                 payload = payload.decode('us-ascii', 'replace')
-        print(payload, file=self._text)
+        print(payload, file=self._spool)
         if not payload.endswith('\n'):
-            print(file=self._text)
+            print(file=self._spool)
 
     def finish(self):
         """Finish up the digest, producing the email-ready copy."""
@@ -284,28 +443,80 @@ class RFC1153Digester(Digester):
             # MAS: There is no real place for the digest_footer in an RFC 1153
             # compliant digest, so add it as an additional message with
             # Subject: Digest Footer
-            print(self._separator30, file=self._text)
-            print(file=self._text)
-            print('Subject: ' + _('Digest Footer'), file=self._text)
-            print(file=self._text)
-            print(footer_text, file=self._text)
-            print(file=self._text)
-            print(self._separator30, file=self._text)
-            print(file=self._text)
+            print(self._separator30, file=self._spool)
+            print(file=self._spool)
+            print('Subject: ' + _('Digest Footer'), file=self._spool)
+            print(file=self._spool)
+            print(footer_text, file=self._spool)
+            print(file=self._spool)
+            print(self._separator30, file=self._spool)
+            print(file=self._spool)
         # Add the sign-off.
         sign_off = _('End of ') + self._digest_id
-        print(sign_off, file=self._text)
-        print('*' * len(sign_off), file=self._text)
+        print(sign_off, file=self._spool)
+        print('*' * len(sign_off), file=self._spool)
+        self._spool.flush()
+        # Encode the text a piece at a time into the body file, which is
+        # handed on the way the MIME digest's spool file is.  If the digest
+        # message can't be encoded by the list character set, fall back to
+        # utf-8.
+        for charset in (self._charset, 'utf-8'):
+            try:
+                encoded = self._encode(Charset(charset))
+            except UnicodeError:
+                continue
+            if encoded:
+                self._message.set_payload(b'', charset=charset)
+                return SpooledMessage.with_headers(self._message, self._body)
+            break
+        # Otherwise, the text has to be read back and encoded all at once.
+        # Read it in pieces, so that only one more copy of the text is made
+        # when they're joined.
+        self._spool.seek(0)
+        chunks = [self._text.getvalue()]
+        chunks.extend(iter(lambda: self._spool.read(SPOOL_CHUNK), ''))
+        text = ''.join(chunks)
+        del chunks
         # If the digest message can't be encoded by the list character set,
         # fall back to utf-8.
-        text = self._text.getvalue()
         try:
-            self._message.set_payload(text.encode(self._charset),
-                                      charset=self._charset)
+            payload, charset = text.encode(self._charset), self._charset
         except UnicodeError:
-            self._message.set_payload(text.encode('utf-8'), charset='utf-8')
+            payload, charset = text.encode('utf-8'), 'utf-8'
+        del text
+        self._message.set_payload(payload, charset=charset)
         return self._message
 
+    def _encode(self, charset):
+        # Write the body to the body file as `set_payload()` would encode the
+        # text, and return whether that could be done a piece at a time.
+        # UnicodeError is raised when the character set can't encode the
+        # text at all.
+        if charset.get_output_charset() != charset.input_charset:
+            return False
+        self._body.seek(0)
+        self._body.truncate()
+        self._spool.seek(0)
+        chunks = (chunk.encode(charset.input_charset) for chunk in chain(
+            [self._text.getvalue()],
+            iter(lambda: self._spool.read(SPOOL_CHUNK), '')))
+        if charset.body_encoding is None:
+            # The text is the body as it is, as long as it's plain text.
+            for chunk in chunks:
+                if not _is_plain_text(chunk):
+                    return False
+                self._body.write(chunk)
+        else:
+            for piece in _encode_body(charset, chunks):
+                self._body.write(piece)
+        self._body.flush()
+        return True
+
+    def close(self):
+        """See `Digester`."""
+        super(RFC1153Digester, self).close()
+        self._body.close()
+
 
 
 class DigestRunner(Runner):
@@ -315,55 +526,26 @@ class DigestRunner(Runner):
         """See `IRunner`."""
         volume = msgdata['volume']
         digest_number = msgdata['digest_number']
-        # Backslashes make me cry.
-        code = mlist.preferred_language.code
-        with Mailbox(msgdata['digest_path']) as mailbox, _.using(code):
-            # Create the digesters.
-            mime_digest = MIMEDigester(mlist, volume, digest_number)
-            rfc1153_digest = RFC1153Digester(mlist, volume, digest_number)
-            # Cruise through all the messages in the mailbox, first building
-            # the table of contents and accumulating Subject: headers and
-            # authors.  The question really is whether it's better from a1
-            # performance and memory footprint to go through the mailbox once
-            # and cache the messages in a list, or to cruise through the
-            # mailbox twice.  We'll do the latter, but it's a complete guess.
-            count = None
-            for count, (key, message) in enumerate(mailbox.iteritems(), 1):
-                mime_digest.add_to_toc(message, count)
-                rfc1153_digest.add_to_toc(message, count)
-            assert count is not None, 'No digest messages?'
-            # Add the table of contents.
-            mime_digest.add_toc(count)
-            rfc1153_digest.add_toc(count)
-            # Cruise through the set of messages a second time, adding them to
-            # the actual digest.
-            for count, (key, message) in enumerate(mailbox.iteritems(), 1):
-                mime_digest.add_message(message, count)
-                rfc1153_digest.add_message(message, count)
-            # Finish up the digests.
-            mime = mime_digest.finish()
-            rfc1153 = rfc1153_digest.finish()
         # Calculate the recipients lists
         mime_recipients = set()
         rfc1153_recipients = set()
         # When someone turns off digest delivery, they will get one last
         # digest to ensure that there will be no gaps in the messages they
         # receive.
-        digest_members = set(mlist.digest_members.members)
-        for member in digest_members:
-            if member.delivery_status is not DeliveryStatus.enabled:
+        for recipient in mlist.digest_members.recipients:
+            if recipient.delivery_status is not DeliveryStatus.enabled:
                 continue
             # Send the digest to the case-preserved address of the digest
             # members.
-            email_address = member.address.original_email
-            if member.delivery_mode == DeliveryMode.plaintext_digests:
+            email_address = recipient.original_email
+            if recipient.delivery_mode == DeliveryMode.plaintext_digests:
                 rfc1153_recipients.add(email_address)
-            elif member.delivery_mode == DeliveryMode.mime_digests:
+            elif recipient.delivery_mode == DeliveryMode.mime_digests:
                 mime_recipients.add(email_address)
             else:
                 raise AssertionError(
                     'Digest member "{0}" unexpected delivery mode: {1}'.format(
-                        email_address, member.delivery_mode))
+                        email_address, recipient.delivery_mode))
         # Add also the folks who are receiving one last digest.
         for address, delivery_mode in mlist.last_digest_recipients:
             if delivery_mode == DeliveryMode.plaintext_digests:
@@ -374,13 +556,42 @@ class DigestRunner(Runner):
                 raise AssertionError(
                     'OLD recipient "{0}" unexpected delivery mode: {1}'.format(
                         address, delivery_mode))
-        # Send the digests to the virgin queue for final delivery.
-        queue = config.switchboards['virgin']
-        queue.enqueue(mime,
-                      recipients=mime_recipients,
-                      listid=mlist.list_id,
-                      isdigest=True)
-        queue.enqueue(rfc1153,
-                      recipients=rfc1153_recipients,
-                      listid=mlist.list_id,
-                      isdigest=True)
+        # Backslashes make me cry.
+        code = mlist.preferred_language.code
+        with _digest_items(msgdata['digest_path']) as items, _.using(code):
+            # Create the digesters.
+            mime_digest = MIMEDigester(mlist, volume, digest_number)
+            rfc1153_digest = RFC1153Digester(mlist, volume, digest_number)
+            try:
+                # Cruise through the digest once, adding each message to the
+                # table of contents and to both digests.  The table of
+                # contents comes from the digest's index.  The digesters
+                # spool the messages as they go, so nothing is kept around.
+                count = None
+                for count, (subject, sender, message) in enumerate(items, 1):
+                    mime_digest.add_toc_entry(subject, sender, count)
+                    rfc1153_digest.add_toc_entry(subject, sender, count)
+                    mime_digest.add_message(message, count)
+                    rfc1153_digest.add_message(message, count)
+                assert count is not None, 'No digest messages?'
+                # Add the table of contents.
+                mime_digest.add_toc(count)
+                rfc1153_digest.add_toc(count)
+                # Finish up the digests.
+                mime = mime_digest.finish()
+                rfc1153 = rfc1153_digest.finish()
+                # Send the digests to the virgin queue for final delivery.
+                # Their spool files are copied into it, so they can only be
+                # closed after that.
+                queue = config.switchboards['virgin']
+                queue.enqueue(mime,
+                              recipients=mime_recipients,
+                              listid=mlist.list_id,
+                              isdigest=True)
+                queue.enqueue(rfc1153,
+                              recipients=rfc1153_recipients,
+                              listid=mlist.list_id,
+                              isdigest=True)
+            finally:
+                mime_digest.close()
+                rfc1153_digest.close()
@@ -15,9 +15,6 @@
 # You should have received a copy of the GNU General Public License along with
 # GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
 
-# XXX This module needs to be refactored to avoid direct access to the
-# config.db global.
-
 """Mailman LMTP runner (server).
 
 Most mail servers can be configured to deliver local messages via 'LMTP'[1].
@@ -30,26 +27,44 @@ Mailman's incoming queue for normal processing.  If they don't look good, or
 are destined for a bogus sub-address, they are rejected right away, hopefully
 so that the peer mail server can provide better diagnostics.
 
+The server runs on an asyncio event loop and supports command pipelining[2].
+Messages are parsed and queued by a pool of worker threads, so that the
+event loop keeps serving other connections while queue files are synced to
+disk.  The number of messages handled at once is limited, and when the
+incoming queue is deep, the server waits before accepting more message data.
+This slows the mail server down instead of failing its deliveries.
+
 [1] RFC 2033 Local Mail Transport Protocol
     http://www.faqs.org/rfcs/rfc2033.html
+[2] RFC 2920 SMTP Service Extension for Command Pipelining
+    http://www.faqs.org/rfcs/rfc2920.html
 """
 
 __all__ = [
     'LMTPRunner',
+    'ListNameCache',
+    'handle_ListCreatedEvent',
+    'handle_ListDeletedEvent',
+    'list_names',
     ]
 
 
+import time
 import email
-import smtpd
+import socket
+import asyncio
 import logging
-import asyncore
 
+from concurrent.futures import ThreadPoolExecutor
 from email.utils import parseaddr
+from lazr.config import as_timedelta
 from mailman.config import config
 from mailman.core.runner import Runner
+from mailman.core.switchboard import enqueue_shared
 from mailman.database.transaction import transactional
 from mailman.email.message import Message
-from mailman.interfaces.listmanager import IListManager
+from mailman.interfaces.listmanager import (
+    IListManager, ListCreatedEvent, ListDeletedEvent)
 from mailman.utilities.datetime import now
 from mailman.utilities.email import add_message_hash
 from zope.component import getUtility
@@ -89,13 +104,33 @@ SUBADDRESS_QUEUES = dict(
 DASH    = '-'
 CRLF    = '\r\n'
 ERR_451 = '451 Requested action aborted: error in processing'
+ERR_500 = '500 Error: bad syntax'
+ERR_500_LINE = '500 Error: line too long'
 ERR_501 = '501 Message has defects'
 ERR_502 = '502 Error: command HELO not implemented'
 ERR_550 = '550 Requested action not taken: mailbox unavailable'
 ERR_550_MID = '550 No Message-ID header provided'
+ERR_552 = '552 Error: Too much mail data'
+
+VERSION = 'Python LMTP runner 1.0'
+
+# The longest line and the most message data accepted.
+LINE_LIMIT = 1024 * 1024
+DATA_SIZE_LIMIT = 32 * 1024 * 1024
+
+# How long the names of the mailing lists are cached for, in seconds.  Lists
+# created or deleted in this process invalidate the cache at once, and so does
+# a message to a list that isn't cached, in case it was created elsewhere.
+LIST_NAMES_TTL = 60
 
-# XXX Blech
-smtpd.__version__ = 'Python LMTP runner 1.0'
+# How long to wait after reading the names before a message to a list that
+# isn't cached makes them be read again, in seconds.  Messages to lists which
+# don't exist are common, and mustn't read the names every time.
+LIST_NAMES_MISS_TTL = 1
+
+# How often to check the incoming queue while waiting for it to drain, in
+# seconds.
+BACKPRESSURE_INTERVAL = 0.1
 
 
 
@@ -126,78 +161,349 @@ def split_recipient(address):
     return listname, subaddress, domain
 
 
+def _listname(recipient):
+    # The fully qualified name of the list a recipient address belongs to.
+    address = parseaddr(recipient)[1].lower()
+    local, subaddress, domain = split_recipient(address)
+    return '{}@{}'.format(local, domain)
+
+
 
-class Channel(smtpd.SMTPChannel):
-    """An LMTP channel."""
+class ListNameCache:
+    """The fully qualified names of all the mailing lists.
 
-    def __init__(self, server, conn, addr):
-        smtpd.SMTPChannel.__init__(self, server, conn, addr)
-        # Stash this here since the subclass uses private attributes. :(
-        self._server = server
+    The names are read from the database again when they are older than the
+    time to live, after `invalidate()` is called, or when asked about a name
+    which isn't cached, but no more often than the miss time to live unless
+    invalidated.  The names can be read and looked up from any thread.
+    """
+
+    def __init__(self, ttl=LIST_NAMES_TTL, miss_ttl=LIST_NAMES_MISS_TTL):
+        self._ttl = ttl
+        self._miss_ttl = miss_ttl
+        self._names = frozenset()
+        self._expires = 0
+        self._next_read = 0
+
+    def __contains__(self, fqdn_listname):
+        return fqdn_listname in self._names
+
+    def invalidate(self):
+        """Read the names again the next time they are asked about."""
+        self._expires = 0
+        self._next_read = 0
+
+    def should_read(self, fqdn_listnames=()):
+        """Should the names be read again?
+
+        When they should, the caller is expected to call `read()`, and
+        nobody else is told to until the miss time to live has passed.
+
+        :param fqdn_listnames: The names which are about to be looked up.  If
+            any of them isn't cached, all the names are read again.
+        :type fqdn_listnames: sequence of str
+        :rtype: bool
+        """
+        now = time.time()
+        if now < self._next_read:
+            return False
+        if (now < self._expires and
+                all(name in self._names for name in fqdn_listnames)):
+            return False
+        self._next_read = now + self._miss_ttl
+        return True
+
+    def load(self, fqdn_listnames=()):
+        """Make sure the cached names are current.
+
+        :param fqdn_listnames: The names which are about to be looked up.
+        :type fqdn_listnames: sequence of str
+        """
+        if self.should_read(fqdn_listnames):
+            self.read()
+
+    @transactional
+    def read(self):
+        """Read the names from the database."""
+        self._names = frozenset(getUtility(IListManager).names)
+        self._expires = time.time() + self._ttl
+
+
+list_names = ListNameCache()
+
+
+def handle_ListCreatedEvent(event):
+    if isinstance(event, ListCreatedEvent):
+        list_names.invalidate()
 
-    def smtp_LHLO(self, arg):
-        """The LMTP greeting, used instead of HELO/EHLO."""
-        smtpd.SMTPChannel.smtp_HELO(self, arg)
 
-    def smtp_HELO(self, arg):
+def handle_ListDeletedEvent(event):
+    if isinstance(event, ListDeletedEvent):
+        list_names.invalidate()
+
+
+
+class Channel:
+    """An LMTP session with one client."""
+
+    def __init__(self, runner, reader, writer):
+        self._runner = runner
+        self._reader = reader
+        self._writer = writer
+        self._peer = writer.get_extra_info('peername')
+        self._greeted = False
+        self._closing = False
+        self._reset()
+
+    def _reset(self):
+        self._mailfrom = None
+        self._rcpttos = []
+
+    def push(self, status):
+        self._writer.write(status.encode('utf-8') + b'\r\n')
+
+    @asyncio.coroutine
+    def handle(self):
+        """Talk to the client until it quits or goes away."""
+        self.push('220 {} {}'.format(self._runner.fqdn, VERSION))
+        try:
+            while not self._closing:
+                # The replies to pipelined commands are only flushed when the
+                # write buffer fills up, or while waiting for more commands.
+                yield from self._writer.drain()
+                line = yield from self._reader.readline()
+                if not line.endswith(b'\n'):
+                    # The client went away.
+                    break
+                line = line.rstrip(b'\r\n').decode('utf-8', 'replace')
+                command, space, arg = line.partition(' ')
+                command = command.upper()
+                arg = arg.strip()
+                if command == 'DATA':
+                    yield from self.lmtp_DATA(arg)
+                    continue
+                method = getattr(self, 'lmtp_' + command, None)
+                if not command:
+                    self.push(ERR_500)
+                elif method is None:
+                    self.push(
+                        '500 Error: command "{}" not recognized'.format(
+                            command))
+                else:
+                    method(arg)
+            yield from self._writer.drain()
+        except ValueError:
+            # The line was longer than the stream reader's limit.
+            self.push(ERR_500_LINE)
+        except ConnectionError:
+            pass
+        finally:
+            self._writer.close()
+
+    def lmtp_LHLO(self, arg):
+        """The LMTP greeting, used instead of HELO/EHLO."""
+        if not arg:
+            self.push('501 Syntax: LHLO hostname')
+        elif self._greeted:
+            self.push('503 Duplicate LHLO')
+        else:
+            self._greeted = True
+            self._reset()
+            self.push('250-{}'.format(self._runner.fqdn))
+            self.push('250-PIPELINING')
+            self.push('250 8BITMIME')
+
+    def lmtp_HELO(self, arg):
         """HELO is not a valid LMTP command."""
         self.push(ERR_502)
 
-    ## def push(self, arg):
-    ##     import pdb; pdb.set_trace()
-    ##     return super().push(arg)
+    def lmtp_EHLO(self, arg):
+        """Nor is EHLO."""
+        self.push('502 Error: command EHLO not implemented')
+
+    def lmtp_NOOP(self, arg):
+        self.push('250 OK')
+
+    def lmtp_RSET(self, arg):
+        self._reset()
+        self.push('250 OK')
+
+    def lmtp_QUIT(self, arg):
+        self.push('221 Bye')
+        self._closing = True
+
+    def _get_address(self, keyword, arg):
+        # Return the address in a MAIL FROM or RCPT TO command, or None.  Any
+        # parameters after the address are ignored.
+        if not arg[:len(keyword)].upper() == keyword:
+            return None
+        arg = arg[len(keyword):].strip()
+        if arg.startswith('<'):
+            address, bracket, parameters = arg[1:].partition('>')
+            if not bracket:
+                return None
+            return address
+        return arg.split()[0] if arg else None
+
+    def lmtp_MAIL(self, arg):
+        if not self._greeted:
+            self.push('503 Error: send LHLO first')
+            return
+        address = self._get_address('FROM:', arg)
+        if address is None:
+            self.push('501 Syntax: MAIL FROM:<address>')
+        elif self._mailfrom is not None:
+            self.push('503 Error: nested MAIL command')
+        else:
+            self._mailfrom = address
+            self.push('250 OK')
+
+    def lmtp_RCPT(self, arg):
+        if self._mailfrom is None:
+            self.push('503 Error: need MAIL command')
+            return
+        address = self._get_address('TO:', arg)
+        if not address:
+            self.push('501 Syntax: RCPT TO:<address>')
+        else:
+            self._rcpttos.append(address)
+            self.push('250 OK')
+
+    @asyncio.coroutine
+    def lmtp_DATA(self, arg):
+        if not self._rcpttos:
+            self.push('503 Error: need RCPT command')
+            return
+        if arg:
+            self.push('501 Syntax: DATA')
+            return
+        mailfrom, rcpttos = self._mailfrom, self._rcpttos
+        self._reset()
+        with (yield from self._runner.slots):
+            yield from self._runner.wait_for_queue()
+            self.push('354 End data with <CR><LF>.<CR><LF>')
+            yield from self._writer.drain()
+            # Read the message, undoing the dot stuffing.  Like the smtpd
+            # module, the lines are joined with bare newlines.
+            lines = []
+            size = 0
+            while True:
+                line = yield from self._reader.readline()
+                if not line.endswith(b'\n'):
+                    raise ConnectionError('Connection lost during DATA')
+                if line in (b'.\r\n', b'.\n'):
+                    break
+                if line.startswith(b'.'):
+                    line = line[1:]
+                size += len(line)
+                if size <= DATA_SIZE_LIMIT:
+                    lines.append(line.rstrip(b'\r\n'))
+            if size > DATA_SIZE_LIMIT:
+                self.push(ERR_552)
+                return
+            status = yield from self._runner.handle_message(
+                self._peer, mailfrom, rcpttos, b'\n'.join(lines))
+        self.push(status)
 
 
 
-class LMTPRunner(Runner, smtpd.SMTPServer):
-    # Only __init__ is called on startup. Asyncore is responsible for later
-    # connections from the MTA.  slice and numslices are ignored and are
-    # necessary only to satisfy the API.
+class LMTPRunner(Runner):
+    # Only __init__ and run() are called on startup.  The event loop is
+    # responsible for later connections from the MTA.  slice and numslices are
+    # ignored and are necessary only to satisfy the API.
 
     is_queue_runner = False
 
     def __init__(self, name, slice=None):
-        localaddr = config.mta.lmtp_host, int(config.mta.lmtp_port)
         # Do not call Runner's constructor because there's no QDIR to create
-        qlog.debug('LMTP server listening on %s:%s',
-                   localaddr[0], localaddr[1])
-        smtpd.SMTPServer.__init__(self, localaddr, remoteaddr=None)
         super(LMTPRunner, self).__init__(name, slice)
+        self.fqdn = socket.getfqdn()
+        self._concurrency = max(int(config.mta.lmtp_max_concurrency), 1)
+        self._max_queue_depth = int(config.mta.lmtp_max_queue_depth)
+        self._backpressure_wait = as_timedelta(
+            config.mta.lmtp_backpressure_wait).total_seconds()
+        self._loop = None
+        self._executor = None
+        self._channels = set()
+        self.slots = None
+
+    def _accept(self, reader, writer):
+        slog.debug('LMTP accept from %s', writer.get_extra_info('peername'))
+        channel = self._loop.create_task(
+            Channel(self, reader, writer).handle())
+        self._channels.add(channel)
+        channel.add_done_callback(self._channels.discard)
+
+    @asyncio.coroutine
+    def wait_for_queue(self):
+        """Wait while the incoming queue is too deep.
+
+        This gives up after `lmtp_backpressure_wait`; the message is then
+        accepted anyway.
+        """
+        if self._max_queue_depth <= 0:
+            return
+        switchboard = config.switchboards['in']
+        until = time.time() + self._backpressure_wait
+        while (len(switchboard.files) >= self._max_queue_depth and
+               time.time() < until):
+            yield from asyncio.sleep(BACKPRESSURE_INTERVAL, loop=self._loop)
+
+    @asyncio.coroutine
+    def handle_message(self, peer, mailfrom, rcpttos, data):
+        """Queue a message in a worker thread.
+
+        :return: The LMTP status lines, one for each recipient.
+        :rtype: str
+        """
+        try:
+            names = []
+            for to in rcpttos:
+                try:
+                    names.append(_listname(to))
+                except ValueError:
+                    pass
+            # The names are read in a worker thread, which has a database
+            # session of its own, so the other sessions aren't held up.
+            if list_names.should_read(names):
+                yield from self._loop.run_in_executor(
+                    self._executor, list_names.read)
+            return (yield from self._loop.run_in_executor(
+                self._executor, self.process_message,
+                peer, mailfrom, rcpttos, data))
+        except Exception:
+            elog.exception('LMTP message processing')
+            return CRLF.join(ERR_451 for to in rcpttos)
 
-    def handle_accept(self):
-        conn, addr = self.accept()
-        Channel(self, conn, addr)
-        slog.debug('LMTP accept from %s', addr)
-
-    @transactional
     def process_message(self, peer, mailfrom, rcpttos, data):
+        """Parse a message and queue it for each of its recipients.
+
+        This is called in a worker thread, and must not use the database.
+        """
         try:
-            # Refresh the list of list names every time we process a message
-            # since the set of mailing lists could have changed.
-            listnames = set(getUtility(IListManager).names)
             # Parse the message data.  If there are any defects in the
             # message, reject it right away; it's probably spam.
-            msg = email.message_from_string(data, Message)
+            msg = email.message_from_bytes(data, Message)
         except Exception:
             elog.exception('LMTP message parsing')
-            config.db.abort()
             return CRLF.join(ERR_451 for to in rcpttos)
         # Do basic post-processing of the message, checking it for defects or
-        # other missing information.
+        # other missing information.  RFC 2033 requires us to return a status
+        # code for every recipient.
         message_id = msg.get('message-id')
         if message_id is None:
-            return ERR_550_MID
+            return CRLF.join(ERR_550_MID for to in rcpttos)
         if msg.defects:
-            return ERR_501
+            return CRLF.join(ERR_501 for to in rcpttos)
         msg.original_size = len(data)
         add_message_hash(msg)
         msg['X-MailFrom'] = mailfrom
-        # RFC 2033 requires us to return a status code for every recipient.
         status = []
         # Now for each address in the recipients, parse the address to first
-        # see if it's destined for a valid mailing list.  If so, then queue
-        # the message to the appropriate place and record a 250 status for
-        # that recipient.  If not, record a failure status for that recipient.
+        # see if it's destined for a valid mailing list.  If so, then find the
+        # queue to put the message in.  If not, record a failure status for
+        # that recipient.
+        destinations = []
         received_time = now()
         for to in rcpttos:
             try:
@@ -206,7 +512,7 @@ class LMTPRunner(Runner, smtpd.SMTPServer):
                 slog.debug('%s to: %s, list: %s, sub: %s, dom: %s',
                            message_id, to, local, subaddress, domain)
                 listname = '{}@{}'.format(local, domain)
-                if listname not in listnames:
+                if listname not in list_names:
                     status.append(ERR_550)
                     continue
                 listid = '{}.{}'.format(local, domain)
@@ -238,27 +544,61 @@ class LMTPRunner(Runner, smtpd.SMTPServer):
                             envsender=config.mailman.site_owner,
                             ))
                         queue = 'in'
-                # If we found a valid destination, enqueue the message and add
-                # a success status for this recipient.
+                # If we found a valid destination, remember where this
+                # recipient's status goes.
                 if queue is not None:
-                    config.switchboards[queue].enqueue(msg, msgdata)
+                    destinations.append((len(status), queue, msgdata))
                     slog.debug('%s subaddress: %s, queue: %s',
                                message_id, canonical_subaddress, queue)
-                    status.append('250 Ok')
+                    status.append(None)
             except Exception:
                 slog.exception('Queue detection: %s', msg['message-id'])
-                config.db.abort()
                 status.append(ERR_550)
+        # Enqueue the message to all its destinations at once, so that its
+        # body is only written once, and add a success status for each of
+        # those recipients.
+        if len(destinations) > 0:
+            try:
+                enqueue_shared(msg, [
+                    (config.switchboards[queue], msgdata)
+                    for index, queue, msgdata in destinations])
+            except Exception:
+                elog.exception('LMTP enqueue: %s', message_id)
+                reply = ERR_451
+            else:
+                reply = '250 Ok'
+            for index, queue, msgdata in destinations:
+                status[index] = reply
+        self._publish_metrics()
         # All done; returning this big status string should give the expected
         # response to the LMTP client.
         return CRLF.join(status)
 
     def run(self):
         """See `IRunner`."""
-        asyncore.loop()
+        self._loop = loop = asyncio.new_event_loop()
+        self._executor = ThreadPoolExecutor(self._concurrency)
+        self.slots = asyncio.Semaphore(self._concurrency, loop=loop)
+        host, port = config.mta.lmtp_host, int(config.mta.lmtp_port)
+        try:
+            server = loop.run_until_complete(asyncio.start_server(
+                self._accept, host, port, loop=loop, limit=LINE_LIMIT))
+            qlog.debug('LMTP server listening on %s:%s', host, port)
+            if not self._stop:
+                loop.run_forever()
+            server.close()
+            loop.run_until_complete(server.wait_closed())
+            for channel in self._channels:
+                channel.cancel()
+            if self._channels:
+                loop.run_until_complete(
+                    asyncio.wait(self._channels, loop=loop))
+        finally:
+            self._executor.shutdown()
+            loop.close()
 
     def stop(self):
         """See `IRunner`."""
-        asyncore.socket_map.clear()
-        asyncore.close_all()
-        self.close()
+        super(LMTPRunner, self).stop()
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._loop.stop)
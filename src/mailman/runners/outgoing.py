@@ -22,6 +22,7 @@ __all__ = [
     ]
 
 
+import time
 import socket
 import logging
 
@@ -61,13 +62,15 @@ class OutgoingRunner(Runner):
         # error log.  It gets reset if the message was successfully sent, and
         # set if there was a socket.error.
         self._logged = False
-        self._retryq = config.switchboards['retry']
 
     def _dispose(self, mlist, msg, msgdata):
-        # See if we should retry delivery of this message again.
+        # See if we should retry delivery of this message again.  Normally the
+        # message is only seen once it's due, but it may have been enqueued
+        # by someone else with a deliver_after time in the future.
         deliver_after = msgdata.get('deliver_after', datetime.fromtimestamp(0))
         if now() < deliver_after:
-            return True
+            self._schedule(msg, msgdata)
+            return False
         # Calculate whether we should VERP this message or not.  The results of
         # this set the 'verp' key in the message metadata.
         interval = int(config.mta.verp_delivery_interval)
@@ -98,8 +101,7 @@ class OutgoingRunner(Runner):
             self._logged = False
         except socket.error:
             # There was a problem connecting to the SMTP server.  Log this
-            # once, but crank up our sleep time so we don't fill the error
-            # log.
+            # once, so we don't fill the error log, and try again later.
             port = int(config.mta.smtp_port)
             if port == 0:
                 port = 'smtp'            # Log this just once.
@@ -107,7 +109,7 @@ class OutgoingRunner(Runner):
                 log.error('Cannot connect to SMTP server %s on port %s',
                           config.mta.smtp_host, port)
                 self._logged = True
-            return True
+            self._retry_later(msg, msgdata, msgdata.get('retries', -1) + 1)
         except SomeRecipientsFailed as error:
             processor = getUtility(IBounceProcessor)
             # BAW: msg is the original message that failed delivery, not a
@@ -139,14 +141,14 @@ class OutgoingRunner(Runner):
                 # but temporary failures are retried for later.
                 for email in error.permanent_failures:
                     processor.register(mlist, email, msg, BounceContext.normal)
-                # Move temporary failures to the qfiles/retry queue which will
-                # occasionally move them back here for another shot at
-                # delivery.
+                # Temporary failures are retried later, after a wait which
+                # grows for as long as the retries make no progress.
                 if error.temporary_failures:
                     current_time = now()
                     recipients = error.temporary_failures
                     last_recip_count = msgdata.get('last_recip_count', 0)
                     deliver_until = msgdata.get('deliver_until', current_time)
+                    retries = 0
                     if len(recipients) == last_recip_count:
                         # We didn't make any progress.  If we've exceeded the
                         # configured retry period, log this failure and
@@ -156,6 +158,7 @@ class OutgoingRunner(Runner):
                                            'persistent temporary failures: '
                                            '{0}'.format(msg['message-id']))
                             return False
+                        retries = msgdata.get('retries', -1) + 1
                     else:
                         # We made some progress, so keep trying to delivery
                         # this message for a while longer.
@@ -164,6 +167,41 @@ class OutgoingRunner(Runner):
                     msgdata['last_recip_count'] = len(recipients)
                     msgdata['deliver_until'] = deliver_until
                     msgdata['recipients'] = recipients
-                    self._retryq.enqueue(msg, msgdata)
+                    self._retry_later(msg, msgdata, retries)
         # We've successfully completed handling of this message.
         return False
+
+    def _retry_later(self, msg, msgdata, retries):
+        """Schedule another delivery attempt.
+
+        The wait doubles with each retry which makes no progress, from
+        `[mta]delivery_retry_delay` up to `[mta]delivery_retry_max_delay`.
+
+        :param msg: The message.
+        :param msgdata: The message metadata.
+        :param retries: The number of retries so far which made no progress.
+        :type retries: int
+        """
+        delay = as_timedelta(config.mta.delivery_retry_delay)
+        max_delay = as_timedelta(config.mta.delivery_retry_max_delay)
+        for i in range(retries):
+            if delay >= max_delay:
+                break
+            delay *= 2
+        msgdata['retries'] = retries
+        msgdata['deliver_after'] = now() + min(delay, max_delay)
+        self._schedule(msg, msgdata)
+
+    def _schedule(self, msg, msgdata):
+        """Put the message back in our queue until its deliver_after time.
+
+        The queue file is hidden from the runners until it is due, so the
+        message isn't read again before then.
+
+        :param msg: The message.
+        :param msgdata: The message metadata.
+        """
+        # The metadata's times are by the clock of `now()`, but queue files
+        # are scheduled by the system clock.
+        delay = (msgdata['deliver_after'] - now()).total_seconds()
+        self.switchboard.enqueue(msg, msgdata, _due=time.time() + delay)
@@ -42,10 +42,11 @@ class RESTRunner(Runner):
     def __init__(self, name, slice=None):
         """See `IRunner`."""
         super(RESTRunner, self).__init__(name, slice)
-        # Both the REST server and the signal handlers must run in the main
-        # thread; the former because of SQLite requirements (objects created
-        # in one thread cannot be shared with the other threads), and the
-        # latter because of Python's signal handling semantics.
+        # The signal handlers must run in the main thread because of
+        # Python's signal handling semantics, so the REST server's loop runs
+        # there too.  It hands each connection off to a worker thread with a
+        # database session of its own (objects created in one thread cannot
+        # be shared with the other threads).
         #
         # Unfortunately, we cannot issue a TCPServer shutdown in the main
         # thread, because that will cause a deadlock.  Yay.   So what we do is
@@ -63,7 +64,10 @@ class RESTRunner(Runner):
 
     def run(self):
         """See `IRunner`."""
-        self._server.serve_forever()
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
 
     def signal_handler(self, signum, frame):
         super(RESTRunner, self).signal_handler(signum, frame)
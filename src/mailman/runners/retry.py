@@ -30,7 +30,12 @@ from mailman.core.runner import Runner
 
 
 class RetryRunner(Runner):
-    """Retry delivery."""
+    """Retry delivery.
+
+    The outgoing runner schedules its retries in its own queue, so only the
+    messages left in the retry queue by older versions of Mailman end up
+    here.
+    """
 
     def _dispose(self, mlist, msg, msgdata):
         # Move the message to the out queue for another try.
@@ -63,6 +63,36 @@ class DummyArchiver:
         return path
 
 
+# The Message-IDs of each batch of messages the batch archiver got.
+batches = []
+
+
+class BatchArchiver(DummyArchiver):
+    @staticmethod
+    def archive_messages(mlist, messages):
+        batches.append([msg['message-id'] for msg in messages])
+
+
+# Each time the flushing archiver was flushed.
+flushes = []
+
+
+class FlushingArchiver(DummyArchiver):
+    @staticmethod
+    def flush():
+        flushes.append(True)
+
+
+# Each time the closing archiver was closed.
+closes = []
+
+
+class ClosingArchiver(DummyArchiver):
+    @staticmethod
+    def close():
+        closes.append(True)
+
+
 
 class TestArchiveRunner(unittest.TestCase):
     """Test the archive runner."""
@@ -96,6 +126,9 @@ First post!
 """)
         self._runner = make_testable_runner(ArchiveRunner)
         IListArchiverSet(self._mlist).get('dummy').is_enabled = True
+        del batches[:]
+        del flushes[:]
+        del closes[:]
 
     def tearDown(self):
         config.pop('dummy')
@@ -115,6 +148,25 @@ First post!
             archived = message_from_file(fp)
         self.assertEqual(archived['message-id'], '<first>')
 
+    @configuration('archiver.dummy', enable='yes')
+    def test_archive_non_ascii_text(self):
+        # A message parsed from text which isn't ASCII can't be flattened to
+        # bytes, but it is still archived.
+        msg = mfs(self._msg.as_string().replace(
+            'First post!', 'Caf\xe9 \u20ac'))
+        self._archiveq.enqueue(
+            msg, {},
+            listid=self._mlist.list_id,
+            received_time=now())
+        self._runner.run()
+        filename = os.path.join(
+            config.MESSAGES_DIR, '4CMWUN6BHVCMHMDAOSJZ2Q72G5M32MWB')
+        with open(filename) as fp:
+            archived = message_from_file(fp)
+        self.assertEqual(archived['message-id'], '<first>')
+        self.assertEqual(archived['date'], 'Mon, 01 Aug 2005 07:49:23 +0000')
+        self.assertEqual(archived.get_payload(), 'Caf\xe9 \u20ac\n\n')
+
     @configuration('archiver.dummy', enable='yes')
     def test_archive_runner_with_dated_message(self):
         # Date headers don't throw off the archiver runner.
@@ -247,3 +299,59 @@ First post!
             listid=self._mlist.list_id)
         self._runner.run()
         self.assertEqual(os.listdir(config.MESSAGES_DIR), [])
+
+    @configuration('archiver.dummy', enable='yes',
+                   **{'class': 'mailman.runners.tests.test_archiver.'
+                               'BatchArchiver'})
+    def test_batch(self):
+        # An archiver gets all of a list's messages in a batch at once.
+        self._archiveq.enqueue(self._msg, {}, listid=self._mlist.list_id)
+        del self._msg['message-id']
+        self._msg['Message-ID'] = '<second>'
+        self._archiveq.enqueue(self._msg, {}, listid=self._mlist.list_id)
+        with configuration('runner.archive', batch_size=10):
+            runner = make_testable_runner(ArchiveRunner)
+        runner.run()
+        self.assertEqual(batches, [['<first>', '<second>']])
+
+    @configuration('archiver.dummy', enable='yes',
+                   **{'class': 'mailman.runners.tests.test_archiver.'
+                               'BatchArchiver'})
+    def test_no_batching(self):
+        # By default, every message is a batch of its own.
+        self._archiveq.enqueue(self._msg, {}, listid=self._mlist.list_id)
+        del self._msg['message-id']
+        self._msg['Message-ID'] = '<second>'
+        self._archiveq.enqueue(self._msg, {}, listid=self._mlist.list_id)
+        self._runner.run()
+        self.assertEqual(batches, [['<first>'], ['<second>']])
+
+    @configuration('archiver.dummy', enable='yes',
+                   **{'class': 'mailman.runners.tests.test_archiver.'
+                               'FlushingArchiver'})
+    def test_flush(self):
+        # Archivers which hold on to messages are flushed periodically, but
+        # no more often than the runner sleeps.
+        runner = ArchiveRunner('archive')
+        runner._do_periodic()
+        runner._do_periodic()
+        self.assertEqual(flushes, [True])
+        runner._next_flush = 0
+        runner._do_periodic()
+        self.assertEqual(flushes, [True, True])
+
+    @configuration('archiver.dummy',
+                   **{'class': 'mailman.runners.tests.test_archiver.'
+                               'FlushingArchiver'})
+    def test_no_flush_when_disabled(self):
+        # Archivers which are disabled site-wide aren't flushed.
+        ArchiveRunner('archive')._do_periodic()
+        self.assertEqual(flushes, [])
+
+    @configuration('archiver.dummy',
+                   **{'class': 'mailman.runners.tests.test_archiver.'
+                               'ClosingArchiver'})
+    def test_close(self):
+        # Archivers are closed when the runner stops.
+        ArchiveRunner('archive')._clean_up()
+        self.assertEqual(closes, [True])
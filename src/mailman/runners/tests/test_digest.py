@@ -38,6 +38,7 @@ from mailman.testing.helpers import (
     specialized_message_from_string as mfs)
 from mailman.testing.layers import ConfigLayer
 from string import Template
+from unittest.mock import patch
 
 
 
@@ -88,6 +89,56 @@ class TestDigest(unittest.TestCase):
         self.assertEqual(len(self._shuntq.files), 0, error_log.read())
         self._check_virgin_queue()
 
+    def test_mime_digest_is_not_parsed(self):
+        # The MIME digest is handed on as the bytes it was generated as.
+        make_digest_messages(self._mlist)
+        items = [item for item in get_queue_messages('virgin')
+                 if item.msg.get_content_type() == 'multipart/mixed']
+        self.assertEqual(len(items), 1)
+        mime = items[0].msg
+        text = mime.as_string()
+        self.assertNotIn('_payload', vars(mime))
+        # Parsing the text gives the whole digest.
+        parsed = message_from_string(text)
+        self.assertEqual(parsed.as_string(), text)
+        self.assertEqual(
+            [part['content-description'] for part in parsed.get_payload()],
+            ['Test Digest, Vol 1, Issue 1', "Today's Topics (1 messages)",
+             None, 'Digest Footer'])
+        self.assertEqual(parsed.get_payload(2).get_payload(0)['message-id'],
+                         '<testing>')
+
+    def test_digests_read_in_pieces(self):
+        # The digests are handed on with their bodies in spool files, which
+        # are read a piece at a time to encode them.  However small the
+        # pieces, the digests come out whole.
+        text = 'caf\xe9\n' + 'another line\n' * 20
+        msg = Message()
+        msg['From'] = 'anne@example.org'
+        msg['To'] = 'test@example.com'
+        msg['Message-ID'] = '<testing>'
+        msg.set_payload(text, 'utf-8')
+        with patch('mailman.runners.digest.SPOOL_CHUNK', 10):
+            make_digest_messages(self._mlist, msg)
+        messages = get_queue_messages('virgin')
+        self.assertEqual(len(messages), 2)
+        if messages[0].msg.is_multipart():
+            mime, rfc1153 = messages[0].msg, messages[1].msg
+        else:
+            rfc1153, mime = messages[0].msg, messages[1].msg
+        post = mime.get_payload(2).get_payload(0)
+        self.assertEqual(post['message-id'], '<testing>')
+        self.assertEqual(post.get_payload(decode=True).decode('utf-8'), text)
+        # The RFC 1153 digest can't be encoded in ASCII, so it falls back to
+        # utf-8 and base64.
+        self.assertEqual(rfc1153.get_content_charset(), 'utf-8')
+        self.assertEqual(rfc1153['content-transfer-encoding'], 'base64')
+        payload = rfc1153.get_payload(decode=True).decode('utf-8')
+        self.assertIn('\n\n' + text, payload)
+        self.assertTrue(payload.endswith(
+            'End of Test Digest, Vol 1, Issue 1\n'
+            '**********************************\n'))
+
     def test_mime_digest_format(self):
         # Make sure that the format of the MIME digest is as expected.
         self._mlist.digest_size_threshold = 0.6
@@ -210,6 +261,6 @@ Content-Transfer-Encoding: 7bit
         # be recast into utf-8.
         self.assertEqual(str(rfc1153['subject']),
                          'Groupe Test, Vol 1, Parution 1')
-        self.assertEqual(rfc1153.get_charset(), 'utf-8')
+        self.assertEqual(rfc1153.get_content_charset(), 'utf-8')
         lines = rfc1153.get_payload(decode=True).decode('utf-8').splitlines()
         self.assertEqual(lines[0], 'Envoyez vos messages pour la liste Test à')
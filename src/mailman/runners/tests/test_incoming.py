@@ -29,9 +29,10 @@ from mailman.chains.base import TerminalChainBase
 from mailman.config import config
 from mailman.runners.incoming import IncomingRunner
 from mailman.testing.helpers import (
-    get_queue_messages, make_testable_runner,
+    configuration, get_queue_messages, make_testable_runner,
     specialized_message_from_string as mfs)
 from mailman.testing.layers import ConfigLayer
+from unittest.mock import patch
 
 
 
@@ -88,3 +89,25 @@ To: test@example.com
         messages = get_queue_messages('out')
         self.assertEqual(len(messages), 1)
         self.assertEqual(messages[0].msgdata.get('marker'), 'owner')
+
+    @configuration('runner.in', batch_size=3)
+    def test_batch(self):
+        # The incoming runner completes a transaction for every message, but
+        # when batching, the database is only committed once per batch.
+        for i in range(7):
+            msg = mfs("""\
+From: person{0}@example.com
+To: test@example.com
+Message-ID: <ant{0}>
+
+""".format(i))
+            config.switchboards['in'].enqueue(msg, listid='test.example.com')
+        runner = make_testable_runner(IncomingRunner, 'in')
+        with patch.object(config.db.store, 'commit',
+                          wraps=config.db.store.commit) as commit:
+            runner.run()
+        self.assertEqual(commit.call_count, 3)
+        self.assertEqual(len(get_queue_messages('shunt')), 0)
+        messages = get_queue_messages('out', sort_on='message-id')
+        self.assertEqual([bag.msg['message-id'] for bag in messages],
+                         ['<ant{0}>'.format(i) for i in range(7)])
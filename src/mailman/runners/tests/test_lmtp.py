@@ -18,20 +18,26 @@
 """Tests for the LMTP server."""
 
 __all__ = [
+    'TestBugs',
     'TestLMTP',
+    'TestListNameCache',
     ]
 
 
 import os
+import time
 import smtplib
 import unittest
 
 from datetime import datetime
 from mailman.config import config
-from mailman.app.lifecycle import create_list
+from mailman.app.lifecycle import create_list, remove_list
+from mailman.core.queuefile import shared_directory
 from mailman.database.transaction import transaction
+from mailman.runners.lmtp import ListNameCache, list_names
 from mailman.testing.helpers import get_lmtp_client, get_queue_messages
-from mailman.testing.layers import LMTPLayer
+from mailman.testing.layers import ConfigLayer, LMTPLayer
+from unittest.mock import patch
 
 
 
@@ -49,6 +55,83 @@ class TestLMTP(unittest.TestCase):
     def tearDown(self):
         self._lmtp.close()
 
+    def _pipeline(self, recipients, message):
+        # Send a whole transaction without waiting for any replies, then
+        # return the replies to MAIL, RCPT, DATA, and each recipient's status.
+        commands = ['MAIL FROM:<anne@example.com>']
+        commands.extend('RCPT TO:<{}>'.format(to) for to in recipients)
+        commands.append('DATA')
+        self._lmtp.send('\r\n'.join(commands) + '\r\n')
+        replies = [self._lmtp.getreply() for command in commands]
+        self._lmtp.send(message.replace('\n', '\r\n') + '.\r\n')
+        replies.extend(self._lmtp.getreply() for to in recipients)
+        return [code for code, text in replies]
+
+    def test_pipelining_is_advertised(self):
+        self.assertIn(b'PIPELINING', self._lmtp.helo_resp.split(b'\n'))
+
+    def test_pipelined_transaction(self):
+        # The client may send the envelope without waiting for the replies.
+        codes = self._pipeline(['test@example.com'], """\
+From: anne@example.com
+To: test@example.com
+Message-ID: <ant>
+
+""")
+        self.assertEqual(codes, [250, 250, 354, 250])
+        messages = get_queue_messages('in')
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(messages[0].msgdata['listid'], 'test.example.com')
+
+    def test_status_for_each_recipient(self):
+        # LMTP returns a status for each recipient, in the order in which the
+        # recipients were given.
+        codes = self._pipeline(
+            ['test@example.com', 'notalist@example.com',
+             'test-request@example.com'], """\
+From: anne@example.com
+To: test@example.com
+Message-ID: <ant>
+
+""")
+        self.assertEqual(codes, [250, 250, 250, 250, 354, 250, 550, 250])
+        self.assertEqual(len(get_queue_messages('in')), 1)
+        self.assertEqual(len(get_queue_messages('command')), 1)
+
+    def test_fan_out_shares_body(self):
+        # A message for several recipients is stored once, and each queue
+        # file refers to it.
+        codes = self._pipeline(
+            ['test@example.com', 'test-request@example.com'], """\
+From: anne@example.com
+To: test@example.com
+Message-ID: <ant>
+
+""")
+        self.assertEqual(codes, [250, 250, 250, 354, 250, 250])
+        shared = shared_directory()
+        self.assertEqual(
+            len([name for name in os.listdir(shared)
+                 if name.endswith('.msg')]), 1)
+        messages = get_queue_messages('in') + get_queue_messages('command')
+        self.assertEqual([message.msg['message-id'] for message in messages],
+                         ['<ant>', '<ant>'])
+        # Once both queue files are finished, the body is gone.
+        self.assertEqual(os.listdir(shared), [])
+
+    def test_rejection_status_for_each_recipient(self):
+        # A message which is rejected outright still gets one status for each
+        # recipient, so the client doesn't lose track of the replies.
+        codes = self._pipeline(['test@example.com', 'test@example.com'], """\
+From: anne@example.com
+To: test@example.com
+Subject: This has no Message-ID header
+
+""")
+        self.assertEqual(codes, [250, 250, 250, 354, 550, 550])
+        # The session is still in step.
+        self.assertEqual(self._lmtp.noop(), (250, b'OK'))
+
     def test_message_id_required(self):
         # The message is rejected if it does not have a Message-ID header.
         with self.assertRaises(smtplib.SMTPDataError) as cm:
@@ -170,3 +253,52 @@ Message-ID: <alpha>
         self.assertEqual(len(messages), 1)
         self.assertEqual(messages[0].msgdata['listid'],
                          'my-list.example.com')
+
+
+
+class TestListNameCache(unittest.TestCase):
+    """Test the cache of mailing list names."""
+
+    layer = ConfigLayer
+
+    def setUp(self):
+        self._names = ListNameCache()
+
+    def test_load_on_miss(self):
+        # Names which aren't cached cause the names to be read again, even
+        # though they haven't expired.
+        self._names = ListNameCache(miss_ttl=0)
+        self._names.load()
+        self.assertNotIn('ant@example.com', self._names)
+        create_list('ant@example.com')
+        self._names.load()
+        self.assertNotIn('ant@example.com', self._names)
+        self._names.load(['ant@example.com'])
+        self.assertIn('ant@example.com', self._names)
+
+    def test_nonexistent_names_are_not_cached(self):
+        self._names.load(['bee@example.com'])
+        self.assertNotIn('bee@example.com', self._names)
+
+    def test_misses_read_at_most_once_per_miss_ttl(self):
+        # Messages to lists which don't exist don't read the names every
+        # time.
+        self.assertTrue(self._names.should_read(['bee@example.com']))
+        self._names.read()
+        self.assertFalse(self._names.should_read(['bee@example.com']))
+        with patch('mailman.runners.lmtp.time.time',
+                   return_value=time.time() + 2):
+            self.assertTrue(self._names.should_read(['bee@example.com']))
+        # Invalidating the names makes them be read at once.
+        self._names.invalidate()
+        self.assertTrue(self._names.should_read())
+
+    def test_invalidate_on_create_and_delete(self):
+        # Creating and deleting lists invalidates the global cache.
+        list_names.load()
+        mlist = create_list('ant@example.com')
+        list_names.load()
+        self.assertIn('ant@example.com', list_names)
+        remove_list(mlist)
+        list_names.load()
+        self.assertNotIn('ant@example.com', list_names)
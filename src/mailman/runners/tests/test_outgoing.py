@@ -26,6 +26,7 @@ __all__ = [
 
 
 import os
+import time
 import socket
 import logging
 import unittest
@@ -90,12 +91,17 @@ Message-Id: <first>
 
     def test_deliver_after(self):
         # When the metadata has a deliver_after key in the future, the runner
-        # will re-enqueue the message rather than delivering it.
+        # will re-enqueue the message rather than delivering it.  The queue
+        # file is scheduled for that time, so until then it isn't seen again.
         deliver_after = now() + timedelta(days=10)
         self._msgdata['deliver_after'] = deliver_after
         self._outq.enqueue(self._msg, self._msgdata,
                            tolist=True, listid='test.example.com')
         self._runner.run()
+        self.assertEqual(len(self._outq.files), 0)
+        self.assertEqual(len(self._outq.scheduled), 1)
+        when = float(self._outq.scheduled[0].split('+')[0])
+        self.assertAlmostEqual(when - time.time(), 10 * 24 * 3600, delta=60)
         items = get_queue_messages('out')
         self.assertEqual(len(items), 1)
         self.assertEqual(items[0].msgdata['deliver_after'], deliver_after)
@@ -319,6 +325,38 @@ Message-Id: <first>
             line[-53:-1],
             'Cannot connect to SMTP server localhost on port 2112')
 
+    def test_error_schedules_retry(self):
+        # The message is tried again later, after a wait which doubles every
+        # time the SMTP server still can't be reached.
+        self._outq.enqueue(self._msg, {}, listid='test.example.com')
+        self._runner.run()
+        self.assertEqual(len(self._outq.files), 0)
+        items = get_queue_messages('out')
+        self.assertEqual(len(items), 1)
+        self.assertEqual(items[0].msgdata['retries'], 0)
+        self.assertEqual(items[0].msgdata['deliver_after'],
+                         now() + as_timedelta(config.mta.delivery_retry_delay))
+        # The next failure waits twice as long.
+        del items[0].msgdata['deliver_after']
+        self._outq.enqueue(items[0].msg, items[0].msgdata)
+        self._runner.run()
+        items = get_queue_messages('out')
+        self.assertEqual(items[0].msgdata['retries'], 1)
+        self.assertEqual(
+            items[0].msgdata['deliver_after'],
+            now() + 2 * as_timedelta(config.mta.delivery_retry_delay))
+
+    def test_retry_delay_maximum(self):
+        # The wait never gets longer than the maximum.
+        self._outq.enqueue(self._msg, dict(retries=1000),
+                           listid='test.example.com')
+        self._runner.run()
+        items = get_queue_messages('out')
+        self.assertEqual(items[0].msgdata['retries'], 1001)
+        self.assertEqual(
+            items[0].msgdata['deliver_after'],
+            now() + as_timedelta(config.mta.delivery_retry_max_delay))
+
 
 
 temporary_failures = []
@@ -432,14 +470,17 @@ Message-Id: <first>
 
     def test_one_temporary_failure(self):
         # The first time there are temporary failures, the message just gets
-        # put in the retry queue, but with some metadata to prevent infinite
+        # scheduled for a retry, but with some metadata to prevent infinite
         # retries.
         temporary_failures.append('cris@example.com')
         self._outq.enqueue(self._msg, {}, listid='test.example.com')
         self._runner.run()
         events = list(self._processor.unprocessed)
         self.assertEqual(len(events), 0)
-        items = get_queue_messages('retry')
+        # The message is back in the outgoing queue, but it isn't due yet.
+        self.assertEqual(len(self._outq.files), 0)
+        self.assertEqual(len(get_queue_messages('retry')), 0)
+        items = get_queue_messages('out')
         self.assertEqual(len(items), 1)
         self.assertEqual(self._msg.as_string(), items[0].msg.as_string())
         # The metadata has three keys which are used two decide whether the
@@ -449,10 +490,16 @@ Message-Id: <first>
                          as_timedelta(config.mta.delivery_retry_period))
         self.assertEqual(items[0].msgdata['deliver_until'], deliver_until)
         self.assertEqual(items[0].msgdata['recipients'], ['cris@example.com'])
+        # The first retry comes after the initial delay.
+        self.assertEqual(items[0].msgdata['retries'], 0)
+        self.assertEqual(
+            items[0].msgdata['deliver_after'],
+            datetime(2005, 8, 1, 7, 49, 23) +
+            as_timedelta(config.mta.delivery_retry_delay))
 
     def test_two_temporary_failures(self):
         # The first time there are temporary failures, the message just gets
-        # put in the retry queue, but with some metadata to prevent infinite
+        # scheduled for a retry, but with some metadata to prevent infinite
         # retries.
         temporary_failures.append('cris@example.com')
         temporary_failures.append('dave@example.com')
@@ -460,8 +507,8 @@ Message-Id: <first>
         self._runner.run()
         events = list(self._processor.unprocessed)
         self.assertEqual(len(events), 0)
-        items = get_queue_messages('retry')
-        # There's still only one item in the retry queue, but the metadata
+        items = get_queue_messages('out')
+        # There's still only one item in the outgoing queue, but the metadata
         # contains both temporary failures.
         self.assertEqual(len(items), 1)
         self.assertEqual(items[0].msgdata['last_recip_count'], 2)
@@ -484,7 +531,7 @@ Message-Id: <first>
         self.assertEqual(events[1].email, 'fred@example.com')
         self.assertEqual(events[1].context, BounceContext.normal)
         # Let's look at the temporary failures.
-        items = get_queue_messages('retry')
+        items = get_queue_messages('out')
         self.assertEqual(len(items), 1)
         self.assertEqual(items[0].msgdata['recipients'],
                          ['gwen@example.com', 'herb@example.com'])
@@ -500,15 +547,37 @@ Message-Id: <first>
         deliver_until = (datetime(2005, 8, 1, 7, 49, 23) +
                          as_timedelta(config.mta.delivery_retry_period))
         msgdata = dict(last_recip_count=2,
-                       deliver_until=deliver_until)
+                       deliver_until=deliver_until,
+                       retries=2)
         self._outq.enqueue(self._msg, msgdata, listid='test.example.com')
         self._runner.run()
-        # The retry queue should have our message waiting to be retried.
-        items = get_queue_messages('retry')
+        # The outgoing queue should have our message waiting to be retried.
+        items = get_queue_messages('out')
         self.assertEqual(len(items), 1)
         self.assertEqual(items[0].msgdata['deliver_until'], deliver_until)
         self.assertEqual(items[0].msgdata['recipients'],
                          ['iona@example.com', 'jeff@example.com'])
+        # No progress was made, so the wait is twice as long as last time.
+        self.assertEqual(items[0].msgdata['retries'], 3)
+        self.assertEqual(
+            items[0].msgdata['deliver_after'],
+            datetime(2005, 8, 1, 7, 49, 23) +
+            8 * as_timedelta(config.mta.delivery_retry_delay))
+
+    def test_progress_resets_retry_delay(self):
+        # When a retry gets the message to some more recipients, the wait
+        # before the next one goes back to the initial delay.
+        temporary_failures.append('iona@example.com')
+        msgdata = dict(last_recip_count=2, retries=3)
+        self._outq.enqueue(self._msg, msgdata, listid='test.example.com')
+        self._runner.run()
+        items = get_queue_messages('out')
+        self.assertEqual(len(items), 1)
+        self.assertEqual(items[0].msgdata['retries'], 0)
+        self.assertEqual(
+            items[0].msgdata['deliver_after'],
+            datetime(2005, 8, 1, 7, 49, 23) +
+            as_timedelta(config.mta.delivery_retry_delay))
 
     def test_no_progress_on_retries_with_expired_retry_period(self):
         # We've had temporary failures with no progress, and the retry period
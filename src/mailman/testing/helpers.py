@@ -64,9 +64,10 @@ from mailman.email.message import Message
 from mailman.interfaces.member import MemberRole
 from mailman.interfaces.messages import IMessageStore
 from mailman.interfaces.styles import IStyleManager
+from mailman.interfaces.templates import ITemplateLoader
 from mailman.interfaces.usermanager import IUserManager
 from mailman.runners.digest import DigestRunner
-from mailman.utilities.mailbox import Mailbox
+from mailman.utilities.mailbox import DigestAccumulator
 from urllib.error import HTTPError
 from urllib.parse import urlencode
 from zope import event
@@ -124,6 +125,8 @@ class _Bag:
 def get_queue_messages(queue_name, sort_on=None):
     """Return and clear all the messages in the given queue.
 
+    The messages scheduled for later are included.
+
     :param queue_name: A string naming a queue.
     :param sort_on: The message header to sort on.  If None (the default),
         no sorting is performed.
@@ -132,7 +135,7 @@ def get_queue_messages(queue_name, sort_on=None):
     """
     queue = config.switchboards[queue_name]
     messages = []
-    for filebase in queue.files:
+    for filebase in queue.files + queue.scheduled:
         msg, msgdata = queue.dequeue(filebase)
         messages.append(_Bag(msg=msg, msgdata=msgdata))
         queue.finish(filebase)
@@ -143,13 +146,14 @@ def get_queue_messages(queue_name, sort_on=None):
 
 
 def digest_mbox(mlist):
-    """The mailing list's pending digest as a mailbox.
+    """The mailing list's pending digest.
 
     :param mlist: The mailing list.
-    :return: The mailing list's pending digest as a mailbox.
+    :return: The mailing list's pending digest.
+    :rtype: `DigestAccumulator`
     """
-    path = os.path.join(mlist.data_path, 'digest.mmdf')
-    return Mailbox(path)
+    path = os.path.join(mlist.data_path, 'digest')
+    return DigestAccumulator(path)
 
 
 
@@ -468,6 +472,7 @@ def reset_the_world():
     * Remove all residual queue and digest files
     * Clear the message store
     * Reset the global style manager
+    * Forget all cached templates
 
     This should be as thorough a reset of the system as necessary to keep
     tests isolated.
@@ -477,6 +482,10 @@ def reset_the_world():
     # Remove any digest files and members.txt file (for the file-recips
     # handler) in the lists' data directories.
     for dirpath, dirnames, filenames in os.walk(config.LIST_DATA_DIR):
+        for dirname in list(dirnames):
+            if dirname == 'digest' or dirname.startswith('digest.'):
+                shutil.rmtree(os.path.join(dirpath, dirname))
+                dirnames.remove(dirname)
         for filename in filenames:
             if filename.endswith('.mmdf') or filename == 'members.txt':
                 os.remove(os.path.join(dirpath, filename))
@@ -498,6 +507,8 @@ def reset_the_world():
     getUtility(IStyleManager).populate()
     # Remove all dynamic header-match rules.
     config.chains['header-match'].flush()
+    # Forget all cached templates.
+    getUtility(ITemplateLoader).flush()
 
 
 
@@ -547,12 +558,12 @@ Message-ID: <testing>
 
 message triggering a digest
 """.format(listname=mlist.fqdn_listname))
-    mbox_path = os.path.join(mlist.data_path, 'digest.mmdf')
+    digest_path = os.path.join(mlist.data_path, 'digest')
     config.handlers['to-digest'].process(mlist, msg, {})
     config.switchboards['digest'].enqueue(
         msg,
         listname=mlist.fqdn_listname,
-        digest_path=mbox_path,
+        digest_path=digest_path,
         volume=1, digest_number=1)
     runner = make_testable_runner(DigestRunner, 'digest')
     runner.run()
@@ -253,6 +253,8 @@ class SMTPLayer(ConfigLayer):
 
     @classmethod
     def testTearDown(cls):
+        # Don't let the next test reuse this test's connections.
+        config.connection_pool.close()
         cls.smtpd.reset()
         cls.smtpd.clear()
 
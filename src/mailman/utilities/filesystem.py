@@ -19,12 +19,19 @@
 
 __all__ = [
     'makedirs',
+    'sync_files',
     'umask',
     ]
 
 
 import os
 import errno
+import ctypes
+import ctypes.util
+
+
+# libc's syncfs(), None if it is not available, or False if not yet looked up.
+_syncfs = False
 
 
 
@@ -73,3 +80,52 @@ def makedirs(path, mode=0o2775):
             os.chmod(dirpath, mode)
         except OSError:
             pass
+
+
+
+def _get_syncfs():
+    global _syncfs
+    if _syncfs is False:
+        _syncfs = None
+        libname = ctypes.util.find_library('c')
+        if libname is not None:
+            try:
+                _syncfs = ctypes.CDLL(libname, use_errno=True).syncfs
+            except (OSError, AttributeError):
+                pass
+    return _syncfs
+
+
+
+def sync_files(paths):
+    """Flush the contents of several files to disk.
+
+    This is equivalent to calling fsync() on each file in turn, but where the
+    platform supports it (e.g. Linux), a single syncfs() is issued for every
+    file system the files live on instead.  When many small files must be
+    made durable at the same time, this costs one disk flush instead of one
+    per file.
+
+    :param paths: The paths of the files to flush.
+    :type paths: sequence of strings
+    """
+    if len(paths) == 0:
+        return
+    syncfs = _get_syncfs()
+    if syncfs is None or len(paths) == 1:
+        for path in paths:
+            with open(path, 'rb') as fp:
+                os.fsync(fp.fileno())
+        return
+    # Flush each file system only once.
+    devices = {}
+    for path in paths:
+        devices.setdefault(os.stat(path).st_dev, path)
+    for path in devices.values():
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            if syncfs(fd) != 0:
+                code = ctypes.get_errno()
+                raise OSError(code, os.strerror(code), path)
+        finally:
+            os.close(fd)
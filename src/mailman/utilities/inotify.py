@@ -0,0 +1,165 @@
+# Copyright (C) 2015 by the Free Software Foundation, Inc.
+#
+# This file is part of GNU Mailman.
+#
+# GNU Mailman is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# GNU Mailman is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Minimal Linux inotify support for watching directories.
+
+Only the small subset of inotify needed to follow files appearing in and
+disappearing from a directory is supported.  A single inotify instance is
+shared by everything in the process that wants to watch a directory; callers
+subscribe to a directory and are told about events the next time anybody
+calls `Watcher.process_events()`.
+"""
+
+__all__ = [
+    'IN_CREATE',
+    'IN_DELETE',
+    'IN_MOVED_FROM',
+    'IN_MOVED_TO',
+    'Watcher',
+    'get_watcher',
+    ]
+
+
+import os
+import errno
+import ctypes
+import struct
+import weakref
+import ctypes.util
+
+
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+
+WATCH_MASK = (IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE |
+              IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+
+# struct inotify_event { int wd; uint32_t mask, cookie, len; char name[]; }
+EVENT = struct.Struct('iIII')
+BUFSIZE = 64 * 1024
+
+_watcher = None
+_watcher_pid = None
+
+
+
+class Watcher:
+    """A process-wide inotify instance.
+
+    Subscribers must provide two methods.  `watch_event(mask, name)` is
+    called for every event on a file in the watched directory, and
+    `watch_lost()` is called whenever events may have been missed, e.g. on
+    queue overflow or when the directory itself goes away.  Subscribers are
+    only weakly referenced.
+    """
+
+    def __init__(self, libc):
+        self._libc = libc
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            code = ctypes.get_errno()
+            raise OSError(code, os.strerror(code))
+        self._fd = fd
+        # Watch descriptor -> WeakSet of subscribers.
+        self._subscribers = {}
+
+    def subscribe(self, directory, subscriber):
+        """Start delivering events in `directory` to `subscriber`.
+
+        :param directory: The directory to watch.
+        :type directory: str
+        :param subscriber: The object to notify.
+        :raises OSError: when the watch could not be added.
+        """
+        wd = self._libc.inotify_add_watch(
+            self._fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            code = ctypes.get_errno()
+            raise OSError(code, os.strerror(code), directory)
+        self._subscribers.setdefault(wd, weakref.WeakSet()).add(subscriber)
+
+    def process_events(self):
+        """Read all pending events and dispatch them to the subscribers."""
+        while True:
+            try:
+                data = os.read(self._fd, BUFSIZE)
+            except BlockingIOError:
+                return
+            except InterruptedError:
+                continue
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, length = EVENT.unpack_from(data, offset)
+                offset += EVENT.size
+                name = data[offset:offset + length].rstrip(b'\0')
+                offset += length
+                if mask & IN_Q_OVERFLOW:
+                    # We don't know what we missed, so everybody must resync.
+                    for subscribers in list(self._subscribers.values()):
+                        for subscriber in list(subscribers):
+                            subscriber.watch_lost()
+                    continue
+                if mask & (IN_IGNORED | IN_DELETE_SELF | IN_MOVE_SELF):
+                    # The watch is gone, or about to be.  Subscribers have to
+                    # resubscribe, and will get a new watch descriptor.
+                    subscribers = self._subscribers.pop(wd, ())
+                    for subscriber in list(subscribers):
+                        subscriber.watch_lost()
+                    continue
+                for subscriber in list(self._subscribers.get(wd, ())):
+                    subscriber.watch_event(mask, os.fsdecode(name))
+
+
+
+def get_watcher():
+    """Return the process-wide `Watcher`, or None if inotify is unavailable.
+
+    A new instance is created in a forked child, so that parent and child
+    don't steal each other's events.
+    """
+    global _watcher, _watcher_pid
+    pid = os.getpid()
+    if _watcher_pid == pid:
+        return _watcher
+    _watcher_pid = pid
+    _watcher = None
+    libname = ctypes.util.find_library('c')
+    if libname is None:
+        return None
+    try:
+        libc = ctypes.CDLL(libname, use_errno=True)
+        # Make sure this platform actually has inotify.
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    try:
+        _watcher = Watcher(libc)
+    except OSError as error:
+        # EMFILE: the per-user inotify instance limit has been reached.
+        # ENOSYS: the kernel doesn't support inotify.
+        if error.errno not in (errno.EMFILE, errno.ENFILE, errno.ENOSYS,
+                               errno.ENOMEM):
+            raise
+    return _watcher
@@ -15,13 +15,44 @@
 # You should have received a copy of the GNU General Public License along with
 # GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
 
-"""MMDF helper for digests."""
+"""MMDF helper for digests.
+
+Messages for a mailing list's digest are collected in a `DigestAccumulator`.
+Every process adding to the digest appends to a segment file of its own, so
+pipeline runners handling posts to the same list never wait for each other.
+Next to each segment is an index, with a line for each message giving its
+offset and length in the segment, the time it was added, its subject and its
+author.  Reading the digest merges the segments in the order the messages
+were added, and the index alone is enough for the table of contents.
+
+The messages in a segment are framed as in an MMDF mailbox, so a segment can
+still be read as one.  Digests cut by older versions of Mailman are single
+`Mailbox` files.
+"""
 
 __all__ = [
+    'DigestAccumulator',
+    'DigestEntry',
     'Mailbox',
     ]
 
 
+import os
+import json
+import time
+import email
+import errno
+import fcntl
+import heapq
+import socket
+
+from collections import namedtuple
+from email.generator import BytesGenerator
+from email.parser import BytesParser
+from io import BytesIO
+from mailman.email.message import Message
+
+
 # Use a single file format for the digest mailbox because this makes it easier
 # to calculate the current size of the mailbox.  This way, we don't have to
 # carry around or store the size of the mailbox, we can just stat the file to
@@ -31,6 +62,15 @@ __all__ = [
 from mailbox import MMDF
 
 
+# Each message in a segment starts and ends with this line.
+MMDF_DELIMITER = b'\x01\x01\x01\x01\n'
+
+# An entry in a segment's index.  The entries sort in the order their
+# messages were added.
+DigestEntry = namedtuple(
+    'DigestEntry', 'time segment offset length subject sender')
+
+
 
 class Mailbox(MMDF):
     """A mailbox that interoperates with the 'with' statement."""
@@ -44,3 +84,235 @@ class Mailbox(MMDF):
         self.unlock()
         # Don't suppress the exception.
         return False
+
+
+
+class DigestAccumulator:
+    """The messages collected for a mailing list's digest.
+
+    The segments and their indexes are kept in a directory.  When the digest
+    is to be sent, the whole directory is moved out of the way with `cut()`,
+    and the next message added starts a new one.
+    """
+
+    def __init__(self, path):
+        """Collect messages in a directory.
+
+        :param path: The directory holding the segments.  It is created when
+            the first message is added.
+        :type path: str
+        """
+        self.path = path
+
+    def _segments(self):
+        # Return the paths of the segments, without their extensions.
+        try:
+            filenames = os.listdir(self.path)
+        except FileNotFoundError:
+            return []
+        return sorted(os.path.join(self.path, filename[:-5])
+                      for filename in filenames
+                      if filename.endswith('.mmdf'))
+
+    def add(self, msg):
+        """Append a message to this process's segment.
+
+        :param msg: The message, or its text.
+        :type msg: `Message`, bytes or str
+        """
+        if isinstance(msg, (bytes, str)):
+            data = (msg.encode('ascii') if isinstance(msg, str) else msg)
+            headers = BytesParser().parsebytes(data, headersonly=True)
+        else:
+            fp = BytesIO()
+            BytesGenerator(fp, mangle_from_=False, maxheaderlen=0).flatten(
+                msg)
+            data = fp.getvalue()
+            headers = msg
+        subject = headers.get('subject')
+        sender = headers.get('from')
+        now = time.time()
+        from_line = 'From MAILER-DAEMON {0}\n'.format(
+            time.asctime(time.gmtime(now))).encode('ascii')
+        record = [MMDF_DELIMITER, from_line, data]
+        if not data.endswith(b'\n'):
+            record.append(b'\n')
+        record.append(MMDF_DELIMITER)
+        record = b''.join(record)
+        entry = dict(
+            time=now, length=len(data),
+            subject=(None if subject is None else str(subject)),
+            sender=(None if sender is None else str(sender)),
+            )
+        while True:
+            os.makedirs(self.path, exist_ok=True)
+            try:
+                directory = os.open(self.path, os.O_RDONLY)
+            except FileNotFoundError:
+                # The digest was just cut.
+                continue
+            try:
+                if self._append(directory, record, entry,
+                                len(MMDF_DELIMITER) + len(from_line)):
+                    return
+            finally:
+                os.close(directory)
+
+    def _append(self, directory, record, entry, start):
+        # Append the record to this process's segment in the directory, and
+        # its entry to the segment's index.  Both files are opened relative to
+        # the directory, so they are in the same one even if the digest is
+        # cut meanwhile.  Return False if the digest was cut before the
+        # segment was locked, so that the message has to go into a new one.
+        def opener(path, flags):
+            return os.open(path, flags, 0o666, dir_fd=directory)
+        # Name the segment after the process, which is the only one writing
+        # to it.  The lock only keeps us from writing to a segment while the
+        # digest is being cut.
+        segment = '{0}.{1}'.format(socket.gethostname(), os.getpid())
+        with open(segment + '.mmdf', 'ab', opener=opener) as fp:
+            fcntl.flock(fp, fcntl.LOCK_EX)
+            # cut() moves the directory before it waits for the segments'
+            # locks, so as long as the directory is still in place, the digest
+            # can't be read before we're done.
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                return False
+            if not os.path.samestat(stat, os.fstat(directory)):
+                return False
+            entry['offset'] = fp.seek(0, os.SEEK_END) + start
+            fp.write(record)
+            fp.flush()
+            # The message only becomes part of the digest when its index
+            # entry is written.  If that never happens, e.g. because the
+            # process died, the message is left in the segment but not read
+            # from it.
+            with open(segment + '.idx', 'a+b', opener=opener) as index:
+                # Finish off what's left of an entry that was not completely
+                # written.
+                if index.seek(0, os.SEEK_END) > 0:
+                    index.seek(-1, os.SEEK_END)
+                    if index.read(1) != b'\n':
+                        index.write(b'\n')
+                index.write(json.dumps(entry).encode('ascii') + b'\n')
+        return True
+
+    def add_mailbox(self, path):
+        """Move the messages of an older version's digest mailbox here.
+
+        Older versions of Mailman collected a list's digest in a single
+        `Mailbox` file.  Its messages are added to this digest, in their
+        order, and the mailbox is removed.  Only one process gets to move
+        them.
+
+        :param path: The mailbox file.
+        :type path: str
+        :return: The number of messages moved.
+        :rtype: int
+        """
+        # Claim the mailbox by moving it out of the way first.
+        claimed = '{0}.{1}.{2}'.format(
+            path, socket.gethostname(), os.getpid())
+        try:
+            os.rename(path, claimed)
+        except FileNotFoundError:
+            return 0
+        count = 0
+        with Mailbox(claimed) as mailbox:
+            for key, msg in mailbox.iteritems():
+                self.add(msg)
+                count += 1
+        os.remove(claimed)
+        return count
+
+    @property
+    def size(self):
+        """The total size of the segments, in bytes."""
+        size = 0
+        for segment in self._segments():
+            try:
+                size += os.path.getsize(segment + '.mmdf')
+            except FileNotFoundError:
+                # The digest was just cut.
+                pass
+        return size
+
+    def _entries(self, segment):
+        # Yield the entries in a segment's index, skipping any which were not
+        # completely written.
+        try:
+            with open(segment + '.idx', 'rb') as fp:
+                for line in fp:
+                    try:
+                        entry = json.loads(line.decode('ascii'))
+                    except ValueError:
+                        continue
+                    yield DigestEntry(
+                        entry['time'], segment, entry['offset'],
+                        entry['length'], entry['subject'], entry['sender'])
+        except FileNotFoundError:
+            pass
+
+    def entries(self):
+        """Iterate over the index entries, in the order they were added.
+
+        :return: The entries of all the segments, merged.
+        :rtype: iterator of `DigestEntry`
+        """
+        return heapq.merge(*[self._entries(segment)
+                             for segment in self._segments()])
+
+    def iteritems(self):
+        """Iterate over the messages, in the order they were added.
+
+        :return: Each message's index entry and the parsed message.
+        :rtype: iterator of (`DigestEntry`, `Message`)
+        """
+        files = {}
+        try:
+            for entry in self.entries():
+                fp = files.get(entry.segment)
+                if fp is None:
+                    fp = files[entry.segment] = open(
+                        entry.segment + '.mmdf', 'rb')
+                fp.seek(entry.offset)
+                msg = email.message_from_bytes(fp.read(entry.length), Message)
+                yield entry, msg
+        finally:
+            for fp in files.values():
+                fp.close()
+
+    def __iter__(self):
+        for entry, msg in self.iteritems():
+            yield msg
+
+    def __len__(self):
+        return sum(1 for entry in self.entries())
+
+    def cut(self, path):
+        """Move the digest out of the way.
+
+        Messages added from now on go into a new digest.
+
+        :param path: Where to move the directory to.  It must not exist.
+        :type path: str
+        :return: The digest which was cut, or None if there was none, or
+            something is already in `path`; e.g. because another process just
+            cut it, or cut the digest before it to the same path.
+        :rtype: `DigestAccumulator`
+        """
+        try:
+            os.rename(self.path, path)
+        except FileNotFoundError:
+            return None
+        except OSError as error:
+            if error.errno in (errno.EEXIST, errno.ENOTEMPTY):
+                return None
+            raise
+        digest = DigestAccumulator(path)
+        # Wait for any process still appending to one of the segments.
+        for segment in digest._segments():
+            with open(segment + '.mmdf', 'rb') as fp:
+                fcntl.flock(fp, fcntl.LOCK_EX)
+        return digest
@@ -0,0 +1,67 @@
+# Copyright (C) 2015 by the Free Software Foundation, Inc.
+#
+# This file is part of GNU Mailman.
+#
+# GNU Mailman is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# GNU Mailman is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Some helpers for queries."""
+
+__all__ = [
+    'QuerySequence',
+    ]
+
+
+from collections.abc import Sequence
+
+
+# How many rows to fetch at a time while iterating over the results.
+BATCH_SIZE = 500
+
+
+
+class QuerySequence(Sequence):
+    """A read-only sequence of the results of a database query.
+
+    Nothing is loaded until it is asked for.  The length of the sequence is
+    counted by the database, and indexing and slicing fetch just the rows
+    they need, so that the first page of a big collection costs no more than
+    that of a small one.  Iterating fetches the rows in batches.
+    """
+
+    def __init__(self, query=None):
+        """Create the sequence.
+
+        :param query: The query, which should be ordered.  None gives an empty
+            sequence.
+        :type query: `sqlalchemy.orm.Query`
+        """
+        self._query = query
+
+    def __len__(self):
+        if self._query is None:
+            return 0
+        # The order doesn't matter when counting.
+        return self._query.order_by(None).count()
+
+    def __getitem__(self, index):
+        if self._query is None:
+            if isinstance(index, slice):
+                return []
+            raise IndexError('index out of range')
+        return self._query[index]
+
+    def __iter__(self):
+        if self._query is None:
+            return iter(())
+        return iter(self._query.yield_per(BATCH_SIZE))
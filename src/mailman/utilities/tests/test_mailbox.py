@@ -0,0 +1,189 @@
+# Copyright (C) 2015 by the Free Software Foundation, Inc.
+#
+# This file is part of GNU Mailman.
+#
+# GNU Mailman is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# GNU Mailman is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test the digest accumulator."""
+
+__all__ = [
+    'TestDigestAccumulator',
+    ]
+
+
+import os
+import mock
+import fcntl
+import shutil
+import tempfile
+import unittest
+
+from mailbox import MMDF
+from mailman.testing.helpers import specialized_message_from_string as mfs
+from mailman.utilities.mailbox import DigestAccumulator
+
+
+def _message(i):
+    return mfs("""\
+From: person_{0}@example.com
+To: test@example.com
+Subject: Message {0}
+Message-ID: <{0}>
+
+Body {0}
+""".format(i))
+
+
+
+class TestDigestAccumulator(unittest.TestCase):
+    """Test the digest accumulator."""
+
+    def setUp(self):
+        self._tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self._tempdir)
+        self._path = os.path.join(self._tempdir, 'digest')
+        self._digest = DigestAccumulator(self._path)
+
+    def _ids(self, digest):
+        return [msg['message-id'] for msg in digest]
+
+    def test_empty(self):
+        self.assertFalse(os.path.exists(self._path))
+        self.assertEqual(len(self._digest), 0)
+        self.assertEqual(self._digest.size, 0)
+        self.assertEqual(list(self._digest), [])
+
+    def test_add(self):
+        self._digest.add(_message(1))
+        self._digest.add(_message(2).as_string())
+        self._digest.add(_message(3).as_bytes())
+        self.assertEqual(len(self._digest), 3)
+        self.assertEqual(self._ids(self._digest), ['<1>', '<2>', '<3>'])
+        self.assertGreater(self._digest.size, 0)
+        # The index has the headers for the table of contents.
+        self.assertEqual(
+            [(entry.subject, entry.sender)
+             for entry in self._digest.entries()],
+            [('Message {0}'.format(i), 'person_{0}@example.com'.format(i))
+             for i in range(1, 4)])
+
+    def test_segment_is_a_mailbox(self):
+        self._digest.add(_message(1))
+        self._digest.add(_message(2))
+        filenames = os.listdir(self._path)
+        self.assertEqual(len(filenames), 2)
+        segment = [filename for filename in filenames
+                   if filename.endswith('.mmdf')][0]
+        mailbox = MMDF(os.path.join(self._path, segment))
+        self.assertEqual(self._ids(mailbox), ['<1>', '<2>'])
+
+    def test_segments_are_merged(self):
+        # Each process adds to its own segment, and the messages are read in
+        # the order they were added.
+        for i in range(1, 7):
+            with mock.patch('os.getpid', return_value=1000 + i % 3):
+                self._digest.add(_message(i))
+        self.assertEqual(len(os.listdir(self._path)), 6)
+        self.assertEqual(self._ids(self._digest),
+                         ['<1>', '<2>', '<3>', '<4>', '<5>', '<6>'])
+
+    def test_incomplete_entries(self):
+        # Messages whose index entries were not completely written are not
+        # part of the digest.
+        self._digest.add(_message(1))
+        segment = [filename for filename in os.listdir(self._path)
+                   if filename.endswith('.idx')][0]
+        with open(os.path.join(self._path, segment), 'ab') as fp:
+            fp.write(b'{"time": 1')
+        self.assertEqual(self._ids(self._digest), ['<1>'])
+        self._digest.add(_message(2))
+        self.assertEqual(self._ids(self._digest), ['<1>', '<2>'])
+
+    def test_cut(self):
+        self._digest.add(_message(1))
+        cut_path = os.path.join(self._tempdir, 'digest.1.1')
+        digest = self._digest.cut(cut_path)
+        self.assertEqual(digest.path, cut_path)
+        self.assertFalse(os.path.exists(self._path))
+        self.assertEqual(self._ids(digest), ['<1>'])
+        # The next message starts a new digest.
+        self._digest.add(_message(2))
+        self.assertEqual(self._ids(self._digest), ['<2>'])
+        self.assertEqual(self._ids(digest), ['<1>'])
+
+    def test_cut_nothing(self):
+        cut_path = os.path.join(self._tempdir, 'digest.1.1')
+        self.assertIsNone(self._digest.cut(cut_path))
+        self.assertFalse(os.path.exists(cut_path))
+
+    def test_cut_onto_existing_digest(self):
+        # A process with a stale digest number leaves the digest alone,
+        # rather than failing, when the digest it would cut it to is there.
+        self._digest.add(_message(1))
+        cut_path = os.path.join(self._tempdir, 'digest.1.1')
+        self._digest.cut(cut_path)
+        self._digest.add(_message(2))
+        self.assertIsNone(self._digest.cut(cut_path))
+        self.assertEqual(self._ids(self._digest), ['<2>'])
+        self.assertEqual(self._ids(DigestAccumulator(cut_path)), ['<1>'])
+
+    def test_add_while_cutting(self):
+        # A message whose segment was opened just before the digest was cut
+        # goes into the next digest.
+        self._digest.add(_message(1))
+        cut_path = os.path.join(self._tempdir, 'digest.1.1')
+        flock = fcntl.flock
+        def cut_first(fp, operation):
+            # Cut the digest when the segment is first locked.
+            locker.side_effect = flock
+            self._digest.cut(cut_path)
+            flock(fp, operation)
+        with mock.patch('fcntl.flock', side_effect=cut_first) as locker:
+            self._digest.add(_message(2))
+        self.assertEqual(self._ids(DigestAccumulator(cut_path)), ['<1>'])
+        self.assertEqual(self._ids(self._digest), ['<2>'])
+
+    def test_cut_after_check(self):
+        # When the digest is cut right after the segment was found to be in
+        # place, the message and its index entry still go into the digest
+        # which was cut, since cut() waits for the segment's lock.
+        self._digest.add(_message(1))
+        cut_path = os.path.join(self._tempdir, 'digest.1.1')
+        samestat = os.path.samestat
+        def cut_after(stat_1, stat_2):
+            result = samestat(stat_1, stat_2)
+            os.rename(self._path, cut_path)
+            return result
+        with mock.patch('os.path.samestat', side_effect=cut_after):
+            self._digest.add(_message(2))
+        self.assertEqual(self._ids(DigestAccumulator(cut_path)),
+                         ['<1>', '<2>'])
+        self.assertFalse(os.path.exists(self._path))
+
+    def test_add_mailbox(self):
+        # The messages of an older version's digest mailbox are moved into
+        # the digest.
+        path = os.path.join(self._tempdir, 'digest.mmdf')
+        mailbox = MMDF(path)
+        mailbox.add(_message(1))
+        mailbox.add(_message(2))
+        mailbox.flush()
+        self._digest.add(_message(3))
+        self.assertEqual(self._digest.add_mailbox(path), 2)
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(self._ids(self._digest), ['<3>', '<1>', '<2>'])
+        self.assertEqual(os.listdir(self._tempdir), ['digest'])
+        # There's nothing left to move.
+        self.assertEqual(self._digest.add_mailbox(path), 0)
+
@@ -0,0 +1,77 @@
+# Copyright (C) 2015 by the Free Software Foundation, Inc.
+#
+# This file is part of GNU Mailman.
+#
+# GNU Mailman is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# GNU Mailman is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test the query helpers."""
+
+__all__ = [
+    'TestQuerySequence',
+    ]
+
+
+import unittest
+
+from mailman.config import config
+from mailman.interfaces.usermanager import IUserManager
+from mailman.model.user import User
+from mailman.testing.layers import ConfigLayer
+from mailman.utilities import queries
+from mailman.utilities.queries import QuerySequence
+from zope.component import getUtility
+
+
+
+class TestQuerySequence(unittest.TestCase):
+    layer = ConfigLayer
+
+    def setUp(self):
+        user_manager = getUtility(IUserManager)
+        for name in ('Elle', 'Cris', 'Anne', 'Dave', 'Bart'):
+            user_manager.create_user(display_name=name)
+        query = config.db.store.query(User).order_by(User.display_name)
+        self._users = QuerySequence(query)
+
+    def test_length(self):
+        self.assertEqual(len(self._users), 5)
+
+    def test_index(self):
+        self.assertEqual(self._users[0].display_name, 'Anne')
+        self.assertEqual(self._users[-1].display_name, 'Elle')
+
+    def test_slice(self):
+        names = [user.display_name for user in self._users[1:3]]
+        self.assertEqual(names, ['Bart', 'Cris'])
+
+    def test_slice_past_the_end(self):
+        self.assertEqual(list(self._users[5:10]), [])
+
+    def test_iteration_in_batches(self):
+        # Iterating over the sequence returns every row, in order, however
+        # many batches they are fetched in.
+        batch_size = queries.BATCH_SIZE
+        queries.BATCH_SIZE = 2
+        try:
+            names = [user.display_name for user in self._users]
+        finally:
+            queries.BATCH_SIZE = batch_size
+        self.assertEqual(names, ['Anne', 'Bart', 'Cris', 'Dave', 'Elle'])
+
+    def test_empty(self):
+        users = QuerySequence()
+        self.assertEqual(len(users), 0)
+        self.assertEqual(list(users), [])
+        self.assertEqual(users[0:10], [])
+        self.assertRaises(IndexError, users.__getitem__, 0)